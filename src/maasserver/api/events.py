@@ -9,6 +9,7 @@ import urllib.error
 import urllib.parse
 import urllib.request
 
+from django.db.models import Q
 from formencode.validators import Int
 from maasserver.api.nodes import filtered_nodes_list_from_request
 from maasserver.api.support import (
@@ -119,13 +120,20 @@ class EventsHandler(OperationsHandler):
             # The limit should never be less than 1.
             limit = 1 if limit < 1 else limit
 
-        # Begin constructing the query.
-        node_events = Event.objects.filter(node__in=nodes)
+        # Begin constructing the query. Events are matched to the nodes by
+        # ID alone, so that the (node, id) index can be used.
+        node_events = Event.objects.filter(
+            node_id__in=nodes.order_by().values('id'))
 
-        # Eliminate logs below the requested level.
+        # Eliminate logs below the requested level. Events carry a copy of
+        # their type's level, so this needs no join, and can use the
+        # (level, id) index. Older events get theirs from the
+        # event-retention service; until then, their type's level is used.
         if level in LOGGING_LEVELS_BY_NAME:
-            node_events = node_events.exclude(
-                type__level__lt=LOGGING_LEVELS_BY_NAME[level])
+            level = LOGGING_LEVELS_BY_NAME[level]
+            node_events = node_events.filter(
+                Q(level__gte=level) |
+                Q(level__isnull=True, type__level__gte=level))
         elif level is not None:
             raise MAASAPIBadRequest(
                 "Unrecognised log level: %s" % level)
@@ -137,10 +145,9 @@ class EventsHandler(OperationsHandler):
         # deployment, and we don't have an event subtype for node status
         # changes to filter for the deploying status event.
 
-        node_events = (
-            node_events.all()
-            .prefetch_related('type')
-            .prefetch_related('node'))
+        # At most `limit` events are fetched, so fetch their types and nodes
+        # in the same query.
+        node_events = node_events.select_related('type', 'node')
 
         if after is None and before is None:
             # Get `limit` events, newest first.
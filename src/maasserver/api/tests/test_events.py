@@ -22,6 +22,7 @@ from django.conf import settings
 from maasserver.api import events as events_module
 from maasserver.api.tests.test_nodes import RequestFixture
 from maasserver.enum import NODE_TYPE
+from maasserver.models import Event
 from maasserver.testing.api import APITestCase
 from maasserver.testing.factory import factory
 from maasserver.utils import ignore_unused
@@ -517,6 +518,24 @@ class TestEventsAPI(APITestCase.ForUser):
                 (event.id for event in chain.from_iterable(events[:idx + 1])),
                 extract_event_ids(parsed_result))
 
+    def test_GET_query_with_log_level_uses_type_of_events_without_level(self):
+        info_events = make_events(
+            type=factory.make_EventType(level=logging.INFO))
+        debug_events = make_events(
+            type=factory.make_EventType(level=logging.DEBUG))
+        Event.objects.filter(
+            id__in=[event.id for event in info_events + debug_events]).update(
+            level=None)
+        response = self.client.get(
+            reverse('events_handler'), {
+                'op': 'query',
+                'level': 'INFO',
+            })
+        self.assertEqual(http.client.OK, response.status_code)
+        self.assertItemsEqual(
+            [event.id for event in info_events],
+            extract_event_ids(json_load_bytes(response.content)))
+
     def test_GET_query_with_default_log_level_is_info(self):
         for level_name, level in self.log_levels:
             make_events(type=factory.make_EventType(level=level))
@@ -547,10 +566,8 @@ class TestEventsAPI(APITestCase.ForUser):
             make_events(number_events, node=node)
 
     def test_query_num_queries_is_independent_of_num_nodes_and_events(self):
-        # 1 query for select event +
-        # 1 query to prefetch eventtype +
-        # 1 query to prefetch node details
-        expected_queries = 3
+        # 1 query to select events with their event types and nodes.
+        expected_queries = 1
         events_per_node = 5
         num_nodes_per_group = 5
         events_per_group = num_nodes_per_group * events_per_node
@@ -16,9 +16,14 @@ __all__ = [
 ]
 
 from datetime import timedelta
+import hashlib
+import http.client
 from operator import itemgetter
 import os
+import queue
+import re
 from subprocess import CalledProcessError
+import tempfile
 from textwrap import dedent
 import threading
 import time
@@ -76,7 +81,11 @@ from maasserver.utils.orm import (
     transactional,
     with_connection,
 )
-from maasserver.utils.threads import deferToDatabase
+from maasserver.utils.threads import (
+    DATABASE_PRIORITY,
+    deferToDatabase,
+    deferToDatabaseWithPriority,
+)
 from provisioningserver.config import is_dev_environment
 from provisioningserver.events import EVENT_TYPES
 from provisioningserver.import_images.download_descriptions import (
@@ -94,6 +103,7 @@ from provisioningserver.logger import (
     get_maas_logger,
     LegacyLogger,
 )
+from provisioningserver.path import get_data_path
 from provisioningserver.rpc.cluster import (
     ListBootImages,
     ListBootImagesV2,
@@ -123,6 +133,7 @@ from twisted.internet.defer import (
     Deferred,
     DeferredList,
     inlineCallbacks,
+    returnValue,
 )
 from twisted.protocols.amp import UnhandledCommand
 from twisted.python.failure import Failure
@@ -154,11 +165,15 @@ class ConnectionWrapper:
 
     A new database connection is made at the start of the interation and is
     closed upon close of wrapper.
+
+    Only `length` bytes from `start` are streamed when `length` is given.
     """
 
-    def __init__(self, largeobject, alias="default"):
+    def __init__(self, largeobject, alias="default", start=0, length=None):
         self.largeobject = largeobject
         self.alias = alias
+        self.start = start
+        self.length = length
         self._connection = None
         self._stream = None
 
@@ -182,15 +197,22 @@ class ConnectionWrapper:
         if self._stream is None:
             self._stream = self.largeobject.open(
                 'rb', connection=self._connection)
+            if self.start != 0:
+                self._stream.seek(self.start)
 
     def __iter__(self):
         return self
 
     def __next__(self):
         self._set_up()
-        data = self._stream.read(self.largeobject.block_size)
+        size = self.largeobject.block_size
+        if self.length is not None:
+            size = min(size, self.length)
+        data = self._stream.read(size) if size > 0 else b""
         if len(data) == 0:
             raise StopIteration
+        if self.length is not None:
+            self.length -= len(data)
         return data
 
     def close(self):
@@ -206,6 +228,243 @@ class ConnectionWrapper:
             self._connection = None
 
 
+# Size of the reads made when filling and serving the on-disk cache.
+LARGEFILE_CACHE_CHUNK_SIZE = 1024 * 1024
+
+# Most bytes copied into the on-disk cache by each transaction of a fill in
+# the background; the database thread is given back in between.
+LARGEFILE_CACHE_FILL_SIZE = 16 * LARGEFILE_CACHE_CHUNK_SIZE
+
+# The sha256 of each `LargeFile` whose content this process is copying into
+# the on-disk cache. Guarded by `_largefile_cache_filling_lock`.
+_largefile_cache_filling = set()
+_largefile_cache_filling_lock = threading.Lock()
+
+
+def get_largefile_cache_dir():
+    """Return the directory of the on-disk `LargeFile` content cache."""
+    path = get_data_path("/var/lib/maas/boot-resources-cache")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_largefile_cache_path(largefile):
+    """Return the path of the cached content of `largefile`, or `None`."""
+    path = os.path.join(get_largefile_cache_dir(), largefile.sha256)
+    return path if os.path.exists(path) else None
+
+
+def prune_largefile_cache(cache_dir):
+    """Remove cached content of `LargeFile`s that no longer exist."""
+    names = set(os.listdir(cache_dir))
+    cached = {name for name in names if not name.startswith(".")}
+    if len(cached) == 0:
+        return
+    existing = set(
+        LargeFile.objects.filter(sha256__in=cached).values_list(
+            "sha256", flat=True))
+    for name in cached - existing:
+        try:
+            os.unlink(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass  # Another process got there first.
+
+
+class LargeFileCacheFill:
+    """Copies the content of a `LargeFile` into the on-disk cache.
+
+    The copy is named after the sha256 of the content, so each file is read
+    from the large object storage only once. The copy is written to a
+    temporary file, checked against the sha256 and then renamed into place,
+    so a partial copy is never served.
+
+    Call `step` until it returns `True`, each time in a transaction. Each
+    call copies at most `size` bytes, or everything if `size` is `None`.
+
+    :ivar path: Once finished, the path of the copy, or `None` if
+        `largefile` is incomplete or the copy could not be made.
+    """
+
+    def __init__(self, largefile, size=None):
+        super(LargeFileCacheFill, self).__init__()
+        self.largefile = largefile
+        self.size = size
+        self.path = None
+        self._sha256 = hashlib.sha256()
+        self._offset = 0
+        self._tmp_path = None
+
+    @synchronous
+    def step(self):
+        """Copy the next part of the content.
+
+        :return: `True` once finished, else `False`.
+        """
+        largefile = self.largefile
+        if self._tmp_path is None:
+            if not largefile.complete:
+                return True
+            cache_dir = get_largefile_cache_dir()
+            path = os.path.join(cache_dir, largefile.sha256)
+            if os.path.exists(path):
+                self.path = path
+                return True
+            prune_largefile_cache(cache_dir)
+            fd, self._tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".")
+            os.close(fd)
+        try:
+            if not self._copy():
+                return False
+            if self._sha256.hexdigest() != largefile.sha256:
+                maaslog.error(
+                    "Content of %s does not match its sha256; "
+                    "not caching it.", largefile)
+                self.discard()
+                return True
+            path = os.path.join(
+                os.path.dirname(self._tmp_path), largefile.sha256)
+            os.rename(self._tmp_path, path)
+            self._tmp_path = None
+            self.path = path
+        except OSError as error:
+            maaslog.error(
+                "Unable to cache content of %s: %s", largefile, error)
+            self.discard()
+        return True
+
+    def _copy(self):
+        """Append up to `size` bytes of the content to the temporary file.
+
+        :return: `True` if the end of the content was reached.
+        """
+        remaining = self.size
+        with open(self._tmp_path, "ab") as output:
+            with self.largefile.content.open("rb") as stream:
+                stream.seek(self._offset)
+                while remaining is None or remaining > 0:
+                    if remaining is None:
+                        data = stream.read(LARGEFILE_CACHE_CHUNK_SIZE)
+                    else:
+                        data = stream.read(
+                            min(remaining, LARGEFILE_CACHE_CHUNK_SIZE))
+                        remaining -= len(data)
+                    if len(data) == 0:
+                        return True
+                    self._sha256.update(data)
+                    self._offset += len(data)
+                    output.write(data)
+        return self._offset >= self.largefile.total_size
+
+    def discard(self):
+        """Remove the partial copy, if any."""
+        if self._tmp_path is not None:
+            if os.path.exists(self._tmp_path):
+                os.unlink(self._tmp_path)
+            self._tmp_path = None
+
+
+@synchronous
+def fill_largefile_cache(largefile):
+    """Return the path of an on-disk copy of `largefile`'s content.
+
+    The whole copy is made in the current transaction; see
+    `LargeFileCacheFill`.
+
+    :return: The path, or `None` if `largefile` is incomplete or the copy
+        could not be made. The content must then be streamed from the
+        database.
+    """
+    fill = LargeFileCacheFill(largefile)
+    while not fill.step():
+        pass
+    return fill.path
+
+
+def fill_largefile_cache_later(largefile):
+    """Copy `largefile`'s content into the on-disk cache in the background.
+
+    The copy is made with `LargeFileCacheFill` in database threads at
+    background priority, so the request that found the content missing is
+    not held up and the number of copies made at once is bounded. Each
+    transaction copies at most `LARGEFILE_CACHE_FILL_SIZE` bytes, so a
+    multi-gigabyte copy does not hold a database thread throughout. Nothing
+    is done if `largefile` is incomplete or this process is already copying
+    it.
+    """
+    if not largefile.complete:
+        return
+    sha256 = largefile.sha256
+    with _largefile_cache_filling_lock:
+        if sha256 in _largefile_cache_filling:
+            return
+        _largefile_cache_filling.add(sha256)
+    fill = LargeFileCacheFill(largefile, LARGEFILE_CACHE_FILL_SIZE)
+
+    @inlineCallbacks
+    def copy():
+        step = transactional(fill.step)
+        while True:
+            done = yield deferToDatabaseWithPriority(
+                DATABASE_PRIORITY.BACKGROUND, step)
+            if done:
+                returnValue(fill.path)
+
+    def failed(failure):
+        fill.discard()
+        log.err(failure, "Failed to cache content of %s." % largefile)
+
+    def filled(result):
+        with _largefile_cache_filling_lock:
+            _largefile_cache_filling.discard(sha256)
+        return result
+
+    def fill_in_background():
+        d = copy()
+        d.addErrback(failed)
+        return d.addBoth(filled)
+
+    reactor.callFromThread(fill_in_background)
+
+
+def read_file_range(path, start, length):
+    """Yield `length` bytes from `path` starting at `start`."""
+    with open(path, "rb") as stream:
+        stream.seek(start)
+        while length > 0:
+            data = stream.read(min(length, LARGEFILE_CACHE_CHUNK_SIZE))
+            if len(data) == 0:
+                break
+            length -= len(data)
+            yield data
+
+
+def parse_range_header(header, size):
+    """Parse a single-range HTTP `Range` header for content of `size`.
+
+    :return: A `(start, end)` tuple, inclusive, `None` if `header` is not a
+        single byte range and so should be ignored, or `False` if the range
+        cannot be satisfied.
+    """
+    match = re.match(r"^bytes=(\d*)-(\d*)$", header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    elif first == "":
+        # Suffix range; the final `last` bytes.
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    else:
+        start = int(first)
+        end = size - 1 if last == "" else min(int(last), size - 1)
+        if start > end:
+            return False
+        return start, end
+
+
 class SimpleStreamsHandler:
     """Simplestreams endpoint, that the racks talk to.
 
@@ -373,10 +632,55 @@ class SimpleStreamsHandler:
             rfile = resource_set.files.get(filename=filename)
         except BootResourceFile.DoesNotExist:
             raise Http404()
+        largefile = rfile.largefile
+        path = get_largefile_cache_path(largefile)
+        if path is None:
+            # Not cached, so stream the content from the database while
+            # the cache is filled in the background for later requests.
+            fill_largefile_cache_later(largefile)
+
+            def read_range(start, length):
+                return ConnectionWrapper(
+                    largefile.content, start=start, length=length)
+        else:
+            def read_range(start, length):
+                return read_file_range(path, start, length)
+        return self.get_file_response(
+            request, read_range, largefile.total_size)
+
+    def get_file_response(self, request, read_range, size):
+        """Return a response with the content read by `read_range`.
+
+        A single byte range in the `Range` header is honoured so that an
+        interrupted download can be resumed, whether the content is read
+        from the on-disk cache or from the database.
+
+        :param read_range: A callable taking the start and length of the
+            range to read, returning an iterable of its content.
+        :param size: The size of the whole content.
+        """
+        byte_range = None
+        if "HTTP_RANGE" in request.META:
+            byte_range = parse_range_header(request.META["HTTP_RANGE"], size)
+        if byte_range is False:
+            response = HttpResponse(
+                status=http.client.REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+        elif byte_range is None:
+            start, end = 0, size - 1
+            status = http.client.OK
+        else:
+            start, end = byte_range
+            status = http.client.PARTIAL_CONTENT
+        length = end - start + 1
         response = StreamingHttpResponse(
-            ConnectionWrapper(rfile.largefile.content),
+            read_range(start, length), status=status,
             content_type='application/octet-stream')
-        response['Content-Length'] = rfile.largefile.total_size
+        response['Content-Length'] = length
+        response['Accept-Ranges'] = 'bytes'
+        if status == http.client.PARTIAL_CONTENT:
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
         return response
 
 
@@ -427,6 +731,19 @@ class BootResourceStore(ObjectStore):
     # Read at 10MiB per chunk.
     read_size = 1024 * 1024 * 10
 
+    # Number of chunks that can be read ahead of writing into the database.
+    read_ahead = 4
+
+    # Content is committed into the database in transactions starting at
+    # `read_size`, growing to at most `max_write_size` while each
+    # transaction finishes within `write_target_seconds`.
+    max_write_size = 1024 * 1024 * 160
+    write_target_seconds = 2
+
+    # Minimum number of seconds between saving the size of a `LargeFile`,
+    # which is what reports the progress of an import.
+    progress_interval = 5
+
     def __init__(self):
         """Initialize store."""
         self.cache_current_resources()
@@ -749,7 +1066,13 @@ class BootResourceStore(ObjectStore):
 
     def write_content_thread(self, rid, reader):
         """Writes the data from the given reader, into the object storage
-        for the given `BootResourceFile`."""
+        for the given `BootResourceFile`.
+
+        The content is read and hashed in a separate thread while it is
+        written into the database, so downloading and writing overlap. The
+        content is committed in transactions that grow up to
+        `max_write_size` while each completes within `write_target_seconds`.
+        """
 
         @transactional
         def get_rfile_and_ident():
@@ -767,30 +1090,75 @@ class BootResourceStore(ObjectStore):
         rfile.largefile.size = 0
         transactional(rfile.largefile.save)(update_fields=['size'])
 
+        # Chunks read from `reader`. `None` marks the end of the content.
+        chunks = queue.Queue(self.read_ahead)
+        read_errors = []
+        stop_reading = threading.Event()
+        content_read = threading.Event()
+
+        def read_content():
+            """Read and hash the content, placing it into `chunks`."""
+            try:
+                while not (self._cancel_finalize or stop_reading.is_set()):
+                    buf = reader.read(self.read_size)
+                    cksummer.update(buf)
+                    if len(buf) > 0:
+                        chunks.put(buf)
+                    if len(buf) != self.read_size:
+                        break
+            except Exception as error:
+                read_errors.append(error)
+            finally:
+                chunks.put(None)
+
         @transactional
-        def write_chunk():
-            """Write a chunk into the database with a transaction per trunk.
+        def write_chunks(write_size, report_progress):
+            """Write up to `write_size` bytes into the database.
 
-            This ensures that the content and the size is committed into the
-            database per chunk. This makes the process be reported correctly.
+            The size of the largefile is only saved when `report_progress` is
+            set, so the progress is not updated for every transaction.
             """
             with rfile.largefile.content.open('wb') as stream:
-                buf = reader.read(self.read_size)
                 stream.seek(0, 2)
-                stream.write(buf)
-                cksummer.update(buf)
-                buf_len = len(buf)
-                rfile.largefile.size += buf_len
+                written = 0
+                while written < write_size:
+                    buf = chunks.get()
+                    if buf is None:
+                        content_read.set()
+                        break
+                    stream.write(buf)
+                    written += len(buf)
+            rfile.largefile.size += written
+            if report_progress or content_read.is_set():
                 rfile.largefile.save(update_fields=['size'])
-                if buf_len != self.read_size:
-                    return True
-                else:
-                    return False
 
-        # Write chunks until it says its done.
-        while not self._cancel_finalize:
-            if write_chunk():
-                break
+        read_thread = threading.Thread(target=read_content)
+        read_thread.start()
+        try:
+            write_size = self.read_size
+            last_progress = time.monotonic()
+            while not (content_read.is_set() or self._cancel_finalize):
+                started = time.monotonic()
+                report_progress = (
+                    started - last_progress >= self.progress_interval)
+                if report_progress:
+                    last_progress = started
+                write_chunks(write_size, report_progress)
+                elapsed = time.monotonic() - started
+                if elapsed < self.write_target_seconds:
+                    write_size = min(write_size * 2, self.max_write_size)
+                else:
+                    write_size = max(write_size // 2, self.read_size)
+        finally:
+            # Consume the remaining chunks so the read thread can finish.
+            stop_reading.set()
+            while not content_read.is_set():
+                if chunks.get() is None:
+                    content_read.set()
+            read_thread.join()
+
+        if len(read_errors) > 0:
+            raise read_errors[0]
 
         # Don't check the checksum if finalization was cancelled.
         if self._cancel_finalize:
@@ -816,35 +1184,33 @@ class BootResourceStore(ObjectStore):
     def perform_write(self):
         """Performs all writing of content into the object storage.
 
-        This method will spawn threads to perform the writing. Maximum of
-        `write_threads` will be running at once."""
-        threads = []
-        while True:
-            # Update list to only those that are still running.
-            threads = [thread for thread in threads if thread.isAlive()]
-            if len(threads) >= self.write_threads:
-                # Cannot start any more threads as the maximum is already
-                # running. Lets wait a second and try again.
-                time.sleep(1)
-                continue
-
-            if self._cancel_finalize or len(self._content_to_finalize) == 0:
-                # No more threads to spawn because the finalization has been
-                # cancelled or all of the content has been de-queued. Wait for
-                # all the remaining running threads to finish.
-                for thread in threads:
-                    thread.join()
-                break
-
-            # Spawn a writer thread with a resource file and reader from
-            # the queue of content to be saved.
-            rid, reader = self._content_to_finalize.popitem()
-            # FIXME: Use deferToDatabase and the coiterator if possible.
-            thread = threading.Thread(
-                target=self.write_content_thread,
-                args=(rid, reader))
+        This method starts a pool of `write_threads` threads, each of which
+        writes content from the queue until it is empty or the finalization
+        is cancelled."""
+
+        def write_content():
+            while not self._cancel_finalize:
+                try:
+                    rid, reader = self._content_to_finalize.popitem()
+                except KeyError:
+                    break
+                try:
+                    self.write_content_thread(rid, reader)
+                except Exception as error:
+                    # Continue with the remaining content; the incomplete
+                    # file will not be used.
+                    maaslog.error(
+                        "Failed to write content for boot resource file "
+                        "%d: %s", rid, error)
+
+        threads = [
+            threading.Thread(target=write_content)
+            for _ in range(self.write_threads)
+        ]
+        for thread in threads:
             thread.start()
-            threads.append(thread)
+        for thread in threads:
+            thread.join()
 
     def _other_resources_exists(self, os, arch, subarch, series):
         """Return `True` when simplestreams provided an image with the same
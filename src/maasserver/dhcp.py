@@ -21,7 +21,10 @@ from typing import (
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.db.models import (
+    Prefetch,
+    Q,
+)
 from maasserver.dns.zonegenerator import get_dns_server_address
 from maasserver.enum import (
     INTERFACE_TYPE,
@@ -34,6 +37,7 @@ from maasserver.models import (
     Config,
     DHCPSnippet,
     Domain,
+    Interface,
     RackController,
     Service,
     StaticIPAddress,
@@ -310,17 +314,38 @@ def make_dhcp_snippet(dhcp_snippet):
 def make_hosts_for_subnets(subnets, nodes_dhcp_snippets: list=None):
     """Return list of host entries to create in the DHCP configuration for the
     given `subnets`.
+
+    The addresses, their interfaces, the interfaces' nodes and the parents of
+    bonds are fetched with a fixed number of queries, however many hosts
+    there are.
     """
     if nodes_dhcp_snippets is None:
         nodes_dhcp_snippets = []
 
+    # Group the node DHCP snippets by node so each lookup is cheap.
+    snippets_by_node = defaultdict(list)
+    for dhcp_snippet in nodes_dhcp_snippets:
+        snippets_by_node[dhcp_snippet.node_id].append(
+            make_dhcp_snippet(dhcp_snippet))
+
     def get_dhcp_snippets_for_interface(interface):
-        dhcp_snippets = list()
-        for dhcp_snippet in nodes_dhcp_snippets:
-            if dhcp_snippet.node == interface.node:
-                dhcp_snippets.append(make_dhcp_snippet(dhcp_snippet))
-        return dhcp_snippets
+        if interface.node_id is None:
+            return []
+        else:
+            return list(snippets_by_node.get(interface.node_id, []))
+
+    def make_host(interface, ip):
+        return {
+            'host': make_interface_hostname(interface),
+            'mac': str(interface.mac_address),
+            'ip': ip,
+            'dhcp_snippets': get_dhcp_snippets_for_interface(interface),
+        }
 
+    interfaces = Interface.objects.order_by('id').select_related('node')
+    interfaces = interfaces.prefetch_related(Prefetch(
+        'parents', queryset=Interface.objects.order_by(
+            'id').select_related('node')))
     sips = StaticIPAddress.objects.filter(
         alloc_type__in=[
             IPADDRESS_TYPE.AUTO,
@@ -328,6 +353,7 @@ def make_hosts_for_subnets(subnets, nodes_dhcp_snippets: list=None):
             IPADDRESS_TYPE.USER_RESERVED,
             ],
         subnet__in=subnets, ip__isnull=False).order_by('id')
+    sips = sips.prefetch_related(Prefetch('interface_set', interfaces))
     hosts = []
     interface_ids = set()
     for sip in sips:
@@ -336,7 +362,7 @@ def make_hosts_for_subnets(subnets, nodes_dhcp_snippets: list=None):
             continue
 
         # Add all interfaces attached to this IP address.
-        for interface in sip.interface_set.order_by('id'):
+        for interface in sip.interface_set.all():
             # Only allow an interface to be in hosts once.
             if interface.id in interface_ids:
                 continue
@@ -351,28 +377,8 @@ def make_hosts_for_subnets(subnets, nodes_dhcp_snippets: list=None):
                     # from the bond.
                     if parent.mac_address != interface.mac_address:
                         interface_ids.add(parent.id)
-                        hosts.append({
-                            'host': make_interface_hostname(parent),
-                            'mac': str(parent.mac_address),
-                            'ip': str(sip.ip),
-                            'dhcp_snippets': get_dhcp_snippets_for_interface(
-                                parent),
-                        })
-                hosts.append({
-                    'host': make_interface_hostname(interface),
-                    'mac': str(interface.mac_address),
-                    'ip': str(sip.ip),
-                    'dhcp_snippets': get_dhcp_snippets_for_interface(
-                        interface),
-                })
-            else:
-                hosts.append({
-                    'host': make_interface_hostname(interface),
-                    'mac': str(interface.mac_address),
-                    'ip': str(sip.ip),
-                    'dhcp_snippets': get_dhcp_snippets_for_interface(
-                        interface),
-                })
+                        hosts.append(make_host(parent, str(sip.ip)))
+            hosts.append(make_host(interface, str(sip.ip)))
     return hosts
 
 
@@ -436,7 +442,7 @@ def make_subnet_config(
         'dhcp_snippets': [
             make_dhcp_snippet(dhcp_snippet)
             for dhcp_snippet in subnets_dhcp_snippets
-            if dhcp_snippet.subnet == subnet
+            if dhcp_snippet.subnet_id == subnet.id
             ],
         }
 
@@ -464,8 +470,13 @@ def make_failover_peer_config(vlan, rack_controller):
 @typed
 def get_dhcp_configure_for(
         ip_version: int, rack_controller, vlan, subnets: list,
-        ntp_servers: Union[list, dict], domain, dhcp_snippets: Iterable=None):
-    """Get the DHCP configuration for `ip_version`."""
+        ntp_servers: Union[list, dict], domain, dhcp_snippets: Iterable=None,
+        hosts: list=None):
+    """Get the DHCP configuration for `ip_version`.
+
+    :param hosts: The hosts for `subnets`, if already known; otherwise they
+        are generated with `make_hosts_for_subnets`.
+    """
     try:
         maas_dns_server = get_dns_server_address(
             rack_controller, ipv4=(ip_version == 4), ipv6=(ip_version == 6))
@@ -490,14 +501,13 @@ def get_dhcp_configure_for(
 
     subnets_dhcp_snippets = [
         dhcp_snippet for dhcp_snippet in dhcp_snippets
-        if dhcp_snippet.subnet is not None]
+        if dhcp_snippet.subnet_id is not None]
     nodes_dhcp_snippets = [
         dhcp_snippet for dhcp_snippet in dhcp_snippets
-        if dhcp_snippet.node is not None]
+        if dhcp_snippet.node_id is not None]
 
     # Generate the shared network configurations.
     subnet_configs = []
-    hosts = []
     for subnet in subnets:
         subnet_configs.append(
             make_subnet_config(
@@ -505,17 +515,60 @@ def get_dhcp_configure_for(
                 domain, peer_name, subnets_dhcp_snippets))
 
     # Generate the hosts for all subnets.
-    hosts = make_hosts_for_subnets(subnets, nodes_dhcp_snippets)
+    if hosts is None:
+        hosts = make_hosts_for_subnets(subnets, nodes_dhcp_snippets)
     return (
         peer_config, sorted(subnet_configs, key=itemgetter("subnet")),
         hosts, None if interface is None else interface.name)
 
 
+# The hosts generated for each VLAN by `get_dhcp_configuration`, keyed by
+# rack controller ID and then by VLAN ID, IP version, and subnet IDs.
+_hosts_cache = {}
+
+
+def discard_cached_hosts(rack_controller_id):
+    """Forget the hosts generated for `rack_controller_id`.
+
+    The next call to `get_dhcp_configuration` for it regenerates every
+    host, whichever VLANs it is told have changed.
+    """
+    _hosts_cache.pop(rack_controller_id, None)
+
+
+def prune_cached_hosts(rack_controller_ids):
+    """Forget the hosts generated for rack controllers not in the given IDs.
+    """
+    for rack_controller_id in list(_hosts_cache):
+        if rack_controller_id not in rack_controller_ids:
+            discard_cached_hosts(rack_controller_id)
+
+
 @synchronous
 @transactional
-def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
+def get_dhcp_configuration(
+        rack_controller, test_dhcp_snippet=None, changed_vlans=None):
     """Return tuple with IPv4 and IPv6 configurations for the
-    rack controller."""
+    rack controller.
+
+    :param changed_vlans: The IDs of the VLANs that have changed since this
+        was last called for `rack_controller`. The hosts of other VLANs are
+        reused from that call instead of being generated again. When this
+        is `None` everything is regenerated.
+    """
+    if changed_vlans is None or test_dhcp_snippet is not None:
+        cached_hosts = {}
+    else:
+        cached_hosts = _hosts_cache.get(rack_controller.id, {})
+    generated_hosts = {}
+
+    def get_cached_hosts(key):
+        vlan_id, _, _ = key
+        if vlan_id in changed_vlans:
+            return None
+        else:
+            return cached_hosts.get(key)
+
     # Get list of all vlans that are being managed by the rack controller.
     vlans = gen_managed_vlans_for(rack_controller)
 
@@ -529,7 +582,8 @@ def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
     # 1 + (the number of DHCP snippets used in this VLAN) instead of
     # 1 + (the number of subnets in this VLAN) +
     #     (the number of nodes in this VLAN)
-    dhcp_snippets = DHCPSnippet.objects.filter(enabled=True)
+    dhcp_snippets = DHCPSnippet.objects.filter(
+        enabled=True).select_related('value')
     # If we're testing a DHCP Snippet insert it into our list
     if test_dhcp_snippet is not None:
         dhcp_snippets = list(dhcp_snippets)
@@ -548,7 +602,7 @@ def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
     global_dhcp_snippets = [
         make_dhcp_snippet(dhcp_snippet)
         for dhcp_snippet in dhcp_snippets
-        if dhcp_snippet.node is None and dhcp_snippet.subnet is None
+        if dhcp_snippet.node_id is None and dhcp_snippet.subnet_id is None
         ]
 
     # Configure both DHCPv4 and DHCPv6 on the rack controller.
@@ -573,10 +627,12 @@ def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
     for vlan, (subnets_v4, subnets_v6) in vlan_subnets.items():
         # IPv4
         if len(subnets_v4) > 0:
+            key = vlan.id, 4, tuple(subnet.id for subnet in subnets_v4)
             config = get_dhcp_configure_for(
                 4, rack_controller, vlan, subnets_v4, ntp_servers,
-                default_domain, dhcp_snippets)
+                default_domain, dhcp_snippets, get_cached_hosts(key))
             failover_peer, subnets, hosts, interface = config
+            generated_hosts[key] = hosts
             if failover_peer is not None:
                 failover_peers_v4.append(failover_peer)
             shared_networks_v4.append({
@@ -588,10 +644,13 @@ def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
                 interfaces_v4.add(interface)
         # IPv6
         if len(subnets_v6) > 0:
+            key = vlan.id, 6, tuple(subnet.id for subnet in subnets_v6)
             config = get_dhcp_configure_for(
                 6, rack_controller, vlan, subnets_v6,
-                ntp_servers, default_domain, dhcp_snippets)
+                ntp_servers, default_domain, dhcp_snippets,
+                get_cached_hosts(key))
             failover_peer, subnets, hosts, interface = config
+            generated_hosts[key] = hosts
             if failover_peer is not None:
                 failover_peers_v6.append(failover_peer)
             shared_networks_v6.append({
@@ -607,6 +666,10 @@ def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
         shared_networks_v4 = {}
     if len(interfaces_v6) == 0:
         shared_networks_v6 = {}
+    # Keep the hosts for next time, unless they include a snippet that is
+    # only being tested.
+    if test_dhcp_snippet is None:
+        _hosts_cache[rack_controller.id] = generated_hosts
     return DHCPConfigurationForRack(
         failover_peers_v4, shared_networks_v4, hosts_v4, interfaces_v4,
         failover_peers_v6, shared_networks_v6, hosts_v6, interfaces_v6,
@@ -621,9 +684,13 @@ DHCPConfigurationForRack = namedtuple("DHCPConfigurationForRack", (
 
 @asynchronous
 @inlineCallbacks
-def configure_dhcp(rack_controller):
+def configure_dhcp(rack_controller, changed_vlans=None):
     """Write the DHCP configuration files and restart the DHCP servers.
 
+    :param changed_vlans: The IDs of the VLANs that have changed since the
+        DHCP servers were last configured, or `None` if that is not known.
+        See `get_dhcp_configuration`.
+
     :raises: :py:class:`~.exceptions.NoConnectionsAvailable` when there
         are no open connections to the specified cluster controller.
     """
@@ -639,7 +706,9 @@ def configure_dhcp(rack_controller):
     client = yield getClientFor(rack_controller.system_id)
 
     # Get configuration for both IPv4 and IPv6.
-    config = yield deferToDatabase(get_dhcp_configuration, rack_controller)
+    config = yield deferToDatabase(
+        get_dhcp_configuration, rack_controller,
+        changed_vlans=changed_vlans)
 
     # Fix interfaces to go over the wire.
     interfaces_v4 = [
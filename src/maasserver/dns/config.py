@@ -6,6 +6,8 @@
 __all__ = [
     'dns_force_reload',
     'dns_update_all_zones',
+    'dns_update_changed_zones',
+    'dns_update_zones',
     ]
 
 from django.conf import settings
@@ -15,13 +17,16 @@ from maasserver.models.config import Config
 from maasserver.models.dnspublication import DNSPublication
 from maasserver.models.domain import Domain
 from maasserver.models.subnet import Subnet
+from netaddr import IPNetwork
 from provisioningserver.dns.actions import (
     bind_reload,
     bind_reload_with_retries,
+    bind_reload_zones,
     bind_write_configuration,
     bind_write_options,
     bind_write_zones,
 )
+from provisioningserver.dns.zoneconfig import DNSReverseZoneConfig
 from provisioningserver.logger import get_maas_logger
 
 
@@ -89,6 +94,154 @@ def dns_update_all_zones(reload_retry=False):
         bind_reload()
 
 
+def dns_update_changed_zones(since=None, reload_retry=False):
+    """Update the zone files touched by publications made after `since`.
+
+    The tracked DNS triggers record which domains and subnets each
+    publication affects. When every publication made after `since` is
+    tracked, only those zones are regenerated and reloaded; otherwise this
+    falls back to `dns_update_all_zones`.
+
+    :param since: The ID of the most recent `DNSPublication` already
+        published, or `None` to update all zones.
+    :param reload_retry: Should the DNS server reload be retried in case
+        of failure? Defaults to `False`.
+    :return: The ID of the most recent `DNSPublication` that has now been
+        published, or `None` if there is nothing published.
+    """
+    if not is_dns_enabled():
+        return None
+
+    try:
+        publication = DNSPublication.objects.get_most_recent()
+    except DNSPublication.DoesNotExist:
+        dns_update_all_zones(reload_retry=reload_retry)
+        return None
+
+    if since is None:
+        changes = None
+    elif since == publication.id:
+        return publication.id  # Nothing new to publish.
+    else:
+        changes = DNSPublication.objects.get_changes_since(since)
+
+    if changes is None:
+        dns_update_all_zones(reload_retry=reload_retry)
+    else:
+        domain_ids, subnet_ids = changes
+        dns_update_zones(domain_ids, subnet_ids, reload_retry=reload_retry)
+    return publication.id
+
+
+def dns_update_zones(domain_ids, subnet_ids, reload_retry=False):
+    """Update the zone files for the given domains and subnets.
+
+    Only the forward zones of the given domains (and of their parents, which
+    carry delegations) and the reverse zones that overlap the given subnets
+    are regenerated, then BIND is asked to reload just those zones. When an
+    RFC2317 subnet is involved all zones are updated instead, because its
+    glue may live in any of its parents' zones.
+
+    :param domain_ids: IDs of the `Domain`s to update.
+    :param subnet_ids: IDs of the `Subnet`s to update.
+    :param reload_retry: Should the DNS server reload be retried in case
+        of failure? Defaults to `False`.
+    """
+    if not is_dns_enabled():
+        return
+
+    subnets = get_affected_subnets(subnet_ids)
+    if subnets is None:
+        dns_update_all_zones(reload_retry=reload_retry)
+        return
+    domains = get_affected_domains(domain_ids)
+    if len(domains) == 0 and len(subnets) == 0:
+        return
+
+    default_ttl = Config.objects.get_config('default_dns_ttl')
+    serial = current_zone_serial()
+    zones = ZoneGenerator(domains, subnets, default_ttl, serial).as_list()
+    bind_write_zones(zones)
+
+    # The set of zones is unchanged, so there is no need to rewrite BIND's
+    # configuration; reload only the zones that were written.
+    zone_names = [
+        zone_info.zone_name
+        for zone in zones
+        for zone_info in zone.zone_info
+    ]
+    if not bind_reload_zones(zone_names):
+        if reload_retry:
+            bind_reload_with_retries()
+        else:
+            bind_reload()
+
+
+def get_affected_domains(domain_ids):
+    """Return the authoritative domains whose zones cover `domain_ids`.
+
+    This includes the parents of each domain because they hold the
+    delegations for their children.
+
+    :return: A list of `Domain`.
+    """
+    domains = list(Domain.objects.filter(authoritative=True))
+    names = {
+        domain.name
+        for domain in domains
+        if domain.id in domain_ids
+    }
+    return [
+        domain for domain in domains
+        if domain.name in names or any(
+            name.endswith("." + domain.name) for name in names)
+    ]
+
+
+def get_affected_subnets(subnet_ids):
+    """Return the subnets whose reverse zones cover `subnet_ids`.
+
+    Every subnet that overlaps, or shares a reverse zone with, one of the
+    given subnets is included, since they write the same zone files.
+
+    :return: A list of `Subnet`, or `None` if all zones need regenerating.
+    """
+    subnets = list(Subnet.objects.exclude(rdns_mode=RDNS_MODE.DISABLED))
+    networks = {subnet.id: IPNetwork(subnet.cidr) for subnet in subnets}
+    zone_names = {
+        subnet.id: {
+            zone_info.zone_name
+            for zone_info in DNSReverseZoneConfig.compose_zone_info(
+                networks[subnet.id])
+        }
+        for subnet in subnets
+    }
+    touched = [subnet for subnet in subnets if subnet.id in subnet_ids]
+    touched_zones = set().union(
+        *(zone_names[subnet.id] for subnet in touched))
+    affected = [
+        subnet for subnet in subnets
+        if not zone_names[subnet.id].isdisjoint(touched_zones) or any(
+            networks[subnet.id] in networks[other.id] or
+            networks[other.id] in networks[subnet.id]
+            for other in touched)
+    ]
+    for subnet in subnets:
+        if subnet.rdns_mode == RDNS_MODE.RFC2317:
+            # Glue for RFC2317 subnets ends up in the zones of the networks
+            # that contain them; play safe and regenerate everything.
+            network = networks[subnet.id]
+            prefixlen = 24 if network.version == 4 else 124
+            if network.prefixlen > prefixlen:
+                network = IPNetwork(
+                    "%s/%d" % (network.network, prefixlen)).cidr
+            for other in affected:
+                if (network in networks[other.id] or
+                        networks[other.id] in network):
+                    return None
+    return affected
+
+
 def get_upstream_dns():
     """Return the IP addresses of configured upstream DNS servers.
 
@@ -7,6 +7,7 @@ __all__ = []
 
 import random
 import time
+from unittest.mock import ANY
 
 from django.conf import settings
 from django.core.management import call_command
@@ -17,12 +18,16 @@ from maasserver.dns.config import (
     current_zone_serial,
     dns_force_reload,
     dns_update_all_zones,
+    dns_update_changed_zones,
+    dns_update_zones,
+    get_affected_subnets,
     get_trusted_networks,
     get_upstream_dns,
 )
 from maasserver.enum import (
     IPADDRESS_TYPE,
     NODE_STATUS,
+    RDNS_MODE,
 )
 from maasserver.listener import PostgresListenerService
 from maasserver.models import (
@@ -33,7 +38,11 @@ from maasserver.models.dnspublication import DNSPublication
 from maasserver.testing.config import RegionConfigurationFixture
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.djangotestcase import count_queries
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from netaddr import IPAddress
 from provisioningserver.dns.config import (
     compose_config_path,
@@ -356,6 +365,133 @@ class TestIPv6DNS(TestDNSServer):
             node.hostname, node.domain.name, static.ip, version=6)
 
 
+class TestDNSUpdateChangedZones(MAASServerTestCase):
+    """Tests for `dns_update_changed_zones` and `dns_update_zones`."""
+
+    def setUp(self):
+        super(TestDNSUpdateChangedZones, self).setUp()
+        self.patch(settings, 'DNS_CONNECT', True)
+        self.useFixture(RegionConfigurationFixture())
+        self.bind_write_zones = self.patch_autospec(
+            dns_config_module, "bind_write_zones")
+        self.bind_reload_zones = self.patch_autospec(
+            dns_config_module, "bind_reload_zones")
+        self.dns_update_all_zones = self.patch_autospec(
+            dns_config_module, "dns_update_all_zones")
+
+    def get_written_zone_names(self):
+        [zones], _ = self.bind_write_zones.call_args
+        return {
+            zone_info.zone_name
+            for zone in zones
+            for zone_info in zone.zone_info
+        }
+
+    def test_updates_all_zones_when_since_is_None(self):
+        publication = DNSPublication(source="Initial")
+        publication.save()
+        self.assertEqual(publication.id, dns_update_changed_zones())
+        self.assertThat(
+            self.dns_update_all_zones, MockCalledOnceWith(reload_retry=False))
+
+    def test_does_nothing_when_nothing_published(self):
+        publication = DNSPublication(source="Initial")
+        publication.save()
+        self.assertEqual(
+            publication.id, dns_update_changed_zones(publication.id))
+        self.assertThat(self.dns_update_all_zones, MockNotCalled())
+        self.assertThat(self.bind_write_zones, MockNotCalled())
+
+    def test_updates_all_zones_for_untracked_publication(self):
+        since = DNSPublication(source="Initial")
+        since.save()
+        publication = DNSPublication(source="Untracked")
+        publication.save()
+        self.assertEqual(publication.id, dns_update_changed_zones(since.id))
+        self.assertThat(
+            self.dns_update_all_zones, MockCalledOnceWith(reload_retry=False))
+
+    def test_updates_only_touched_zones(self):
+        domain = factory.make_Domain()
+        factory.make_Domain()
+        subnet = factory.make_Subnet(cidr="10.1.0.0/24")
+        factory.make_Subnet(cidr="10.2.0.0/24")
+        since = DNSPublication(source="Initial")
+        since.save()
+        DNSPublication(
+            touched_domains=[domain.id],
+            touched_subnets=[subnet.id]).save()
+        dns_update_changed_zones(since.id)
+        self.assertThat(self.dns_update_all_zones, MockNotCalled())
+        expected = {domain.name, "0.1.10.in-addr.arpa"}
+        self.assertEqual(expected, self.get_written_zone_names())
+        self.assertThat(
+            self.bind_reload_zones, MockCalledOnceWith(ANY))
+        [names], _ = self.bind_reload_zones.call_args
+        self.assertItemsEqual(expected, names)
+
+    def test_update_zones_includes_parent_domains(self):
+        parent = factory.make_Domain()
+        child = factory.make_Domain(name="sub." + parent.name)
+        dns_update_zones({child.id}, set())
+        self.assertEqual(
+            {parent.name, child.name}, self.get_written_zone_names())
+
+    def test_update_zones_falls_back_to_full_reload_on_failure(self):
+        domain = factory.make_Domain()
+        self.bind_reload_zones.return_value = False
+        bind_reload = self.patch_autospec(dns_config_module, "bind_reload")
+        dns_update_zones({domain.id}, set())
+        self.assertThat(bind_reload, MockCalledOnceWith())
+
+    def test_get_affected_subnets_includes_overlapping_subnets(self):
+        small = factory.make_Subnet(cidr="10.1.0.0/24")
+        big = factory.make_Subnet(cidr="10.0.0.0/8")
+        factory.make_Subnet(cidr="192.168.0.0/24")
+        self.assertItemsEqual([small, big], get_affected_subnets({small.id}))
+
+    def test_get_affected_subnets_includes_subnets_sharing_a_zone(self):
+        first = factory.make_Subnet(cidr="10.1.0.0/25")
+        second = factory.make_Subnet(cidr="10.1.0.128/25")
+        self.assertItemsEqual(
+            [first, second], get_affected_subnets({first.id}))
+
+    def test_get_affected_subnets_returns_None_near_rfc2317_subnets(self):
+        subnet = factory.make_Subnet(cidr="10.1.0.0/24")
+        factory.make_Subnet(cidr="10.1.0.8/29", rdns_mode=RDNS_MODE.RFC2317)
+        self.assertIsNone(get_affected_subnets({subnet.id}))
+
+    def test_incremental_update_uses_fewer_queries_than_full_rebuild(self):
+        # A rough benchmark: with many domains and subnets, regenerating the
+        # zones touched by a single address must be much cheaper than
+        # regenerating every zone.
+        self.patch(dns_config_module, "bind_write_configuration")
+        self.patch(dns_config_module, "bind_write_options")
+        self.patch(dns_config_module, "bind_reload")
+        domains = [factory.make_Domain() for _ in range(10)]
+        subnets = [
+            factory.make_Subnet(cidr="10.%d.0.0/24" % index)
+            for index in range(10)
+        ]
+        for domain, subnet in zip(domains, subnets):
+            node = factory.make_Node(interface=True, domain=domain)
+            factory.make_StaticIPAddress(
+                alloc_type=IPADDRESS_TYPE.AUTO, subnet=subnet,
+                ip=factory.pick_ip_in_Subnet(subnet),
+                interface=node.get_boot_interface())
+        DNSPublication(source="Initial").save()
+        full_queries, _ = count_queries(
+            dns_config_module.ZoneGenerator(
+                Domain.objects.filter(authoritative=True),
+                subnets, 30, "1").as_list)
+        incremental_queries, _ = count_queries(
+            dns_update_zones, {domains[0].id}, {subnets[0].id})
+        self.assertLess(incremental_queries, full_queries)
+        self.assertEqual(
+            {domains[0].name, "0.0.10.in-addr.arpa"},
+            self.get_written_zone_names())
+
+
 class TestGetUpstreamDNS(MAASServerTestCase):
     """Test for maasserver/dns/config.py:get_upstream_dns()"""
 
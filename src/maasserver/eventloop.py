@@ -95,6 +95,11 @@ def make_DNSPublicationGarbageService():
     return publication.DNSPublicationGarbageService()
 
 
+def make_EventRetentionService():
+    from maasserver.regiondservices import event_retention
+    return event_retention.EventRetentionService()
+
+
 def make_StatusMonitorService():
     from maasserver import status_monitor
     return status_monitor.StatusMonitorService()
@@ -112,7 +117,12 @@ def make_ImportResourcesProgressService():
 
 def make_PostgresListenerService():
     from maasserver.listener import PostgresListenerService
-    return PostgresListenerService()
+    from maasserver.models import Config
+    from maasserver.models.subnet import allocation_cache
+    listener = PostgresListenerService()
+    Config.objects.cache.listen(listener)
+    allocation_cache.listen(listener)
+    return listener
 
 
 def make_RackControllerService(postgresListener, advertisingService):
@@ -228,6 +238,11 @@ class RegionEventLoop:
             "factory": make_DNSPublicationGarbageService,
             "requires": [],
         },
+        "event-retention": {
+            "only_on_master": True,
+            "factory": make_EventRetentionService,
+            "requires": [],
+        },
         "status-monitor": {
             "only_on_master": True,
             "factory": make_StatusMonitorService,
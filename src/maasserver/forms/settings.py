@@ -538,6 +538,17 @@ CONFIG_ITEMS = {
             'min_value': 1,
         },
     },
+    'events_retention_days': {
+        'default': 0,
+        'form': forms.IntegerField,
+        'form_kwargs': {
+            'required': False,
+            'label': (
+                "Number of days to keep node events; older events are "
+                "deleted. Set to 0 to keep all events"),
+            'min_value': 0,
+        },
+    },
     'http_boot': {
         'default': False,
         'form': forms.BooleanField,
@@ -8,12 +8,22 @@ __all__ = [
     "PostgresListenerService",
     ]
 
-from collections import defaultdict
+from collections import (
+    Counter,
+    defaultdict,
+    OrderedDict,
+)
 from contextlib import closing
 from errno import ENOENT
+from functools import partial
 
 from django.db import connections
 from django.db.utils import load_backend
+from provisioningserver.utils.debug import (
+    register_statistics,
+    report_counters,
+    unregister_statistics,
+)
 from provisioningserver.utils.enum import map_enum
 from provisioningserver.utils.twisted import (
     callOut,
@@ -78,6 +88,13 @@ class PostgresListenerService(Service, object):
         other times.
     :ivar disconnecting: a :class:`Deferred` while disconnecting, `None`
         at all other times.
+    :ivar notifyDelay: Seconds over which notifications are collected, and
+        duplicates collapsed, before being handled.
+    :ivar counters: A `Counter` of notifications "received" from postgres,
+        "coalesced" into an identical pending notification, and "delivered"
+        to handlers. A batch delivered to a batch handler counts once for
+        each notification in it. These are printed upon SIGUSR2 while the
+        service is running.
     """
 
     # Seconds to wait to handle new notifications. When the notifications set
@@ -85,9 +102,12 @@ class PostgresListenerService(Service, object):
     # notifications.
     HANDLE_NOTIFY_DELAY = 0.5
 
-    def __init__(self, alias="default"):
+    def __init__(self, alias="default", notifyDelay=HANDLE_NOTIFY_DELAY):
         self.alias = alias
+        self.notifyDelay = notifyDelay
         self.listeners = defaultdict(list)
+        self.batchHandlers = set()
+        self.counters = Counter()
         self.autoReconnect = False
         self.connection = None
         self.connectionFileno = None
@@ -103,14 +123,22 @@ class PostgresListenerService(Service, object):
         """Start the listener."""
         super(PostgresListenerService, self).startService()
         self.autoReconnect = True
+        register_statistics(
+            self.statisticsTitle, partial(report_counters, self.counters))
         return self.tryConnection()
 
     def stopService(self):
         """Stop the listener."""
         super(PostgresListenerService, self).stopService()
         self.autoReconnect = False
+        unregister_statistics(self.statisticsTitle)
         return self.loseConnection()
 
+    @property
+    def statisticsTitle(self):
+        """The title of this listener's counters upon SIGUSR2."""
+        return "PostgreSQL notifications (%s)" % self.alias
+
     def connected(self):
         """Return True if connected."""
         if self.connection is None:
@@ -178,8 +206,12 @@ class PostgresListenerService(Service, object):
                     else:
                         # Place non-system messages into the queue to be
                         # processed.
-                        self.notifications.add(
-                            (notify.channel, notify.payload))
+                        notification = (notify.channel, notify.payload)
+                        self.counters["received"] += 1
+                        if notification in self.notifications:
+                            self.counters["coalesced"] += 1
+                        else:
+                            self.notifications.add(notification)
                 # Delete the contents of the connection's notifies list so
                 # that we don't process them a second time.
                 del notifies[:]
@@ -206,11 +238,16 @@ class PostgresListenerService(Service, object):
         finally:
             self.connectionFileno = None
 
-    def register(self, channel, handler):
+    def register(self, channel, handler, batch=False):
         """Register listening for notifications from a channel.
 
         When a notification is received for that `channel` the `handler` will
         be called with the action and object id.
+
+        :param batch: When True, `handler` is instead called once for each
+            batch of notifications collected within `notifyDelay`, with a
+            list of `(action, object id)` tuples. Only supported on
+            non-system channels.
         """
         handlers = self.listeners[channel]
         if self.isSystemChannel(channel) and len(handlers) > 0:
@@ -223,6 +260,12 @@ class PostgresListenerService(Service, object):
                 "System channel '%s' has already been registered." % channel)
         else:
             handlers.append(handler)
+        if batch:
+            if self.isSystemChannel(channel):
+                raise PostgresListenerRegistrationError(
+                    "System channel '%s' cannot be registered for "
+                    "batches." % channel)
+            self.batchHandlers.add(handler)
         if self.registeredChannels and self.connection:
             # Channels have already been registered. Register the
             # new channel on the already existing connection.
@@ -239,6 +282,8 @@ class PostgresListenerService(Service, object):
         handlers = self.listeners[channel]
         if handler in handlers:
             handlers.remove(handler)
+            if handler not in handlers:
+                self.batchHandlers.discard(handler)
         else:
             raise PostgresListenerUnregistrationError(
                 "Handler is not registered on that channel '%s'." % channel)
@@ -297,7 +342,7 @@ class PostgresListenerService(Service, object):
                 else:
                     return failure
 
-            def connect(interval=self.HANDLE_NOTIFY_DELAY):
+            def connect(interval=self.notifyDelay):
                 d = deferToThread(self.startConnection)
                 d.addCallback(callOut, deferToThread, self.registerChannels)
                 d.addCallback(callOut, self.startReading)
@@ -408,33 +453,60 @@ class PostgresListenerService(Service, object):
             return succeed(None)
 
     def handleNotifies(self, clock=reactor):
-        """Process all notify message in the notifications set."""
-        def gen_notifications(notifications):
-            while len(notifications) != 0:
-                yield notifications.pop()
-        return task.coiterate(
-            self.handleNotify(notification, clock=clock)
-            for notification in gen_notifications(self.notifications))
-
-    def handleNotify(self, notification, clock=reactor):
-        """Process a notify message in the notifications set."""
-        channel, payload = notification
-        try:
-            channel, action = self.convertChannel(channel)
-        except PostgresListenerNotifyError:
-            # Log the error and continue processing the remaining
-            # notifications.
-            self.log.failure(
-                "Failed to convert channel {channel!r}.", channel=channel)
-        else:
-            defers = []
-            handlers = self.listeners[channel]
-            # XXX: There could be an arbitrary number of listeners. Should we
-            # limit concurrency here? Perhaps even do one at a time.
-            for handler in handlers:
-                d = defer.maybeDeferred(handler, action, payload)
-                d.addErrback(lambda failure: self.log.failure(
-                    "Failure while handling notification to {channel!r}: "
-                    "{payload!r}", failure, channel=channel, payload=payload))
-                defers.append(d)
-            return defer.DeferredList(defers)
+        """Process all notify message in the notifications set.
+
+        Notifications are grouped by channel. Handlers registered with
+        `batch=True` are called once per channel with all of the channel's
+        notifications; other handlers are called once per notification.
+        """
+        batches = OrderedDict()
+        while len(self.notifications) != 0:
+            channel, payload = self.notifications.pop()
+            try:
+                channel, action = self.convertChannel(channel)
+            except PostgresListenerNotifyError:
+                # Log the error and continue processing the remaining
+                # notifications.
+                self.log.failure(
+                    "Failed to convert channel {channel!r}.", channel=channel)
+            else:
+                batches.setdefault(channel, []).append((action, payload))
+
+        def gen_deliveries():
+            for channel, notifies in batches.items():
+                handlers = self.listeners[channel]
+                batch_handlers = [
+                    handler for handler in handlers
+                    if handler in self.batchHandlers
+                ]
+                if len(batch_handlers) != 0:
+                    yield self.deliverNotify(
+                        channel, batch_handlers, notifies, notifies)
+                other_handlers = [
+                    handler for handler in handlers
+                    if handler not in self.batchHandlers
+                ]
+                if len(other_handlers) != 0:
+                    for action, payload in notifies:
+                        yield self.deliverNotify(
+                            channel, other_handlers, [(action, payload)],
+                            action, payload)
+
+        return task.coiterate(gen_deliveries())
+
+    def deliverNotify(self, channel, handlers, notifies, *args):
+        """Call each of `handlers` with `args`.
+
+        :param notifies: The `(action, payload)` tuples being delivered.
+        """
+        defers = []
+        # XXX: There could be an arbitrary number of listeners. Should we
+        # limit concurrency here? Perhaps even do one at a time.
+        for handler in handlers:
+            self.counters["delivered"] += len(notifies)
+            d = defer.maybeDeferred(handler, *args)
+            d.addErrback(lambda failure: self.log.failure(
+                "Failure while handling notification to {channel!r}: "
+                "{payload!r}", failure, channel=channel, payload=notifies))
+            defers.append(d)
+        return defer.DeferredList(defers)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import (
+    migrations,
+    models,
+)
+
+
+class Migration(migrations.Migration):
+
+    # The index is built concurrently, which cannot be done in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('maasserver', '0125_dnspublication_touched_zones'),
+    ]
+
+    operations = [
+        # Without a default, adding the column does not rewrite the table.
+        # Existing events are given their type's level in batches by the
+        # event-retention service.
+        migrations.AddField(
+            model_name='event',
+            name='level',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+                    "maasserver_event_level_id_727db5d1_idx "
+                    "ON maasserver_event (level, id)",
+                    "DROP INDEX IF EXISTS "
+                    "maasserver_event_level_id_727db5d1_idx",
+                ),
+            ],
+            state_operations=[
+                migrations.AlterIndexTogether(
+                    name='event',
+                    index_together=set([('node', 'id'), ('level', 'id')]),
+                ),
+            ],
+        ),
+    ]
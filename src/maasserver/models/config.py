@@ -8,22 +8,33 @@ __all__ = [
     ]
 
 from collections import (
+    Counter,
     defaultdict,
     namedtuple,
 )
 import copy
 from datetime import timedelta
+from functools import partial
 from socket import gethostname
+import threading
 
+from django.db import connection
 from django.db.models import (
     CharField,
     Manager,
     Model,
 )
-from django.db.models.signals import post_save
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+)
 from maasserver import DefaultMeta
 from maasserver.fields import JSONObjectField
 from provisioningserver.drivers.osystem.ubuntu import UbuntuOS
+from provisioningserver.utils.debug import (
+    register_statistics,
+    report_counters,
+)
 
 
 DEFAULT_OS = UbuntuOS()
@@ -103,6 +114,8 @@ def get_default_config():
         # Notifications.
         'subnet_ip_exhaustion_threshold_count': 16,
         'http_boot': True,
+        # Events.
+        'events_retention_days': 0,
     }
 
 
@@ -114,6 +127,123 @@ NetworkDiscoveryConfig = namedtuple(
     'NetworkDiscoveryConfig', ('active', 'passive'))
 
 
+class ConfigCache:
+    """A process-wide cache of every `Config` value.
+
+    Values are only cached once `listen` has been called, and only while
+    that listener is connected to the database. Every change to a config
+    value is announced on the ``sys_config`` channel with the ID of the
+    transaction that made it, and discards the cache. Values are loaded
+    again in one query, and kept only when loaded in a transaction that
+    can see every change announced so far. A transaction that changes
+    config values therefore reads them from the database until it ends,
+    and sees its own changes.
+
+    Changes made by other processes are seen once their announcement has
+    been received, not as soon as they are committed.
+
+    :ivar counters: A `Counter` of "hits", config values found in the
+        cache, and "misses", config values loaded from the database
+        because the cache was empty or could not be used. These are
+        printed upon SIGUSR2 once `listen` has been called.
+    """
+
+    def __init__(self):
+        super(ConfigCache, self).__init__()
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._listener = None
+        # The listener's connection on which the last change was announced.
+        # Changes made while it was disconnected may not have been seen.
+        self._listening = None
+        # The ID of the most recent transaction to change a config value.
+        self._latest = None
+        # Incremented every time the cache is discarded.
+        self._generation = 0
+        self._values = None
+
+    def listen(self, listener):
+        """Cache config values for as long as `listener` is connected.
+
+        :type listener: `PostgresListenerService`
+        """
+        listener.register("sys_config", self._changedElsewhere)
+        register_statistics(
+            "Config cache", partial(report_counters, self.counters))
+        with self._lock:
+            self._listener = listener
+            self._discard(None)
+
+    def _discard(self, txid):
+        """Discard cached values; `txid` is the transaction changing them.
+
+        Call with the lock held.
+        """
+        self._values = None
+        self._generation += 1
+        if txid is not None:
+            if self._latest is None or txid > self._latest:
+                self._latest = txid
+
+    def _changedElsewhere(self, channel, payload):
+        """Called by the listener when a transaction changes config."""
+        with self._lock:
+            self._listening = self._listener.connection
+            self._discard(int(payload))
+
+    def _changedHere(self, sender, instance, **kwargs):
+        """Called when this process changes config."""
+        if self._listener is not None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT txid_current()")
+                [txid] = cursor.fetchone()
+            with self._lock:
+                self._discard(txid)
+
+    def get_values(self):
+        """Return a dict of every config value that has been set.
+
+        :return: The dict, which must not be modified, or `None` when
+            config values cannot be cached.
+        """
+        if self._listener is None:
+            return None
+        with self._lock:
+            listening = self._listener.connection
+            if listening is None:
+                return None  # Changes are not being announced.
+            elif self._values is not None and listening is self._listening:
+                self.counters["hits"] += 1
+                return self._values
+            else:
+                self.counters["misses"] += 1
+                generation = self._generation
+                latest = self._latest
+                synchronised = listening is self._listening
+        with connection.cursor() as cursor:
+            if synchronised:
+                # Every transaction that changed config must have ended
+                # before this transaction's snapshot was taken.
+                cursor.execute(
+                    "SELECT %s < txid_snapshot_xmin(txid_current_snapshot())",
+                    [latest])
+                [complete] = cursor.fetchone()
+            else:
+                # Changes may have been missed while the listener was not
+                # connected. Announce this transaction as a change, so that
+                # transactions that can see it can also see every change
+                # made before the listener connected.
+                cursor.execute(
+                    "SELECT pg_notify('sys_config', txid_current()::text)")
+                complete = False
+        values = dict(Config.objects.values_list("name", "value"))
+        if complete:
+            with self._lock:
+                if self._generation == generation:
+                    self._values = values
+        return values
+
+
 class ConfigManager(Manager):
     """Manager for Config model class.
 
@@ -123,6 +253,7 @@ class ConfigManager(Manager):
     def __init__(self):
         super(ConfigManager, self).__init__()
         self._config_changed_connections = defaultdict(set)
+        self.cache = ConfigCache()
 
     def get_config(self, name, default=None):
         """Return the config value corresponding to the given config name.
@@ -137,6 +268,12 @@ class ConfigManager(Manager):
         :return: A config value.
         :raises: Config.MultipleObjectsReturned
         """
+        values = self.cache.get_values()
+        if values is not None:
+            if name in values:
+                return copy.deepcopy(values[name])
+            else:
+                return copy.deepcopy(DEFAULT_CONFIG.get(name, default))
         try:
             return self.get(name=name).value
         except Config.DoesNotExist:
@@ -187,8 +324,8 @@ class ConfigManager(Manager):
         self._config_changed_connections[config_name].discard(method)
 
     def _config_changed(self, sender, instance, created, **kwargs):
-        for connection in self._config_changed_connections[instance.name]:
-            connection(sender, instance, created, **kwargs)
+        for method in self._config_changed_connections[instance.name]:
+            method(sender, instance, created, **kwargs)
 
     def get_network_discovery_config_from_value(self, value):
         """Given the configuration value for `network_discovery`, return
@@ -228,3 +365,7 @@ class Config(Model):
 
 # Connect config manager's _config_changed to Config's post-save signal.
 post_save.connect(Config.objects._config_changed, sender=Config)
+
+# Discard cached config values when they change.
+post_save.connect(Config.objects.cache._changedHere, sender=Config)
+post_delete.connect(Config.objects.cache._changedHere, sender=Config)
@@ -9,6 +9,7 @@ __all__ = [
 
 from datetime import datetime
 
+from django.contrib.postgres.fields import ArrayField
 from django.core.validators import (
     MaxValueValidator,
     MinValueValidator,
@@ -21,6 +22,7 @@ from django.db.models.fields import (
     BigIntegerField,
     CharField,
     DateTimeField,
+    IntegerField,
 )
 from maasserver import DefaultMeta
 from maasserver.sequence import (
@@ -68,6 +70,30 @@ class DNSPublicationManager(Manager):
                 candidates = candidates.filter(created__lt=cutoff)
             candidates.delete()
 
+    def get_changes_since(self, publication_id):
+        """Return the domains and subnets touched since `publication_id`.
+
+        Publications made by the tracked DNS triggers record the IDs of the
+        domains and subnets whose zones they affect. Anything else, like a
+        change to a domain, a subnet's CIDR, or DNS configuration, leaves
+        these unset and requires that all zones are rebuilt.
+
+        :return: A ``(domain_ids, subnet_ids)`` tuple of sets, or `None` when
+            all zones must be rebuilt, including when the publication with
+            `publication_id` has been garbage collected.
+        """
+        if not self.filter(id=publication_id).exists():
+            return None
+        domain_ids, subnet_ids = set(), set()
+        publications = self.filter(id__gt=publication_id).values_list(
+            "touched_domains", "touched_subnets")
+        for touched_domains, touched_subnets in publications:
+            if touched_domains is None or touched_subnets is None:
+                return None
+            domain_ids.update(touched_domains)
+            subnet_ids.update(touched_subnets)
+        return domain_ids, subnet_ids
+
 
 class DNSPublication(Model):
     """A row in this table denotes a DNS publication request.
@@ -101,3 +127,11 @@ class DNSPublication(Model):
     source = CharField(
         editable=False, max_length=255, null=False, blank=True,
         help_text="A brief explanation why DNS was published.")
+
+    # The IDs of the domains and subnets whose zones are affected by this
+    # publication. These are set by the tracked DNS triggers; when either is
+    # NULL, every zone must be regenerated.
+    touched_domains = ArrayField(
+        IntegerField(), editable=False, null=True, blank=True, default=None)
+    touched_subnets = ArrayField(
+        IntegerField(), editable=False, null=True, blank=True, default=None)
@@ -9,9 +9,11 @@ __all__ = [
 
 import logging
 
+from django.db import connection
 from django.db.models import (
     CASCADE,
     ForeignKey,
+    IntegerField,
     Manager,
     TextField,
 )
@@ -27,6 +29,13 @@ from provisioningserver.utils.env import get_maas_id
 
 maaslog = get_maas_logger('models.event')
 
+# The most events deleted by `EventManager.delete_older_than` at once. This
+# keeps each transaction, and the locks it holds, short.
+EVENT_DELETE_BATCH_SIZE = 10000
+
+# The most events given a level by `EventManager.fill_levels` at once.
+EVENT_FILL_LEVEL_BATCH_SIZE = 10000
+
 
 class EventManager(Manager):
     """A utility to manage the collection of Events."""
@@ -65,12 +74,56 @@ class EventManager(Manager):
             system_id=get_maas_id(), event_type=event_type,
             event_description=event_description)
 
+    def delete_older_than(self, cutoff, limit=EVENT_DELETE_BATCH_SIZE):
+        """Delete events created before `cutoff` from the oldest `limit`.
+
+        Only the oldest `limit` events, by ID, are considered, so this never
+        scans more than `limit` rows, even when there's nothing to delete.
+        Call this repeatedly, in separate transactions, until it returns
+        fewer than `limit` to delete all events created before `cutoff`.
+
+        :return: The number of events deleted.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""\
+                DELETE FROM maasserver_event WHERE id IN (
+                    SELECT id FROM maasserver_event ORDER BY id LIMIT %s)
+                AND created < %s
+                """, [limit, cutoff])
+            return cursor.rowcount
+
+    def fill_levels(self, limit=EVENT_FILL_LEVEL_BATCH_SIZE):
+        """Copy their type's level to up to `limit` events without one.
+
+        Events created before the level was recorded have none. The (level,
+        id) index finds them without scanning the table. Call this
+        repeatedly, in separate transactions, until it returns fewer than
+        `limit` to fill in every event.
+
+        :return: The number of events updated.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""\
+                UPDATE maasserver_event AS event
+                SET level = eventtype.level
+                FROM maasserver_eventtype AS eventtype
+                WHERE event.id IN (
+                    SELECT id FROM maasserver_event
+                    WHERE level IS NULL ORDER BY id LIMIT %s)
+                AND event.type_id = eventtype.id
+                """, [limit])
+            return cursor.rowcount
+
 
 class Event(CleanSave, TimestampedModel):
     """An `Event` represents a MAAS event.
 
     :ivar type: The event's type.
     :ivar node: The node of the event.
+    :ivar level: Severity of the event; a copy of the type's level, so that
+        events can be filtered by level without joining onto their types.
+        `None` for old events that have not been given one yet; see
+        `EventManager.fill_levels`.
     :ivar description: A free-form description of the event.
     """
 
@@ -79,6 +132,8 @@ class Event(CleanSave, TimestampedModel):
 
     node = ForeignKey('Node', null=False, editable=False, on_delete=CASCADE)
 
+    level = IntegerField(null=True, editable=False)
+
     action = TextField(default='', blank=True, editable=False)
 
     description = TextField(default='', blank=True, editable=False)
@@ -89,8 +144,14 @@ class Event(CleanSave, TimestampedModel):
         verbose_name = "Event record"
         index_together = (
             ("node", "id"),
+            ("level", "id"),
         )
 
+    def save(self, *args, **kwargs):
+        if self.level is None:
+            self.level = self.type.level
+        return super(Event, self).save(*args, **kwargs)
+
     def __str__(self):
         return "%s (node=%s, type=%s, created=%s)" % (
             self.id, self.node, self.type.name, self.created)
@@ -18,8 +18,10 @@ __all__ = [
     "nodes",
     "partitions",
     "power",
+    "preseed",
     "services",
     "staticipaddress",
+    "subnets",
 ]
 
 from maasserver.models.signals import (
@@ -37,6 +39,8 @@ from maasserver.models.signals import (
     nodes,
     partitions,
     power,
+    preseed,
     services,
     staticipaddress,
+    subnets,
 )
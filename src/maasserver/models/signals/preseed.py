@@ -0,0 +1,147 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Discard rendered configuration when the models it derives from change."""
+
+__all__ = [
+    "signals",
+]
+
+from django.contrib.auth.models import User
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+)
+from maasserver.models import (
+    Bcache,
+    BlockDevice,
+    BondInterface,
+    BootResource,
+    BootResourceFile,
+    BootResourceSet,
+    BridgeInterface,
+    CacheSet,
+    Config,
+    Controller,
+    Device,
+    Domain,
+    Fabric,
+    Filesystem,
+    FilesystemGroup,
+    Interface,
+    LargeFile,
+    LicenseKey,
+    Machine,
+    Node,
+    PackageRepository,
+    Partition,
+    PartitionTable,
+    PhysicalBlockDevice,
+    PhysicalInterface,
+    RackController,
+    RAID,
+    RegionController,
+    Space,
+    StaticIPAddress,
+    Subnet,
+    UnknownInterface,
+    VirtualBlockDevice,
+    VLAN,
+    VLANInterface,
+    VolumeGroup,
+)
+from maasserver.models.interface import InterfaceRelationship
+from maasserver.utils.signals import SignalsManager
+from metadataserver.models.nodekey import NodeKey
+
+
+NODE_CLASSES = {
+    Node,
+    Machine,
+    Device,
+    Controller,
+    RackController,
+    RegionController,
+}
+
+# Models that belong to a single node, through `node_id`.
+NODE_PART_CLASSES = {
+    Interface,
+    PhysicalInterface,
+    BondInterface,
+    BridgeInterface,
+    VLANInterface,
+    UnknownInterface,
+    BlockDevice,
+    PhysicalBlockDevice,
+    VirtualBlockDevice,
+    NodeKey,
+}
+
+# Models that may affect what is rendered for any node.
+SHARED_CLASSES = {
+    InterfaceRelationship,
+    StaticIPAddress,
+    PartitionTable,
+    Partition,
+    Filesystem,
+    FilesystemGroup,
+    VolumeGroup,
+    RAID,
+    Bcache,
+    CacheSet,
+    Config,
+    PackageRepository,
+    LicenseKey,
+    Domain,
+    Space,
+    Fabric,
+    VLAN,
+    Subnet,
+    BootResource,
+    BootResourceSet,
+    BootResourceFile,
+    LargeFile,
+}
+
+signals = SignalsManager()
+
+
+def discard_rendered_for_node(sender, instance, **kwargs):
+    """Discard what has been rendered for the node."""
+    from maasserver.preseed import discard_rendered
+    discard_rendered(instance.id)
+
+
+def discard_rendered_for_node_part(sender, instance, **kwargs):
+    """Discard what has been rendered for the node that owns `instance`."""
+    from maasserver.preseed import discard_rendered
+    discard_rendered(instance.node_id)
+
+
+def discard_rendered_for_owner(sender, instance, **kwargs):
+    """Discard what has been rendered for the nodes owned by `instance`."""
+    from maasserver.preseed import discard_rendered
+    owned = Node.objects.filter(owner_id=instance.id)
+    for node_id in owned.values_list("id", flat=True):
+        discard_rendered(node_id)
+
+
+def discard_rendered_for_all(sender, instance, **kwargs):
+    """Discard what has been rendered for every node."""
+    from maasserver.preseed import discard_rendered
+    discard_rendered()
+
+
+for signal in post_save, post_delete:
+    for klass in NODE_CLASSES:
+        signals.watch(signal, discard_rendered_for_node, sender=klass)
+    for klass in NODE_PART_CLASSES:
+        signals.watch(signal, discard_rendered_for_node_part, sender=klass)
+    for klass in SHARED_CLASSES:
+        signals.watch(signal, discard_rendered_for_all, sender=klass)
+    signals.watch(signal, discard_rendered_for_owner, sender=User)
+
+
+# Enable all signals by default.
+signals.enable()
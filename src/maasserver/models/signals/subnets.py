@@ -0,0 +1,32 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Discard cached free addresses when subnets, ranges, or routes change."""
+
+__all__ = [
+    "signals",
+]
+
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+)
+from maasserver.models import (
+    IPRange,
+    StaticRoute,
+    Subnet,
+)
+from maasserver.models.subnet import allocation_cache
+from maasserver.utils.signals import SignalsManager
+
+
+signals = SignalsManager()
+
+
+for signal in post_save, post_delete:
+    for klass in Subnet, IPRange, StaticRoute:
+        signals.watch(signal, allocation_cache._changedHere, sender=klass)
+
+
+# Enable all signals by default.
+signals.enable()
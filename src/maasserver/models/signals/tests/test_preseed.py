@@ -0,0 +1,62 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Test the discarding of rendered configuration by signals."""
+
+__all__ = []
+
+from maasserver import preseed as preseed_module
+from maasserver.models import Config
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from maastesting.matchers import (
+    MockAnyCall,
+    MockCalledOnceWith,
+)
+
+
+class TestPreseedSignals(MAASServerTestCase):
+
+    def setUp(self):
+        super(TestPreseedSignals, self).setUp()
+        self.discard_rendered = self.patch_autospec(
+            preseed_module, "discard_rendered")
+
+    def test_saving_node_discards_its_renderings(self):
+        node = factory.make_Node()
+        self.discard_rendered.reset_mock()
+        node.save()
+        self.assertThat(self.discard_rendered, MockAnyCall(node.id))
+
+    def test_saving_interface_discards_renderings_for_its_node(self):
+        node = factory.make_Node()
+        interface = factory.make_Interface(node=node)
+        self.discard_rendered.reset_mock()
+        interface.save()
+        self.assertThat(self.discard_rendered, MockAnyCall(node.id))
+
+    def test_deleting_block_device_discards_renderings_for_its_node(self):
+        node = factory.make_Node()
+        block_device = factory.make_PhysicalBlockDevice(node=node)
+        self.discard_rendered.reset_mock()
+        block_device.delete()
+        self.assertThat(self.discard_rendered, MockAnyCall(node.id))
+
+    def test_setting_config_discards_all_renderings(self):
+        self.discard_rendered.reset_mock()
+        Config.objects.set_config("curtin_verbose", True)
+        self.assertThat(self.discard_rendered, MockAnyCall())
+
+    def test_saving_boot_resource_discards_all_renderings(self):
+        resource = factory.make_BootResource()
+        self.discard_rendered.reset_mock()
+        resource.save()
+        self.assertThat(self.discard_rendered, MockAnyCall())
+
+    def test_saving_owner_discards_renderings_for_their_nodes(self):
+        owner = factory.make_User()
+        node = factory.make_Node(owner=owner)
+        self.discard_rendered.reset_mock()
+        owner.email = factory.make_email_address()
+        owner.save()
+        self.assertThat(self.discard_rendered, MockCalledOnceWith(node.id))
@@ -0,0 +1,47 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Test the discarding of cached free addresses by signals."""
+
+__all__ = []
+
+from unittest.mock import sentinel
+
+from maasserver.enum import IPRANGE_TYPE
+from maasserver.models.subnet import allocation_cache
+from maasserver.testing.factory import factory
+from maasserver.testing.listener import FakePostgresListenerService
+from maasserver.testing.testcase import MAASServerTestCase
+
+
+class TestSubnetsSignals(MAASServerTestCase):
+
+    def setUp(self):
+        super(TestSubnetsSignals, self).setUp()
+        self.subnet = factory.make_Subnet(
+            cidr="10.0.0.0/24", gateway_ip=None, dns_servers=None,
+            managed=True)
+        self.route = factory.make_StaticRoute(source=self.subnet)
+        listener = FakePostgresListenerService()
+        listener.connection = sentinel.connection
+        self.patch(allocation_cache, "_listener", listener)
+        self.patch(allocation_cache, "_listening", listener.connection)
+        self.patch(allocation_cache, "_latest", 1)
+        allocation_cache.clear()
+        self.addCleanup(allocation_cache.clear)
+        allocation_cache.pick(self.subnet)
+        self.assertIn(self.subnet.id, allocation_cache._entries)
+
+    def test_saving_subnet_discards_free_addresses(self):
+        self.subnet.save()
+        self.assertNotIn(self.subnet.id, allocation_cache._entries)
+
+    def test_creating_iprange_discards_free_addresses(self):
+        factory.make_IPRange(
+            self.subnet, start_ip="10.0.0.10", end_ip="10.0.0.20",
+            type=IPRANGE_TYPE.RESERVED)
+        self.assertNotIn(self.subnet.id, allocation_cache._entries)
+
+    def test_deleting_static_route_discards_free_addresses(self):
+        self.route.delete()
+        self.assertNotIn(self.subnet.id, allocation_cache._entries)
@@ -49,7 +49,10 @@ from maasserver.fields import MAASIPAddressField
 from maasserver.models.cleansave import CleanSave
 from maasserver.models.config import Config
 from maasserver.models.domain import Domain
-from maasserver.models.subnet import Subnet
+from maasserver.models.subnet import (
+    allocation_cache,
+    Subnet,
+)
 from maasserver.models.timestampedmodel import TimestampedModel
 from maasserver.utils import orm
 from maasserver.utils.dns import get_ip_based_hostname
@@ -195,6 +198,9 @@ class StaticIPAddressManager(Manager):
                 # retry with the `address_allocation` lock. We can't take it
                 # here because we're already in a transaction; we need to exit
                 # the transaction, take the lock, and only then try again.
+                # The cached addresses in use on the subnet are out of date.
+                if subnet is not None:
+                    allocation_cache.discard(subnet.id)
                 orm.request_transaction_retry(locks.address_allocation)
             else:
                 raise
@@ -205,6 +211,8 @@ class StaticIPAddressManager(Manager):
             # address and nothing else.
             ipaddress.user = user
             ipaddress.save()
+            if subnet is not None:
+                subnet.record_allocated_ip(ipaddress.ip)
             return ipaddress
 
     def allocate_new(
@@ -8,7 +8,14 @@ __all__ = [
     'Subnet',
 ]
 
+from bisect import (
+    bisect_left,
+    bisect_right,
+    insort,
+)
+from collections import Counter
 from operator import attrgetter
+import threading
 from typing import (
     Iterable,
     Optional,
@@ -20,6 +27,7 @@ from django.core.exceptions import (
     ValidationError,
 )
 from django.core.validators import RegexValidator
+from django.db import connection
 from django.db.models import (
     BooleanField,
     CharField,
@@ -78,6 +86,388 @@ SUBNET_NAME_VALIDATOR = RegexValidator('^[.: \w/-]+$')
 IPAddressExcludeList = Optional[Iterable[MaybeIPAddress]]
 
 
+class FreeAddresses:
+    """The addresses on a subnet that are free to be allocated.
+
+    Free addresses are kept as a sorted list of ranges, so that allocating
+    or releasing an address is a binary search followed by changing,
+    splitting, or joining one range. The ranges are also indexed by size,
+    so that the smallest can be found without looking at the others.
+
+    :param network: The subnet's `IPNetwork`.
+    :param in_use: A `MAASIPSet` of every address in use on the subnet.
+    :param reserved: A `MAASIPSet` of the addresses in use on the subnet
+        for reasons other than being assigned, like ranges and gateways;
+        these remain in use when an address within them is released.
+    """
+
+    def __init__(self, network, in_use, reserved):
+        super(FreeAddresses, self).__init__()
+        self._firsts, self._lasts, self._sizes = [], [], []
+        free = in_use.get_unused_ranges(network)
+        for index, free_range in enumerate(free.ranges):
+            self._insert(index, free_range.first, free_range.last)
+        self._reserved_firsts = [
+            reserved_range.first for reserved_range in reserved.ranges]
+        self._reserved_lasts = [
+            reserved_range.last for reserved_range in reserved.ranges]
+        # The addresses that may be allocated at all; this skips network
+        # and broadcast addresses as `get_unused_ranges` does.
+        usable = MAASIPSet([]).get_unused_ranges(network).ranges
+        if len(usable) == 0:
+            self._usable = range(0)
+        else:
+            self._usable = range(usable[0].first, usable[0].last + 1)
+
+    def _insert(self, index, first, last):
+        """Insert the free range `first` to `last` at `index`."""
+        self._firsts.insert(index, first)
+        self._lasts.insert(index, last)
+        insort(self._sizes, (last - first + 1, first))
+
+    def _delete(self, index):
+        """Delete the free range at `index`."""
+        first, last = self._firsts.pop(index), self._lasts.pop(index)
+        del self._sizes[bisect_left(self._sizes, (last - first + 1, first))]
+
+    def allocate(self, address: int):
+        """Record that `address` is in use."""
+        index = bisect_right(self._firsts, address) - 1
+        if index < 0 or address > self._lasts[index]:
+            return  # Already in use.
+        first, last = self._firsts[index], self._lasts[index]
+        self._delete(index)
+        if address < last:
+            self._insert(index, address + 1, last)
+        if first < address:
+            self._insert(index, first, address - 1)
+
+    def release(self, address: int):
+        """Record that `address` is no longer assigned."""
+        if address not in self._usable:
+            return  # Never free.
+        index = bisect_right(self._reserved_firsts, address) - 1
+        if index >= 0 and address <= self._reserved_lasts[index]:
+            return  # Still in use.
+        index = bisect_right(self._firsts, address) - 1
+        if index >= 0 and address <= self._lasts[index]:
+            return  # Already free.
+        first = last = address
+        if (index + 1 < len(self._firsts) and
+                self._firsts[index + 1] == address + 1):
+            last = self._lasts[index + 1]
+            self._delete(index + 1)
+        if index >= 0 and self._lasts[index] == address - 1:
+            first = self._firsts[index]
+            self._delete(index)
+            index -= 1
+        self._insert(index + 1, first, last)
+
+    def reserve(self, address: int):
+        """Record that `address` is in use, and remains so when released."""
+        if address not in self._usable:
+            return  # Never free.
+        index = bisect_right(self._reserved_firsts, address) - 1
+        if index < 0 or address > self._reserved_lasts[index]:
+            self._reserved_firsts.insert(index + 1, address)
+            self._reserved_lasts.insert(index + 1, address)
+        self.allocate(address)
+
+    def pick(self, exclude: Iterable[int]=()) -> Optional[int]:
+        """Return the first address of the smallest free range.
+
+        Addresses in `exclude` are treated as in use, splitting the free
+        ranges they fall within. Of ranges the same size, the one with the
+        lowest addresses is picked.
+
+        :return: The address, or `None` if there are no free addresses.
+        """
+        exclude = sorted(set(exclude))
+        best = None  # (size, first address)
+        # Split the ranges that excluded addresses fall within.
+        split = set()
+        for address in exclude:
+            index = bisect_right(self._firsts, address) - 1
+            if index >= 0 and address <= self._lasts[index]:
+                split.add(index)
+        for index in split:
+            first, last = self._firsts[index], self._lasts[index]
+            lower = bisect_left(exclude, first)
+            upper = bisect_right(exclude, last)
+            start = first
+            for address in exclude[lower:upper] + [last + 1]:
+                if address > start:
+                    piece = (address - start, start)
+                    if best is None or piece < best:
+                        best = piece
+                start = address + 1
+        # Any other range can be taken whole; the smallest is first.
+        for piece in self._sizes:
+            if best is not None and piece >= best:
+                break
+            if bisect_left(self._firsts, piece[1]) not in split:
+                best = piece
+                break
+        return None if best is None else best[1]
+
+
+class SubnetAddresses:
+    """The free addresses on a subnet, with and without its neighbours.
+
+    :param network: The subnet's `IPNetwork`.
+    :param in_use: A `MAASIPSet` of every address in use on the subnet.
+    :param reserved: A `MAASIPSet` of the addresses in use on the subnet
+        for reasons other than being assigned.
+    :param neighbours: A `MAASIPSet` of the addresses of neighbours that
+        have been observed on the subnet.
+    """
+
+    def __init__(self, network, in_use, reserved, neighbours):
+        super(SubnetAddresses, self).__init__()
+        self.free = FreeAddresses(network, in_use, reserved)
+        self.unobserved = FreeAddresses(
+            network, MAASIPSet(list(in_use.ranges) + list(neighbours.ranges)),
+            MAASIPSet(list(reserved.ranges) + list(neighbours.ranges)))
+
+    def allocate(self, address: int):
+        """Record that `address` is in use."""
+        self.free.allocate(address)
+        self.unobserved.allocate(address)
+
+    def release(self, address: int):
+        """Record that `address` is no longer assigned."""
+        self.free.release(address)
+        self.unobserved.release(address)
+
+    def observe(self, address: int):
+        """Record that a neighbour has been observed using `address`."""
+        self.unobserved.reserve(address)
+
+    def pick(
+            self, exclude: Iterable[int]=(),
+            avoid_neighbours: bool=True) -> Optional[int]:
+        """Return the next address to allocate.
+
+        See `FreeAddresses.pick`.
+        """
+        if avoid_neighbours:
+            return self.unobserved.pick(exclude)
+        else:
+            return self.free.pick(exclude)
+
+
+class AllocationCache:
+    """Cache of the free addresses on subnets, for address allocation.
+
+    Working out which addresses are free on a large subnet means loading
+    every address, range, route and neighbour on it, so the
+    `SubnetAddresses` of each subnet are kept between allocations. They are
+    only kept once `listen` has been called, and only while that listener
+    is connected to the database.
+
+    Every change to the addresses in use on a subnet is announced on the
+    ``sys_subnet_allocation`` channel with the ID of the transaction that
+    made it. Addresses assigned and released, and neighbours observed, are
+    applied to the cached entry one at a time; any other change, like a
+    new range or route, discards the entry. Addresses allocated by this
+    process are applied as soon as they are saved. An entry is loaded from
+    the database and kept only when loaded in a transaction that can see
+    every change announced so far, and every allocation and change made by
+    this process; see `ConfigCache`, which works the same way.
+
+    The unique constraint on `StaticIPAddress.ip` remains the final
+    arbiter; an entry is discarded when an allocation from it collides.
+
+    :ivar counters: A `Counter` of "hits", entries found in the cache, and
+        "misses", entries loaded from the database.
+    """
+
+    def __init__(self):
+        super(AllocationCache, self).__init__()
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._listener = None
+        # The listener's connection on which the last change was announced.
+        # Changes made while it was disconnected may not have been seen.
+        self._listening = None
+        # The ID of the most recent transaction to change any subnet.
+        self._latest = None
+        # Incremented every time a change is announced or made.
+        self._generation = 0
+        self._entries = {}
+
+    def listen(self, listener):
+        """Cache free addresses for as long as `listener` is connected.
+
+        :type listener: `PostgresListenerService`
+        """
+        listener.register("sys_subnet_allocation", self._changedElsewhere)
+        with self._lock:
+            self._listener = listener
+            self._changed(None)
+            self._entries.clear()
+
+    def _changed(self, txid):
+        """Record a change made by transaction `txid`.
+
+        Call with the lock held.
+        """
+        self._generation += 1
+        if txid is not None:
+            if self._latest is None or txid > self._latest:
+                self._latest = txid
+
+    def _changedElsewhere(self, channel, payload):
+        """Called by the listener when a transaction changes a subnet.
+
+        The payload is the ID of the subnet and of the transaction, then,
+        when an address was assigned or released or a neighbour observed,
+        "+", "-", or "*" followed by the address, and the ID of the row.
+        """
+        subnet_id, txid, *change = payload.split()
+        subnet_id, txid = int(subnet_id), int(txid)
+        with self._lock:
+            listening = self._listener.connection
+            if listening is not self._listening:
+                # Entries loaded before this connection can't be trusted.
+                self._listening = listening
+                self._entries.clear()
+            self._changed(txid)
+            entry = self._entries.get(subnet_id)
+            if entry is None:
+                pass  # Nothing to update.
+            elif len(change) == 0:
+                del self._entries[subnet_id]
+            elif change[0].startswith("+"):
+                entry.allocate(int(IPAddress(change[0][1:])))
+            elif change[0].startswith("*"):
+                entry.observe(int(IPAddress(change[0][1:])))
+            else:
+                entry.release(int(IPAddress(change[0][1:])))
+
+    def _changedHere(self, sender, instance, **kwargs):
+        """Called when this process changes a subnet, range, or route."""
+        if self._listener is not None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT txid_current()")
+                [txid] = cursor.fetchone()
+            with self._lock:
+                self._changed(txid)
+                self._entries.clear()
+
+    def _load(self, subnet):
+        network = subnet.get_ipnetwork()
+        reserved = subnet.get_ipranges_in_use(ignore_allocated_ips=True)
+        in_use = MAASIPSet(list(reserved.ranges) + list(
+            subnet._get_ranges_for_allocated_ips(network, False)))
+        # Every neighbour observed on the subnet's VLAN, known or not, as
+        # the triggers announce them; known addresses are in use anyway.
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT DISTINCT neigh.ip
+                FROM maasserver_neighbour AS neigh
+                JOIN maasserver_interface AS iface
+                    ON neigh.interface_id = iface.id
+                WHERE iface.vlan_id = %s AND neigh.ip << %s
+                """, [subnet.vlan_id, str(network)])
+            neighbours = MAASIPSet([
+                make_iprange(ip, purpose="neighbour")
+                for ip, in cursor.fetchall()
+            ])
+        return SubnetAddresses(network, in_use, reserved, neighbours)
+
+    def _get(self, subnet):
+        """Return `subnet`'s `SubnetAddresses`, and whether it was cached."""
+        if self._listener is None:
+            return self._load(subnet), False
+        with self._lock:
+            listening = self._listener.connection
+            entry = self._entries.get(subnet.id)
+            if listening is None:
+                pass  # Changes are not being announced.
+            elif entry is not None and listening is self._listening:
+                self.counters["hits"] += 1
+                return entry, True
+            else:
+                self.counters["misses"] += 1
+                generation = self._generation
+                latest = self._latest
+                synchronised = listening is self._listening
+        if listening is None:
+            return self._load(subnet), False
+        with connection.cursor() as cursor:
+            if synchronised:
+                # Every transaction that changed a subnet must have ended
+                # before this transaction's snapshot was taken.
+                cursor.execute(
+                    "SELECT txid_visible_in_snapshot("
+                    "%s, txid_current_snapshot())", [latest])
+                [complete] = cursor.fetchone()
+            else:
+                # Changes may have been missed while the listener was not
+                # connected. Announce this transaction as a change, so that
+                # transactions that can see it can also see every change
+                # made before the listener connected.
+                cursor.execute(
+                    "SELECT pg_notify('sys_subnet_allocation', "
+                    "concat_ws(' ', %s, txid_current()))", [subnet.id])
+                complete = False
+        entry = self._load(subnet)
+        if complete:
+            with self._lock:
+                if self._generation == generation:
+                    self._entries[subnet.id] = entry
+        return entry, False
+
+    def pick(
+            self, subnet, exclude: Iterable[int]=(),
+            avoid_neighbours: bool=True) -> Optional[int]:
+        """Return the next address to allocate from `subnet`.
+
+        See `SubnetAddresses.pick`.
+        """
+        entry, cached = self._get(subnet)
+        with self._lock:
+            address = entry.pick(exclude, avoid_neighbours)
+        if address is None and cached:
+            # The entry may include addresses allocated by transactions
+            # that were rolled back, so check the database before giving up.
+            self.discard(subnet.id)
+            entry, cached = self._get(subnet)
+            with self._lock:
+                address = entry.pick(exclude, avoid_neighbours)
+        return address
+
+    def allocated(self, subnet_id, address):
+        """Record that `address` has just been allocated on the subnet.
+
+        Until this transaction ends, other transactions cannot see the
+        address, so what they load is not kept.
+        """
+        if self._listener is not None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT txid_current()")
+                [txid] = cursor.fetchone()
+            with self._lock:
+                self._changed(txid)
+                entry = self._entries.get(subnet_id)
+                if entry is not None:
+                    entry.allocate(int(IPAddress(address)))
+
+    def discard(self, subnet_id):
+        with self._lock:
+            self._changed(None)
+            self._entries.pop(subnet_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._changed(None)
+            self._entries.clear()
+
+
+allocation_cache = AllocationCache()
+
+
 def get_default_vlan():
     from maasserver.models.vlan import VLAN
     return VLAN.objects.get_default_vlan().id
@@ -491,12 +881,14 @@ class Subnet(CleanSave, TimestampedModel):
             self, exclude_addresses: IPAddressExcludeList=None,
             ranges_only: bool=False, include_reserved: bool=True,
             with_neighbours: bool=False,
-            ignore_discovered_ips: bool=False) -> MAASIPSet:
+            ignore_discovered_ips: bool=False,
+            ignore_allocated_ips: bool=False) -> MAASIPSet:
         """Returns a `MAASIPSet` of `MAASIPRange` objects which are currently
         in use on this `Subnet`.
 
         :param exclude_addresses: Additional addresses to consider "in use".
         :param ignore_discovered_ips: DISCOVERED addresses are not "in use".
+        :param ignore_allocated_ips: No `StaticIPAddress` is "in use".
         :param ranges_only: if True, filters out gateway IPs, static routes,
             DNS servers, and `exclude_addresses`.
         :param with_neighbours: If True, includes addresses learned from
@@ -542,8 +934,9 @@ class Subnet(CleanSave, TimestampedModel):
                 ranges |= {
                     make_iprange(
                         static_route.gateway_ip, purpose="gateway-ip")}
-            ranges |= self._get_ranges_for_allocated_ips(
-                ipnetwork, ignore_discovered_ips)
+            if not ignore_allocated_ips:
+                ranges |= self._get_ranges_for_allocated_ips(
+                    ipnetwork, ignore_discovered_ips)
             ranges |= set(
                 make_iprange(address, purpose="excluded")
                 for address in exclude_addresses
@@ -687,6 +1080,10 @@ class Subnet(CleanSave, TimestampedModel):
             reserved_ranges |= self.get_maasipset_for_neighbours()
         return reserved_ranges.get_full_range(self.get_ipnetwork())
 
+    def record_allocated_ip(self, address):
+        """Record `address`, just allocated, in `allocation_cache`."""
+        allocation_cache.allocated(self.id, address)
+
     def get_next_ip_for_allocation(
             self, exclude_addresses: Optional[Iterable]=None,
             avoid_observed_neighbours: bool=True):
@@ -701,15 +1098,36 @@ class Subnet(CleanSave, TimestampedModel):
         """
         if exclude_addresses is None:
             exclude_addresses = []
-        free_ranges = self.get_ipranges_not_in_use(
-            exclude_addresses=exclude_addresses,
-            with_neighbours=avoid_observed_neighbours)
-        if len(free_ranges) == 0 and avoid_observed_neighbours is True:
+        if self.managed:
+            # Pick from the cached free addresses. This matches what
+            # `get_ipranges_not_in_use` does for managed subnets.
+            network = self.get_ipnetwork()
+            exclude = {
+                int(IPAddress(address))
+                for address in exclude_addresses
+                if address in network
+            }
+            first_free = allocation_cache.pick(
+                self, exclude, avoid_observed_neighbours)
+        else:
+            free_ranges = self.get_ipranges_not_in_use(
+                exclude_addresses=exclude_addresses,
+                with_neighbours=avoid_observed_neighbours)
+            if len(free_ranges) == 0:
+                first_free = None
+            else:
+                # The purpose of this is to that we ensure we always get an
+                # IP address from the *smallest* free contiguous range. This
+                # way, larger ranges can be preserved in case they need to be
+                # used for applications requiring them.
+                free_range = min(free_ranges, key=attrgetter('num_addresses'))
+                first_free = free_range.first
+        if first_free is None and avoid_observed_neighbours is True:
             # Try again recursively, but this time consider neighbours to be
             # "free" IP addresses. (We'll pick the least recently seen IP.)
             return self.get_next_ip_for_allocation(
                 exclude_addresses, avoid_observed_neighbours=False)
-        elif len(free_ranges) == 0:
+        elif first_free is None:
             raise StaticIPAddressExhaustion(
                 "No more IPs available in subnet: %s." % self.cidr)
         # The first time through this function, we aren't trying to avoid
@@ -729,12 +1147,7 @@ class Subnet(CleanSave, TimestampedModel):
                         discovery.observer_interface.get_log_string(),
                         discovery.last_seen))
                 return str(discovery.ip)
-        # The purpose of this is to that we ensure we always get an IP address
-        # from the *smallest* free contiguous range. This way, larger ranges
-        # can be preserved in case they need to be used for applications
-        # requiring them.
-        free_range = min(free_ranges, key=attrgetter('num_addresses'))
-        return str(IPAddress(free_range.first))
+        return str(IPAddress(first_free))
 
     def render_json_for_related_ips(
             self, with_username=True, with_summary=True):
@@ -6,6 +6,7 @@
 __all__ = []
 
 from socket import gethostname
+from unittest.mock import sentinel
 
 from django.db import IntegrityError
 from fixtures import TestWithFixtures
@@ -14,9 +15,14 @@ from maasserver.models import (
     signals,
 )
 import maasserver.models.config
-from maasserver.models.config import get_default_config
+from maasserver.models.config import (
+    ConfigCache,
+    get_default_config,
+)
 from maasserver.testing.factory import factory
+from maasserver.testing.listener import FakePostgresListenerService
 from maasserver.testing.testcase import MAASServerTestCase
+from provisioningserver.utils import debug
 from testtools.matchers import Is
 
 
@@ -168,6 +174,99 @@ class ConfigTest(MAASServerTestCase):
         self.assertEqual([], recorder.calls)
 
 
+class ConfigCacheTest(MAASServerTestCase):
+    """Tests for `ConfigCache`."""
+
+    def make_cache(self):
+        cache = ConfigCache()
+        listener = FakePostgresListenerService()
+        listener.connection = sentinel.connection
+        cache.listen(listener)
+        return cache, listener
+
+    def test_listen_registers_for_config_changes(self):
+        cache, listener = self.make_cache()
+        self.assertEqual(
+            [cache._changedElsewhere], listener.listeners["sys_config"])
+
+    def test_listen_reports_counters(self):
+        cache, listener = self.make_cache()
+        cache.counters["hits"] = 2
+        self.assertEqual(["hits: 2"], debug._statistics["Config cache"]())
+
+    def test_get_values_returns_None_when_not_listening(self):
+        self.assertIsNone(ConfigCache().get_values())
+
+    def test_get_values_returns_None_when_listener_is_disconnected(self):
+        cache, listener = self.make_cache()
+        listener.connection = None
+        self.assertIsNone(cache.get_values())
+
+    def test_get_values_loads_values(self):
+        cache, _ = self.make_cache()
+        value = [factory.make_name("value")]
+        Config.objects.set_config("name", value)
+        self.assertEqual(value, cache.get_values()["name"])
+
+    def test_get_values_caches_once_changes_have_been_announced(self):
+        cache, _ = self.make_cache()
+        cache._changedElsewhere("sys_config", "1")
+        values = cache.get_values()
+        self.assertIs(values, cache.get_values())
+        self.assertEqual({"hits": 1, "misses": 1}, cache.counters)
+
+    def test_get_values_does_not_cache_until_changes_are_announced(self):
+        cache, _ = self.make_cache()
+        cache.get_values()
+        cache.get_values()
+        self.assertEqual({"misses": 2}, cache.counters)
+
+    def test_get_values_does_not_cache_after_listener_reconnects(self):
+        cache, listener = self.make_cache()
+        cache._changedElsewhere("sys_config", "1")
+        cache.get_values()
+        listener.connection = sentinel.reconnected
+        cache.get_values()
+        self.assertEqual({"misses": 2}, cache.counters)
+
+    def test_announced_change_discards_values(self):
+        cache, _ = self.make_cache()
+        cache._changedElsewhere("sys_config", "1")
+        cache.get_values()
+        cache._changedElsewhere("sys_config", "2")
+        cache.get_values()
+        self.assertEqual({"misses": 2}, cache.counters)
+
+    def test_change_here_is_seen_by_transaction_that_made_it(self):
+        cache, _ = self.make_cache()
+        cache._changedElsewhere("sys_config", "1")
+        cache.get_values()
+        value = [factory.make_name("value")]
+        config = Config.objects.create(name="name", value=value)
+        cache._changedHere(Config, config)
+        # Values loaded by this transaction are not cached, because it has
+        # not yet ended.
+        self.assertEqual(value, cache.get_values()["name"])
+        self.assertEqual(value, cache.get_values()["name"])
+        self.assertEqual({"misses": 3}, cache.counters)
+
+    def test_get_config_uses_cached_values(self):
+        value = [factory.make_name("value")]
+        self.patch(Config.objects.cache, "get_values").return_value = {
+            "name": value}
+        self.assertEqual(value, Config.objects.get_config("name"))
+        self.assertIsNot(value, Config.objects.get_config("name"))
+
+    def test_get_config_uses_default_when_not_in_cached_values(self):
+        self.patch(Config.objects.cache, "get_values").return_value = {}
+        self.assertEqual(
+            get_default_config()["maas_name"],
+            Config.objects.get_config("maas_name"))
+        default = [factory.make_name("default")]
+        self.assertEqual(
+            default, Config.objects.get_config("unknown", default))
+
+
 class SettingConfigTest(MAASServerTestCase):
     """Testing of the :class:`Config` model and setting each option."""
 
@@ -170,3 +170,36 @@ class TestDNSPublicationManager(MAASServerTestCase):
         DNSPublication.objects.collect_garbage()
         self.assertThat(get_ages(), Equals(deltas))
         self.assertThat(deltas, HasLength(1))
+
+    def test_get_changes_since_returns_touched_domains_and_subnets(self):
+        since = DNSPublication()
+        since.save()
+        DNSPublication(touched_domains=[1, 2], touched_subnets=[3]).save()
+        DNSPublication(touched_domains=[2], touched_subnets=[4, 5]).save()
+        self.assertThat(
+            DNSPublication.objects.get_changes_since(since.id),
+            Equals(({1, 2}, {3, 4, 5})))
+
+    def test_get_changes_since_ignores_earlier_publications(self):
+        DNSPublication().save()
+        since = DNSPublication(touched_domains=[1], touched_subnets=[2])
+        since.save()
+        self.assertThat(
+            DNSPublication.objects.get_changes_since(since.id),
+            Equals((set(), set())))
+
+    def test_get_changes_since_returns_None_for_untracked_publication(self):
+        since = DNSPublication()
+        since.save()
+        DNSPublication(touched_domains=[1], touched_subnets=[2]).save()
+        DNSPublication(source="untracked").save()
+        self.assertIsNone(
+            DNSPublication.objects.get_changes_since(since.id))
+
+    def test_get_changes_since_returns_None_for_collected_publication(self):
+        since = DNSPublication()
+        since.save()
+        DNSPublication(touched_domains=[1], touched_subnets=[2]).save()
+        since.delete()
+        self.assertIsNone(
+            DNSPublication.objects.get_changes_since(since.id))
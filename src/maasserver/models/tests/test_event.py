@@ -5,6 +5,10 @@
 
 __all__ = []
 
+from datetime import (
+    datetime,
+    timedelta,
+)
 import logging
 import random
 
@@ -16,6 +20,7 @@ from maasserver.models import (
 )
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
+from maasserver.utils.orm import reload_object
 from provisioningserver.events import EVENT_TYPES
 
 
@@ -140,3 +145,74 @@ class EventTest(MAASServerTestCase):
         event_type = EventType.objects.get(name=type_name)
         self.assertIsNotNone(event_type)
         self.assertEqual(2, Event.objects.filter(node=node).count())
+
+    def test_copies_level_from_type(self):
+        event_type = factory.make_EventType(
+            level=random.choice([logging.ERROR, logging.WARNING]))
+        event = factory.make_Event(type=event_type)
+        self.assertEqual(event_type.level, reload_object(event).level)
+
+
+class TestEventManagerDeleteOlderThan(MAASServerTestCase):
+    """Tests for `EventManager.delete_older_than`."""
+
+    def make_events(self, count, created):
+        events = [factory.make_Event() for _ in range(count)]
+        Event.objects.filter(id__in=[event.id for event in events]).update(
+            created=created)
+        return events
+
+    def test_deletes_events_created_before_cutoff(self):
+        now = datetime.now()
+        self.make_events(3, now - timedelta(days=2))
+        new_events = self.make_events(2, now)
+        deleted = Event.objects.delete_older_than(now - timedelta(days=1))
+        self.assertEqual(3, deleted)
+        self.assertItemsEqual(
+            [event.id for event in new_events],
+            Event.objects.values_list("id", flat=True))
+
+    def test_deletes_from_the_oldest_limit_events_only(self):
+        now = datetime.now()
+        old_events = self.make_events(3, now - timedelta(days=2))
+        deleted = Event.objects.delete_older_than(
+            now - timedelta(days=1), limit=2)
+        self.assertEqual(2, deleted)
+        self.assertItemsEqual(
+            [old_events[-1].id], Event.objects.values_list("id", flat=True))
+
+    def test_deletes_nothing_when_oldest_events_are_new(self):
+        now = datetime.now()
+        self.make_events(2, now)
+        self.make_events(2, now - timedelta(days=2))
+        deleted = Event.objects.delete_older_than(
+            now - timedelta(days=1), limit=2)
+        self.assertEqual(0, deleted)
+        self.assertEqual(4, Event.objects.count())
+
+
+class TestEventManagerFillLevels(MAASServerTestCase):
+    """Tests for `EventManager.fill_levels`."""
+
+    def make_events_without_level(self, count):
+        events = [factory.make_Event() for _ in range(count)]
+        Event.objects.filter(id__in=[event.id for event in events]).update(
+            level=None)
+        return events
+
+    def test_copies_level_from_type(self):
+        [event] = self.make_events_without_level(1)
+        self.assertEqual(1, Event.objects.fill_levels())
+        self.assertEqual(event.type.level, reload_object(event).level)
+
+    def test_fills_at_most_limit_events_oldest_first(self):
+        events = self.make_events_without_level(3)
+        self.assertEqual(2, Event.objects.fill_levels(limit=2))
+        self.assertEqual(
+            [False, False, True],
+            [reload_object(event).level is None for event in events])
+
+    def test_leaves_events_with_levels_alone(self):
+        event = factory.make_Event()
+        self.assertEqual(0, Event.objects.fill_levels())
+        self.assertEqual(event.level, reload_object(event).level)
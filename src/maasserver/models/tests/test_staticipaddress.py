@@ -5,6 +5,7 @@
 
 __all__ = []
 
+from collections import Counter
 from random import (
     randint,
     shuffle,
@@ -34,8 +35,12 @@ from maasserver.models.staticipaddress import (
     HostnameIPMapping,
     StaticIPAddress,
 )
-from maasserver.models.subnet import Subnet
+from maasserver.models.subnet import (
+    allocation_cache,
+    Subnet,
+)
 from maasserver.testing.factory import factory
+from maasserver.testing.listener import FakePostgresListenerService
 from maasserver.testing.testcase import (
     MAASServerTestCase,
     MAASTransactionServerTestCase,
@@ -55,6 +60,7 @@ from testtools.matchers import (
     AllMatch,
     Contains,
     Equals,
+    GreaterThan,
     HasLength,
     Is,
     IsInstance,
@@ -321,10 +327,8 @@ class TestStaticIPAddressManagerTransactional(MAASTransactionServerTestCase):
         ("IPv6", dict(ip_version=6)),
     )
 
-    def test_allocate_new_works_under_extreme_concurrency(self):
-        ipv6 = (self.ip_version == 6)
-        subnet = factory.make_managed_Subnet(ipv6=ipv6)
-        count = 20  # Allocate this number of IP addresses.
+    def allocate_concurrently(self, subnet, count):
+        """Allocate `count` addresses from `subnet`, each in a thread."""
         concurrency = threading.Semaphore(16)
         mutex = threading.Lock()
         results = []
@@ -361,6 +365,29 @@ class TestStaticIPAddressManagerTransactional(MAASTransactionServerTestCase):
         self.assertThat(ips, AllMatch(
             AfterPreprocessing(subnet.is_valid_static_ip, Is(True))))
 
+    def test_allocate_new_works_under_extreme_concurrency(self):
+        ipv6 = (self.ip_version == 6)
+        subnet = factory.make_managed_Subnet(ipv6=ipv6)
+        # Allocate this number of IP addresses.
+        self.allocate_concurrently(subnet, 20)
+
+    def test_allocate_new_works_under_extreme_concurrency_when_cached(self):
+        # Free addresses are cached while the region's listener is
+        # connected. Allocations in other threads are applied to the cache
+        # as they are made, so they rarely collide.
+        ipv6 = (self.ip_version == 6)
+        subnet = factory.make_managed_Subnet(ipv6=ipv6)
+        listener = FakePostgresListenerService()
+        listener.connection = sentinel.connection
+        self.patch(allocation_cache, "_listener", listener)
+        self.patch(allocation_cache, "_listening", listener.connection)
+        self.patch(allocation_cache, "_latest", 1)
+        self.patch(allocation_cache, "counters", Counter())
+        allocation_cache.clear()
+        self.addCleanup(allocation_cache.clear)
+        self.allocate_concurrently(subnet, 100)
+        self.assertThat(allocation_cache.counters["hits"], GreaterThan(0))
+
 
 class TestStaticIPAddressManagerMapping(MAASServerTestCase):
     """Tests for get_hostname_ip_mapping()."""
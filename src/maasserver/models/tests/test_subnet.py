@@ -10,7 +10,9 @@ from datetime import (
     datetime,
     timedelta,
 )
+from collections import Counter
 import random
+from unittest.mock import sentinel
 
 from django.core.exceptions import (
     PermissionDenied,
@@ -30,18 +32,25 @@ from maasserver.enum import (
 from maasserver.exceptions import StaticIPAddressExhaustion
 from maasserver.models import (
     Config,
+    IPRange,
     Notification,
     Space,
+    StaticIPAddress,
 )
 from maasserver.models.subnet import (
+    AllocationCache,
+    allocation_cache,
     create_cidr,
+    FreeAddresses,
     Subnet,
+    SubnetAddresses,
 )
 from maasserver.testing.factory import (
     factory,
     RANDOM,
     RANDOM_OR_NONE,
 )
+from maasserver.testing.listener import FakePostgresListenerService
 from maasserver.testing.orm import rollback
 from maasserver.testing.testcase import MAASServerTestCase
 from maasserver.utils.orm import (
@@ -49,6 +58,7 @@ from maasserver.utils.orm import (
     reload_object,
 )
 from maastesting.matchers import DocTestMatches
+from maastesting.testcase import MAASTestCase
 from netaddr import (
     AddrFormatError,
     IPAddress,
@@ -57,6 +67,8 @@ from netaddr import (
 from provisioningserver.utils.network import (
     inet_ntop,
     MAASIPRange,
+    MAASIPSet,
+    make_iprange,
 )
 from testtools import ExpectedException
 from testtools.matchers import (
@@ -1166,6 +1178,370 @@ class TestSubnetGetNextIPForAllocation(MAASServerTestCase):
         self.assertThat(ip, Equals("10.0.0.5"))
 
 
+class TestFreeAddresses(MAASTestCase):
+
+    def make_free_addresses(self, cidr, in_use=(), reserved=()):
+        in_use = [
+            make_iprange(address, purpose="assigned-ip")
+            for address in in_use
+        ]
+        reserved = [
+            make_iprange(first, last, purpose="reserved")
+            for first, last in reserved
+        ]
+        return FreeAddresses(
+            IPNetwork(cidr), MAASIPSet(in_use + reserved),
+            MAASIPSet(reserved))
+
+    def pick(self, free, exclude=()):
+        address = free.pick(int(IPAddress(ip)) for ip in exclude)
+        return None if address is None else str(IPAddress(address))
+
+    def test_pick_returns_first_address_of_smallest_free_range(self):
+        free = self.make_free_addresses(
+            "10.0.0.0/24", in_use=["10.0.0.10", "10.0.0.13"])
+        self.assertEqual("10.0.0.11", self.pick(free))
+
+    def test_pick_skips_network_and_broadcast_addresses(self):
+        free = self.make_free_addresses(
+            "10.0.0.0/30", in_use=["10.0.0.1"])
+        self.assertEqual("10.0.0.2", self.pick(free))
+        free.allocate(int(IPAddress("10.0.0.2")))
+        self.assertIsNone(self.pick(free))
+
+    def test_pick_splits_free_ranges_around_excluded_addresses(self):
+        free = self.make_free_addresses("10.0.0.0/24")
+        self.assertEqual(
+            "10.0.0.1", self.pick(free, exclude=["10.0.0.2", "10.0.0.200"]))
+        self.assertEqual(
+            "10.0.0.2", self.pick(free, exclude=["10.0.0.1", "10.0.0.6"]))
+
+    def test_pick_returns_None_when_everything_is_excluded(self):
+        free = self.make_free_addresses("10.0.0.0/30")
+        self.assertIsNone(self.pick(free, exclude=["10.0.0.1", "10.0.0.2"]))
+
+    def test_allocate_removes_address_from_free_ranges(self):
+        free = self.make_free_addresses("10.0.0.0/29")
+        for address in range(1, 7):
+            self.assertEqual("10.0.0.%d" % address, self.pick(free))
+            free.allocate(int(IPAddress(self.pick(free))))
+        self.assertIsNone(self.pick(free))
+
+    def test_allocate_splits_free_range(self):
+        free = self.make_free_addresses("10.0.0.0/24")
+        free.allocate(int(IPAddress("10.0.0.3")))
+        self.assertEqual("10.0.0.1", self.pick(free))
+        free.allocate(int(IPAddress("10.0.0.1")))
+        self.assertEqual("10.0.0.2", self.pick(free))
+
+    def test_allocate_ignores_addresses_in_use(self):
+        free = self.make_free_addresses(
+            "10.0.0.0/29", in_use=["10.0.0.1"])
+        free.allocate(int(IPAddress("10.0.0.1")))
+        free.allocate(int(IPAddress("192.168.0.1")))
+        self.assertEqual("10.0.0.2", self.pick(free))
+
+    def test_release_joins_free_ranges(self):
+        free = self.make_free_addresses(
+            "10.0.0.0/24", in_use=["10.0.0.5", "10.0.0.7"])
+        self.assertEqual("10.0.0.6", self.pick(free))
+        free.release(int(IPAddress("10.0.0.5")))
+        free.release(int(IPAddress("10.0.0.7")))
+        # There is one free range again; .5 and .7 are not ranges of their
+        # own, which would be picked first.
+        self.assertEqual("10.0.0.1", self.pick(free))
+
+    def test_release_ignores_reserved_addresses(self):
+        free = self.make_free_addresses(
+            "10.0.0.0/29", in_use=["10.0.0.1"],
+            reserved=[("10.0.0.2", "10.0.0.6")])
+        self.assertIsNone(self.pick(free))
+        free.release(int(IPAddress("10.0.0.3")))
+        free.release(int(IPAddress("10.0.0.7")))
+        self.assertIsNone(self.pick(free))
+        free.release(int(IPAddress("10.0.0.1")))
+        self.assertEqual("10.0.0.1", self.pick(free))
+
+    def test_pick_prefers_lowest_of_ranges_the_same_size(self):
+        free = self.make_free_addresses(
+            "10.0.0.0/24",
+            in_use=["10.0.0.1", "10.0.0.4", "10.0.0.7", "10.0.0.10"])
+        self.assertEqual("10.0.0.2", self.pick(free))
+        self.assertEqual(
+            "10.0.0.2", self.pick(free, exclude=["10.0.0.3", "10.0.0.5"]))
+        self.assertEqual(
+            "10.0.0.5", self.pick(free, exclude=["10.0.0.9", "10.0.0.6"]))
+        self.assertEqual("10.0.0.3", self.pick(free, exclude=["10.0.0.2"]))
+
+    def test_pick_follows_allocations_and_releases(self):
+        free = self.make_free_addresses("10.0.0.0/24")
+        for address in ["10.0.0.10", "10.0.0.12", "10.0.0.20"]:
+            free.allocate(int(IPAddress(address)))
+        self.assertEqual("10.0.0.11", self.pick(free))
+        free.release(int(IPAddress("10.0.0.12")))
+        self.assertEqual("10.0.0.1", self.pick(free))
+        free.release(int(IPAddress("10.0.0.10")))
+        self.assertEqual("10.0.0.1", self.pick(free))
+        free.allocate(int(IPAddress("10.0.0.2")))
+        self.assertEqual("10.0.0.1", self.pick(free))
+
+    def test_reserve_keeps_address_in_use_when_released(self):
+        free = self.make_free_addresses("10.0.0.0/30")
+        free.reserve(int(IPAddress("10.0.0.1")))
+        self.assertEqual("10.0.0.2", self.pick(free))
+        free.release(int(IPAddress("10.0.0.1")))
+        self.assertEqual("10.0.0.2", self.pick(free))
+
+
+class TestSubnetAddresses(MAASTestCase):
+
+    def make_subnet_addresses(self, cidr, neighbours=()):
+        neighbours = MAASIPSet([
+            make_iprange(address, purpose="neighbour")
+            for address in neighbours
+        ])
+        return SubnetAddresses(
+            IPNetwork(cidr), MAASIPSet([]), MAASIPSet([]), neighbours)
+
+    def pick(self, addresses, avoid_neighbours=True):
+        address = addresses.pick(avoid_neighbours=avoid_neighbours)
+        return None if address is None else str(IPAddress(address))
+
+    def test_pick_avoids_neighbours_on_request(self):
+        addresses = self.make_subnet_addresses(
+            "10.0.0.0/30", neighbours=["10.0.0.1"])
+        self.assertEqual("10.0.0.2", self.pick(addresses))
+        self.assertEqual(
+            "10.0.0.1", self.pick(addresses, avoid_neighbours=False))
+
+    def test_observe_avoids_neighbour(self):
+        addresses = self.make_subnet_addresses("10.0.0.0/30")
+        addresses.observe(int(IPAddress("10.0.0.1")))
+        self.assertEqual("10.0.0.2", self.pick(addresses))
+        self.assertEqual(
+            "10.0.0.1", self.pick(addresses, avoid_neighbours=False))
+
+    def test_release_does_not_free_neighbours(self):
+        addresses = self.make_subnet_addresses(
+            "10.0.0.0/30", neighbours=["10.0.0.1"])
+        addresses.allocate(int(IPAddress("10.0.0.1")))
+        addresses.allocate(int(IPAddress("10.0.0.2")))
+        addresses.release(int(IPAddress("10.0.0.1")))
+        self.assertIsNone(self.pick(addresses))
+        self.assertEqual(
+            "10.0.0.1", self.pick(addresses, avoid_neighbours=False))
+
+
+class TestAllocationCache(MAASServerTestCase):
+
+    def make_cache(self):
+        cache = AllocationCache()
+        listener = FakePostgresListenerService()
+        listener.connection = sentinel.connection
+        cache.listen(listener)
+        return cache, listener
+
+    def make_subnet(self):
+        return factory.make_Subnet(
+            cidr="10.0.0.0/29", gateway_ip=None, dns_servers=None,
+            managed=True)
+
+    def announce(self, cache, subnet, change=None):
+        payload = "%d 1" % subnet.id
+        if change is not None:
+            payload += " %s 1" % change
+        cache._changedElsewhere("sys_subnet_allocation", payload)
+
+    def pick(self, cache, subnet):
+        return str(IPAddress(cache.pick(subnet)))
+
+    def test_listen_registers_for_subnet_changes(self):
+        cache, listener = self.make_cache()
+        self.assertEqual(
+            [cache._changedElsewhere],
+            listener.listeners["sys_subnet_allocation"])
+
+    def test_pick_loads_free_addresses_when_not_listening(self):
+        cache = AllocationCache()
+        subnet = self.make_subnet()
+        factory.make_StaticIPAddress(ip="10.0.0.1", subnet=subnet)
+        self.assertEqual("10.0.0.2", self.pick(cache, subnet))
+        self.assertEqual({}, cache.counters)
+
+    def test_pick_caches_once_changes_have_been_announced(self):
+        cache, _ = self.make_cache()
+        subnet = self.make_subnet()
+        self.announce(cache, subnet)
+        self.pick(cache, subnet)
+        self.pick(cache, subnet)
+        self.assertEqual({"hits": 1, "misses": 1}, cache.counters)
+
+    def test_pick_does_not_cache_until_changes_are_announced(self):
+        cache, _ = self.make_cache()
+        subnet = self.make_subnet()
+        self.pick(cache, subnet)
+        self.pick(cache, subnet)
+        self.assertEqual({"misses": 2}, cache.counters)
+
+    def test_pick_does_not_cache_after_listener_reconnects(self):
+        cache, listener = self.make_cache()
+        subnet = self.make_subnet()
+        self.announce(cache, subnet)
+        self.pick(cache, subnet)
+        listener.connection = sentinel.reconnected
+        self.pick(cache, subnet)
+        self.assertEqual({"misses": 2}, cache.counters)
+
+    def test_announced_assignment_is_applied(self):
+        cache, _ = self.make_cache()
+        subnet = self.make_subnet()
+        self.announce(cache, subnet)
+        self.assertEqual("10.0.0.1", self.pick(cache, subnet))
+        self.announce(cache, subnet, "+10.0.0.1")
+        self.assertEqual("10.0.0.2", self.pick(cache, subnet))
+        self.assertEqual({"hits": 1, "misses": 1}, cache.counters)
+
+    def test_announced_release_is_applied(self):
+        cache, _ = self.make_cache()
+        subnet = self.make_subnet()
+        factory.make_StaticIPAddress(ip="10.0.0.1", subnet=subnet)
+        self.announce(cache, subnet)
+        self.assertEqual("10.0.0.2", self.pick(cache, subnet))
+        self.announce(cache, subnet, "-10.0.0.1")
+        self.assertEqual("10.0.0.1", self.pick(cache, subnet))
+        self.assertEqual({"hits": 1, "misses": 1}, cache.counters)
+
+    def test_announced_neighbour_is_avoided(self):
+        cache, _ = self.make_cache()
+        subnet = self.make_subnet()
+        self.announce(cache, subnet)
+        self.assertEqual("10.0.0.1", self.pick(cache, subnet))
+        self.announce(cache, subnet, "*10.0.0.1")
+        self.assertEqual("10.0.0.2", self.pick(cache, subnet))
+        self.assertEqual(
+            "10.0.0.1", str(IPAddress(cache.pick(
+                subnet, avoid_neighbours=False))))
+        self.assertEqual({"hits": 2, "misses": 1}, cache.counters)
+
+    def test_announced_change_discards_entry(self):
+        cache, _ = self.make_cache()
+        subnet = self.make_subnet()
+        self.announce(cache, subnet)
+        self.pick(cache, subnet)
+        self.announce(cache, subnet)
+        self.pick(cache, subnet)
+        self.assertEqual({"misses": 2}, cache.counters)
+
+    def test_change_here_is_not_cached_by_transaction_that_made_it(self):
+        cache, _ = self.make_cache()
+        subnet = self.make_subnet()
+        self.announce(cache, subnet)
+        self.pick(cache, subnet)
+        iprange = factory.make_IPRange(
+            subnet, start_ip="10.0.0.1", end_ip="10.0.0.3",
+            type=IPRANGE_TYPE.RESERVED)
+        cache._changedHere(IPRange, iprange)
+        self.assertEqual("10.0.0.4", self.pick(cache, subnet))
+        self.assertEqual("10.0.0.4", self.pick(cache, subnet))
+        self.assertEqual({"misses": 3}, cache.counters)
+
+    def test_allocated_is_applied(self):
+        cache, _ = self.make_cache()
+        subnet = self.make_subnet()
+        self.announce(cache, subnet)
+        self.assertEqual("10.0.0.1", self.pick(cache, subnet))
+        cache.allocated(subnet.id, "10.0.0.1")
+        self.assertEqual("10.0.0.2", self.pick(cache, subnet))
+
+    def test_pick_checks_database_before_giving_up(self):
+        cache, _ = self.make_cache()
+        subnet = self.make_subnet()
+        self.announce(cache, subnet)
+        for address in range(1, 7):
+            cache.allocated(subnet.id, "10.0.0.%d" % address)
+        self.assertEqual("10.0.0.1", self.pick(cache, subnet))
+
+    def test_discard_removes_entry(self):
+        cache, _ = self.make_cache()
+        subnet = self.make_subnet()
+        self.announce(cache, subnet)
+        self.pick(cache, subnet)
+        cache.discard(subnet.id)
+        self.pick(cache, subnet)
+        self.assertEqual({"misses": 2}, cache.counters)
+
+
+class TestSubnetGetNextIPForAllocationCache(MAASServerTestCase):
+
+    def listen(self):
+        # Subnets created by this transaction must be created first, or
+        # nothing it loads will be cached.
+        listener = FakePostgresListenerService()
+        listener.connection = sentinel.connection
+        self.patch(allocation_cache, "_listener", listener)
+        self.patch(allocation_cache, "_listening", listener.connection)
+        self.patch(allocation_cache, "_latest", 1)
+        self.patch(allocation_cache, "counters", Counter())
+        allocation_cache.clear()
+        self.addCleanup(allocation_cache.clear)
+
+    def test__reuses_free_addresses_between_allocations(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/29", gateway_ip=None, dns_servers=None,
+            managed=True)
+        self.listen()
+        calls = []
+        get_ipranges_in_use = Subnet.get_ipranges_in_use
+
+        def record_get_ipranges_in_use(subnet, *args, **kwargs):
+            calls.append(subnet)
+            return get_ipranges_in_use(subnet, *args, **kwargs)
+
+        self.patch(
+            Subnet, "get_ipranges_in_use", record_get_ipranges_in_use)
+        first = StaticIPAddress.objects.allocate_new(subnet=subnet)
+        second = StaticIPAddress.objects.allocate_new(subnet=subnet)
+        self.assertNotEqual(first.ip, second.ip)
+        self.assertThat(calls, HasLength(1))
+
+    def test__excludes_addresses_and_neighbours(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/29", gateway_ip=None, dns_servers=None,
+            managed=True)
+        rackif = factory.make_Interface(vlan=subnet.vlan)
+        factory.make_Discovery(ip="10.0.0.2", interface=rackif)
+        self.listen()
+        self.assertEqual(
+            "10.0.0.3", subnet.get_next_ip_for_allocation(
+                exclude_addresses=["10.0.0.1"]))
+
+    def test__does_not_query_neighbours_when_cached(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/29", gateway_ip=None, dns_servers=None,
+            managed=True)
+        rackif = factory.make_Interface(vlan=subnet.vlan)
+        factory.make_Discovery(ip="10.0.0.1", interface=rackif)
+        self.listen()
+        self.assertEqual("10.0.0.2", subnet.get_next_ip_for_allocation())
+        self.patch(Subnet, "get_maasipset_for_neighbours").side_effect = (
+            AssertionError("Neighbours queried."))
+        self.assertEqual("10.0.0.2", subnet.get_next_ip_for_allocation())
+        self.assertEqual({"hits": 1, "misses": 1}, allocation_cache.counters)
+
+    def test__recomputes_free_addresses_when_ranges_change(self):
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/29", gateway_ip=None, dns_servers=None,
+            managed=True)
+        self.listen()
+        self.assertEqual("10.0.0.1", subnet.get_next_ip_for_allocation())
+        self.assertEqual({"misses": 1}, allocation_cache.counters)
+        factory.make_IPRange(
+            subnet, start_ip="10.0.0.1", end_ip="10.0.0.3",
+            type=IPRANGE_TYPE.RESERVED)
+        subnet = reload_object(subnet)
+        self.assertEqual("10.0.0.4", subnet.get_next_ip_for_allocation())
+
+
 class TestUnmanagedSubnets(MAASServerTestCase):
 
     def test__allocation_uses_reserved_range(self):
@@ -12,7 +12,10 @@ __all__ = [
 import time
 
 from maasserver.utils.orm import transactional
-from maasserver.utils.threads import deferToDatabase
+from maasserver.utils.threads import (
+    DATABASE_PRIORITY,
+    deferToDatabaseWithPriority,
+)
 from oauth.oauth import OAuthServer
 from piston3.models import Nonce
 from provisioningserver.utils.twisted import synchronous
@@ -101,4 +104,5 @@ class NonceCleanupService(TimerService, object):
     def __init__(self, interval=(24 * 60 * 60)):
         cleanup = synchronous(transactional(cleanup_old_nonces))
         super(NonceCleanupService, self).__init__(
-            interval, deferToDatabase, cleanup)
+            interval, deferToDatabaseWithPriority,
+            DATABASE_PRIORITY.BACKGROUND, cleanup)
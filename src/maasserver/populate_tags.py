@@ -13,6 +13,7 @@ from functools import partial
 from math import ceil
 
 from apiclient.creds import convert_tuple_to_string
+from django.db.models import Max
 from lxml import etree
 from maasserver import logger
 from maasserver.models.node import (
@@ -48,13 +49,21 @@ from provisioningserver.utils.twisted import (
     synchronous,
 )
 from provisioningserver.utils.xpath import try_match_xpath
-from twisted.internet.defer import DeferredList
+from twisted.internet.defer import (
+    DeferredList,
+    inlineCallbacks,
+)
 
 
 maaslog = get_maas_logger("tags")
 log = LegacyLogger()
 
 
+# AMP limits each value to 0xffff bytes, so keep the encoded nodes in each
+# `EvaluateTag` call comfortably below that.
+EVALUATE_TAG_NODES_LIMIT = 60 * (2 ** 10)  # 60kiB
+
+
 # The nsmap that XPath expression must be compiled with. This will
 # ensure that expressions like //lshw:something will work correctly.
 tag_nsmap = {
@@ -77,6 +86,28 @@ def chunk_list(items, num_chunks):
         yield items[i:i + size]
 
 
+def chunk_nodes(nodes, limit=EVALUATE_TAG_NODES_LIMIT):
+    """Split `nodes` into lists that each fit in one `EvaluateTag` call.
+
+    Each node is encoded in the call as an AMP box: every key and value is
+    preceded by a 2-byte length, and the box ends with a 2-byte terminator.
+    The encoding of each list of nodes is at most `limit` bytes, though
+    every list has at least one node.
+    """
+    chunk, size = [], 0
+    for node in nodes:
+        length = 2 + sum(
+            4 + len(key.encode("utf-8")) + len(value.encode("utf-8"))
+            for key, value in node.items())
+        if len(chunk) != 0 and size + length > limit:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(node)
+        size += length
+    if len(chunk) != 0:
+        yield chunk
+
+
 @synchronous
 @transactional
 def populate_tags(tag):
@@ -100,8 +131,16 @@ def populate_tags(tag):
         return populate_tag_for_multiple_nodes(tag, Node.objects.all())
     else:
         # Split the work between the connected rack controllers.
-        node_ids = Node.objects.all().values_list("system_id", flat=True)
-        node_ids = [{"system_id": node_id} for node_id in node_ids]
+        node_ids = Node.objects.all().annotate(
+            details_updated=Max(
+                "current_commissioning_script_set__scriptresult__updated"))
+        node_ids = node_ids.values_list(
+            "system_id", "current_commissioning_script_set_id",
+            "details_updated")
+        node_ids = [
+            _make_node_info(system_id, script_set_id, details_updated)
+            for system_id, script_set_id, details_updated in node_ids
+        ]
         chunked_node_ids = list(chunk_list(node_ids, len(clients)))
         connected_racks = []
         for idx, client in enumerate(clients):
@@ -125,6 +164,23 @@ def populate_tags(tag):
         return _do_populate_tags(connected_racks)
 
 
+def _make_node_info(system_id, script_set_id, details_updated):
+    """Describe a node for `EvaluateTag`.
+
+    The node's details come from the results in its current commissioning
+    script set. The set's ID and the time its results were last updated form
+    the key under which rack controllers cache the details.
+    """
+    if script_set_id is None or details_updated is None:
+        return {"system_id": system_id}
+    else:
+        return {
+            "system_id": system_id,
+            "details_key": "%d-%s" % (
+                script_set_id, details_updated.isoformat()),
+        }
+
+
 def _get_or_create_auth_token(user):
     """Get the most recent OAuth token for `user`, or create one."""
     for token in reversed(get_auth_tokens(user)):
@@ -141,16 +197,21 @@ def _do_populate_tags(clients):
         will be called.
     """
 
+    @inlineCallbacks
     def call_client(client_info):
+        # The nodes are sent in as many calls as needed to stay within the
+        # AMP limits, one after another so the rack controller evaluates one
+        # chunk at a time.
         client = client_info["client"]
-        return client(
-            EvaluateTag,
-            system_id=client_info["system_id"],
-            tag_name=client_info["tag_name"],
-            tag_definition=client_info["tag_definition"],
-            tag_nsmap=client_info["tag_nsmap"],
-            credentials=client_info["credentials"],
-            nodes=client_info["nodes"])
+        for nodes in chunk_nodes(client_info["nodes"]):
+            yield client(
+                EvaluateTag,
+                system_id=client_info["system_id"],
+                tag_name=client_info["tag_name"],
+                tag_definition=client_info["tag_definition"],
+                tag_nsmap=client_info["tag_nsmap"],
+                credentials=client_info["credentials"],
+                nodes=nodes)
 
     def check_results(results):
         for client_info, (success, result) in zip(clients, results):
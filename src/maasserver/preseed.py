@@ -15,10 +15,19 @@ __all__ = [
     'OS_WITH_IPv6_SUPPORT',
     ]
 
-from collections import namedtuple
+from collections import (
+    namedtuple,
+    OrderedDict,
+)
+from copy import copy
+from functools import (
+    lru_cache,
+    wraps,
+)
 import json
 import os.path
 from pipes import quote
+import threading
 from urllib.parse import (
     urlencode,
     urlparse,
@@ -28,6 +37,7 @@ from crochet import TimeoutError
 from curtin.config import merge_config
 from curtin.pack import pack_install
 from django.conf import settings
+from django.db import connection
 from maasserver import logger
 from maasserver.clusterrpc.boot_images import get_boot_images_for
 from maasserver.compose_preseed import (
@@ -40,6 +50,7 @@ from maasserver.compose_preseed import (
 )
 from maasserver.enum import (
     FILESYSTEM_TYPE,
+    NODE_TYPE,
     PRESEED_TYPE,
     USERDATA_TYPE,
 )
@@ -94,6 +105,160 @@ OS_WITH_IPv6_SUPPORT = ['ubuntu']
 CURTIN_INSTALL_LOG = "/tmp/install.log"
 
 
+# The maximum number of renderings kept by `cache_rendered`.
+RENDERED_CACHE_SIZE = 1000
+
+# Renderings kept by `cache_rendered`, keyed by function name and node ID,
+# least recently used first.
+_rendered = OrderedDict()
+_rendered_lock = threading.Lock()
+
+
+# The rows that a node's rendered configuration is derived from, as
+# (table, condition) pairs; see `get_node_config_version`. The conditions
+# can refer to the node's rows gathered in `NODE_CONFIG_VERSION_SQL`. The
+# interfaces of controllers are included because the URLs and DNS servers
+# given to a node depend on them, as are boot resources because the kernel
+# package given to curtin is found in them.
+NODE_CONFIG_SOURCES = (
+    ("maasserver_node", "id = %(node)s"),
+    ("metadataserver_nodekey", "node_id = %(node)s"),
+    ("auth_user",
+     "id IN (SELECT owner_id FROM maasserver_node WHERE id = %(node)s)"),
+    ("maasserver_interface", "id IN (SELECT id FROM node_interface)"),
+    ("maasserver_interfacerelationship",
+     "child_id IN (SELECT id FROM node_interface)"),
+    ("maasserver_interface_ip_addresses",
+     "interface_id IN (SELECT id FROM node_interface)"),
+    ("maasserver_staticipaddress",
+     "id IN (SELECT staticipaddress_id "
+     "FROM maasserver_interface_ip_addresses "
+     "WHERE interface_id IN (SELECT id FROM node_interface))"),
+    ("maasserver_blockdevice", "id IN (SELECT id FROM node_blockdevice)"),
+    ("maasserver_physicalblockdevice",
+     "blockdevice_ptr_id IN (SELECT id FROM node_blockdevice)"),
+    ("maasserver_virtualblockdevice",
+     "blockdevice_ptr_id IN (SELECT id FROM node_blockdevice)"),
+    ("maasserver_partitiontable",
+     "id IN (SELECT id FROM node_partitiontable)"),
+    ("maasserver_partition",
+     "partition_table_id IN (SELECT id FROM node_partitiontable)"),
+    ("maasserver_filesystem", "id IN (SELECT id FROM node_filesystem)"),
+    ("maasserver_filesystemgroup",
+     "id IN (SELECT filesystem_group_id FROM node_filesystem)"),
+    ("maasserver_cacheset",
+     "id IN (SELECT cache_set_id FROM node_filesystem)"),
+    # These are shared by all nodes.
+    ("maasserver_config", "TRUE"),
+    ("maasserver_packagerepository", "TRUE"),
+    ("maasserver_licensekey", "TRUE"),
+    ("maasserver_domain", "TRUE"),
+    ("maasserver_space", "TRUE"),
+    ("maasserver_fabric", "TRUE"),
+    ("maasserver_vlan", "TRUE"),
+    ("maasserver_subnet", "TRUE"),
+    ("maasserver_bootresource", "TRUE"),
+    ("maasserver_bootresourceset", "TRUE"),
+    ("maasserver_bootresourcefile", "TRUE"),
+    ("maasserver_largefile", "TRUE"),
+)
+
+NODE_CONFIG_VERSION_SQL = """\
+WITH
+  node_interface AS (
+    SELECT id FROM maasserver_interface
+    WHERE node_id = %%(node)s OR node_id IN (
+      SELECT id FROM maasserver_node WHERE node_type IN %%(controllers)s)),
+  node_blockdevice AS (
+    SELECT id FROM maasserver_blockdevice WHERE node_id = %%(node)s),
+  node_partitiontable AS (
+    SELECT id FROM maasserver_partitiontable
+    WHERE block_device_id IN (SELECT id FROM node_blockdevice)),
+  node_filesystem AS (
+    SELECT id, filesystem_group_id, cache_set_id FROM maasserver_filesystem
+    WHERE node_id = %%(node)s
+    OR block_device_id IN (SELECT id FROM node_blockdevice)
+    OR partition_id IN (
+      SELECT id FROM maasserver_partition
+      WHERE partition_table_id IN (SELECT id FROM node_partitiontable)))
+SELECT now(), md5(concat_ws(';', %s))
+""" % ", ".join(
+    "coalesce((SELECT string_agg(xmin::text, ',' ORDER BY xmin::text) "
+    "FROM %s WHERE %s), '')" % source for source in NODE_CONFIG_SOURCES)
+
+
+def get_node_config_version(node):
+    """Return a version for the configuration rendered for `node`.
+
+    This is derived from the `xmin` of every row in `NODE_CONFIG_SOURCES`,
+    which changes whenever one of those rows is created, updated, or
+    deleted, and from `get_preseed_templates_version`.
+
+    :return: A ``(started, version)`` tuple, where `started` is the time
+        at which the current transaction started.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(NODE_CONFIG_VERSION_SQL, {
+            "node": node.id,
+            "controllers": (
+                NODE_TYPE.RACK_CONTROLLER,
+                NODE_TYPE.REGION_CONTROLLER,
+                NODE_TYPE.REGION_AND_RACK_CONTROLLER,
+            ),
+        })
+        started, version = cursor.fetchone()
+    return started, (version, get_preseed_templates_version())
+
+
+def cache_rendered(func):
+    """Cache, in this process, what `func` renders for a node.
+
+    A rendering is reused for as long as `get_node_config_version` is
+    unchanged, except within the transaction that rendered it: that
+    transaction may have changed rows again since, without changing their
+    versions. Renderings are also discarded when the models they derive
+    from are saved or deleted in this process; see `discard_rendered`.
+    """
+    @wraps(func)
+    def wrapper(node):
+        if node.id is None:
+            return func(node)
+        key = func.__name__, node.id
+        started, version = get_node_config_version(node)
+        with _rendered_lock:
+            cached = _rendered.get(key)
+            if cached is not None:
+                _rendered.move_to_end(key)
+        if cached is not None:
+            cached_started, cached_version, rendered = cached
+            if cached_version == version and cached_started != started:
+                return copy(rendered)
+        rendered = func(node)
+        with _rendered_lock:
+            _rendered[key] = started, version, rendered
+            _rendered.move_to_end(key)
+            while len(_rendered) > RENDERED_CACHE_SIZE:
+                _rendered.popitem(last=False)
+        return copy(rendered)
+
+    return wrapper
+
+
+def discard_rendered(node_id=None):
+    """Discard renderings cached by `cache_rendered`.
+
+    :param node_id: The ID of the node whose renderings to discard, or
+        `None` to discard the renderings for all nodes.
+    """
+    with _rendered_lock:
+        if node_id is None:
+            _rendered.clear()
+        else:
+            for key in list(_rendered):
+                if key[1] == node_id:
+                    del _rendered[key]
+
+
 def get_enlist_preseed(rack_controller=None):
     """Return the enlistment preseed.
 
@@ -332,6 +497,7 @@ def compose_curtin_verbose_preseed():
         return []
 
 
+@cache_rendered
 def get_curtin_yaml_config(node):
     """Return the curtin configration for the node."""
     main_config = get_curtin_config(node)
@@ -551,6 +717,7 @@ def get_preseed_type_for(node):
         return PRESEED_TYPE.CURTIN
 
 
+@cache_rendered
 @typed
 def get_preseed(node) -> bytes:
     """Return the preseed for a given node. Depending on the node's
@@ -676,8 +843,7 @@ def get_preseed_template(filenames):
         for filename in filenames:
             filepath = os.path.join(location, filename)
             try:
-                with open(filepath, "r", encoding="utf-8") as stream:
-                    content = stream.read()
+                content = read_preseed_template(filepath)
             except IOError:
                 pass  # Ignore.
             else:
@@ -686,6 +852,50 @@ def get_preseed_template(filenames):
         return None, None
 
 
+# The content of preseed templates, keyed by path. An entry is used for as
+# long as the file's modification time and size are unchanged.
+_preseed_templates = {}
+
+
+def read_preseed_template(filepath):
+    """Return the content of the template at `filepath`.
+
+    The file is only read again when it has changed since it was last read
+    by this process.
+
+    :raise IOError: When the file cannot be read.
+    """
+    stat = os.stat(filepath)
+    stamp = stat.st_mtime_ns, stat.st_size
+    cached = _preseed_templates.get(filepath)
+    if cached is None or cached[0] != stamp:
+        with open(filepath, "r", encoding="utf-8") as stream:
+            cached = stamp, stream.read()
+        _preseed_templates[filepath] = cached
+    return cached[1]
+
+
+def get_preseed_templates_version():
+    """Return a version for all the templates that could be loaded.
+
+    This changes whenever a template is created, modified, or deleted.
+    """
+    version = []
+    for location in settings.PRESEED_TEMPLATE_LOCATIONS:
+        try:
+            entries = list(os.scandir(location))
+        except IOError:
+            continue  # Ignore.
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except IOError:
+                pass  # Ignore.
+            else:
+                version.append((entry.path, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(version))
+
+
 def get_escape_singleton():
     """Return a singleton containing methods to escape various formats used in
     the preseed templates.
@@ -716,6 +926,16 @@ class TemplateNotFoundError(Exception):
         self.name = name
 
 
+@lru_cache(maxsize=256)
+def compile_preseed_template(filepath, content):
+    """Return `content`, from the template at `filepath`, compiled.
+
+    Templates are compiled once per process. The result is shared, so
+    callers must copy it before setting its `get_template`.
+    """
+    return PreseedTemplate(content, name=filepath)
+
+
 def load_preseed_template(node, prefix, osystem='', release=''):
     """Find and load a `PreseedTemplate` for the given node.
 
@@ -736,10 +956,11 @@ def load_preseed_template(node, prefix, osystem='', release=''):
         filepath, content = get_preseed_template(filenames)
         if filepath is None:
             raise TemplateNotFoundError(name)
-        # This is where the closure happens: pass `get_template` when
-        # instanciating PreseedTemplate.
-        return PreseedTemplate(
-            content, name=filepath, get_template=get_template)
+        # This is where the closure happens: set `get_template` on a copy
+        # of the compiled PreseedTemplate.
+        template = copy(compile_preseed_template(filepath, content))
+        template.get_template = get_template
+        return template
 
     return get_template(prefix, None, default=True)
 
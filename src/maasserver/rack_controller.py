@@ -30,6 +30,18 @@ DHCP:
     for messages on 'sys_dhcp_{id}' channel and set that rack controller as
     needing an update. Any time a message is received on this queue that rack
     controller is marked as needing an update.
+
+    A message may name the VLAN that changed. While every message for a rack
+    controller names a VLAN, only the hosts on those VLANs are regenerated
+    for its next update; otherwise its whole configuration is regenerated.
+
+Boot configuration:
+    Every regiond process listens for messages on the 'sys_boot_config'
+    channel, each of which carries the comma-separated MAC addresses of
+    interfaces whose node's status or boot settings have changed. The rack
+    controllers being watched are told to discard the boot configurations
+    they have cached for those MAC addresses. This takes turns with DHCP
+    updates, so that neither holds up the other.
 """
 
 __all__ = [
@@ -41,9 +53,12 @@ from functools import partial
 from maasserver import dhcp
 from maasserver.listener import PostgresListenerUnregistrationError
 from maasserver.models.node import RackController
+from maasserver.rpc import getClientFor
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
 from provisioningserver.logger import LegacyLogger
+from provisioningserver.rpc.cluster import DiscardBootConfig
+from provisioningserver.rpc.exceptions import NoConnectionsAvailable
 from provisioningserver.utils.twisted import (
     asynchronous,
     callOut,
@@ -53,13 +68,21 @@ from twisted.application.service import Service
 from twisted.internet import reactor
 from twisted.internet.defer import (
     CancelledError,
+    DeferredList,
+    inlineCallbacks,
     maybeDeferred,
 )
+from twisted.internet.error import ConnectionClosed
 from twisted.internet.task import LoopingCall
+from twisted.protocols.amp import UnhandledCommand
 
 
 log = LegacyLogger()
 
+# AMP limits each value to 0xffff bytes. A MAC address takes 19 bytes in a
+# `DiscardBootConfig` call, so this keeps each call comfortably below that.
+BOOT_CONFIG_BATCH_SIZE = 3000
+
 
 class RackControllerService(Service):
     """
@@ -86,6 +109,9 @@ class RackControllerService(Service):
         self.processingDone = None
         self.watching = set()
         self.needsDHCPUpdate = set()
+        self.changedVLANs = {}
+        self.bootConfigMACs = set()
+        self.bootConfigTurn = True
         self.postgresListener = postgresListener
         self.advertisingService = advertisingService
 
@@ -99,6 +125,8 @@ class RackControllerService(Service):
             self.processId = advertising.process_id
             self.postgresListener.register(
                 "sys_core_%d" % self.processId, self.coreHandler)
+            self.postgresListener.register(
+                "sys_boot_config", self.bootConfigHandler)
             return self.processId
 
         @transactional
@@ -150,6 +178,14 @@ class RackControllerService(Service):
                 # Error is acceptable as it might not have been called yet.
                 pass
 
+            # Unregister the boot configuration handler.
+            try:
+                self.postgresListener.unregister(
+                    "sys_boot_config", self.bootConfigHandler)
+            except PostgresListenerUnregistrationError:
+                # Error is acceptable as it might not have been called yet.
+                pass
+
             # Unregister all DHCP handling.
             for rack_id in self.watching:
                 try:
@@ -161,6 +197,9 @@ class RackControllerService(Service):
 
             self.watching = set()
             self.needsDHCPUpdate = set()
+            self.changedVLANs = {}
+            self.bootConfigMACs = set()
+            dhcp.prune_cached_hosts(self.watching)
             self.starting = None
             if self.processing.running:
                 self.processing.stop()
@@ -182,13 +221,16 @@ class RackControllerService(Service):
                 self.postgresListener.unregister(
                     "sys_dhcp_%s" % rack_id, self.dhcpHandler)
             self.needsDHCPUpdate.discard(rack_id)
+            self.changedVLANs.pop(rack_id, None)
             self.watching.discard(rack_id)
+            dhcp.discard_cached_hosts(rack_id)
         elif action == "watch":
             if rack_id not in self.watching:
                 self.postgresListener.register(
                     "sys_dhcp_%s" % rack_id, self.dhcpHandler)
             self.watching.add(rack_id)
             self.needsDHCPUpdate.add(rack_id)
+            self.changedVLANs.pop(rack_id, None)
             self.startProcessing()
         else:
             raise ValueError("Unknown action: %s." % action)
@@ -198,9 +240,21 @@ class RackControllerService(Service):
         _, rack_id = channel.split("sys_dhcp_")
         rack_id = int(rack_id)
         if rack_id in self.watching:
+            if message == "":
+                # Anything might have changed; regenerate everything.
+                self.changedVLANs.pop(rack_id, None)
+            elif (rack_id in self.changedVLANs or
+                    rack_id not in self.needsDHCPUpdate):
+                self.changedVLANs.setdefault(rack_id, set()).add(int(message))
             self.needsDHCPUpdate.add(rack_id)
             self.startProcessing()
 
+    def bootConfigHandler(self, channel, message):
+        """Called when the `sys_boot_config` message is received."""
+        if len(self.watching) > 0 and message != "":
+            self.bootConfigMACs.update(message.split(","))
+            self.startProcessing()
+
     def startProcessing(self):
         """Start the process looping call."""
         if not self.processing.running:
@@ -211,10 +265,23 @@ class RackControllerService(Service):
         if not self.running:
             # We're shutting down.
             self.processing.stop()
+        elif len(self.bootConfigMACs) > 0 and (
+                self.bootConfigTurn or len(self.needsDHCPUpdate) == 0):
+            # Discarding boot configurations is quick, and a machine may be
+            # booting right now, so do this first, but then give a rack
+            # controller that needs a DHCP update its turn.
+            self.bootConfigTurn = False
+            macs, self.bootConfigMACs = self.bootConfigMACs, set()
+            d = maybeDeferred(self.processBootConfig, macs)
+            d.addErrback(
+                log.err,
+                "Failed discarding boot configurations on rack controllers.")
+            return d
         elif len(self.needsDHCPUpdate) == 0:
             # Nothing more to do.
             self.processing.stop()
         else:
+            self.bootConfigTurn = True
             rack_id = self.needsDHCPUpdate.pop()
             d = maybeDeferred(self.processDHCP, rack_id)
             d.addErrback(
@@ -224,8 +291,66 @@ class RackControllerService(Service):
             return d
 
     def processDHCP(self, rack_id):
-        """Process DHCP for the rack controller."""
+        """Process DHCP for the rack controller.
+
+        When this fails the VLANs that changed are forgotten, so the hosts
+        cached for the rack controller are discarded too; its next update
+        regenerates them all. Hosts cached for rack controllers that are no
+        longer being watched are discarded either way.
+        """
+        changed_vlans = self.changedVLANs.pop(rack_id, None)
+
+        def eb_discardCachedHosts(failure):
+            dhcp.discard_cached_hosts(rack_id)
+            return failure
+
         d = deferToDatabase(
             transactional(RackController.objects.get), id=rack_id)
-        d.addCallback(dhcp.configure_dhcp)
+        d.addCallback(dhcp.configure_dhcp, changed_vlans=changed_vlans)
+        d.addErrback(eb_discardCachedHosts)
+        d.addBoth(callOut, lambda: dhcp.prune_cached_hosts(self.watching))
+        return d
+
+    def processBootConfig(self, macs):
+        """Discard the boot configurations for `macs` on watched racks.
+
+        The MAC addresses are sent in batches of `BOOT_CONFIG_BATCH_SIZE`.
+        Rack controllers that can't be reached, or that don't know how to
+        discard boot configurations, are skipped; they let the cached
+        configurations expire soon enough anyway. Other failures are logged.
+        """
+        rack_ids = list(self.watching)
+        macs = sorted(macs)
+        batches = [
+            macs[index:index + BOOT_CONFIG_BATCH_SIZE]
+            for index in range(0, len(macs), BOOT_CONFIG_BATCH_SIZE)
+        ]
+
+        @transactional
+        def get_system_ids():
+            return list(RackController.objects.filter(
+                id__in=rack_ids).values_list("system_id", flat=True))
+
+        @inlineCallbacks
+        def discard(client):
+            for batch in batches:
+                yield client(DiscardBootConfig, macs=batch)
+
+        def eb_discard(failure, system_id):
+            if failure.check(
+                    NoConnectionsAvailable, ConnectionClosed,
+                    UnhandledCommand) is None:
+                log.err(
+                    failure, "Failed discarding boot configurations on "
+                    "rack controller '%s'." % system_id)
+
+        def discard_on(system_id):
+            d = getClientFor(system_id, timeout=1)
+            d.addCallback(discard)
+            d.addErrback(eb_discard, system_id)
+            return d
+
+        d = deferToDatabase(get_system_ids)
+        d.addCallback(lambda system_ids: DeferredList(
+            map(discard_on, system_ids)))
         return d
@@ -10,7 +10,9 @@ DNS:
     The regiond process listens for messages from Postgres on channel
     'sys_dns'. Any time a message is recieved on that channel the DNS is marked
     as requiring an update. Once marked for update the DNS configuration is
-    updated and bind9 is told to reload.
+    updated and bind9 is told to reload. After the first update only the zones
+    touched by publications since the previous update are regenerated, when
+    those publications record what they touched.
 
 Proxy:
     The regiond process listens for messages from Postgres on channel
@@ -23,7 +25,7 @@ __all__ = [
     "RegionControllerService",
 ]
 
-from maasserver.dns.config import dns_update_all_zones
+from maasserver.dns.config import dns_update_changed_zones
 from maasserver.proxyconfig import proxy_update_config
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
@@ -64,6 +66,7 @@ class RegionControllerService(Service):
         self.needsDNSUpdate = False
         self.needsProxyUpdate = False
         self.postgresListener = postgresListener
+        self.dnsPublicationId = None
 
     @asynchronous(timeout=FOREVER)
     def startService(self):
@@ -97,6 +100,10 @@ class RegionControllerService(Service):
         self.needsProxyUpdate = True
         self.startProcessing()
 
+    def _setDNSPublicationId(self, publication_id):
+        """Record the most recent publication that has been published."""
+        self.dnsPublicationId = publication_id
+
     def startProcessing(self):
         """Start the process looping call."""
         if not self.processing.running:
@@ -107,7 +114,10 @@ class RegionControllerService(Service):
         defers = []
         if self.needsDNSUpdate:
             self.needsDNSUpdate = False
-            d = deferToDatabase(transactional(dns_update_all_zones))
+            d = deferToDatabase(
+                transactional(dns_update_changed_zones),
+                self.dnsPublicationId)
+            d.addCallback(self._setDNSPublicationId)
             d.addCallback(
                 lambda _: log.msg(
                     "Successfully configured DNS."))
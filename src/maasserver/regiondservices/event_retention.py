@@ -0,0 +1,113 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Service that periodically deletes old node events."""
+
+__all__ = [
+    "EventRetentionService"
+]
+
+from datetime import timedelta
+
+from maasserver.models import (
+    Config,
+    Event,
+)
+from maasserver.models.event import (
+    EVENT_DELETE_BATCH_SIZE,
+    EVENT_FILL_LEVEL_BATCH_SIZE,
+)
+from maasserver.models.timestampedmodel import now
+from maasserver.utils.orm import transactional
+from maasserver.utils.threads import deferToDatabase
+from provisioningserver.logger import LegacyLogger
+from twisted.application.internet import TimerService
+from twisted.internet import reactor
+from twisted.internet.defer import (
+    inlineCallbacks,
+    returnValue,
+)
+
+
+log = LegacyLogger()
+
+
+# How often to look for events older than the retention period.
+CHECK_INTERVAL = timedelta(hours=1).total_seconds()
+
+
+class EventRetentionService(TimerService):
+    """Service to delete events older than `events_retention_days`.
+
+    Events are deleted in batches of `EVENT_DELETE_BATCH_SIZE`, each in its
+    own transaction, so that no transaction holds locks on the event table
+    for long, and other database work can run in between.
+
+    Events created before events recorded their level are also given their
+    type's level, in batches of `EVENT_FILL_LEVEL_BATCH_SIZE`.
+    """
+
+    def __init__(self, clock=reactor):
+        super().__init__(CHECK_INTERVAL, self.run)
+        self.clock = clock
+
+    @inlineCallbacks
+    def run(self):
+        try:
+            filled = yield self.fillEventLevels()
+            if filled > 0:
+                log.msg("Filled in the level of %d event(s)." % filled)
+        except:
+            log.err(None, "Failed to fill in the level of events.")
+        try:
+            cutoff = yield deferToDatabase(self.getCutoff)
+            if cutoff is not None:
+                deleted = yield self.deleteEventsBefore(cutoff)
+                if deleted > 0:
+                    log.msg(
+                        "Deleted %d event(s) created before %s." % (
+                            deleted, cutoff))
+        except:
+            log.err(None, "Failed to delete old events.")
+
+    @transactional
+    def getCutoff(self):
+        """Return the time before which events should be deleted.
+
+        :return: A `datetime`, or `None` if events are kept forever.
+        """
+        days = Config.objects.get_config('events_retention_days')
+        if days is None or days <= 0:
+            return None
+        else:
+            return now() - timedelta(days=days)
+
+    @inlineCallbacks
+    def deleteEventsBefore(self, cutoff):
+        """Delete events created before `cutoff`, one batch at a time.
+
+        :return: A `Deferred` that fires with the number of events deleted.
+        """
+        deleted = 0
+        while True:
+            count = yield deferToDatabase(
+                transactional(Event.objects.delete_older_than), cutoff,
+                EVENT_DELETE_BATCH_SIZE)
+            deleted += count
+            if count < EVENT_DELETE_BATCH_SIZE:
+                returnValue(deleted)
+
+    @inlineCallbacks
+    def fillEventLevels(self):
+        """Give events without a level their type's, one batch at a time.
+
+        :return: A `Deferred` that fires with the number of events updated.
+        """
+        filled = 0
+        while True:
+            count = yield deferToDatabase(
+                transactional(Event.objects.fill_levels),
+                EVENT_FILL_LEVEL_BATCH_SIZE)
+            filled += count
+            if count < EVENT_FILL_LEVEL_BATCH_SIZE:
+                returnValue(filled)
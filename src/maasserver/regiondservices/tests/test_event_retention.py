@@ -0,0 +1,143 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.regiondservices.event_retention`."""
+
+__all__ = []
+
+from datetime import timedelta
+
+from crochet import wait_for
+from maasserver.models import (
+    Config,
+    Event,
+)
+from maasserver.models.timestampedmodel import now
+from maasserver.regiondservices import event_retention
+from maasserver.regiondservices.event_retention import EventRetentionService
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import (
+    MAASServerTestCase,
+    MAASTransactionServerTestCase,
+)
+from maasserver.utils.orm import transactional
+from maasserver.utils.threads import deferToDatabase
+from maastesting.matchers import DocTestMatches
+from maastesting.testcase import MAASTestCase
+from maastesting.twisted import TwistedLoggerFixture
+from testtools.matchers import MatchesStructure
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import Clock
+
+
+wait_for_reactor = wait_for(30)  # 30 seconds.
+
+
+class TestEventRetentionService(MAASTestCase):
+    """Tests for `EventRetentionService`."""
+
+    def test_runs_every_hour(self):
+        clock = Clock()
+        service = EventRetentionService(clock=clock)
+        self.assertThat(service, MatchesStructure.byEquality(
+            step=timedelta(hours=1).total_seconds(), clock=clock,
+            call=(service.run, (), {})))
+
+
+class TestEventRetentionServiceGetCutoff(MAASServerTestCase):
+    """Tests for `EventRetentionService.getCutoff`."""
+
+    def test_returns_None_when_events_are_kept_forever(self):
+        Config.objects.set_config('events_retention_days', 0)
+        self.assertIsNone(EventRetentionService().getCutoff())
+
+    def test_returns_time_retention_days_ago(self):
+        Config.objects.set_config('events_retention_days', 30)
+        self.assertEqual(
+            now() - timedelta(days=30), EventRetentionService().getCutoff())
+
+
+class TestEventRetentionServiceRun(MAASTransactionServerTestCase):
+    """Tests for `EventRetentionService.run`."""
+
+    @transactional
+    def make_events(self, count, days_ago):
+        events = [factory.make_Event() for _ in range(count)]
+        Event.objects.filter(id__in=[event.id for event in events]).update(
+            created=now() - timedelta(days=days_ago))
+        return [event.id for event in events]
+
+    @transactional
+    def get_event_ids(self):
+        return set(Event.objects.values_list("id", flat=True))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_deletes_old_events_in_batches(self):
+        self.patch(event_retention, "EVENT_DELETE_BATCH_SIZE", 2)
+        yield deferToDatabase(
+            transactional(Config.objects.set_config),
+            'events_retention_days', 7)
+        yield deferToDatabase(self.make_events, 5, 8)
+        new_events = yield deferToDatabase(self.make_events, 2, 1)
+
+        with TwistedLoggerFixture() as logger:
+            yield EventRetentionService().run()
+
+        event_ids = yield deferToDatabase(self.get_event_ids)
+        self.assertEqual(set(new_events), event_ids)
+        self.assertThat(logger.output, DocTestMatches(
+            "Deleted 5 event(s) created before ..."))
+
+    @transactional
+    def make_events_without_level(self, count):
+        events = [factory.make_Event() for _ in range(count)]
+        Event.objects.filter(id__in=[event.id for event in events]).update(
+            level=None)
+
+    @transactional
+    def count_events_without_level(self):
+        return Event.objects.filter(level__isnull=True).count()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_fills_in_levels_in_batches(self):
+        self.patch(event_retention, "EVENT_FILL_LEVEL_BATCH_SIZE", 2)
+        yield deferToDatabase(self.make_events_without_level, 5)
+
+        with TwistedLoggerFixture() as logger:
+            yield EventRetentionService().run()
+
+        count = yield deferToDatabase(self.count_events_without_level)
+        self.assertEqual(0, count)
+        self.assertThat(logger.output, DocTestMatches(
+            "Filled in the level of 5 event(s)."))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_keeps_events_when_retention_is_disabled(self):
+        yield deferToDatabase(
+            transactional(Config.objects.set_config),
+            'events_retention_days', 0)
+        old_events = yield deferToDatabase(self.make_events, 2, 1000)
+
+        yield EventRetentionService().run()
+
+        event_ids = yield deferToDatabase(self.get_event_ids)
+        self.assertEqual(set(old_events), event_ids)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_logs_failures(self):
+        service = EventRetentionService()
+        self.patch(service, "getCutoff").side_effect = ZeroDivisionError()
+
+        with TwistedLoggerFixture() as logger:
+            yield service.run()
+
+        self.assertThat(logger.output, DocTestMatches("""\
+            Failed to delete old events.
+            Traceback (most recent call last):
+            ...
+            builtins.ZeroDivisionError:
+            """))
@@ -7,8 +7,11 @@ __all__ = [
     "register_event_type",
     "send_event",
     "send_event_mac_address",
+    "send_events",
 ]
 
+from datetime import datetime
+
 from maasserver.enum import INTERFACE_TYPE
 from maasserver.models import (
     Event,
@@ -17,6 +20,10 @@ from maasserver.models import (
     Node,
 )
 from maasserver.utils.orm import transactional
+from netaddr import (
+    AddrFormatError,
+    EUI,
+)
 from provisioningserver.logger import get_maas_logger
 from provisioningserver.rpc.exceptions import NoSuchEventType
 from provisioningserver.utils.twisted import synchronous
@@ -90,3 +97,89 @@ def send_event_mac_address(mac_address, type_name, description, timestamp):
         Event.objects.create(
             node=interface.node, type=event_type, description=description,
             created=timestamp)
+
+
+def _parse_mac(mac_address):
+    """Return `mac_address` as an `EUI`, or `None` if it's not valid."""
+    try:
+        return EUI(mac_address)
+    except (AddrFormatError, TypeError, ValueError):
+        return None
+
+
+@synchronous
+@transactional
+def send_events(events, timestamp):
+    """Send many events.
+
+    The event types and nodes are resolved with one query each for the
+    whole batch, and the events are inserted together. Events for unknown
+    event types or nodes are ignored, as for `send_event`.
+
+    for :py:class:`~provisioningserver.rpc.region.SendEvents`.
+
+    :param events: An iterable of dicts with `type_name`, `description`,
+        and one of `system_id` or `mac_address`, and optionally the
+        `timestamp` at which the event occurred.
+    :param timestamp: The `datetime` to record for events without a
+        `timestamp` of their own.
+    """
+    events = list(events)
+    event_types = {
+        name: (type_id, level)
+        for name, type_id, level in (
+            EventType.objects
+            .filter(name__in={event["type_name"] for event in events})
+            .values_list("name", "id", "level"))
+    }
+    node_ids = dict(
+        Node.objects
+        .filter(system_id__in={
+            event["system_id"] for event in events
+            if event.get("system_id") is not None})
+        .values_list("system_id", "id"))
+    # MAC addresses are matched as `EUI`s because the rack may not format
+    # them as the database does.
+    mac_addresses = {
+        event["mac_address"]: _parse_mac(event["mac_address"])
+        for event in events if event.get("mac_address") is not None
+    }
+    mac_node_ids = {
+        EUI(str(mac_address)): node_id
+        for mac_address, node_id in (
+            Interface.objects
+            .filter(
+                type=INTERFACE_TYPE.PHYSICAL,
+                mac_address__in={
+                    str(mac_address) for mac_address in mac_addresses.values()
+                    if mac_address is not None})
+            .values_list("mac_address", "node_id"))
+    }
+    records = []
+    for event in events:
+        type_name, description = event["type_name"], event["description"]
+        if type_name not in event_types:
+            maaslog.debug(
+                "Event '%s: %s' sent with non-existent event type.",
+                type_name, description)
+            continue
+        if event.get("system_id") is not None:
+            node_id = node_ids.get(event["system_id"])
+        else:
+            node_id = mac_node_ids.get(mac_addresses.get(event["mac_address"]))
+        if node_id is None:
+            # See `send_event` for why this is not an error.
+            maaslog.debug(
+                "Event '%s: %s' sent for non-existent node '%s'.",
+                type_name, description,
+                event.get("system_id") or event.get("mac_address"))
+            continue
+        type_id, level = event_types[type_name]
+        if event.get("timestamp") is None:
+            created = timestamp
+        else:
+            created = datetime.fromtimestamp(event["timestamp"])
+        records.append(Event(
+            node_id=node_id, type_id=type_id, level=level,
+            description=description, created=created, updated=created))
+    Event.objects.bulk_create(records)
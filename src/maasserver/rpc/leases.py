@@ -5,13 +5,19 @@
 
 __all__ = [
     "update_lease",
+    "update_leases",
 ]
 
+from collections import (
+    defaultdict,
+    OrderedDict,
+)
 from datetime import datetime
 
 from maasserver.enum import (
     IPADDRESS_FAMILY,
     IPADDRESS_TYPE,
+    IPRANGE_TYPE,
 )
 from maasserver.models import (
     DNSResource,
@@ -23,10 +29,17 @@ from maasserver.models import (
 )
 from maasserver.utils.orm import transactional
 from netaddr import IPAddress
+from provisioningserver.logger import get_maas_logger
 from provisioningserver.utils.network import coerce_to_valid_hostname
 from provisioningserver.utils.twisted import synchronous
 
 
+maaslog = get_maas_logger("region.leases")
+
+# Actions that a cluster can report for a lease.
+LEASE_ACTIONS = ("commit", "expiry", "release")
+
+
 class LeaseUpdateError(Exception):
     """Raise when `update_lease` fails to update lease information."""
 
@@ -67,12 +80,143 @@ def update_lease(
         exist.
     """
     # Check for a valid action.
-    if action not in ["commit", "expiry", "release"]:
+    if action not in LEASE_ACTIONS:
         raise LeaseUpdateError("Unknown lease action: %s" % action)
 
     # Get the subnet for this IP address. If no subnet exists then something
     # is wrong as we should not be recieving message about unknown subnets.
     subnet = Subnet.objects.get_best_subnet_for_ip(ip)
+    subnet_family = _check_subnet(subnet, ip_family, ip)
+
+    # We will recieve actions on all addresses in the subnet. We only want
+    # to update the addresses in the dynamic range.
+    dynamic_range = subnet.get_dynamic_range_for_ip(IPAddress(ip))
+    if dynamic_range is None:
+        # Do nothing.
+        return {}
+
+    interfaces = list(Interface.objects.filter(mac_address=mac))
+    _apply_lease(
+        action, mac, ip, timestamp, lease_time, hostname,
+        subnet, subnet_family, interfaces, _hostname_belongs_to_a_node)
+    return {}
+
+
+def coalesce_lease_updates(updates):
+    """Return `updates` keeping only the last action for each MAC/IP pair.
+
+    The order of the returned updates follows the position of the last
+    update seen for each pair, so later actions are still applied after
+    earlier ones.
+    """
+    coalesced = OrderedDict()
+    for update in updates:
+        key = (update["mac"].lower(), update["ip"])
+        coalesced.pop(key, None)
+        coalesced[key] = update
+    return list(coalesced.values())
+
+
+@synchronous
+@transactional
+def update_leases(updates):
+    """Update a batch of DHCP leases from a cluster in one transaction.
+
+    :param updates: A list of dicts, each with the arguments accepted by
+        `update_lease`, as found in
+        :py:class`~provisioningserver.rpc.region.UpdateLeases`.
+
+    The subnets (with their dynamic ranges), interfaces and node hostnames
+    needed for the whole batch are fetched up front with a fixed number of
+    queries, instead of several queries per lease. A lease that cannot be
+    processed is logged and skipped; it does not abort the rest of the
+    batch.
+    """
+    updates = coalesce_lease_updates(updates)
+    if len(updates) == 0:
+        return {}
+
+    subnets = list(
+        Subnet.objects.select_related("vlan").prefetch_related(
+            "iprange_set"))
+
+    interfaces_by_mac = defaultdict(list)
+    macs = {update["mac"] for update in updates}
+    for interface in Interface.objects.filter(mac_address__in=macs):
+        interfaces_by_mac[str(interface.mac_address).lower()].append(
+            interface)
+
+    hostnames = {
+        coerce_to_valid_hostname(update["hostname"])
+        for update in updates
+        if _get_lease_hostname(update.get("hostname")) is not None
+    }
+    node_hostnames = set(
+        Node.objects.filter(hostname__in=hostnames).values_list(
+            "hostname", flat=True))
+
+    for update in updates:
+        action, mac, ip = update["action"], update["mac"], update["ip"]
+        try:
+            if action not in LEASE_ACTIONS:
+                raise LeaseUpdateError("Unknown lease action: %s" % action)
+            subnet = _find_best_subnet_for_ip(subnets, ip)
+            subnet_family = _check_subnet(subnet, update["ip_family"], ip)
+        except LeaseUpdateError as error:
+            maaslog.warning("Ignoring DHCP lease update: %s", error)
+            continue
+
+        ip_address = IPAddress(ip)
+        dynamic_range = None
+        for iprange in subnet.iprange_set.all():
+            if (iprange.type == IPRANGE_TYPE.DYNAMIC and
+                    ip_address in iprange.netaddr_iprange):
+                dynamic_range = iprange
+                break
+        if dynamic_range is None:
+            continue
+
+        interfaces = interfaces_by_mac[mac.lower()]
+        created = _apply_lease(
+            action, mac, ip, update["timestamp"], update.get("lease_time"),
+            update.get("hostname"), subnet, subnet_family, interfaces,
+            lambda hostname: hostname in node_hostnames)
+        if created is not None:
+            interfaces.append(created)
+    return {}
+
+
+def _hostname_belongs_to_a_node(hostname):
+    """Whether `hostname`, already coerced, is used by a node."""
+    return Node.objects.filter(hostname=hostname).exists()
+
+
+def _find_best_subnet_for_ip(subnets, ip):
+    """Return the best subnet from `subnets` for `ip`.
+
+    This mirrors `SubnetManager.get_best_subnet_for_ip`: subnets on VLANs
+    with DHCP enabled win, then the most specific subnet.
+    """
+    ip = IPAddress(ip)
+    if ip.is_ipv4_mapped():
+        ip = ip.ipv4()
+    best, best_key = None, None
+    for subnet in subnets:
+        network = subnet.get_ipnetwork()
+        if network.version != ip.version or ip not in network:
+            continue
+        key = (subnet.vlan.dhcp_on, network.prefixlen)
+        if best_key is None or key > best_key:
+            best, best_key = subnet, key
+    return best
+
+
+def _check_subnet(subnet, ip_family, ip):
+    """Check `subnet` exists and matches `ip_family`.
+
+    :return: The family of `subnet`.
+    :raises LeaseUpdateError: If the subnet is missing or mismatched.
+    """
     if subnet is None:
         raise LeaseUpdateError("No subnet exists for: %s" % ip)
 
@@ -84,25 +228,42 @@ def update_lease(
     elif ip_family == "ipv6" and subnet_family != IPADDRESS_FAMILY.IPv6:
         raise LeaseUpdateError(
             "Family for the subnet does not match. Expected: %s" % ip_family)
+    return subnet_family
 
-    # We will recieve actions on all addresses in the subnet. We only want
-    # to update the addresses in the dynamic range.
-    dynamic_range = subnet.get_dynamic_range_for_ip(IPAddress(ip))
-    if dynamic_range is None:
-        # Do nothing.
-        return {}
 
-    interfaces = list(Interface.objects.filter(mac_address=mac))
+def _get_lease_hostname(hostname):
+    """Return `hostname` or `None` if the cluster did not send one.
+
+    Hostname sent from the cluster is either blank or can be "(none)". In
+    either of those cases we do not set the hostname.
+    """
+    if (hostname is not None and
+            len(hostname) > 0 and
+            not hostname.isspace() and
+            hostname != "(none)"):
+        return hostname
+    else:
+        return None
+
+
+def _apply_lease(
+        action, mac, ip, timestamp, lease_time, hostname,
+        subnet, subnet_family, interfaces, hostname_belongs_to_a_node):
+    """Apply a validated lease `action` to `interfaces`.
+
+    :return: The `UnknownInterface` created for `mac`, if one was needed.
+    """
+    created_interface = None
     if len(interfaces) == 0 and action == "commit":
         # A MAC address that is unknown to MAAS was given an IP address. Create
         # an unknown interface for this lease.
-        unknown_interface = UnknownInterface(
+        created_interface = UnknownInterface(
             name="eth0", mac_address=mac, vlan_id=subnet.vlan_id)
-        unknown_interface.save()
-        interfaces = [unknown_interface]
+        created_interface.save()
+        interfaces = [created_interface]
     elif len(interfaces) == 0:
         # No interfaces and not commit action so nothing needs to be done.
-        return {}
+        return None
 
     sip = None
     # Delete all discovered IP addresses attached to all interfaces of the same
@@ -127,14 +288,7 @@ def update_lease(
         # Interfaces received a new lease. Create the new object with the
         # updated lease information.
 
-        # Hostname sent from the cluster is either blank or can be "(none)". In
-        # either of those cases we do not set the hostname.
-        sip_hostname = None
-        if (hostname is not None and
-                len(hostname) > 0 and
-                not hostname.isspace() and
-                hostname != "(none)"):
-            sip_hostname = hostname
+        sip_hostname = _get_lease_hostname(hostname)
 
         # Use the timestamp from the lease to create the StaticIPAddress
         # object. That will make sure that the lease_time is correct from
@@ -150,11 +304,8 @@ def update_lease(
         if sip_hostname is not None:
             # MAAS automatically manages DNS for node hostnames, so we cannot
             # allow a DHCP client to override that.
-            hostname_belongs_to_a_node = (
-                Node.objects.filter(
-                    hostname=coerce_to_valid_hostname(sip_hostname)).exists()
-            )
-            if hostname_belongs_to_a_node:
+            if hostname_belongs_to_a_node(
+                    coerce_to_valid_hostname(sip_hostname)):
                 # Ensure we don't allow a DHCP hostname to override a node
                 # hostname.
                 DNSResource.objects.release_dynamic_hostname(sip)
@@ -171,4 +322,4 @@ def update_lease(
             sip.save()
         for interface in interfaces:
             interface.ip_addresses.add(sip)
-    return {}
+    return created_interface
@@ -6,6 +6,7 @@
 __all__ = [
     "mark_node_failed",
     "update_node_power_state",
+    "update_node_power_states",
     "commission_node",
     "create_node",
 ]
@@ -19,6 +20,12 @@ import json
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db.models import (
+    Case,
+    CharField,
+    Value,
+    When,
+)
 from maasserver import (
     exceptions,
     ntp,
@@ -44,6 +51,14 @@ from provisioningserver.rpc.exceptions import (
 from provisioningserver.utils.twisted import synchronous
 
 
+# Statuses in which a change of power state also changes the status of the
+# node. See `Node.update_power_state`.
+POWER_STATE_DEPENDENT_STATUSES = {
+    NODE_STATUS.RELEASING,
+    NODE_STATUS.EXITING_RESCUE_MODE,
+}
+
+
 @synchronous
 @transactional
 def mark_node_failed(system_id, error_description):
@@ -187,6 +202,46 @@ def update_node_power_state(system_id, power_state):
     node.update_power_state(power_state)
 
 
+@synchronous
+@transactional
+def update_node_power_states(states):
+    """Update the power states of many nodes.
+
+    Only the nodes whose power state has changed are written, with a single
+    UPDATE, so unchanged nodes do not fire the node triggers. Nodes whose
+    status depends on the power state, e.g. a releasing node powering off,
+    are always updated through `Node.update_power_state`.
+
+    for :py:class:`~provisioningserver.rpc.region.UpdateNodePowerStates`.
+
+    :param states: An iterable of dicts with `system_id` and `power_state`.
+    """
+    power_states = {
+        state["system_id"]: state["power_state"]
+        for state in states
+    }
+    nodes = (
+        Node.objects
+        .filter(system_id__in=power_states.keys())
+        .only("id", "system_id", "power_state", "status"))
+    changed_states = {}
+    for node in nodes:
+        power_state = power_states[node.system_id]
+        if node.status in POWER_STATE_DEPENDENT_STATUSES:
+            # The status may need to change even when the power state has
+            # not, e.g. a releasing node that was already off.
+            Node.objects.get(id=node.id).update_power_state(power_state)
+        elif node.power_state != power_state:
+            changed_states[node.id] = power_state
+    if len(changed_states) > 0:
+        Node.objects.filter(id__in=changed_states.keys()).update(
+            power_state=Case(*(
+                When(id=node_id, then=Value(power_state))
+                for node_id, power_state in changed_states.items()
+            ), output_field=CharField()),
+            power_state_updated=now())
+
+
 @synchronous
 @transactional
 def create_node(
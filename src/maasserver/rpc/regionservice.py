@@ -50,6 +50,7 @@ from maasserver.rpc import (
     packagerepository,
     rackcontrollers,
 )
+from maasserver.rpc.events import send_events
 from maasserver.rpc.nodes import (
     commission_node,
     create_node,
@@ -74,7 +75,10 @@ from provisioningserver.rpc import (
     exceptions,
     region,
 )
-from provisioningserver.rpc.common import RPCProtocol
+from provisioningserver.rpc.common import (
+    RPCProtocol,
+    select_least_loaded,
+)
 from provisioningserver.rpc.exceptions import NoSuchCluster
 from provisioningserver.rpc.interfaces import IConnection
 from provisioningserver.security import calculate_digest
@@ -198,6 +202,30 @@ class Region(RPCProtocol):
         # region recieves the message.
         return d
 
+    @region.UpdateLeases.responder
+    def update_leases(self, cluster_uuid, updates):
+        """update_leases(cluster_uuid, updates)
+
+        Implementation of
+        :py:class`~provisioningserver.rpc.region.UpdateLeases`.
+        """
+        dbtasks = eventloop.services.getServiceNamed("database-tasks")
+        d = dbtasks.deferTask(leases.update_leases, updates)
+
+        # Catch all errors except the NoSuchCluster failure. We want that to
+        # be sent back to the cluster.
+        def err_NoSuchCluster_passThrough(failure):
+            if failure.check(NoSuchCluster):
+                return failure
+            else:
+                log.err(failure, "Unhandled failure in updating leases.")
+                return {}
+        d.addErrback(err_NoSuchCluster_passThrough)
+
+        # Wait for the batch to be handled so that batches from a cluster
+        # are processed in order no matter which region recieves them.
+        return d
+
     @amp.StartTLS.responder
     def get_tls_parameters(self):
         """get_tls_parameters()
@@ -320,6 +348,17 @@ class Region(RPCProtocol):
         d.addCallback(lambda args: {})
         return d
 
+    @region.UpdateNodePowerStates.responder
+    def update_node_power_states(self, states):
+        """update_node_power_states()
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.region.UpdateNodePowerStates`.
+        """
+        d = deferToDatabase(nodes.update_node_power_states, states)
+        d.addCallback(lambda args: {})
+        return d
+
     @region.RegisterEventType.responder
     def register_event_type(self, name, description, level):
         """register_event_type()
@@ -362,6 +401,20 @@ class Region(RPCProtocol):
         # Don't wait for the record to be written.
         return succeed({})
 
+    @region.SendEvents.responder
+    def send_events(self, events):
+        """send_events()
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.region.SendEvents`.
+        """
+        # Unlike `send_event`, wait for the records to be written: the rack
+        # keeps the events until this responds, so none are lost if the
+        # region goes away in the meantime.
+        d = deferToDatabase(send_events, events, datetime.now())
+        d.addCallback(lambda _: {})
+        return d
+
     @region.ReportForeignDHCPServer.responder
     def report_foreign_dhcp_server(
             self, system_id, interface_name, dhcp_ip=None):
@@ -784,15 +837,16 @@ class RegionService(service.Service, object):
             waiters.add(d)
             return d
         else:
-            connection = random.choice(conns)
+            connection = select_least_loaded(conns)
             return defer.succeed(connection)
 
     def _getConnectionFromIdentifiers(self, identifiers, timeout):
         """Wait up to `timeout` seconds for at least one connection from
         `identifiers`.
 
-        Returns a `Deferred` which will fire with a list of random connections
-        to each client. Only one connection per client will be returned.
+        Returns a `Deferred` which will fire with a list of the least loaded
+        connections to each client. Only one connection per client will be
+        returned.
 
         The public interface to this method is `getClientFromIdentifiers`.
         """
@@ -800,7 +854,7 @@ class RegionService(service.Service, object):
         for ident in identifiers:
             conns = list(self.connections[ident])
             if len(conns) > 0:
-                matched_connections.append(random.choice(conns))
+                matched_connections.append(select_least_loaded(conns))
         if len(matched_connections) > 0:
             return defer.succeed(matched_connections)
         else:
@@ -954,7 +1008,7 @@ class RegionService(service.Service, object):
 
         If more than one connection exists to that rack controller - implying
         that there are multiple rack controllers for the particular
-        cluster, for HA - one of them will be returned at random.
+        cluster, for HA - the least loaded of them will be returned.
 
         :param system_id: The system_id - as a string - of the rack controller
             that a connection is wanted for.
@@ -979,7 +1033,7 @@ class RegionService(service.Service, object):
         identifiers.
 
         If more than one connection exists to that given `identifiers`, then
-        one of them will be returned at random.
+        the least loaded of them will be returned.
 
         :param identifiers: List of system_id's of the rack controller
             that a connection is wanted for.
@@ -997,7 +1051,7 @@ class RegionService(service.Service, object):
                 "available." % ','.join(identifiers))
 
         def cb_client(conns):
-            return common.Client(random.choice(conns))
+            return common.Client(select_least_loaded(conns))
 
         return d.addCallbacks(cb_client, cancelled)
 
@@ -1005,7 +1059,7 @@ class RegionService(service.Service, object):
     def getAllClients(self):
         """Return a list with one connection per rack controller."""
         return [
-            common.Client(random.choice(list(connections)))
+            common.Client(select_least_loaded(connections))
             for connections in self.connections.values()
             if len(connections) > 0
         ]
@@ -1023,7 +1077,7 @@ class RegionService(service.Service, object):
             # The connection object is a set of RegionServer objects.
             # Make sure a sane set was returned.
             assert len(connection) > 0, "Connection set empty."
-            return common.Client(random.choice(list(connection)))
+            return common.Client(select_least_loaded(connection))
 
 
 def ignoreCancellation(failure):
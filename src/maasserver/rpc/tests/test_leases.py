@@ -18,8 +18,10 @@ from maasserver.models import DNSResource
 from maasserver.models.interface import UnknownInterface
 from maasserver.models.staticipaddress import StaticIPAddress
 from maasserver.rpc.leases import (
+    coalesce_lease_updates,
     LeaseUpdateError,
     update_lease,
+    update_leases,
 )
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
@@ -381,3 +383,96 @@ class TestUpdateLease(MAASServerTestCase):
         self.assertItemsEqual(
             [boot_interface.id],
             sip.interface_set.values_list("id", flat=True))
+
+
+class TestCoalesceLeaseUpdates(MAASServerTestCase):
+
+    def test_keeps_last_update_for_each_mac_and_ip(self):
+        mac = factory.make_mac_address()
+        ip = factory.make_ipv4_address()
+        other = {"mac": mac, "ip": factory.make_ipv4_address()}
+        last = {"mac": mac.upper(), "ip": ip, "action": "release"}
+        self.assertEquals(
+            [other, last],
+            coalesce_lease_updates([
+                {"mac": mac, "ip": ip, "action": "commit"},
+                other,
+                last,
+            ]))
+
+
+class TestUpdateLeases(MAASServerTestCase):
+
+    def make_update(self, subnet, action="commit", mac=None, hostname=None):
+        dynamic_range = subnet.get_dynamic_ranges()[0]
+        return {
+            "action": action,
+            "mac": factory.make_mac_address() if mac is None else mac,
+            "ip_family": "ipv4",
+            "ip": str(factory.pick_ip_in_IPRange(dynamic_range)),
+            "timestamp": int(time.time()),
+            "lease_time": random.randint(30, 1000),
+            "hostname": hostname,
+        }
+
+    def make_managed_subnet(self):
+        return factory.make_ipv4_Subnet_with_IPRanges(
+            with_static_range=False, dhcp_on=True)
+
+    def test_creates_leases_for_all_updates(self):
+        subnet = self.make_managed_subnet()
+        updates = [self.make_update(subnet) for _ in range(3)]
+        update_leases(updates)
+        for update in updates:
+            sip = StaticIPAddress.objects.get(
+                alloc_type=IPADDRESS_TYPE.DISCOVERED, ip=update["ip"])
+            self.assertEquals(subnet, sip.subnet)
+            self.assertItemsEqual(
+                [str(update["mac"])],
+                [str(interface.mac_address)
+                 for interface in sip.interface_set.all()])
+
+    def test_applies_only_last_action_for_mac_and_ip(self):
+        subnet = self.make_managed_subnet()
+        node = factory.make_Node_with_Interface_on_Subnet(subnet=subnet)
+        boot_interface = node.get_boot_interface()
+        commit = self.make_update(subnet, mac=str(boot_interface.mac_address))
+        release = dict(commit, action="release")
+        update_leases([commit, release])
+        self.assertIsNone(
+            StaticIPAddress.objects.filter(
+                alloc_type=IPADDRESS_TYPE.DISCOVERED,
+                ip=commit["ip"]).first())
+        sip = StaticIPAddress.objects.filter(
+            alloc_type=IPADDRESS_TYPE.DISCOVERED, ip=None,
+            subnet=subnet, interface=boot_interface).first()
+        self.assertIsNotNone(sip)
+
+    def test_skips_invalid_updates(self):
+        subnet = self.make_managed_subnet()
+        bad = self.make_update(subnet, action=factory.make_name("action"))
+        no_subnet = dict(
+            self.make_update(subnet), ip=factory.make_ipv6_address(),
+            ip_family="ipv6")
+        good = self.make_update(subnet)
+        update_leases([bad, no_subnet, good])
+        self.assertIsNotNone(
+            StaticIPAddress.objects.filter(
+                alloc_type=IPADDRESS_TYPE.DISCOVERED, ip=good["ip"]).first())
+
+    def test_creates_dns_record_for_hostname(self):
+        subnet = self.make_managed_subnet()
+        hostname = factory.make_name("host").lower()
+        update = self.make_update(subnet, hostname=hostname)
+        update_leases([update])
+        dns_resource = DNSResource.objects.get(name=hostname)
+        self.assertThat(
+            dns_resource.ip_addresses.first(),
+            MatchesStructure.byEquality(ip=update["ip"]))
+
+    def test_skips_dns_record_for_hostname_from_existing_node(self):
+        subnet = self.make_managed_subnet()
+        hostname = factory.make_name("host").lower()
+        factory.make_Node(hostname=hostname)
+        update_leases([self.make_update(subnet, hostname=hostname)])
+        self.assertFalse(DNSResource.objects.filter(name=hostname).exists())
@@ -31,6 +31,7 @@ from maasserver.rpc.nodes import (
     mark_node_failed,
     request_node_info_by_mac_address,
     update_node_power_state,
+    update_node_power_states,
 )
 from maasserver.rpc.testing.fixtures import MockLiveRegionToClusterRPCFixture
 from maasserver.testing.architecture import make_usable_architecture
@@ -535,6 +536,72 @@ class TestUpdateNodePowerState(MAASServerTestCase):
         self.assertEqual(reload_object(node).power_state, POWER_STATE.ON)
 
 
+class TestUpdateNodePowerStates(MAASServerTestCase):
+
+    def test__updates_changed_power_states(self):
+        node_on = factory.make_Node(power_state=POWER_STATE.OFF)
+        node_off = factory.make_Node(power_state=POWER_STATE.ON)
+        update_node_power_states([
+            {"system_id": node_on.system_id, "power_state": POWER_STATE.ON},
+            {"system_id": node_off.system_id, "power_state": POWER_STATE.OFF},
+        ])
+        self.assertEqual(POWER_STATE.ON, reload_object(node_on).power_state)
+        self.assertEqual(
+            POWER_STATE.OFF, reload_object(node_off).power_state)
+
+    def test__does_not_write_unchanged_power_states(self):
+        node = factory.make_Node(power_state=POWER_STATE.ON)
+        power_state_updated = node.power_state_updated
+        update_node_power_states([
+            {"system_id": node.system_id, "power_state": POWER_STATE.ON},
+        ])
+        self.assertEqual(
+            power_state_updated, reload_object(node).power_state_updated)
+
+    def test__ignores_unknown_nodes(self):
+        node = factory.make_Node(power_state=POWER_STATE.OFF)
+        update_node_power_states([
+            {"system_id": factory.make_name("system_id"),
+             "power_state": POWER_STATE.ON},
+            {"system_id": node.system_id, "power_state": POWER_STATE.ON},
+        ])
+        self.assertEqual(POWER_STATE.ON, reload_object(node).power_state)
+
+    def test__releases_node_that_powered_off(self):
+        node = factory.make_Node(
+            status=NODE_STATUS.RELEASING, power_state=POWER_STATE.ON,
+            owner=factory.make_User())
+        update_node_power_states([
+            {"system_id": node.system_id, "power_state": POWER_STATE.OFF},
+        ])
+        node = reload_object(node)
+        self.assertEqual(POWER_STATE.OFF, node.power_state)
+        self.assertEqual(NODE_STATUS.READY, node.status)
+
+    def test__releases_node_that_was_already_off(self):
+        node = factory.make_Node(
+            status=NODE_STATUS.RELEASING, power_state=POWER_STATE.OFF,
+            owner=factory.make_User())
+        update_node_power_states([
+            {"system_id": node.system_id, "power_state": POWER_STATE.OFF},
+        ])
+        node = reload_object(node)
+        self.assertEqual(POWER_STATE.OFF, node.power_state)
+        self.assertEqual(NODE_STATUS.READY, node.status)
+
+    def test__deploys_node_exiting_rescue_mode_that_was_already_on(self):
+        node = factory.make_Node(
+            status=NODE_STATUS.EXITING_RESCUE_MODE,
+            previous_status=NODE_STATUS.DEPLOYED, power_state=POWER_STATE.ON,
+            owner=factory.make_User())
+        update_node_power_states([
+            {"system_id": node.system_id, "power_state": POWER_STATE.ON},
+        ])
+        node = reload_object(node)
+        self.assertEqual(POWER_STATE.ON, node.power_state)
+        self.assertEqual(NODE_STATUS.DEPLOYED, node.status)
+
+
 class TestGetControllerType(MAASServerTestCase):
     """Tests for `get_controller_type`."""
 
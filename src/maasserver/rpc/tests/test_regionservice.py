@@ -907,6 +907,21 @@ class TestRegionService(MAASTestCase):
 
         return service.getClientFor(uuid).addCallback(check)
 
+    @wait_for_reactor
+    def test_getClientFor_returns_least_loaded_connection(self):
+        busy = DummyConnection()
+        idle = DummyConnection()
+        common.get_connection_load(busy).started()
+
+        service = RegionService(sentinel.advertiser)
+        uuid = factory.make_UUID()
+        service.connections[uuid].update({busy, idle})
+
+        def check(client):
+            self.assertThat(client, Equals(common.Client(idle)))
+
+        return service.getClientFor(uuid).addCallback(check)
+
     @wait_for_reactor
     def test_getAllClients_empty(self):
         service = RegionService(sentinel.advertiser)
@@ -18,6 +18,7 @@ import random
 from random import randint
 import time
 from unittest import skip
+from unittest.mock import call
 from urllib.parse import urlparse
 
 from crochet import wait_for
@@ -64,6 +65,7 @@ from maastesting.matchers import (
     MockCalledOnce,
     MockCalledOnceWith,
     MockCalledWith,
+    MockCallsMatch,
 )
 from maastesting.testcase import MAASTestCase
 from maastesting.twisted import TwistedLoggerFixture
@@ -93,9 +95,12 @@ from provisioningserver.rpc.region import (
     RequestRackRefresh,
     SendEvent,
     SendEventMACAddress,
+    SendEvents,
     UpdateInterfaces,
     UpdateLease,
+    UpdateLeases,
     UpdateNodePowerState,
+    UpdateNodePowerStates,
     UpdateServices,
 )
 from provisioningserver.rpc.testing import (
@@ -298,6 +303,65 @@ class TestRegionProtocol_UpdateLease(MAASTransactionServerTestCase):
         # works as expected.
 
 
+class TestRegionProtocol_UpdateLeases(MAASTransactionServerTestCase):
+
+    def setUp(self):
+        super(TestRegionProtocol_UpdateLeases, self).setUp()
+        self.useFixture(RegionEventLoopFixture("database-tasks"))
+
+    def test_update_leases_is_registered(self):
+        protocol = Region()
+        responder = protocol.locateResponder(UpdateLeases.commandName)
+        self.assertIsNotNone(responder)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__passes_updates_to_update_leases(self):
+        update_leases = self.patch(leases_module, "update_leases")
+        update_leases.return_value = {}
+        update = {
+            "action": "expiry",
+            "mac": factory.make_mac_address(),
+            "ip_family": "ipv4",
+            "ip": factory.make_ipv4_address(),
+            "timestamp": int(time.time()),
+            "lease_time": None,
+            "hostname": None,
+        }
+
+        yield eventloop.start()
+        try:
+            yield call_responder(
+                Region(), UpdateLeases, {
+                    "cluster_uuid": factory.make_name("uuid"),
+                    "updates": [update],
+                    })
+        finally:
+            yield eventloop.reset()
+
+        self.assertThat(update_leases, MockCalledOnceWith([update]))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__doesnt_raises_other_errors(self):
+        # Cause a random exception
+        self.patch(leases_module, "update_leases").side_effect = (
+            factory.make_exception())
+
+        yield eventloop.start()
+        try:
+            yield call_responder(
+                Region(), UpdateLeases, {
+                    "cluster_uuid": factory.make_name("uuid"),
+                    "updates": [],
+                    })
+        finally:
+            yield eventloop.reset()
+
+        # Test is that no exceptions are raised. If this test passes then all
+        # works as expected.
+
+
 class TestRegionProtocol_GetBootConfig(MAASTransactionServerTestCase):
 
     def test_get_boot_config_is_registered(self):
@@ -653,6 +717,45 @@ class TestRegionProtocol_UpdateNodePowerState(MAASTransactionServerTestCase):
         return d.addErrback(check)
 
 
+class TestRegionProtocol_UpdateNodePowerStates(
+        MAASTransactionServerTestCase):
+
+    @transactional
+    def create_node(self, power_state):
+        node = factory.make_Node(power_state=power_state)
+        return node
+
+    @transactional
+    def get_node_power_state(self, system_id):
+        node = Node.objects.get(system_id=system_id)
+        return node.power_state
+
+    def test__is_registered(self):
+        protocol = Region()
+        responder = protocol.locateResponder(
+            UpdateNodePowerStates.commandName)
+        self.assertIsNotNone(responder)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__changes_power_states(self):
+        power_state = factory.pick_enum(POWER_STATE)
+        node = yield deferToDatabase(self.create_node, power_state)
+
+        new_state = factory.pick_enum(POWER_STATE, but_not=power_state)
+        response = yield call_responder(
+            Region(), UpdateNodePowerStates, {'states': [
+                {'system_id': node.system_id, 'power_state': new_state},
+                {'system_id': factory.make_name('unknown-system-id'),
+                 'power_state': new_state},
+            ]})
+
+        self.assertEqual({}, response)
+        db_state = yield deferToDatabase(
+            self.get_node_power_state, node.system_id)
+        self.assertEqual(new_state, db_state)
+
+
 class TestRegionProtocol_RegisterEventType(MAASTransactionServerTestCase):
 
     def test_register_event_type_is_registered(self):
@@ -999,6 +1102,121 @@ class TestRegionProtocol_SendEventMACAddress(MAASTransactionServerTestCase):
                 "'%s'.", name, event_description, mac_address))
 
 
+class TestRegionProtocol_SendEvents(MAASTransactionServerTestCase):
+
+    def test_send_events_is_registered(self):
+        protocol = Region()
+        responder = protocol.locateResponder(SendEvents.commandName)
+        self.assertIsNotNone(responder)
+
+    @transactional
+    def get_events(self, node):
+        return [
+            (event.type.name, event.description, event.created)
+            for event in Event.objects.filter(node=node)
+            .select_related('type').order_by('id')
+        ]
+
+    @transactional
+    def create_event_type(self):
+        return factory.make_EventType().name
+
+    @transactional
+    def make_interface(self):
+        # Precache the node. So a database query is not made in the event-loop.
+        interface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
+        node = interface.node
+        ignore_unused(node)
+        return interface
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_send_events_stores_events_with_timestamp_received(self):
+        timestamp = datetime.now() - timedelta(seconds=randint(99, 99999))
+        self.patch(regionservice, "datetime").now.return_value = timestamp
+        event_type = yield deferToDatabase(self.create_event_type)
+        interface = yield deferToDatabase(self.make_interface)
+        node = interface.node
+        # The MAC address need not be formatted as the database formats it.
+        mac_address = interface.mac_address.get_raw().upper().replace(
+            ":", "-")
+
+        response = yield call_responder(
+            Region(), SendEvents, {'events': [
+                {'system_id': node.system_id, 'type_name': event_type,
+                 'description': 'first'},
+                {'mac_address': mac_address, 'type_name': event_type,
+                 'description': 'second'},
+            ]})
+
+        self.assertEqual({}, response)
+        events = yield deferToDatabase(self.get_events, node)
+        self.assertEqual([
+            (event_type, 'first', timestamp),
+            (event_type, 'second', timestamp),
+        ], events)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_send_events_stores_events_with_their_own_timestamp(self):
+        received = datetime.now()
+        self.patch(regionservice, "datetime").now.return_value = received
+        occurred = float(randint(1000000000, 1400000000))
+        event_type = yield deferToDatabase(self.create_event_type)
+        interface = yield deferToDatabase(self.make_interface)
+        node = interface.node
+
+        yield call_responder(
+            Region(), SendEvents, {'events': [
+                {'system_id': node.system_id, 'type_name': event_type,
+                 'description': 'stamped', 'timestamp': occurred},
+                {'system_id': node.system_id, 'type_name': event_type,
+                 'description': 'unstamped'},
+            ]})
+
+        events = yield deferToDatabase(self.get_events, node)
+        self.assertEqual([
+            (event_type, 'stamped', datetime.fromtimestamp(occurred)),
+            (event_type, 'unstamped', received),
+        ], events)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_send_events_logs_and_ignores_unknown_types_and_nodes(self):
+        maaslog = self.patch(events_module, 'maaslog')
+        event_type = yield deferToDatabase(self.create_event_type)
+        interface = yield deferToDatabase(self.make_interface)
+        node = interface.node
+        unknown_type = factory.make_name('type_name')
+        unknown_system_id = factory.make_name('system_id')
+        unknown_mac_address = factory.make_mac_address()
+
+        yield call_responder(
+            Region(), SendEvents, {'events': [
+                {'system_id': node.system_id, 'type_name': unknown_type,
+                 'description': 'unknown type'},
+                {'system_id': unknown_system_id, 'type_name': event_type,
+                 'description': 'unknown node'},
+                {'mac_address': unknown_mac_address, 'type_name': event_type,
+                 'description': 'unknown MAC'},
+                {'system_id': node.system_id, 'type_name': event_type,
+                 'description': 'known'},
+            ]})
+
+        events = yield deferToDatabase(self.get_events, node)
+        self.assertEqual(
+            [(event_type, 'known')],
+            [(name, description) for name, description, _ in events])
+        self.assertThat(maaslog.debug, MockCallsMatch(
+            call("Event '%s: %s' sent with non-existent event type.",
+                 unknown_type, 'unknown type'),
+            call("Event '%s: %s' sent for non-existent node '%s'.",
+                 event_type, 'unknown node', unknown_system_id),
+            call("Event '%s: %s' sent for non-existent node '%s'.",
+                 event_type, 'unknown MAC', unknown_mac_address),
+        ))
+
+
 class TestRegionProtocol_UpdateServices(MAASTransactionServerTestCase):
 
     def setUp(self):
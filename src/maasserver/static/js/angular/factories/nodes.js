@@ -16,6 +16,12 @@ angular.module('MAAS').service(
 
         function NodesManager() {
             Manager.call(this);
+
+            // Node handlers list nodes ordered by id and nodes have an
+            // updated timestamp, so the list can be streamed and reloaded
+            // with only the nodes that changed.
+            this._streamLoad = true;
+            this._sinceReload = true;
         }
 
         NodesManager.prototype = new Manager();
@@ -22,7 +22,8 @@ angular.module('MAAS').factory(
         // Response types
         var RESPONSE_TYPE = {
             SUCCESS: 0,
-            ERROR: 1
+            ERROR: 1,
+            PARTIAL: 2
         };
 
         // Constructor
@@ -273,7 +274,12 @@ angular.module('MAAS').factory(
             var defer = this.callbacks[msg.request_id];
             var remembered_request = this.requests[msg.request_id];
             if(angular.isDefined(defer)) {
-                if(msg.rtype === RESPONSE_TYPE.SUCCESS) {
+                if(msg.rtype === RESPONSE_TYPE.PARTIAL) {
+                    // Part of a streamed result, more will follow. Keep the
+                    // defer registered until the final result arrives.
+                    $rootScope.$apply(defer.notify(msg.result));
+                    return;
+                } else if(msg.rtype === RESPONSE_TYPE.SUCCESS) {
                     // Resolve the defer inside of the digest cycle, so any
                     // update to an object or collection will trigger a
                     // watcher.
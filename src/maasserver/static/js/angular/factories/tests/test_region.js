@@ -482,6 +482,28 @@ describe("RegionConnection", function() {
             expect(RegionConnection.callbacks[requestId]).toBeUndefined();
         });
 
+        it("notifies defer for partial result", function(done) {
+            var result = {};
+            var requestId = RegionConnection.newRequestId();
+            var defer = $q.defer();
+            defer.promise.then(null, null, function(msg_result) {
+                expect(msg_result).toBe(result);
+                done();
+            });
+
+            spyOn($rootScope, "$apply").and.callThrough();
+
+            RegionConnection.callbacks[requestId] = defer;
+            RegionConnection.onResponse({
+                type: 1,
+                rtype: 2,
+                request_id: requestId,
+                result: result
+            });
+            expect($rootScope.$apply).toHaveBeenCalled();
+            expect(RegionConnection.callbacks[requestId]).toBe(defer);
+        });
+
         it("rejects defer inside of rootScope", function(done) {
             var error = {};
             var requestId = RegionConnection.newRequestId();
@@ -20,6 +20,11 @@ angular.module('MAAS').service(
             DELETE: "delete"
         };
 
+        // Number of seconds to subtract from the time of the last load when
+        // only reloading the items changed since then. This allows for
+        // clock differences between the browser and the region.
+        var SINCE_MARGIN = 60;
+
         // Constructor
         function Manager() {
             // Primary key on the items in the list. Used to match items.
@@ -29,6 +34,22 @@ angular.module('MAAS').service(
             // but not always.
             this._batchKey = "id";
 
+            // True when the region should stream the list to this manager.
+            // All items are then loaded with one request and the region
+            // sends them in batches as each is ready. Only set this when the
+            // handler lists its objects ordered and limited by _batchKey.
+            this._streamLoad = false;
+
+            // True when the objects listed by the handler have an updated
+            // timestamp. While connected to the region, a reload then only
+            // loads the items that changed since the last load; the items
+            // that were deleted have already been removed by notifications.
+            this._sinceReload = false;
+
+            // Time, in seconds since the epoch, when the last load of the
+            // items list started.
+            this._lastLoadTime = null;
+
             // The field from which to get a human-readable name.
             this._name_field = "name";
 
@@ -135,13 +156,28 @@ angular.module('MAAS').service(
             return {};
         };
 
-        // Batch load items from the region in groups of 50.
-        Manager.prototype._batchLoadItems = function(array, extra_func) {
+        // Batch load items from the region in groups of 50. When since is
+        // given only the items updated after that time are loaded.
+        Manager.prototype._batchLoadItems = function(
+                array, extra_func, since) {
             var self = this;
             var defer = $q.defer();
             var method = this._handler + ".list";
+            this._lastLoadTime = Date.now() / 1000;
+            function addItems(items) {
+                // Pass each item to extra_func function if given.
+                if(angular.isFunction(extra_func)) {
+                    angular.forEach(items, function(item) {
+                        extra_func(item);
+                    });
+                }
+                array.push.apply(array, items);
+            }
             function callLoad() {
                 var params = self._initBatchLoadParameters();
+                if(angular.isNumber(since)) {
+                    params.since = since;
+                }
                 params.limit = 50;
 
                 // Get the last batchKey in the list so the region knows to
@@ -151,14 +187,7 @@ angular.module('MAAS').service(
                 }
                 RegionConnection.callMethod(
                     method, params).then(function(items) {
-                        // Pass each item to extra_func function if given.
-                        if(angular.isFunction(extra_func)) {
-                            angular.forEach(items, function(item) {
-                                extra_func(item);
-                            });
-                        }
-
-                        array.push.apply(array, items);
+                        addItems(items);
                         if(items.length === 50) {
                             // Could be more items, request the next 50.
                             callLoad(array);
@@ -167,7 +196,27 @@ angular.module('MAAS').service(
                         }
                     }, defer.reject);
             }
-            callLoad();
+            function callStream() {
+                var params = self._initBatchLoadParameters();
+                if(angular.isNumber(since)) {
+                    params.since = since;
+                }
+                params.stream = true;
+                params.batch_size = 50;
+
+                // Every batch but the last is a partial result of the one
+                // request, the last batch is the result itself.
+                RegionConnection.callMethod(
+                    method, params).then(function(items) {
+                        addItems(items);
+                        defer.resolve(array);
+                    }, defer.reject, addItems);
+            }
+            if(this._streamLoad) {
+                callStream();
+            } else {
+                callLoad();
+            }
             return defer.promise;
         };
 
@@ -236,8 +285,10 @@ angular.module('MAAS').service(
             });
         };
 
-        // Reload the items list.
-        Manager.prototype.reloadItems = function() {
+        // Reload the items list. Unless full is true, a manager with
+        // _sinceReload set only reloads the items changed since the last
+        // load.
+        Manager.prototype.reloadItems = function(full) {
             // If the items have not been loaded then, we need to
             // load the initial list.
             if(!this._loaded) {
@@ -281,15 +332,43 @@ angular.module('MAAS').service(
                 self._items.push.apply(self._items, items);
             }
 
+            // Updates the items list with the items changed since the last
+            // load, leaving the other items in place.
+            function updateChangedItems(items) {
+                angular.forEach(items, function(updatedItem) {
+                    var idx = self._getIndexOfItem(
+                        self._items, updatedItem[self._pk]);
+                    if(idx === -1) {
+                        updatedItem.$selected = false;
+                        self._updateMetadata(
+                            updatedItem, METADATA_ACTIONS.CREATE);
+                        self._items.push(updatedItem);
+                    } else {
+                        var item = self._items[idx];
+                        self._updateMetadata(
+                            updatedItem, METADATA_ACTIONS.UPDATE);
+                        updatedItem.$selected = item.$selected;
+                        angular.copy(updatedItem, item);
+                    }
+                });
+            }
+
             // The reload action loads all of the items into this list
             // instead of the items list. This list will then be used to
             // update the items list.
             var currentItems = [];
+            var since, update = updateItems;
+            if(this._sinceReload && !full &&
+                    angular.isNumber(this._lastLoadTime)) {
+                since = this._lastLoadTime - SINCE_MARGIN;
+                update = updateChangedItems;
+            }
 
             // Start the reload process and once complete call updateItems.
             self._isLoading = true;
-            return this._batchLoadItems(currentItems).then(function(items) {
-                updateItems(items);
+            return this._batchLoadItems(
+                    currentItems, undefined, since).then(function(items) {
+                update(items);
                 self._isLoading = false;
                 self.processActions();
 
@@ -315,7 +394,9 @@ angular.module('MAAS').service(
                 this._autoReload = true;
                 var self = this;
                 this._reloadFunc = function() {
-                    self.reloadItems();
+                    // Notifications may have been missed while disconnected
+                    // so reload all of the items.
+                    self.reloadItems(true);
                 };
                 RegionConnection.registerHandler("open", this._reloadFunc);
             }
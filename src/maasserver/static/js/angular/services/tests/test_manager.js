@@ -200,6 +200,26 @@ describe("Manager", function() {
             });
         });
 
+        it("streams the list in one call", function(done) {
+            var partialNodes = makeNodes(50);
+            var lastNodes = makeNodes(3);
+            NodesManager._streamLoad = true;
+            webSocket.returnData.push([
+                angular.toJson({type: 1, rtype: 2, result: partialNodes}),
+                makeFakeResponse(lastNodes)
+            ]);
+            NodesManager.loadItems().then(function(nodes) {
+                expect(nodes).toEqual(addSelectedOnNodes(
+                    partialNodes.concat(lastNodes), false));
+                expect(webSocket.sentData.length).toBe(1);
+                var params = angular.fromJson(webSocket.sentData[0]).params;
+                expect(params.stream).toBe(true);
+                expect(params.batch_size).toBe(50);
+                expect(params.limit).toBeUndefined();
+                done();
+            });
+        });
+
         it("sets loaded true when complete", function(done) {
             webSocket.returnData.push(makeFakeResponse([makeNode()]));
             NodesManager.loadItems().then(function() {
@@ -535,6 +555,54 @@ describe("Manager", function() {
         });
     });
 
+    describe("reloadItems since last load", function() {
+
+        beforeEach(function() {
+            NodesManager._loaded = true;
+            NodesManager._sinceReload = true;
+            NodesManager._lastLoadTime = 1000;
+        });
+
+        it("only loads nodes changed since the last load", function(done) {
+            webSocket.returnData.push(makeFakeResponse([]));
+            NodesManager.reloadItems().then(function() {
+                var params = angular.fromJson(webSocket.sentData[0]).params;
+                expect(params.since).toBe(940);
+                done();
+            });
+        });
+
+        it("keeps unchanged nodes and updates changed ones", function(done) {
+            var currentNodes = [makeNode(true), makeNode(false)];
+            var changedNode = stripSelected(currentNodes[1]);
+            changedNode.name = makeName("name");
+            var newNode = makeNode();
+            NodesManager._items = currentNodes;
+            webSocket.returnData.push(
+                makeFakeResponse([changedNode, newNode]));
+            NodesManager.reloadItems().then(function(nodes) {
+                expect(nodes).toEqual([
+                    currentNodes[0],
+                    addSelected(changedNode, false),
+                    addSelected(newNode, false)
+                ]);
+                done();
+            });
+        });
+
+        it("loads all nodes when full", function(done) {
+            var currentNodes = [makeNode(false), makeNode(false)];
+            NodesManager._items = currentNodes;
+            webSocket.returnData.push(makeFakeResponse([currentNodes[0]]));
+            NodesManager.reloadItems(true).then(function(nodes) {
+                var params = angular.fromJson(webSocket.sentData[0]).params;
+                expect(params.since).toBeUndefined();
+                expect(nodes).toEqual([currentNodes[0]]);
+                done();
+            });
+        });
+    });
+
     describe("enableAutoReload", function() {
 
         it("does nothing if already enabled", function() {
@@ -550,6 +618,14 @@ describe("Manager", function() {
             expect(RegionConnection.registerHandler).toHaveBeenCalled();
             expect(NodesManager._autoReload).toBe(true);
         });
+
+        it("reloads all items on reconnection", function() {
+            spyOn(RegionConnection, "registerHandler");
+            spyOn(NodesManager, "reloadItems");
+            NodesManager.enableAutoReload();
+            RegionConnection.registerHandler.calls.argsFor(0)[1]();
+            expect(NodesManager.reloadItems).toHaveBeenCalledWith(true);
+        });
     });
 
     describe("disableAutoReload", function() {
@@ -24,7 +24,10 @@ from maasserver.node_status import (
     NODE_FAILURE_MONITORED_STATUS_TRANSITIONS,
 )
 from maasserver.utils.orm import transactional
-from maasserver.utils.threads import deferToDatabase
+from maasserver.utils.threads import (
+    DATABASE_PRIORITY,
+    deferToDatabaseWithPriority,
+)
 from metadataserver.enum import SCRIPT_STATUS
 from provisioningserver.refresh.node_info_scripts import NODE_INFO_SCRIPTS
 from provisioningserver.utils.twisted import synchronous
@@ -136,4 +139,5 @@ class StatusMonitorService(TimerService, object):
 
     def __init__(self, interval=60):
         super(StatusMonitorService, self).__init__(
-            interval, deferToDatabase, check_status)
+            interval, deferToDatabaseWithPriority,
+            DATABASE_PRIORITY.BACKGROUND, check_status)
@@ -12,7 +12,10 @@ from io import BytesIO
 import json
 import logging
 import os
-from os import environ
+from os import (
+    environ,
+    path as os_path,
+)
 import random
 from random import randint
 from subprocess import CalledProcessError
@@ -91,7 +94,10 @@ from maasserver.utils.orm import (
     reload_object,
     transactional,
 )
-from maasserver.utils.threads import deferToDatabase
+from maasserver.utils.threads import (
+    DATABASE_PRIORITY,
+    deferToDatabase,
+)
 from maastesting.matchers import (
     MockCalledOnce,
     MockCalledOnceWith,
@@ -119,7 +125,9 @@ from testtools.matchers import (
     Contains,
     ContainsAll,
     Equals,
+    FileExists,
     HasLength,
+    Is,
     Not,
 )
 from twisted.application.internet import TimerService
@@ -127,6 +135,7 @@ from twisted.internet.defer import (
     Deferred,
     fail,
     inlineCallbacks,
+    maybeDeferred,
     succeed,
 )
 from twisted.protocols.amp import UnhandledCommand
@@ -174,6 +183,14 @@ class SimplestreamsEnvFixture(Fixture):
 class TestSimpleStreamsHandler(MAASServerTestCase):
     """Tests for `maasserver.bootresources.SimpleStreamsHandler`."""
 
+    def setUp(self):
+        super(TestSimpleStreamsHandler, self).setUp()
+        self.patch(
+            bootresources, "get_largefile_cache_dir").return_value = (
+                self.make_dir())
+        self.fill_later = self.patch(
+            bootresources, "fill_largefile_cache_later")
+
     def reverse_stream_handler(self, filename):
         return reverse(
             'simplestreams_stream_handler', kwargs={'filename': filename})
@@ -502,6 +519,207 @@ class TestSimpleStreamsHandler(MAASServerTestCase):
             os, arch, subarch, series, version, filename)
         self.assertIsInstance(response, StreamingHttpResponse)
 
+    def test_download_fills_cache_in_background(self):
+        product, resource = self.make_usable_product_boot_resource()
+        _, _, os, arch, subarch, series = product.split(':')
+        resource_set = resource.get_latest_complete_set()
+        resource_file = resource_set.files.order_by('?')[0]
+        self.get_file_client(
+            os, arch, subarch, series, resource_set.version,
+            resource_file.filename)
+        self.assertThat(
+            self.fill_later, MockCalledOnceWith(resource_file.largefile))
+
+    def test_download_returns_cached_content(self):
+        product, resource = self.make_usable_product_boot_resource()
+        _, _, os, arch, subarch, series = product.split(':')
+        resource_set = resource.get_latest_complete_set()
+        resource_file = resource_set.files.order_by('?')[0]
+        bootresources.fill_largefile_cache(resource_file.largefile)
+        response = self.get_file_client(
+            os, arch, subarch, series, resource_set.version,
+            resource_file.filename)
+        content = b''.join(response.streaming_content)
+        with resource_file.largefile.content.open('rb') as stream:
+            self.assertEqual(stream.read(), content)
+        self.assertEqual('bytes', response['Accept-Ranges'])
+        self.assertThat(self.fill_later, MockNotCalled())
+
+    def test_download_honours_range(self):
+        product, resource = self.make_usable_product_boot_resource()
+        _, _, os, arch, subarch, series = product.split(':')
+        resource_set = resource.get_latest_complete_set()
+        resource_file = resource_set.files.order_by('?')[0]
+        bootresources.fill_largefile_cache(resource_file.largefile)
+        size = resource_file.largefile.total_size
+        response = self.client.get(
+            self.reverse_file_handler(
+                os, arch, subarch, series, resource_set.version,
+                resource_file.filename),
+            HTTP_RANGE='bytes=10-')
+        self.assertEqual(http.client.PARTIAL_CONTENT, response.status_code)
+        self.assertEqual(
+            'bytes 10-%d/%d' % (size - 1, size), response['Content-Range'])
+        content = b''.join(response.streaming_content)
+        with resource_file.largefile.content.open('rb') as stream:
+            self.assertEqual(stream.read()[10:], content)
+
+    def test_download_rejects_unsatisfiable_range(self):
+        product, resource = self.make_usable_product_boot_resource()
+        _, _, os, arch, subarch, series = product.split(':')
+        resource_set = resource.get_latest_complete_set()
+        resource_file = resource_set.files.order_by('?')[0]
+        bootresources.fill_largefile_cache(resource_file.largefile)
+        size = resource_file.largefile.total_size
+        response = self.client.get(
+            self.reverse_file_handler(
+                os, arch, subarch, series, resource_set.version,
+                resource_file.filename),
+            HTTP_RANGE='bytes=%d-' % size)
+        self.assertEqual(
+            http.client.REQUESTED_RANGE_NOT_SATISFIABLE, response.status_code)
+        self.assertEqual('bytes */%d' % size, response['Content-Range'])
+
+
+class TestLargeFileCache(MAASServerTestCase):
+    """Tests for the on-disk `LargeFile` content cache."""
+
+    def setUp(self):
+        super(TestLargeFileCache, self).setUp()
+        self.cache_dir = self.make_dir()
+        self.patch(
+            bootresources, "get_largefile_cache_dir").return_value = (
+                self.cache_dir)
+
+    def test_fill_copies_content(self):
+        content = factory.make_bytes(size=1024)
+        largefile = factory.make_LargeFile(content=content, size=1024)
+        path = bootresources.fill_largefile_cache(largefile)
+        self.assertEqual(
+            os_path.join(self.cache_dir, largefile.sha256), path)
+        with open(path, "rb") as stream:
+            self.assertEqual(content, stream.read())
+
+    def test_fill_returns_None_for_incomplete_file(self):
+        largefile = factory.make_LargeFile(
+            content=factory.make_bytes(size=512), size=1024)
+        self.assertIsNone(bootresources.fill_largefile_cache(largefile))
+
+    def test_fill_returns_None_for_sha256_mismatch(self):
+        largefile = factory.make_LargeFile()
+        largefile.sha256 = factory.make_string(size=64)
+        self.assertIsNone(bootresources.fill_largefile_cache(largefile))
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_fill_prunes_deleted_largefiles(self):
+        stale = os_path.join(self.cache_dir, factory.make_string(size=64))
+        factory.make_file(self.cache_dir, os_path.basename(stale))
+        bootresources.fill_largefile_cache(factory.make_LargeFile())
+        self.assertThat(stale, Not(FileExists()))
+
+    def test_get_path_returns_None_until_filled(self):
+        largefile = factory.make_LargeFile()
+        self.assertIsNone(bootresources.get_largefile_cache_path(largefile))
+        path = bootresources.fill_largefile_cache(largefile)
+        self.assertEqual(
+            path, bootresources.get_largefile_cache_path(largefile))
+
+    def test_fill_copies_content_in_steps(self):
+        content = factory.make_bytes(size=1024)
+        largefile = factory.make_LargeFile(content=content, size=1024)
+        fill = bootresources.LargeFileCacheFill(largefile, 256)
+        steps = [fill.step() for _ in range(4)]
+        self.assertEqual([False, False, False, True], steps)
+        with open(fill.path, "rb") as stream:
+            self.assertEqual(content, stream.read())
+
+    def test_fill_discard_removes_partial_copy(self):
+        largefile = factory.make_LargeFile(
+            content=factory.make_bytes(size=1024), size=1024)
+        fill = bootresources.LargeFileCacheFill(largefile, 256)
+        self.assertFalse(fill.step())
+        fill.discard()
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def patch_fill_later(self):
+        self.patch(bootresources.reactor, "callFromThread").side_effect = (
+            lambda func: func())
+        defer = self.patch(bootresources, "deferToDatabaseWithPriority")
+        defer.return_value = Deferred()
+        return defer
+
+    def test_fill_later_fills_at_background_priority(self):
+        defer = self.patch_fill_later()
+        largefile = factory.make_LargeFile()
+        bootresources.fill_largefile_cache_later(largefile)
+        self.assertThat(defer, MockCalledOnceWith(
+            DATABASE_PRIORITY.BACKGROUND, ANY))
+        defer.return_value.callback(True)
+        self.assertEqual(set(), bootresources._largefile_cache_filling)
+
+    def test_fill_later_gives_back_thread_between_steps(self):
+        defer = self.patch_fill_later()
+        defer.side_effect = lambda priority, func: maybeDeferred(func)
+        self.patch(bootresources, "LARGEFILE_CACHE_FILL_SIZE", 256)
+        content = factory.make_bytes(size=1024)
+        largefile = factory.make_LargeFile(content=content, size=1024)
+        bootresources.fill_largefile_cache_later(largefile)
+        self.assertEqual(4, defer.call_count)
+        path = bootresources.get_largefile_cache_path(largefile)
+        with open(path, "rb") as stream:
+            self.assertEqual(content, stream.read())
+
+    def test_fill_later_fills_each_largefile_once_at_a_time(self):
+        defer = self.patch_fill_later()
+        largefile = factory.make_LargeFile()
+        bootresources.fill_largefile_cache_later(largefile)
+        bootresources.fill_largefile_cache_later(largefile)
+        self.assertThat(defer, MockCalledOnce())
+        defer.return_value.callback(True)
+        defer.return_value = Deferred()
+        bootresources.fill_largefile_cache_later(largefile)
+        self.assertEqual(2, defer.call_count)
+        defer.return_value.callback(True)
+
+    def test_fill_later_forgets_largefile_after_failure(self):
+        defer = self.patch_fill_later()
+        self.useFixture(TwistedLoggerFixture())
+        largefile = factory.make_LargeFile()
+        bootresources.fill_largefile_cache_later(largefile)
+        defer.return_value.errback(ZeroDivisionError())
+        self.assertEqual(set(), bootresources._largefile_cache_filling)
+
+    def test_fill_later_ignores_incomplete_file(self):
+        defer = self.patch_fill_later()
+        largefile = factory.make_LargeFile(
+            content=factory.make_bytes(size=512), size=1024)
+        bootresources.fill_largefile_cache_later(largefile)
+        self.assertThat(defer, MockNotCalled())
+
+    def test_fill_later_removes_partial_copy_after_failure(self):
+        defer = self.patch_fill_later()
+        # The first step copies some of the content, the second fails.
+        results = [None, fail(ZeroDivisionError())]
+        defer.side_effect = lambda priority, func: (
+            results.pop(0) or maybeDeferred(func))
+        self.patch(bootresources, "LARGEFILE_CACHE_FILL_SIZE", 256)
+        self.useFixture(TwistedLoggerFixture())
+        largefile = factory.make_LargeFile(
+            content=factory.make_bytes(size=1024), size=1024)
+        bootresources.fill_largefile_cache_later(largefile)
+        self.assertEqual(2, defer.call_count)
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_parse_range_header(self):
+        parse = bootresources.parse_range_header
+        self.expectThat(parse("bytes=0-9", 100), Equals((0, 9)))
+        self.expectThat(parse("bytes=90-", 100), Equals((90, 99)))
+        self.expectThat(parse("bytes=-10", 100), Equals((90, 99)))
+        self.expectThat(parse("bytes=50-500", 100), Equals((50, 99)))
+        self.expectThat(parse("bytes=100-", 100), Is(False))
+        self.expectThat(parse("bytes=0-1,5-6", 100), Is(None))
+        self.expectThat(parse("items=0-1", 100), Is(None))
+
 
 class TestConnectionWrapper(MAASTransactionServerTestCase):
     """Tests the use of StreamingHttpResponse(ConnectionWrapper(stream)).
@@ -511,6 +729,13 @@ class TestConnectionWrapper(MAASTransactionServerTestCase):
     the actual content, the transaction to create the data needs be committed.
     """
 
+    def setUp(self):
+        super(TestConnectionWrapper, self).setUp()
+        # Stream from the database rather than the on-disk cache.
+        self.patch(bootresources, "get_largefile_cache_path").return_value = (
+            None)
+        self.patch(bootresources, "fill_largefile_cache_later")
+
     def make_file_for_client(self):
         # Set up the database information inside of a transaction. This is
         # done so the information is committed. As the new connection needs
@@ -565,6 +790,15 @@ class TestConnectionWrapper(MAASTransactionServerTestCase):
         self.read_response(response)
         self.assertThat(mock_get_new_connection, MockCalledOnceWith())
 
+    def test_download_honours_range(self):
+        content, url = self.make_file_for_client()
+        client = Client()
+        response = client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(http.client.PARTIAL_CONTENT, response.status_code)
+        self.assertEqual(
+            'bytes 10-19/%d' % len(content), response['Content-Range'])
+        self.assertEqual(content[10:20], self.read_response(response))
+
     def test_download_connection_is_not_same_as_django_connections(self):
         content, url = self.make_file_for_client()
 
@@ -977,6 +1211,40 @@ class TestBootResourceStore(MAASServerTestCase):
         rfile.largefile = reload_object(rfile.largefile)
         self.assertEqual(rfile.largefile.size, 0)
 
+    def test_write_content_thread_only_saves_size_to_report_progress(self):
+        store = BootResourceStore()
+        store.progress_interval = 3600
+        size = int(4.5 * store.read_size)
+        rfile, reader, content = make_boot_resource_file_with_stream(size=size)
+        save = self.patch_autospec(LargeFile, "save")
+        store.write_content_thread(rfile.id, reader)
+        # The size is reset to zero, then saved once all content is written.
+        self.assertEqual(2, save.call_count)
+        with rfile.largefile.content.open('rb') as stream:
+            written_data = stream.read()
+        self.assertEqual(content, written_data)
+
+    def test_write_content_thread_raises_read_error(self):
+        store = BootResourceStore()
+        rfile, _, _ = make_boot_resource_file_with_stream()
+        exception_type = factory.make_exception_type()
+        reader = Mock(read=Mock(side_effect=exception_type()))
+        self.assertRaises(
+            exception_type, store.write_content_thread, rfile.id, reader)
+
+    def test_perform_write_continues_after_failure(self):
+        store = BootResourceStore()
+        store.write_threads = 1
+        store._content_to_finalize = {
+            random.randint(0, 100): sentinel.reader,
+            random.randint(101, 200): sentinel.reader,
+        }
+        write_content_thread = self.patch(store, "write_content_thread")
+        write_content_thread.side_effect = [factory.make_exception(), None]
+        store.perform_write()
+        self.assertEqual(2, write_content_thread.call_count)
+        self.assertEqual({}, store._content_to_finalize)
+
     @skip(
         "XXX blake_r: Skipped because it causes the test that runs after this "
         "to fail. Because this test is not isolated and places a task in the "
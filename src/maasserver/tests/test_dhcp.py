@@ -7,7 +7,11 @@ __all__ = []
 
 from operator import itemgetter
 import random
-from unittest.mock import ANY
+from unittest.mock import (
+    ANY,
+    call,
+    sentinel,
+)
 
 from crochet import wait_for
 from django.core.exceptions import ValidationError
@@ -39,8 +43,10 @@ from maasserver.utils.threads import deferToDatabase
 from maastesting.djangotestcase import count_queries
 from maastesting.matchers import (
     MockCalledOnceWith,
+    MockCallsMatch,
     MockNotCalled,
 )
+from maastesting.testcase import MAASTestCase
 from maastesting.twisted import (
     always_fail_with,
     always_succeed_with,
@@ -1310,6 +1316,50 @@ class TestMakeHostsForSubnet(MAASServerTestCase):
         self.assertEqual(expected_hosts, dhcp.make_hosts_for_subnets([subnet]))
 
 
+    def test__query_count_is_independent_of_number_of_hosts(self):
+        vlan = factory.make_VLAN()
+        subnet = factory.make_Subnet(vlan=vlan)
+
+        def make_hosts():
+            node = factory.make_Node(interface=False)
+            factory.make_DHCPSnippet(node=node, enabled=True)
+            eth0 = factory.make_Interface(
+                INTERFACE_TYPE.PHYSICAL, node=node, vlan=vlan)
+            eth1 = factory.make_Interface(
+                INTERFACE_TYPE.PHYSICAL, node=node, vlan=vlan)
+            bond0 = factory.make_Interface(
+                INTERFACE_TYPE.BOND, node=node, vlan=vlan,
+                parents=[eth0, eth1])
+            factory.make_StaticIPAddress(
+                alloc_type=IPADDRESS_TYPE.AUTO, subnet=subnet,
+                interface=bond0)
+
+        def count_queries_for_hosts():
+            dhcp_snippets = list(
+                DHCPSnippet.objects.filter(
+                    node__isnull=False).select_related('value'))
+            return count_queries(
+                dhcp.make_hosts_for_subnets, [subnet], dhcp_snippets)
+
+        for _ in range(3):
+            make_hosts()
+        query_3_count, hosts_3 = count_queries_for_hosts()
+        for _ in range(3):
+            make_hosts()
+        query_6_count, hosts_6 = count_queries_for_hosts()
+
+        self.assertThat(hosts_6, HasLength(2 * len(hosts_3)))
+        # This check is to notify the developer that a change was made that
+        # affects the number of queries performed when performing this
+        # operation. It is important to keep this number as low as possible.
+        self.assertEqual(
+            query_3_count, 3,
+            "Number of queries has changed; make sure this is expected.")
+        self.assertEqual(
+            query_3_count, query_6_count,
+            "Number of queries is not independent to the number of objects.")
+
+
 class TestMakeFailoverPeerConfig(MAASServerTestCase):
     """Tests for `make_failover_peer_config`."""
 
@@ -1635,6 +1685,66 @@ class TestGetDHCPConfiguration(MAASServerTestCase):
             config.shared_networks_v6, addr6.subnet, [addr6.ip])
 
 
+    def test__reuses_hosts_for_unchanged_vlans(self):
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.patch(dhcp, "_hosts_cache", {})
+        config = dhcp.get_dhcp_configuration(rack)
+        make_hosts_for_subnets = self.patch_autospec(
+            dhcp, "make_hosts_for_subnets")
+        vlan_id = addr4.subnet.vlan_id
+        cached = dhcp.get_dhcp_configuration(
+            rack, changed_vlans={vlan_id + 1})
+        self.assertThat(make_hosts_for_subnets, MockNotCalled())
+        self.assertEqual(config.hosts_v4, cached.hosts_v4)
+        self.assertEqual(config.hosts_v6, cached.hosts_v6)
+
+    def test__regenerates_hosts_for_changed_vlans(self):
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.patch(dhcp, "_hosts_cache", {})
+        dhcp.get_dhcp_configuration(rack)
+        make_hosts_for_subnets = self.patch_autospec(
+            dhcp, "make_hosts_for_subnets")
+        make_hosts_for_subnets.return_value = []
+        dhcp.get_dhcp_configuration(
+            rack, changed_vlans={addr4.subnet.vlan_id})
+        self.assertThat(make_hosts_for_subnets, MockCallsMatch(
+            call([addr4.subnet], ANY), call([addr6.subnet], ANY)))
+
+    def test__regenerates_all_hosts_without_changed_vlans(self):
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.patch(dhcp, "_hosts_cache", {})
+        dhcp.get_dhcp_configuration(rack)
+        make_hosts_for_subnets = self.patch_autospec(
+            dhcp, "make_hosts_for_subnets")
+        make_hosts_for_subnets.return_value = []
+        dhcp.get_dhcp_configuration(rack)
+        self.assertEqual(2, make_hosts_for_subnets.call_count)
+
+    def test__does_not_cache_hosts_when_testing_snippet(self):
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.patch(dhcp, "_hosts_cache", {})
+        dhcp_snippet = factory.make_DHCPSnippet(
+            node=addr4.interface_set.first().node, enabled=False)
+        dhcp.get_dhcp_configuration(rack, dhcp_snippet)
+        self.assertEqual({}, dhcp._hosts_cache)
+
+
+class TestCachedHosts(MAASTestCase):
+    """Tests for `discard_cached_hosts` and `prune_cached_hosts`."""
+
+    def test_discard_cached_hosts(self):
+        self.patch(dhcp, "_hosts_cache", {1: sentinel.one, 2: sentinel.two})
+        dhcp.discard_cached_hosts(1)
+        dhcp.discard_cached_hosts(3)
+        self.assertEqual({2: sentinel.two}, dhcp._hosts_cache)
+
+    def test_prune_cached_hosts(self):
+        self.patch(dhcp, "_hosts_cache", {
+            1: sentinel.one, 2: sentinel.two, 3: sentinel.three})
+        dhcp.prune_cached_hosts({2, 4})
+        self.assertEqual({2: sentinel.two}, dhcp._hosts_cache)
+
+
 class TestConfigureDHCP(MAASTransactionServerTestCase):
     """Tests for `configure_dhcp`."""
 
@@ -20,7 +20,13 @@ from maasserver import (
     webapp,
 )
 from maasserver.eventloop import DEFAULT_PORT
-from maasserver.regiondservices import service_monitor_service
+from maasserver.listener import PostgresListenerService
+from maasserver.models import Config
+from maasserver.models.subnet import allocation_cache
+from maasserver.regiondservices import (
+    event_retention,
+    service_monitor_service,
+)
 from maasserver.rpc import regionservice
 from maasserver.testing.eventloop import RegionEventLoopFixture
 from maasserver.testing.listener import FakePostgresListenerService
@@ -31,6 +37,7 @@ from maasserver.utils.orm import (
     transactional,
 )
 from maastesting.factory import factory
+from maastesting.matchers import MockCalledOnceWith
 from maastesting.testcase import MAASTestCase
 from metadataserver import api_twisted
 from testtools.matchers import (
@@ -234,6 +241,33 @@ class TestFactories(MAASTestCase):
         self.assertTrue(
             eventloop.loop.factories["nonce-cleanup"]["only_on_master"])
 
+    def test_make_EventRetentionService(self):
+        service = eventloop.make_EventRetentionService()
+        self.assertThat(service, IsInstance(
+            event_retention.EventRetentionService))
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_EventRetentionService,
+            eventloop.loop.factories["event-retention"]["factory"])
+        self.assertTrue(
+            eventloop.loop.factories["event-retention"]["only_on_master"])
+
+    def test_make_PostgresListenerService(self):
+        listen = self.patch(Config.objects.cache, "listen")
+        listen_allocation = self.patch(allocation_cache, "listen")
+        service = eventloop.make_PostgresListenerService()
+        self.assertThat(service, IsInstance(PostgresListenerService))
+        # Config values and free addresses are cached for as long as it is
+        # listening.
+        self.assertThat(listen, MockCalledOnceWith(service))
+        self.assertThat(listen_allocation, MockCalledOnceWith(service))
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_PostgresListenerService,
+            eventloop.loop.factories["postgres-listener"]["factory"])
+        self.assertFalse(
+            eventloop.loop.factories["postgres-listener"]["only_on_master"])
+
     def test_make_StatusMonitorService(self):
         service = eventloop.make_StatusMonitorService()
         self.assertThat(service, IsInstance(
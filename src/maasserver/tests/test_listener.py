@@ -35,6 +35,7 @@ from maastesting.matchers import (
     MockNotCalled,
 )
 from maastesting.twisted import TwistedLoggerFixture
+from provisioningserver.utils import debug
 from provisioningserver.utils.twisted import DeferredValue
 from psycopg2 import OperationalError
 from testtools import ExpectedException
@@ -471,12 +472,78 @@ class TestPostgresListenerService(MAASServerTestCase):
         # Add the notifications twice, so it can test that duplicates are
         # accumulated together.
         connection.connection.notifies = notifications + notifications
-        self.patch(listener, "handleNotify")
 
         listener.doRead()
         self.assertItemsEqual(
             listener.notifications, set(notifications))
 
+    def test__counters_are_reported_while_running(self):
+        listener = PostgresListenerService()
+        self.patch(listener, "tryConnection")
+        self.patch(listener, "loseConnection")
+        listener.counters["received"] = 3
+        listener.startService()
+        self.assertEqual(
+            ["received: 3"],
+            debug._statistics[listener.statisticsTitle]())
+        listener.stopService()
+        self.assertNotIn(listener.statisticsTitle, debug._statistics)
+
+    def test__doRead_counts_received_and_coalesced_notifies(self):
+        listener = PostgresListenerService()
+        notifications = [
+            FakeNotify(
+                channel=factory.make_name("channel_action"),
+                payload=factory.make_name("payload"))
+            for _ in range(3)
+            ]
+
+        connection = self.patch(listener, "connection")
+        connection.connection.poll.return_value = None
+        connection.connection.notifies = notifications + notifications[:1]
+
+        listener.doRead()
+        self.assertEquals(
+            {"received": 4, "coalesced": 1}, dict(listener.counters))
+
+    def test__register_batch_rejects_system_channel(self):
+        listener = PostgresListenerService()
+        with ExpectedException(PostgresListenerRegistrationError):
+            listener.register("sys_test", lambda *args: None, batch=True)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__handleNotifies_delivers_batches_to_batch_handlers(self):
+        listener = PostgresListenerService()
+        batch_handler = MagicMock()
+        handler = MagicMock()
+        listener.register("machine", batch_handler, batch=True)
+        listener.register("machine", handler)
+        listener.notifications.update({
+            ("machine_create", "1"),
+            ("machine_update", "2"),
+        })
+
+        yield listener.handleNotifies()
+
+        self.assertThat(batch_handler, MockCalledOnceWith(ANY))
+        [notifies] = batch_handler.call_args[0]
+        self.assertItemsEqual(
+            [("create", "1"), ("update", "2")], notifies)
+        self.assertThat(handler, MockCallsMatch(
+            call(*notifies[0]), call(*notifies[1])))
+        self.assertEquals(4, listener.counters["delivered"])
+
+    def test__unregister_forgets_batch_handler(self):
+        listener = PostgresListenerService()
+
+        def handler(notifies):
+            pass
+
+        listener.register("machine", handler, batch=True)
+        listener.unregister("machine", handler)
+        self.assertEquals(set(), listener.batchHandlers)
+
     @wait_for_reactor
     @inlineCallbacks
     def test__listener_ignores_ENOENT_when_removing_itself_from_reactor(self):
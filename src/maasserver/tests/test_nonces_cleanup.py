@@ -129,8 +129,11 @@ class TestNonceCleanupService(MAASServerTestCase):
         # a couple of decorators. This indirection makes it clearer to
         # mock `cleanup_old_nonces` here and track calls to it.
         cleanup_old_nonces = self.patch(nonces_cleanup, "cleanup_old_nonces")
-        # Making `deferToDatabase` use the current thread helps testing.
-        self.patch(nonces_cleanup, "deferToDatabase", maybeDeferred)
+        # Making `deferToDatabaseWithPriority` use the current thread helps
+        # testing.
+        self.patch(
+            nonces_cleanup, "deferToDatabaseWithPriority",
+            lambda priority, func: maybeDeferred(func))
 
         service = NonceCleanupService()
         # Use a deterministic clock instead of the reactor for testing.
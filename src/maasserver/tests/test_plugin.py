@@ -95,6 +95,7 @@ class TestRegionServiceMaker(MAASTestCase):
             "active-discovery",
             "database-tasks",
             "dns-publication-cleanup",
+            "event-retention",
             "import-resources",
             "import-resources-progress",
             "networks-monitor",
@@ -127,6 +128,12 @@ class TestRegionServiceMaker(MAASTestCase):
         patcher = monkey.MonkeyPatcher()
         patcher.add_patch(reactor, "threadpool", None)
         patcher.add_patch(reactor, "threadpoolForDatabase", None)
+        patcher.add_patch(
+            reactor, "schedulerForDatabase",
+            getattr(reactor, "schedulerForDatabase", None))
+        patcher.add_patch(
+            reactor, "callInDatabase",
+            getattr(reactor, "callInDatabase", None))
         patcher.patch()
         try:
             service_maker = RegionServiceMaker("Harry", "Hill")
@@ -5,6 +5,7 @@
 
 __all__ = []
 
+from datetime import datetime
 from unittest.mock import (
     ANY,
     call,
@@ -29,6 +30,8 @@ from maasserver.models.user import (
 )
 from maasserver.populate_tags import (
     _do_populate_tags,
+    _make_node_info,
+    chunk_nodes,
     populate_tag_for_multiple_nodes,
     populate_tags,
     populate_tags_for_single_node,
@@ -161,6 +164,29 @@ class TestDoPopulateTags(MAASServerTestCase):
                 system_id=rack.system_id,
                 tag_nsmap=tag_nsmap, credentials=creds, nodes=nodes)))
 
+    def test__splits_nodes_to_fit_in_calls(self):
+        rack_controllers = [factory.make_RackController()]
+        [client] = self.patch_clients(rack_controllers)
+        nodes = [
+            {"system_id": factory.make_name("system_id"),
+             "details_key": "%d-2017-06-01T12:30:00.123456" % index}
+            for index in range(3000)
+        ]
+        [d] = _do_populate_tags([{
+            "system_id": rack_controllers[0].system_id,
+            "hostname": rack_controllers[0].hostname,
+            "client": client,
+            "tag_name": factory.make_name("tag"),
+            "tag_definition": factory.make_name("definition"),
+            "tag_nsmap": {},
+            "credentials": factory.make_name("creds"),
+            "nodes": nodes,
+        }])
+        self.assertIsNone(extract_result(d))
+        sent = [kwargs["nodes"] for _, kwargs in client.call_args_list]
+        self.assertGreater(len(sent), 1)
+        self.assertEqual(nodes, [node for chunk in sent for node in chunk])
+
     def test__logs_successes(self):
         rack_controllers = [factory.make_RackController()]
         clients = self.patch_clients(rack_controllers)
@@ -276,6 +302,44 @@ class TestPopulateTagsEndToNearlyEnd(MAASTransactionServerTestCase):
                 tag_nsmap=ANY, credentials=creds, nodes=ANY))
 
 
+class TestChunkNodes(MAASServerTestCase):
+
+    def test__encoding_of_each_chunk_fits_limit(self):
+        nodes = [
+            {"system_id": factory.make_name("system_id"),
+             "details_key": factory.make_name("key")}
+            for _ in range(100)
+        ]
+        chunks = list(chunk_nodes(nodes, limit=500))
+        self.assertEqual(nodes, [node for chunk in chunks for node in chunk])
+        for chunk in chunks:
+            box = EvaluateTag.arguments[-1][1].toStringProto(chunk, None)
+            self.assertLessEqual(len(box), 500)
+
+    def test__keeps_oversized_node(self):
+        node = {"system_id": factory.make_name("system_id", size=100)}
+        self.assertEqual([[node]], list(chunk_nodes([node], limit=10)))
+
+
+class TestMakeNodeInfo(MAASServerTestCase):
+
+    def test__includes_details_key(self):
+        system_id = factory.make_name("system_id")
+        updated = datetime(2017, 6, 1, 12, 30)
+        self.assertEqual(
+            {"system_id": system_id,
+             "details_key": "12-2017-06-01T12:30:00"},
+            _make_node_info(system_id, 12, updated))
+
+    def test__omits_details_key_without_results(self):
+        system_id = factory.make_name("system_id")
+        self.assertEqual(
+            {"system_id": system_id}, _make_node_info(system_id, 12, None))
+        self.assertEqual(
+            {"system_id": system_id},
+            _make_node_info(system_id, None, None))
+
+
 class TestPopulateTagsInRegion(MAASTransactionServerTestCase):
     """Tests for populating tags in the region.
 
@@ -5,6 +5,7 @@
 
 __all__ = []
 
+from collections import OrderedDict
 import http.client
 import json
 import os
@@ -35,7 +36,9 @@ from maasserver.models import (
     PackageRepository,
     signals,
 )
+from maasserver.models.timestampedmodel import now
 from maasserver.preseed import (
+    cache_rendered,
     compose_curtin_archive_config,
     compose_curtin_cloud_config,
     compose_curtin_kernel_preseed,
@@ -44,7 +47,9 @@ from maasserver.preseed import (
     compose_curtin_verbose_preseed,
     compose_enlistment_preseed_url,
     compose_preseed_url,
+    compile_preseed_template,
     curtin_maas_reporter,
+    discard_rendered,
     GENERIC_FILENAME,
     get_curtin_cloud_config,
     get_curtin_config,
@@ -56,17 +61,20 @@ from maasserver.preseed import (
     get_enlist_preseed,
     get_enlist_userdata,
     get_netloc_and_path,
+    get_node_config_version,
     get_node_deprecated_preseed_context,
     get_node_preseed_context,
     get_preseed,
     get_preseed_context,
     get_preseed_filenames,
     get_preseed_template,
+    get_preseed_templates_version,
     get_preseed_type_for,
     load_preseed_template,
     PreseedTemplate,
     render_enlistment_preseed,
     render_preseed,
+    read_preseed_template,
     split_subarch,
     TemplateNotFoundError,
 )
@@ -334,6 +342,78 @@ class TestGetPreseedTemplate(MAASServerTestCase):
             get_preseed_template([template_filename]))
 
 
+class TestReadPreseedTemplate(MAASTestCase):
+    """Tests for `read_preseed_template`."""
+
+    def setUp(self):
+        super(TestReadPreseedTemplate, self).setUp()
+        self.patch(preseed_module, "_preseed_templates", {})
+
+    def test_returns_content(self):
+        content = factory.make_string()
+        path = self.make_file(contents=content)
+        self.assertEqual(content, read_preseed_template(path))
+
+    def test_does_not_read_unchanged_file_again(self):
+        content = factory.make_string()
+        path = self.make_file(contents=content)
+        read_preseed_template(path)
+        self.patch(preseed_module, "open").side_effect = AssertionError()
+        self.assertEqual(content, read_preseed_template(path))
+
+    def test_reads_changed_file_again(self):
+        path = self.make_file(contents=factory.make_string())
+        read_preseed_template(path)
+        content = factory.make_string(size=20)
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.write(content)
+        self.assertEqual(content, read_preseed_template(path))
+
+    def test_raises_IOError_for_missing_file(self):
+        path = os.path.join(self.make_dir(), factory.make_name("missing"))
+        self.assertRaises(IOError, read_preseed_template, path)
+
+
+class TestGetPreseedTemplatesVersion(MAASTestCase):
+    """Tests for `get_preseed_templates_version`."""
+
+    def setUp(self):
+        super(TestGetPreseedTemplatesVersion, self).setUp()
+        self.location = self.make_dir()
+        self.patch(
+            settings, "PRESEED_TEMPLATE_LOCATIONS", [
+                self.location, os.path.join(self.location, "missing")])
+
+    def test_changes_when_template_is_added(self):
+        version = get_preseed_templates_version()
+        factory.make_file(self.location, contents="added")
+        self.assertNotEqual(version, get_preseed_templates_version())
+
+    def test_changes_when_template_is_modified(self):
+        path = factory.make_file(self.location, contents="original")
+        version = get_preseed_templates_version()
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.write("modified!")
+        self.assertNotEqual(version, get_preseed_templates_version())
+
+    def test_is_stable(self):
+        factory.make_file(self.location)
+        self.assertEqual(
+            get_preseed_templates_version(), get_preseed_templates_version())
+
+
+class TestCompilePreseedTemplate(MAASTestCase):
+    """Tests for `compile_preseed_template`."""
+
+    def test_compiles_once(self):
+        filepath = factory.make_name("filepath")
+        content = factory.make_string()
+        template = compile_preseed_template(filepath, content)
+        self.assertIsInstance(template, PreseedTemplate)
+        self.assertEqual(filepath, template.name)
+        self.assertIs(template, compile_preseed_template(filepath, content))
+
+
 class TestLoadPreseedTemplate(MAASServerTestCase):
     """Tests for `load_preseed_template`."""
 
@@ -363,6 +443,16 @@ class TestLoadPreseedTemplate(MAASServerTestCase):
         template = load_preseed_template(node, name)
         self.assertIsInstance(template, PreseedTemplate)
 
+    def test_load_preseed_template_does_not_modify_compiled_template(self):
+        name = factory.make_string()
+        self.create_template(self.location, name)
+        node = factory.make_Node()
+        template = load_preseed_template(node, name)
+        compiled = compile_preseed_template(template.name, template.content)
+        self.assertIsNot(compiled, template)
+        self.assertIsNone(compiled.get_template)
+        self.assertIsNotNone(template.get_template)
+
     def test_load_preseed_template_raises_if_no_template(self):
         node = factory.make_Node()
         unknown_template_name = factory.make_string()
@@ -440,6 +530,140 @@ class TestLoadPreseedTemplate(MAASServerTestCase):
             TemplateNotFoundError, template.substitute)
 
 
+class TestGetNodeConfigVersion(MAASServerTestCase):
+    """Tests for `get_node_config_version`."""
+
+    def test_returns_transaction_start_time(self):
+        node = factory.make_Node()
+        started, _ = get_node_config_version(node)
+        self.assertEqual(now(), started)
+
+    def test_is_stable(self):
+        node = factory.make_Node()
+        self.assertEqual(
+            get_node_config_version(node), get_node_config_version(node))
+
+    def test_changes_when_interface_is_added(self):
+        node = factory.make_Node()
+        _, version = get_node_config_version(node)
+        factory.make_Interface(node=node)
+        self.assertNotEqual(version, get_node_config_version(node)[1])
+
+    def test_changes_when_storage_is_added(self):
+        node = factory.make_Node()
+        block_device = factory.make_PhysicalBlockDevice(node=node)
+        _, version = get_node_config_version(node)
+        factory.make_PartitionTable(block_device=block_device)
+        self.assertNotEqual(version, get_node_config_version(node)[1])
+
+    def test_changes_when_config_is_set(self):
+        node = factory.make_Node()
+        _, version = get_node_config_version(node)
+        Config.objects.set_config("curtin_verbose", True)
+        self.assertNotEqual(version, get_node_config_version(node)[1])
+
+    def test_changes_when_template_is_added(self):
+        location = self.make_dir()
+        self.patch(settings, "PRESEED_TEMPLATE_LOCATIONS", [location])
+        node = factory.make_Node()
+        _, version = get_node_config_version(node)
+        factory.make_file(location)
+        self.assertNotEqual(version, get_node_config_version(node)[1])
+
+    def test_changes_when_owner_is_changed(self):
+        owner = factory.make_User()
+        node = factory.make_Node(owner=owner)
+        _, version = get_node_config_version(node)
+        owner.email = factory.make_email_address()
+        owner.save()
+        self.assertNotEqual(version, get_node_config_version(node)[1])
+
+    def test_changes_when_boot_resource_is_added(self):
+        node = factory.make_Node()
+        _, version = get_node_config_version(node)
+        factory.make_usable_boot_resource()
+        self.assertNotEqual(version, get_node_config_version(node)[1])
+
+    def test_ignores_other_nodes_storage(self):
+        node = factory.make_Node()
+        _, version = get_node_config_version(node)
+        factory.make_PhysicalBlockDevice(node=factory.make_Node())
+        self.assertEqual(version, get_node_config_version(node)[1])
+
+
+class TestCacheRendered(MAASServerTestCase):
+    """Tests for `cache_rendered`."""
+
+    def setUp(self):
+        super(TestCacheRendered, self).setUp()
+        self.patch(preseed_module, "_rendered", OrderedDict())
+        self.get_node_config_version = self.patch(
+            preseed_module, "get_node_config_version")
+        self.get_node_config_version.return_value = (
+            factory.make_name("started"), factory.make_name("version"))
+
+    def make_render(self):
+        return cache_rendered(lambda node: [factory.make_name("rendered")])
+
+    def start_transaction(self):
+        _, version = self.get_node_config_version.return_value
+        self.get_node_config_version.return_value = (
+            factory.make_name("started"), version)
+
+    def test_reuses_rendering_in_later_transaction(self):
+        render = self.make_render()
+        node = factory.make_Node()
+        rendered = render(node)
+        self.start_transaction()
+        self.assertEqual(rendered, render(node))
+
+    def test_returns_copy_of_rendering(self):
+        render = self.make_render()
+        node = factory.make_Node()
+        rendered = render(node)
+        self.start_transaction()
+        self.assertIsNot(rendered, render(node))
+
+    def test_renders_again_in_same_transaction(self):
+        render = self.make_render()
+        node = factory.make_Node()
+        self.assertNotEqual(render(node), render(node))
+
+    def test_renders_again_when_version_changes(self):
+        render = self.make_render()
+        node = factory.make_Node()
+        rendered = render(node)
+        self.get_node_config_version.return_value = (
+            factory.make_name("started"), factory.make_name("version"))
+        self.assertNotEqual(rendered, render(node))
+
+    def test_renders_again_when_discarded(self):
+        render = self.make_render()
+        node = factory.make_Node()
+        rendered = render(node)
+        discard_rendered(node.id)
+        self.start_transaction()
+        self.assertNotEqual(rendered, render(node))
+
+    def test_keeps_renderings_for_other_nodes_when_discarded(self):
+        render = self.make_render()
+        node = factory.make_Node()
+        rendered = render(node)
+        discard_rendered(factory.make_Node().id)
+        self.start_transaction()
+        self.assertEqual(rendered, render(node))
+
+    def test_discards_least_recently_used(self):
+        self.patch(preseed_module, "RENDERED_CACHE_SIZE", 2)
+        render = self.make_render()
+        nodes = [factory.make_Node() for _ in range(3)]
+        rendered = [render(node) for node in nodes]
+        self.start_transaction()
+        self.assertEqual(rendered[2], render(nodes[2]))
+        self.assertEqual(rendered[1], render(nodes[1]))
+        self.assertNotEqual(rendered[0], render(nodes[0]))
+
+
 class TestPreseedContext(MAASServerTestCase):
     """Tests for `get_preseed_context`."""
 
@@ -7,6 +7,7 @@ __all__ = []
 
 import random
 from unittest.mock import (
+    ANY,
     call,
     create_autospec,
     Mock,
@@ -30,11 +31,14 @@ from maastesting.matchers import (
     MockCallsMatch,
     MockNotCalled,
 )
+from provisioningserver.rpc.cluster import DiscardBootConfig
+from provisioningserver.rpc.exceptions import NoConnectionsAvailable
 from testtools import ExpectedException
 from testtools.matchers import MatchesStructure
 from twisted.internet import reactor
 from twisted.internet.defer import (
     Deferred,
+    fail,
     inlineCallbacks,
     succeed,
 )
@@ -55,6 +59,7 @@ class TestRackControllerService(MAASTransactionServerTestCase):
                 starting=None,
                 watching=set(),
                 needsDHCPUpdate=set(),
+                bootConfigMACs=set(),
                 postgresListener=sentinel.listener,
                 advertisingService=sentinel.advertiser))
 
@@ -80,9 +85,9 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         yield service.startService()
         self.assertThat(
             listener.register,
-            MockCalledOnceWith(
-                "sys_core_%d" % regionProcessId,
-                service.coreHandler))
+            MockCallsMatch(
+                call("sys_core_%d" % regionProcessId, service.coreHandler),
+                call("sys_boot_config", service.bootConfigHandler)))
         self.assertEqual(regionProcessId, service.processId)
 
     @wait_for_reactor
@@ -153,8 +158,9 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         yield service.stopService()
         self.assertThat(
             listener.unregister,
-            MockCalledOnceWith(
-                "sys_core_%d" % service.processId, service.coreHandler))
+            MockCallsMatch(
+                call("sys_core_%d" % service.processId, service.coreHandler),
+                call("sys_boot_config", service.bootConfigHandler)))
         self.assertIsNone(service.starting)
 
     @wait_for_reactor
@@ -168,8 +174,9 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         yield service.stopService()
         self.assertThat(
             listener.unregister,
-            MockCalledOnceWith(
-                "sys_core_%d" % processId, service.coreHandler))
+            MockCallsMatch(
+                call("sys_core_%d" % processId, service.coreHandler),
+                call("sys_boot_config", service.bootConfigHandler)))
 
     @wait_for_reactor
     @inlineCallbacks
@@ -209,6 +216,18 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         self.assertEquals(set(), service.watching)
         self.assertEquals(set(), service.needsDHCPUpdate)
 
+    def test_coreHandler_unwatch_discards_cached_hosts(self):
+        processId = random.randint(0, 100)
+        rack_id = random.randint(0, 100)
+        self.patch(rack_controller.dhcp, "_hosts_cache", {
+            rack_id: sentinel.hosts, rack_id + 1: sentinel.other})
+        service = RackControllerService(Mock(), sentinel.advertiser)
+        service.processId = processId
+        service.watching = {rack_id, rack_id + 1}
+        service.coreHandler("sys_core_%d" % processId, "unwatch_%d" % rack_id)
+        self.assertEqual(
+            {rack_id + 1: sentinel.other}, rack_controller.dhcp._hosts_cache)
+
     def test_coreHandler_unwatch_doesnt_call_unregister(self):
         processId = random.randint(0, 100)
         rack_id = random.randint(0, 100)
@@ -274,6 +293,27 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         self.assertEquals(set([rack_id]), service.needsDHCPUpdate)
         self.assertThat(mock_startProcessing, MockCalledOnceWith())
 
+    def test_dhcpHandler_records_changed_vlans(self):
+        rack_id = random.randint(0, 100)
+        service = RackControllerService(Mock(), sentinel.advertiser)
+        service.watching = set([rack_id])
+        self.patch(service, "startProcessing")
+        service.dhcpHandler("sys_dhcp_%d" % rack_id, "3")
+        service.dhcpHandler("sys_dhcp_%d" % rack_id, "4")
+        self.assertEquals(set([rack_id]), service.needsDHCPUpdate)
+        self.assertEquals({rack_id: {3, 4}}, service.changedVLANs)
+
+    def test_dhcpHandler_forgets_changed_vlans_when_all_changed(self):
+        rack_id = random.randint(0, 100)
+        service = RackControllerService(Mock(), sentinel.advertiser)
+        service.watching = set([rack_id])
+        self.patch(service, "startProcessing")
+        service.dhcpHandler("sys_dhcp_%d" % rack_id, "3")
+        service.dhcpHandler("sys_dhcp_%d" % rack_id, "")
+        service.dhcpHandler("sys_dhcp_%d" % rack_id, "4")
+        self.assertEquals(set([rack_id]), service.needsDHCPUpdate)
+        self.assertEquals({}, service.changedVLANs)
+
     def test_dhcpHandler_doesnt_add_to_needsDHCPUpdate(self):
         rack_id = random.randint(0, 100)
         listener = Mock()
@@ -284,6 +324,24 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         self.assertEquals(set(), service.needsDHCPUpdate)
         self.assertThat(mock_startProcessing, MockNotCalled())
 
+    def test_bootConfigHandler_adds_to_bootConfigMACs(self):
+        macs = [factory.make_mac_address() for _ in range(3)]
+        service = RackControllerService(Mock(), sentinel.advertiser)
+        service.watching = set([random.randint(0, 100)])
+        mock_startProcessing = self.patch(service, "startProcessing")
+        service.bootConfigHandler("sys_boot_config", ",".join(macs[:2]))
+        service.bootConfigHandler("sys_boot_config", macs[2])
+        self.assertEquals(set(macs), service.bootConfigMACs)
+        self.assertThat(mock_startProcessing, MockCallsMatch(call(), call()))
+
+    def test_bootConfigHandler_doesnt_add_when_not_watching(self):
+        service = RackControllerService(Mock(), sentinel.advertiser)
+        mock_startProcessing = self.patch(service, "startProcessing")
+        service.bootConfigHandler(
+            "sys_boot_config", factory.make_mac_address())
+        self.assertEquals(set(), service.bootConfigMACs)
+        self.assertThat(mock_startProcessing, MockNotCalled())
+
     def test_startProcessing_doesnt_call_start_when_looping_call_running(self):
         service = RackControllerService(
             sentinel.listener, sentinel.advertiser)
@@ -362,6 +420,121 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         for rack_id in rack_ids:
             self.assertThat(mock_processDHCP, MockAnyCall(rack_id))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_calls_processBootConfig_before_processDHCP(self):
+        rack_id = random.randint(0, 100)
+        macs = {factory.make_mac_address() for _ in range(3)}
+        service = RackControllerService(
+            sentinel.listener, sentinel.advertiser)
+        service.watching = set([rack_id])
+        service.needsDHCPUpdate = set([rack_id])
+        service.bootConfigMACs = set(macs)
+        service.running = True
+        mock_processBootConfig = self.patch(service, "processBootConfig")
+        mock_processDHCP = self.patch(service, "processDHCP")
+        service.startProcessing()
+        yield service.processingDone
+        self.assertThat(mock_processBootConfig, MockCalledOnceWith(macs))
+        self.assertThat(mock_processDHCP, MockCalledOnceWith(rack_id))
+        self.assertEqual(set(), service.bootConfigMACs)
+
+    def test_process_alternates_between_processBootConfig_and_processDHCP(
+            self):
+        rack_ids = [random.randint(0, 100) for _ in range(2)]
+        service = RackControllerService(
+            sentinel.listener, sentinel.advertiser)
+        service.watching = set(rack_ids)
+        service.needsDHCPUpdate = set(rack_ids)
+        service.running = True
+        calls = Mock()
+        self.patch(service, "processBootConfig", calls.processBootConfig)
+        self.patch(service, "processDHCP", calls.processDHCP)
+        for _ in range(4):
+            service.bootConfigMACs.add(factory.make_mac_address())
+            service.process()
+        self.assertEqual(
+            ["processBootConfig", "processDHCP"] * 2,
+            [name for name, _, _ in calls.mock_calls])
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_processBootConfig_discards_on_watched_rack_controllers(self):
+        @transactional
+        def make_rack_controllers():
+            return [factory.make_RackController() for _ in range(3)]
+
+        racks = yield deferToDatabase(make_rack_controllers)
+        macs = {factory.make_mac_address() for _ in range(3)}
+        service = RackControllerService(
+            sentinel.listener, sentinel.advertiser)
+        service.watching = {rack.id for rack in racks[:2]}
+        client = Mock()
+        client.return_value = succeed({})
+        mock_getClientFor = self.patch(rack_controller, "getClientFor")
+        mock_getClientFor.return_value = succeed(client)
+        yield service.processBootConfig(macs)
+        self.assertEqual(2, mock_getClientFor.call_count)
+        for rack in racks[:2]:
+            self.assertThat(
+                mock_getClientFor, MockAnyCall(rack.system_id, timeout=1))
+        self.assertThat(client, MockCallsMatch(
+            call(DiscardBootConfig, macs=sorted(macs)),
+            call(DiscardBootConfig, macs=sorted(macs))))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_processBootConfig_ignores_failures(self):
+        rack = yield deferToDatabase(
+            transactional(factory.make_RackController))
+        service = RackControllerService(
+            sentinel.listener, sentinel.advertiser)
+        service.watching = set([rack.id])
+        mock_getClientFor = self.patch(rack_controller, "getClientFor")
+        mock_getClientFor.return_value = fail(
+            NoConnectionsAvailable(rack.system_id))
+        # No error is raised.
+        yield service.processBootConfig({factory.make_mac_address()})
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_processBootConfig_sends_macs_in_batches(self):
+        self.patch(rack_controller, "BOOT_CONFIG_BATCH_SIZE", 2)
+        rack = yield deferToDatabase(
+            transactional(factory.make_RackController))
+        macs = sorted({factory.make_mac_address() for _ in range(5)})
+        service = RackControllerService(
+            sentinel.listener, sentinel.advertiser)
+        service.watching = set([rack.id])
+        client = Mock()
+        client.return_value = succeed({})
+        mock_getClientFor = self.patch(rack_controller, "getClientFor")
+        mock_getClientFor.return_value = succeed(client)
+        yield service.processBootConfig(set(macs))
+        self.assertThat(client, MockCallsMatch(
+            call(DiscardBootConfig, macs=macs[0:2]),
+            call(DiscardBootConfig, macs=macs[2:4]),
+            call(DiscardBootConfig, macs=macs[4:])))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_processBootConfig_logs_unexpected_failures(self):
+        rack = yield deferToDatabase(
+            transactional(factory.make_RackController))
+        service = RackControllerService(
+            sentinel.listener, sentinel.advertiser)
+        service.watching = set([rack.id])
+        client = Mock()
+        client.return_value = fail(ZeroDivisionError())
+        mock_getClientFor = self.patch(rack_controller, "getClientFor")
+        mock_getClientFor.return_value = succeed(client)
+        log = self.patch(rack_controller, "log")
+        # No error is raised.
+        yield service.processBootConfig({factory.make_mac_address()})
+        self.assertThat(log.err, MockCalledOnceWith(ANY, ANY))
+        failure, _ = log.err.call_args[0]
+        self.assertTrue(failure.check(ZeroDivisionError))
+
     @wait_for_reactor
     @inlineCallbacks
     def test_processDHCP_calls_configure_dhcp(self):
@@ -374,4 +547,57 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         mock_configure_dhcp.return_value = succeed(None)
         yield service.processDHCP(rack.id)
         self.assertThat(
-            mock_configure_dhcp, MockCalledOnceWith(rack))
+            mock_configure_dhcp, MockCalledOnceWith(rack, changed_vlans=None))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_processDHCP_passes_changed_vlans_to_configure_dhcp(self):
+        rack = yield deferToDatabase(
+            transactional(factory.make_RackController))
+        service = RackControllerService(
+            sentinel.listener, sentinel.advertiser)
+        service.changedVLANs = {rack.id: {1, 2}}
+        mock_configure_dhcp = self.patch(
+            rack_controller.dhcp, "configure_dhcp")
+        mock_configure_dhcp.return_value = succeed(None)
+        yield service.processDHCP(rack.id)
+        self.assertThat(
+            mock_configure_dhcp,
+            MockCalledOnceWith(rack, changed_vlans={1, 2}))
+        self.assertEqual({}, service.changedVLANs)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_processDHCP_discards_cached_hosts_on_failure(self):
+        rack = yield deferToDatabase(
+            transactional(factory.make_RackController))
+        service = RackControllerService(
+            sentinel.listener, sentinel.advertiser)
+        service.watching = {rack.id}
+        service.changedVLANs = {rack.id: {1, 2}}
+        self.patch(
+            rack_controller.dhcp, "_hosts_cache", {rack.id: sentinel.hosts})
+        mock_configure_dhcp = self.patch(
+            rack_controller.dhcp, "configure_dhcp")
+        mock_configure_dhcp.return_value = fail(
+            NoConnectionsAvailable(rack.system_id))
+        with ExpectedException(NoConnectionsAvailable):
+            yield service.processDHCP(rack.id)
+        self.assertEqual({}, rack_controller.dhcp._hosts_cache)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_processDHCP_discards_cached_hosts_for_unwatched_racks(self):
+        rack = yield deferToDatabase(
+            transactional(factory.make_RackController))
+        service = RackControllerService(
+            sentinel.listener, sentinel.advertiser)
+        service.watching = {rack.id}
+        self.patch(rack_controller.dhcp, "_hosts_cache", {
+            rack.id: sentinel.hosts, rack.id + 1: sentinel.other})
+        mock_configure_dhcp = self.patch(
+            rack_controller.dhcp, "configure_dhcp")
+        mock_configure_dhcp.return_value = succeed(None)
+        yield service.processDHCP(rack.id)
+        self.assertEqual(
+            {rack.id: sentinel.hosts}, rack_controller.dhcp._hosts_cache)
@@ -44,7 +44,8 @@ class TestRegionControllerService(MAASServerTestCase):
                 clock=reactor,
                 processingDefer=None,
                 needsDNSUpdate=False,
-                postgresListener=sentinel.listener))
+                postgresListener=sentinel.listener,
+                dnsPublicationId=None))
 
     @wait_for_reactor
     @inlineCallbacks
@@ -135,11 +136,11 @@ class TestRegionControllerService(MAASServerTestCase):
     def test_process_doesnt_update_zones_when_nothing_to_process(self):
         service = RegionControllerService(sentinel.listener)
         service.needsDNSUpdate = False
-        mock_dns_update_all_zones = self.patch(
-            region_controller, "dns_update_all_zones")
+        mock_dns_update_changed_zones = self.patch(
+            region_controller, "dns_update_changed_zones")
         service.startProcessing()
         yield service.processingDefer
-        self.assertThat(mock_dns_update_all_zones, MockNotCalled())
+        self.assertThat(mock_dns_update_changed_zones, MockNotCalled())
 
     @wait_for_reactor
     @inlineCallbacks
@@ -166,17 +167,34 @@ class TestRegionControllerService(MAASServerTestCase):
     def test_process_updates_zones(self):
         service = RegionControllerService(sentinel.listener)
         service.needsDNSUpdate = True
-        mock_dns_update_all_zones = self.patch(
-            region_controller, "dns_update_all_zones")
+        mock_dns_update_changed_zones = self.patch(
+            region_controller, "dns_update_changed_zones")
         mock_msg = self.patch(
             region_controller.log, "msg")
         service.startProcessing()
         yield service.processingDefer
-        self.assertThat(mock_dns_update_all_zones, MockCalledOnceWith())
+        self.assertThat(
+            mock_dns_update_changed_zones, MockCalledOnceWith(None))
         self.assertThat(
             mock_msg,
             MockCalledOnceWith("Successfully configured DNS."))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_updates_zones_since_previous_publication(self):
+        service = RegionControllerService(sentinel.listener)
+        service.needsDNSUpdate = True
+        service.dnsPublicationId = sentinel.previous
+        mock_dns_update_changed_zones = self.patch(
+            region_controller, "dns_update_changed_zones")
+        mock_dns_update_changed_zones.return_value = sentinel.latest
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertThat(
+            mock_dns_update_changed_zones,
+            MockCalledOnceWith(sentinel.previous))
+        self.assertIs(sentinel.latest, service.dnsPublicationId)
+
     @wait_for_reactor
     @inlineCallbacks
     def test_process_updates_proxy(self):
@@ -200,14 +218,15 @@ class TestRegionControllerService(MAASServerTestCase):
     def test_process_updates_zones_logs_failure(self):
         service = RegionControllerService(sentinel.listener)
         service.needsDNSUpdate = True
-        mock_dns_update_all_zones = self.patch(
-            region_controller, "dns_update_all_zones")
-        mock_dns_update_all_zones.side_effect = factory.make_exception()
+        mock_dns_update_changed_zones = self.patch(
+            region_controller, "dns_update_changed_zones")
+        mock_dns_update_changed_zones.side_effect = factory.make_exception()
         mock_err = self.patch(
             region_controller.log, "err")
         service.startProcessing()
         yield service.processingDefer
-        self.assertThat(mock_dns_update_all_zones, MockCalledOnceWith())
+        self.assertThat(
+            mock_dns_update_changed_zones, MockCalledOnceWith(None))
         self.assertThat(
             mock_err,
             MockCalledOnceWith(ANY, "Failed configuring DNS."))
@@ -236,14 +255,14 @@ class TestRegionControllerService(MAASServerTestCase):
         service = RegionControllerService(sentinel.listener)
         service.needsDNSUpdate = True
         service.needsProxyUpdate = True
-        mock_dns_update_all_zones = self.patch(
-            region_controller, "dns_update_all_zones")
+        mock_dns_update_changed_zones = self.patch(
+            region_controller, "dns_update_changed_zones")
         mock_proxy_update_config = self.patch(
             region_controller, "proxy_update_config")
         mock_proxy_update_config.return_value = succeed(None)
         service.startProcessing()
         yield service.processingDefer
         self.assertThat(
-            mock_dns_update_all_zones, MockCalledOnceWith())
+            mock_dns_update_changed_zones, MockCalledOnceWith(None))
         self.assertThat(
             mock_proxy_update_config, MockCalledOnceWith(reload_proxy=True))
@@ -258,8 +258,11 @@ class TestStatusMonitorService(MAASServerTestCase):
         # decorators. This indirection makes it clearer to mock
         # `cleanup_old_nonces` here and track calls to it.
         mock_check_status = self.patch(status_monitor, "check_status")
-        # Making `deferToDatabase` use the current thread helps testing.
-        self.patch(status_monitor, "deferToDatabase", maybeDeferred)
+        # Making `deferToDatabaseWithPriority` use the current thread helps
+        # testing.
+        self.patch(
+            status_monitor, "deferToDatabaseWithPriority",
+            lambda priority, func: maybeDeferred(func))
 
         service = StatusMonitorService()
         # Use a deterministic clock instead of the reactor for testing.
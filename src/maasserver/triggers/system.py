@@ -371,10 +371,13 @@ DHCP_ALERT = dedent("""\
     DECLARE
       relay_vlan maasserver_vlan;
     BEGIN
+      -- The payload is the ID of the VLAN that changed.
       IF vlan.dhcp_on THEN
-        PERFORM pg_notify(CONCAT('sys_dhcp_', vlan.primary_rack_id), '');
+        PERFORM pg_notify(CONCAT('sys_dhcp_', vlan.primary_rack_id),
+          vlan.id::text);
         IF vlan.secondary_rack_id IS NOT NULL THEN
-          PERFORM pg_notify(CONCAT('sys_dhcp_', vlan.secondary_rack_id), '');
+          PERFORM pg_notify(CONCAT('sys_dhcp_', vlan.secondary_rack_id),
+            vlan.id::text);
         END IF;
       END IF;
       IF vlan.relay_vlan_id IS NOT NULL THEN
@@ -383,10 +386,10 @@ DHCP_ALERT = dedent("""\
         WHERE maasserver_vlan.id = vlan.relay_vlan_id;
         IF relay_vlan.dhcp_on THEN
           PERFORM pg_notify(CONCAT(
-            'sys_dhcp_', relay_vlan.primary_rack_id), '');
+            'sys_dhcp_', relay_vlan.primary_rack_id), vlan.id::text);
           IF relay_vlan.secondary_rack_id IS NOT NULL THEN
             PERFORM pg_notify(CONCAT(
-              'sys_dhcp_', relay_vlan.secondary_rack_id), '');
+              'sys_dhcp_', relay_vlan.secondary_rack_id), vlan.id::text);
           END IF;
         END IF;
       END IF;
@@ -1035,6 +1038,64 @@ DNS_PUBLISH = dedent("""\
     """)
 
 
+# Creates a new DNS publication that records the domains and subnets whose
+# zones it affects, so that only those zones need to be regenerated.
+DNS_PUBLISH_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_dns_publish_update(
+      reason text, domains integer[], subnets integer[])
+    RETURNS void AS $$
+    BEGIN
+      INSERT INTO maasserver_dnspublication
+        (serial, created, source, touched_domains, touched_subnets)
+      VALUES
+        (nextval('maasserver_zone_serial_seq'), now(),
+         substring(reason FOR 255),
+         array_remove(COALESCE(domains, '{}'), NULL),
+         array_remove(COALESCE(subnets, '{}'), NULL));
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Returns the IDs of the domains in which the given static IP address appears.
+# This is the domain of any node with an interface linked to the address, the
+# domain of any DNS resource linked to the address, and always the default
+# domain, which also carries the dynamic ranges.
+DNS_STATICIPADDRESS_DOMAINS = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_dns_staticipaddress_domains(ip_id integer)
+    RETURNS integer[] AS $$
+      SELECT array_agg(DISTINCT domains.domain_id) FROM (
+        SELECT node.domain_id
+        FROM maasserver_interface_ip_addresses AS link
+        JOIN maasserver_interface AS iface ON iface.id = link.interface_id
+        JOIN maasserver_node AS node ON node.id = iface.node_id
+        WHERE link.staticipaddress_id = ip_id
+        UNION
+        SELECT dnsrr.domain_id
+        FROM maasserver_dnsresource_ip_addresses AS link
+        JOIN maasserver_dnsresource AS dnsrr ON dnsrr.id = link.dnsresource_id
+        WHERE link.staticipaddress_id = ip_id
+        UNION
+        SELECT 0) AS domains
+      WHERE domains.domain_id IS NOT NULL;
+    $$ LANGUAGE sql;
+    """)
+
+
+# SQL expressions used with `render_sys_dns_tracked_procedure`. Each is
+# formatted with the name of the trigger row, i.e. NEW or OLD.
+DNS_STATICIPADDRESS_SUBNETS = (
+    "ARRAY(SELECT subnet_id FROM maasserver_staticipaddress "
+    "WHERE id = %s.staticipaddress_id)")
+DNS_DNSRESOURCE_SUBNETS = (
+    "ARRAY(SELECT DISTINCT ip.subnet_id "
+    "FROM maasserver_dnsresource_ip_addresses AS link "
+    "JOIN maasserver_staticipaddress AS ip ON ip.id = link.staticipaddress_id "
+    "WHERE link.dnsresource_id = %s.id)")
+DNS_DNSDATA_DOMAINS = (
+    "ARRAY(SELECT domain_id FROM maasserver_dnsresource "
+    "WHERE id = %s.dnsresource_id)")
+
+
 # Triggered when a subnet is updated. Increments notifies that proxy needs to
 # be updated. Only watches changes on the cidr and allow_proxy.
 PROXY_SUBNET_UPDATE = dedent("""\
@@ -1102,6 +1163,267 @@ def render_sys_dns_procedure(proc_name, on_delete=False):
         """).format(proc=proc_name, rval='OLD' if on_delete else 'NEW')
 
 
+def render_sys_dns_tracked_procedure(
+        proc_name, domains, subnets, on_delete=False):
+    """Render a database procedure that creates a new DNS publication that
+    records which domains and subnets were touched.
+
+    :param proc_name: Name of the procedure.
+    :param domains: SQL expression giving an integer array of domain IDs.
+    :param subnets: SQL expression giving an integer array of subnet IDs.
+    :param on_delete: True when procedure will be used as a delete trigger.
+    """
+    return dedent("""\
+        CREATE OR REPLACE FUNCTION {proc}() RETURNS trigger AS $$
+        BEGIN
+          PERFORM sys_dns_publish_update(
+            'Call to {proc}', {domains}, {subnets});
+          RETURN {rval};
+        END;
+        $$ LANGUAGE plpgsql;
+        """).format(
+        proc=proc_name, domains=domains, subnets=subnets,
+        rval='OLD' if on_delete else 'NEW')
+
+
+def render_sys_config_procedure(proc_name, on_delete=False):
+    """Render a database procedure with name `proc_name` that notifies that a
+    config value has changed, with the ID of the transaction that changed it.
+
+    :param proc_name: Name of the procedure.
+    :param on_delete: True when procedure will be used as a delete trigger.
+    """
+    return dedent("""\
+        CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$
+        BEGIN
+          PERFORM pg_notify('sys_config', txid_current()::text);
+          RETURN %s;
+        END;
+        $$ LANGUAGE plpgsql;
+        """ % (proc_name, 'OLD' if on_delete else 'NEW'))
+
+
+# Triggered when a node is updated. Notifies with the MAC addresses of the
+# node's interfaces when a change affects how it boots, so that the boot
+# configurations cached by rack controllers for it are discarded.
+BOOT_CONFIG_NODE_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_node_update()
+    RETURNS trigger as $$
+    DECLARE
+      macs text;
+    BEGIN
+      IF OLD.status != NEW.status OR
+         OLD.netboot != NEW.netboot OR
+         OLD.node_type != NEW.node_type OR
+         OLD.architecture IS DISTINCT FROM NEW.architecture OR
+         OLD.osystem != NEW.osystem OR
+         OLD.distro_series != NEW.distro_series OR
+         OLD.hwe_kernel IS DISTINCT FROM NEW.hwe_kernel OR
+         OLD.min_hwe_kernel IS DISTINCT FROM NEW.min_hwe_kernel OR
+         OLD.hostname != NEW.hostname OR
+         OLD.domain_id IS DISTINCT FROM NEW.domain_id THEN
+        SELECT string_agg(mac_address::text, ',') INTO macs
+        FROM maasserver_interface
+        WHERE node_id = NEW.id AND mac_address IS NOT NULL;
+        IF macs IS NOT NULL THEN
+          PERFORM pg_notify('sys_boot_config', macs);
+        END IF;
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Triggered when an interface is updated. Notifies with the old and new MAC
+# addresses when the interface moves to another node or its MAC address
+# changes.
+BOOT_CONFIG_INTERFACE_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_boot_config_interface_update()
+    RETURNS trigger as $$
+    BEGIN
+      IF (OLD.mac_address IS DISTINCT FROM NEW.mac_address OR
+          OLD.node_id IS DISTINCT FROM NEW.node_id) AND
+         coalesce(OLD.mac_address, NEW.mac_address) IS NOT NULL THEN
+        PERFORM pg_notify('sys_boot_config', concat_ws(
+          ',', OLD.mac_address::text, NEW.mac_address::text));
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Helper that announces a change to the addresses in use on a subnet to the
+# allocation caches of region processes. The change is NULL when the subnet
+# or its ranges or routes have changed, or else "+" for an address that has
+# been assigned or "-" for one that has been released, followed by the
+# address and the ID of its row (so that PostgreSQL does not discard a
+# repeated change within a transaction).
+SUBNET_ALLOCATION_NOTIFY = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_subnet_allocation_notify(
+      subnet_id integer, change text)
+    RETURNS void as $$
+    BEGIN
+      IF subnet_id IS NOT NULL THEN
+        PERFORM pg_notify('sys_subnet_allocation', concat_ws(
+          ' ', subnet_id, txid_current(), change));
+      END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when an IP address is inserted.
+SUBNET_ALLOCATION_STATICIPADDRESS_INSERT = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_subnet_allocation_staticipaddress_insert()
+    RETURNS trigger as $$
+    BEGIN
+      IF NEW.ip IS NOT NULL THEN
+        PERFORM sys_subnet_allocation_notify(
+          NEW.subnet_id, '+' || host(NEW.ip) || ' ' || NEW.id);
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when an IP address is updated. Only watches changes to the
+# address and its subnet.
+SUBNET_ALLOCATION_STATICIPADDRESS_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_subnet_allocation_staticipaddress_update()
+    RETURNS trigger as $$
+    BEGIN
+      IF OLD.subnet_id IS DISTINCT FROM NEW.subnet_id OR
+          OLD.ip IS DISTINCT FROM NEW.ip THEN
+        IF OLD.ip IS NOT NULL THEN
+          PERFORM sys_subnet_allocation_notify(
+            OLD.subnet_id, '-' || host(OLD.ip) || ' ' || OLD.id);
+        END IF;
+        IF NEW.ip IS NOT NULL THEN
+          PERFORM sys_subnet_allocation_notify(
+            NEW.subnet_id, '+' || host(NEW.ip) || ' ' || NEW.id);
+        END IF;
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when an IP address is deleted.
+SUBNET_ALLOCATION_STATICIPADDRESS_DELETE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_subnet_allocation_staticipaddress_delete()
+    RETURNS trigger as $$
+    BEGIN
+      IF OLD.ip IS NOT NULL THEN
+        PERFORM sys_subnet_allocation_notify(
+          OLD.subnet_id, '-' || host(OLD.ip) || ' ' || OLD.id);
+      END IF;
+      RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a neighbour is observed. Announces the address to every
+# subnet on the VLAN of the interface it was observed on that contains it.
+SUBNET_ALLOCATION_NEIGHBOUR_INSERT = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_subnet_allocation_neighbour_insert()
+    RETURNS trigger as $$
+    BEGIN
+      PERFORM sys_subnet_allocation_notify(
+          subnet.id, '*' || host(NEW.ip) || ' ' || NEW.id)
+        FROM maasserver_subnet AS subnet, maasserver_interface AS iface
+        WHERE iface.id = NEW.interface_id
+          AND subnet.vlan_id = iface.vlan_id
+          AND NEW.ip << subnet.cidr;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a neighbour is updated. Only watches changes to the address
+# and the interface; neighbours are updated every time they are seen again.
+SUBNET_ALLOCATION_NEIGHBOUR_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_subnet_allocation_neighbour_update()
+    RETURNS trigger as $$
+    BEGIN
+      IF OLD.interface_id != NEW.interface_id OR
+          OLD.ip IS DISTINCT FROM NEW.ip THEN
+        PERFORM sys_subnet_allocation_notify(subnet.id, NULL)
+          FROM maasserver_subnet AS subnet, maasserver_interface AS iface
+          WHERE iface.id = OLD.interface_id
+            AND subnet.vlan_id = iface.vlan_id
+            AND OLD.ip << subnet.cidr;
+        PERFORM sys_subnet_allocation_notify(
+            subnet.id, '*' || host(NEW.ip) || ' ' || NEW.id)
+          FROM maasserver_subnet AS subnet, maasserver_interface AS iface
+          WHERE iface.id = NEW.interface_id
+            AND subnet.vlan_id = iface.vlan_id
+            AND NEW.ip << subnet.cidr;
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Triggered when a neighbour is deleted. Another neighbour may still have
+# the same address, so this discards the cached entries.
+SUBNET_ALLOCATION_NEIGHBOUR_DELETE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_subnet_allocation_neighbour_delete()
+    RETURNS trigger as $$
+    BEGIN
+      PERFORM sys_subnet_allocation_notify(subnet.id, NULL)
+        FROM maasserver_subnet AS subnet, maasserver_interface AS iface
+        WHERE iface.id = OLD.interface_id
+          AND subnet.vlan_id = iface.vlan_id
+          AND OLD.ip << subnet.cidr;
+      RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+def render_sys_boot_config_interface_procedure(proc_name, on_delete=False):
+    """Render a database procedure with name `proc_name` that notifies with
+    the MAC address of an interface that has been created or deleted.
+
+    :param proc_name: Name of the procedure.
+    :param on_delete: True when procedure will be used as a delete trigger.
+    """
+    row = 'OLD' if on_delete else 'NEW'
+    return dedent("""\
+        CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$
+        BEGIN
+          IF %s.mac_address IS NOT NULL THEN
+            PERFORM pg_notify('sys_boot_config', %s.mac_address::text);
+          END IF;
+          RETURN %s;
+        END;
+        $$ LANGUAGE plpgsql;
+        """ % (proc_name, row, row, row))
+
+
+def render_sys_subnet_allocation_procedure(proc_name, column, event):
+    """Render a database procedure with name `proc_name` that notifies that
+    the addresses in use on a subnet must be worked out again.
+
+    :param proc_name: Name of the procedure.
+    :param column: The column holding the ID of the subnet.
+    :param event: The event the procedure will be triggered by: "insert",
+        "update", or "delete".
+    """
+    rows = {"insert": ["NEW"], "update": ["OLD", "NEW"], "delete": ["OLD"]}
+    return dedent("""\
+        CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$
+        BEGIN
+        %s
+          RETURN %s;
+        END;
+        $$ LANGUAGE plpgsql;
+        """) % (proc_name, "\n".join(
+        "  PERFORM sys_subnet_allocation_notify(%s.%s, NULL);" % (
+            row, column) for row in rows[event]), rows[event][-1])
+
+
 def render_sys_proxy_procedure(proc_name, on_delete=False):
     """Render a database procedure with name `proc_name` that notifies that a
     proxy update is needed.
@@ -1224,6 +1546,8 @@ def register_system_triggers():
     # The zone serial is used in the 'sys_dns' triggers. Ensure that it exists
     # before creating the triggers.
     zone_serial.create_if_not_exists()
+    register_procedure(DNS_PUBLISH_UPDATE)
+    register_procedure(DNS_STATICIPADDRESS_DOMAINS)
 
     # - Domain
     register_procedure(
@@ -1241,67 +1565,111 @@ def register_system_triggers():
 
     # - StaticIPAddress
     register_procedure(
-        render_sys_dns_procedure("sys_dns_staticipaddress_update"))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_staticipaddress_update",
+            domains="sys_dns_staticipaddress_domains(NEW.id)",
+            subnets="ARRAY[OLD.subnet_id, NEW.subnet_id]"))
     register_trigger(
         "maasserver_staticipaddress",
         "sys_dns_staticipaddress_update", "update")
 
     # - Interface -> StaticIPAddress
     register_procedure(
-        render_sys_dns_procedure("sys_dns_nic_ip_link"))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_nic_ip_link",
+            domains="sys_dns_staticipaddress_domains(NEW.staticipaddress_id)",
+            subnets=DNS_STATICIPADDRESS_SUBNETS % "NEW"))
     register_trigger(
         "maasserver_interface_ip_addresses",
         "sys_dns_nic_ip_link", "insert")
     register_procedure(
-        render_sys_dns_procedure(
-            "sys_dns_nic_ip_unlink", on_delete=True))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_nic_ip_unlink",
+            domains=(
+                "sys_dns_staticipaddress_domains(OLD.staticipaddress_id) || "
+                "ARRAY(SELECT node.domain_id FROM maasserver_interface AS "
+                "iface JOIN maasserver_node AS node "
+                "ON node.id = iface.node_id "
+                "WHERE iface.id = OLD.interface_id)"),
+            subnets=DNS_STATICIPADDRESS_SUBNETS % "OLD",
+            on_delete=True))
     register_trigger(
         "maasserver_interface_ip_addresses",
         "sys_dns_nic_ip_unlink", "delete")
 
     # - DNSResource
     register_procedure(
-        render_sys_dns_procedure("sys_dns_dnsresource_insert"))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_dnsresource_insert",
+            domains="ARRAY[NEW.domain_id]",
+            subnets=DNS_DNSRESOURCE_SUBNETS % "NEW"))
     register_trigger(
         "maasserver_dnsresource",
         "sys_dns_dnsresource_insert", "insert")
     register_procedure(
-        render_sys_dns_procedure("sys_dns_dnsresource_update"))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_dnsresource_update",
+            domains="ARRAY[OLD.domain_id, NEW.domain_id]",
+            subnets=DNS_DNSRESOURCE_SUBNETS % "NEW"))
     register_trigger(
         "maasserver_dnsresource",
         "sys_dns_dnsresource_update", "update")
     register_procedure(
-        render_sys_dns_procedure("sys_dns_dnsresource_delete", on_delete=True))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_dnsresource_delete",
+            domains="ARRAY[OLD.domain_id]",
+            subnets=DNS_DNSRESOURCE_SUBNETS % "OLD",
+            on_delete=True))
     register_trigger(
         "maasserver_dnsresource",
         "sys_dns_dnsresource_delete", "delete")
 
     # - DNSResource -> StaticIPAddress
     register_procedure(
-        render_sys_dns_procedure("sys_dns_dnsresource_ip_link"))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_dnsresource_ip_link",
+            domains="sys_dns_staticipaddress_domains(NEW.staticipaddress_id)",
+            subnets=DNS_STATICIPADDRESS_SUBNETS % "NEW"))
     register_trigger(
         "maasserver_dnsresource_ip_addresses",
         "sys_dns_dnsresource_ip_link", "insert")
     register_procedure(
-        render_sys_dns_procedure(
-            "sys_dns_dnsresource_ip_unlink", on_delete=True))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_dnsresource_ip_unlink",
+            domains=(
+                "sys_dns_staticipaddress_domains(OLD.staticipaddress_id) || "
+                "ARRAY(SELECT domain_id FROM maasserver_dnsresource "
+                "WHERE id = OLD.dnsresource_id)"),
+            subnets=DNS_STATICIPADDRESS_SUBNETS % "OLD",
+            on_delete=True))
     register_trigger(
         "maasserver_dnsresource_ip_addresses",
         "sys_dns_dnsresource_ip_unlink", "delete")
 
     # - DNSData
     register_procedure(
-        render_sys_dns_procedure("sys_dns_dnsdata_insert"))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_dnsdata_insert",
+            domains=DNS_DNSDATA_DOMAINS % "NEW",
+            subnets="NULL"))
     register_trigger(
         "maasserver_dnsdata",
         "sys_dns_dnsdata_insert", "insert")
     register_procedure(
-        render_sys_dns_procedure("sys_dns_dnsdata_update"))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_dnsdata_update",
+            domains=(DNS_DNSDATA_DOMAINS % "OLD") + " || " + (
+                DNS_DNSDATA_DOMAINS % "NEW"),
+            subnets="NULL"))
     register_trigger(
         "maasserver_dnsdata",
         "sys_dns_dnsdata_update", "update")
     register_procedure(
-        render_sys_dns_procedure("sys_dns_dnsdata_delete", on_delete=True))
+        render_sys_dns_tracked_procedure(
+            "sys_dns_dnsdata_delete",
+            domains=DNS_DNSDATA_DOMAINS % "OLD",
+            subnets="NULL",
+            on_delete=True))
     register_trigger(
         "maasserver_dnsdata",
         "sys_dns_dnsdata_delete", "delete")
@@ -1380,3 +1748,115 @@ def register_system_triggers():
     register_trigger(
         "maasserver_config", "sys_proxy_config_use_peer_proxy_update",
         "update")
+
+    # Config cache
+
+    # - Config
+    register_procedure(render_sys_config_procedure("sys_config_insert"))
+    register_trigger("maasserver_config", "sys_config_insert", "insert")
+    register_procedure(render_sys_config_procedure("sys_config_update"))
+    register_trigger("maasserver_config", "sys_config_update", "update")
+    register_procedure(
+        render_sys_config_procedure("sys_config_delete", on_delete=True))
+    register_trigger("maasserver_config", "sys_config_delete", "delete")
+
+    # Boot configuration cached by rack controllers
+
+    # - Node
+    register_procedure(BOOT_CONFIG_NODE_UPDATE)
+    register_trigger(
+        "maasserver_node", "sys_boot_config_node_update", "update")
+
+    # - Interface
+    register_procedure(
+        render_sys_boot_config_interface_procedure(
+            "sys_boot_config_interface_insert"))
+    register_trigger(
+        "maasserver_interface", "sys_boot_config_interface_insert",
+        "insert")
+    register_procedure(BOOT_CONFIG_INTERFACE_UPDATE)
+    register_trigger(
+        "maasserver_interface", "sys_boot_config_interface_update",
+        "update")
+    register_procedure(
+        render_sys_boot_config_interface_procedure(
+            "sys_boot_config_interface_delete", on_delete=True))
+    register_trigger(
+        "maasserver_interface", "sys_boot_config_interface_delete",
+        "delete")
+
+    # Subnet allocation cache
+    register_procedure(SUBNET_ALLOCATION_NOTIFY)
+
+    # - StaticIPAddress
+    register_procedure(SUBNET_ALLOCATION_STATICIPADDRESS_INSERT)
+    register_trigger(
+        "maasserver_staticipaddress",
+        "sys_subnet_allocation_staticipaddress_insert", "insert")
+    register_procedure(SUBNET_ALLOCATION_STATICIPADDRESS_UPDATE)
+    register_trigger(
+        "maasserver_staticipaddress",
+        "sys_subnet_allocation_staticipaddress_update", "update")
+    register_procedure(SUBNET_ALLOCATION_STATICIPADDRESS_DELETE)
+    register_trigger(
+        "maasserver_staticipaddress",
+        "sys_subnet_allocation_staticipaddress_delete", "delete")
+
+    # - Neighbour
+    register_procedure(SUBNET_ALLOCATION_NEIGHBOUR_INSERT)
+    register_trigger(
+        "maasserver_neighbour", "sys_subnet_allocation_neighbour_insert",
+        "insert")
+    register_procedure(SUBNET_ALLOCATION_NEIGHBOUR_UPDATE)
+    register_trigger(
+        "maasserver_neighbour", "sys_subnet_allocation_neighbour_update",
+        "update")
+    register_procedure(SUBNET_ALLOCATION_NEIGHBOUR_DELETE)
+    register_trigger(
+        "maasserver_neighbour", "sys_subnet_allocation_neighbour_delete",
+        "delete")
+
+    # - Subnet
+    register_procedure(render_sys_subnet_allocation_procedure(
+        "sys_subnet_allocation_subnet_insert", "id", "insert"))
+    register_trigger(
+        "maasserver_subnet", "sys_subnet_allocation_subnet_insert", "insert")
+    register_procedure(render_sys_subnet_allocation_procedure(
+        "sys_subnet_allocation_subnet_update", "id", "update"))
+    register_trigger(
+        "maasserver_subnet", "sys_subnet_allocation_subnet_update", "update")
+    register_procedure(render_sys_subnet_allocation_procedure(
+        "sys_subnet_allocation_subnet_delete", "id", "delete"))
+    register_trigger(
+        "maasserver_subnet", "sys_subnet_allocation_subnet_delete", "delete")
+
+    # - IPRange
+    register_procedure(render_sys_subnet_allocation_procedure(
+        "sys_subnet_allocation_iprange_insert", "subnet_id", "insert"))
+    register_trigger(
+        "maasserver_iprange", "sys_subnet_allocation_iprange_insert", "insert")
+    register_procedure(render_sys_subnet_allocation_procedure(
+        "sys_subnet_allocation_iprange_update", "subnet_id", "update"))
+    register_trigger(
+        "maasserver_iprange", "sys_subnet_allocation_iprange_update", "update")
+    register_procedure(render_sys_subnet_allocation_procedure(
+        "sys_subnet_allocation_iprange_delete", "subnet_id", "delete"))
+    register_trigger(
+        "maasserver_iprange", "sys_subnet_allocation_iprange_delete", "delete")
+
+    # - StaticRoute
+    register_procedure(render_sys_subnet_allocation_procedure(
+        "sys_subnet_allocation_staticroute_insert", "source_id", "insert"))
+    register_trigger(
+        "maasserver_staticroute", "sys_subnet_allocation_staticroute_insert",
+        "insert")
+    register_procedure(render_sys_subnet_allocation_procedure(
+        "sys_subnet_allocation_staticroute_update", "source_id", "update"))
+    register_trigger(
+        "maasserver_staticroute", "sys_subnet_allocation_staticroute_update",
+        "update")
+    register_procedure(render_sys_subnet_allocation_procedure(
+        "sys_subnet_allocation_staticroute_delete", "source_id", "delete"))
+    register_trigger(
+        "maasserver_staticroute", "sys_subnet_allocation_staticroute_delete",
+        "delete")
@@ -61,6 +61,28 @@ class TestTriggers(MAASServerTestCase):
             "subnet_sys_proxy_subnet_insert",
             "subnet_sys_proxy_subnet_update",
             "subnet_sys_proxy_subnet_delete",
+            "config_sys_config_insert",
+            "config_sys_config_update",
+            "config_sys_config_delete",
+            "node_sys_boot_config_node_update",
+            "interface_sys_boot_config_interface_insert",
+            "interface_sys_boot_config_interface_update",
+            "interface_sys_boot_config_interface_delete",
+            "staticipaddress_sys_subnet_allocation_staticipaddress_insert",
+            "staticipaddress_sys_subnet_allocation_staticipaddress_update",
+            "staticipaddress_sys_subnet_allocation_staticipaddress_delete",
+            "neighbour_sys_subnet_allocation_neighbour_insert",
+            "neighbour_sys_subnet_allocation_neighbour_update",
+            "neighbour_sys_subnet_allocation_neighbour_delete",
+            "subnet_sys_subnet_allocation_subnet_insert",
+            "subnet_sys_subnet_allocation_subnet_update",
+            "subnet_sys_subnet_allocation_subnet_delete",
+            "iprange_sys_subnet_allocation_iprange_insert",
+            "iprange_sys_subnet_allocation_iprange_update",
+            "iprange_sys_subnet_allocation_iprange_delete",
+            "staticroute_sys_subnet_allocation_staticroute_insert",
+            "staticroute_sys_subnet_allocation_staticroute_update",
+            "staticroute_sys_subnet_allocation_staticroute_delete",
             ]
         sql, args = psql_array(triggers, sql_type="text")
         with closing(connection.cursor()) as cursor:
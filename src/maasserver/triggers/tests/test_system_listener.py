@@ -19,6 +19,7 @@ from maasserver.enum import (
     INTERFACE_TYPE,
     IPADDRESS_TYPE,
     IPRANGE_TYPE,
+    NODE_STATUS,
     RDNS_MODE,
 )
 from maasserver.models.config import Config
@@ -27,6 +28,7 @@ from maasserver.models.interface import (
     PhysicalInterface,
     UnknownInterface,
 )
+from maasserver.models.neighbour import Neighbour
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import (
     MAASLegacyTransactionServerTestCase,
@@ -1679,10 +1681,13 @@ class TestDHCPStaticIPAddressListener(
                 "alloc_type": IPADDRESS_TYPE.USER_RESERVED,
                 "user": user,
             })
-            yield primary_dv.get(timeout=2)
-            yield secondary_dv.get(timeout=2)
+            _, primary_payload = yield primary_dv.get(timeout=2)
+            _, secondary_payload = yield secondary_dv.get(timeout=2)
         finally:
             yield listener.stopService()
+        # The payload names the VLAN that changed.
+        self.assertEqual(str(vlan.id), primary_payload)
+        self.assertEqual(str(vlan.id), secondary_payload)
 
     @wait_for_reactor
     @inlineCallbacks
@@ -2977,6 +2982,30 @@ class TestDNSInterfaceStaticIPAddressListener(
             self.getCapturedPublication().source,
             Equals("Call to sys_dns_nic_ip_link"))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_interface_staticipaddress_link_records_touched_zones(self):
+        yield deferToDatabase(register_system_triggers)
+        interface = yield deferToDatabase(self.create_interface)
+        yield self.capturePublication()
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_dns", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            sip = yield deferToDatabase(self.create_staticipaddress, {
+                "interface": interface,
+            })
+            yield dv.get(timeout=2)
+            yield self.assertPublicationUpdated()
+        finally:
+            yield listener.stopService()
+        publication = self.getCapturedPublication()
+        self.assertItemsEqual(
+            {0, interface.node.domain_id}, publication.touched_domains)
+        self.assertItemsEqual([sip.subnet_id], publication.touched_subnets)
+
     @wait_for_reactor
     @inlineCallbacks
     def test_sends_message_for_interface_staticipaddress_unlink(self):
@@ -3883,3 +3912,320 @@ class TestProxyListener(
             yield dv.get(timeout=2)
         finally:
             yield listener.stopService()
+
+
+class TestConfigCacheListener(
+        MAASTransactionServerTestCase, TransactionalHelpersMixin):
+    """End-to-end test for the config cache triggers code."""
+
+    @transactional
+    def get_txid(self):
+        with db_connection.cursor() as cursor:
+            cursor.execute("SELECT txid_current()")
+            return cursor.fetchone()[0]
+
+    @transactional
+    def delete_config(self, name):
+        Config.objects.filter(name=name).delete()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_config_insert(self):
+        yield deferToDatabase(register_system_triggers)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            before = yield deferToDatabase(self.get_txid)
+            yield deferToDatabase(
+                self.create_config, factory.make_name("name"), None)
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        self.assertGreater(int(payload), before)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_config_update(self):
+        yield deferToDatabase(register_system_triggers)
+        name = factory.make_name("name")
+        yield deferToDatabase(self.create_config, name, None)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            before = yield deferToDatabase(self.get_txid)
+            yield deferToDatabase(self.set_config, name, True)
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        self.assertGreater(int(payload), before)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_config_delete(self):
+        yield deferToDatabase(register_system_triggers)
+        name = factory.make_name("name")
+        yield deferToDatabase(self.create_config, name, None)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            before = yield deferToDatabase(self.get_txid)
+            yield deferToDatabase(self.delete_config, name)
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        self.assertGreater(int(payload), before)
+
+
+class TestBootConfigListener(
+        MAASTransactionServerTestCase, TransactionalHelpersMixin):
+    """End-to-end test for the boot configuration triggers code."""
+
+    @transactional
+    def create_node_with_interface(self):
+        node = self.create_node({"status": NODE_STATUS.NEW})
+        interface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL, node=node)
+        return node, interface
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_node_status_update(self):
+        yield deferToDatabase(register_system_triggers)
+        node, interface = yield deferToDatabase(
+            self.create_node_with_interface)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.update_node, node.system_id, {
+                "status": NODE_STATUS.COMMISSIONING,
+            })
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        self.assertEqual(str(interface.mac_address), payload)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_node_osystem_update(self):
+        yield deferToDatabase(register_system_triggers)
+        node, interface = yield deferToDatabase(
+            self.create_node_with_interface)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.update_node, node.system_id, {
+                "osystem": factory.make_name("osystem"),
+            })
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        self.assertEqual(str(interface.mac_address), payload)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_interface_insert(self):
+        yield deferToDatabase(register_system_triggers)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            interface = yield deferToDatabase(self.create_interface)
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        self.assertEqual(str(interface.mac_address), payload)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_interface_mac_address_update(self):
+        yield deferToDatabase(register_system_triggers)
+        interface = yield deferToDatabase(self.create_interface)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            mac_address = factory.make_mac_address()
+            yield deferToDatabase(self.update_interface, interface.id, {
+                "mac_address": mac_address,
+            })
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        self.assertEqual(
+            "%s,%s" % (interface.mac_address, mac_address), payload)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_interface_delete(self):
+        yield deferToDatabase(register_system_triggers)
+        interface = yield deferToDatabase(self.create_interface)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_boot_config", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.delete_interface, interface.id)
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        self.assertEqual(str(interface.mac_address), payload)
+
+
+class TestSubnetAllocationListener(
+        MAASTransactionServerTestCase, TransactionalHelpersMixin):
+    """End-to-end test for the subnet allocation cache triggers code."""
+
+    @transactional
+    def get_txid(self):
+        with db_connection.cursor() as cursor:
+            cursor.execute("SELECT txid_current()")
+            return cursor.fetchone()[0]
+
+    @transactional
+    def create_neighbour(self, subnet):
+        interface = factory.make_Interface(vlan=subnet.vlan)
+        network = subnet.get_ipnetwork()
+        return factory.make_Neighbour(
+            ip=str(IPAddress(network.first + 1)), interface=interface)
+
+    @transactional
+    def delete_neighbour(self, id):
+        Neighbour.objects.filter(id=id).delete()
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_staticipaddress_insert(self):
+        yield deferToDatabase(register_system_triggers)
+        subnet = yield deferToDatabase(self.create_subnet)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_subnet_allocation", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            before = yield deferToDatabase(self.get_txid)
+            sip = yield deferToDatabase(
+                self.create_staticipaddress, {
+                    "subnet": subnet,
+                    "alloc_type": IPADDRESS_TYPE.AUTO,
+                })
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        subnet_id, txid, change, sip_id = payload.split()
+        self.assertEqual(
+            (subnet.id, "+", IPAddress(sip.ip), sip.id),
+            (int(subnet_id), change[0], IPAddress(change[1:]), int(sip_id)))
+        self.assertGreater(int(txid), before)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_staticipaddress_delete(self):
+        yield deferToDatabase(register_system_triggers)
+        subnet = yield deferToDatabase(self.create_subnet)
+        sip = yield deferToDatabase(
+            self.create_staticipaddress, {
+                "subnet": subnet,
+                "alloc_type": IPADDRESS_TYPE.AUTO,
+            })
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_subnet_allocation", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.delete_staticipaddress, sip.id)
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        subnet_id, txid, change, sip_id = payload.split()
+        self.assertEqual(
+            (subnet.id, "-", IPAddress(sip.ip), sip.id),
+            (int(subnet_id), change[0], IPAddress(change[1:]), int(sip_id)))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_iprange_insert(self):
+        yield deferToDatabase(register_system_triggers)
+        subnet = yield deferToDatabase(self.create_subnet)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_subnet_allocation", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            before = yield deferToDatabase(self.get_txid)
+            network = subnet.get_ipnetwork()
+            start_ip = str(IPAddress(network.first + 2))
+            end_ip = str(IPAddress(network.first + 3))
+            yield deferToDatabase(self.create_iprange, {
+                "subnet": subnet,
+                "type": IPRANGE_TYPE.RESERVED,
+                "start_ip": start_ip,
+                "end_ip": end_ip,
+            })
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        subnet_id, txid = payload.split()
+        self.assertEqual(subnet.id, int(subnet_id))
+        self.assertGreater(int(txid), before)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_neighbour_insert(self):
+        yield deferToDatabase(register_system_triggers)
+        subnet = yield deferToDatabase(self.create_subnet)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_subnet_allocation", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            neighbour = yield deferToDatabase(self.create_neighbour, subnet)
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        subnet_id, txid, change, neighbour_id = payload.split()
+        self.assertEqual(
+            (subnet.id, "*", IPAddress(neighbour.ip), neighbour.id),
+            (int(subnet_id), change[0], IPAddress(change[1:]),
+             int(neighbour_id)))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_message_for_neighbour_delete(self):
+        yield deferToDatabase(register_system_triggers)
+        subnet = yield deferToDatabase(self.create_subnet)
+        neighbour = yield deferToDatabase(self.create_neighbour, subnet)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_subnet_allocation", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(self.delete_neighbour, neighbour.id)
+            channel, payload = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        subnet_id, txid = payload.split()
+        self.assertEqual(subnet.id, int(subnet_id))
@@ -17,6 +17,7 @@ from maasserver.utils import (
 )
 from maastesting.testcase import MAASTestCase
 from provisioningserver.utils.twisted import (
+    PrioritisedThreadPool,
     ThreadPool,
     ThreadUnpool,
 )
@@ -81,6 +82,33 @@ class TestMakeFunctions(MAASTestCase):
         pool = threads.make_database_unpool(maxthreads)
         self.assertThat(pool.lock.limit, Equals(maxthreads))
 
+    def test__make_database_scheduler_shares_pool_by_priority(self):
+        scheduler = threads.make_database_scheduler(sentinel.pool)
+        self.assertThat(scheduler, IsInstance(PrioritisedThreadPool))
+        self.assertThat(scheduler.pool, Is(sentinel.pool))
+        self.assertThat(scheduler.size, Equals(
+            threads.max_threads_for_database_pool))
+        self.assertThat(scheduler.weights, Equals(
+            threads.database_priority_weights))
+        self.assertThat(scheduler.limits, Equals(
+            threads.database_priority_limits))
+        self.assertThat(scheduler.default, Equals(
+            threads.DATABASE_PRIORITY.RPC))
+
+    def test__make_database_scheduler_accepts_settings(self):
+        maxthreads = random.randint(1, 1000)
+        weights = {
+            threads.DATABASE_PRIORITY.INTERACTIVE: 1,
+            threads.DATABASE_PRIORITY.RPC: 1,
+            threads.DATABASE_PRIORITY.BACKGROUND: 1,
+        }
+        limits = {threads.DATABASE_PRIORITY.RPC: 1}
+        scheduler = threads.make_database_scheduler(
+            sentinel.pool, maxthreads, weights, limits)
+        self.assertThat(scheduler.size, Equals(maxthreads))
+        self.assertThat(scheduler.weights, Equals(weights))
+        self.assertThat(scheduler.limits, Equals(limits))
+
 
 class TestInstallFunctions(MAASTestCase):
     """Tests for the `install_*` functions."""
@@ -108,6 +136,11 @@ class TestInstallFunctions(MAASTestCase):
         self.assertThat(pool, IsInstance(ThreadUnpool))
         self.assertThat(pool.contextFactory, Is(orm.ExclusivelyConnected))
 
+    def test__database_scheduler_wraps_database_pool(self):
+        scheduler = reactor.schedulerForDatabase
+        self.assertThat(scheduler, IsInstance(PrioritisedThreadPool))
+        self.assertThat(scheduler.pool, Is(reactor.threadpoolForDatabase))
+
 
 class TestDeferToDatabase(MAASServerTestCase):
 
@@ -125,6 +158,41 @@ class TestDeferToDatabase(MAASServerTestCase):
         self.assertThat(result, Equals(
             (sentinel.called, sentinel.a, sentinel.b)))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__queues_with_rpc_priority(self):
+        scheduler = reactor.schedulerForDatabase
+        before = scheduler.dispatched[threads.DATABASE_PRIORITY.RPC]
+        yield threads.deferToDatabase(lambda: None)
+        self.assertThat(
+            scheduler.dispatched[threads.DATABASE_PRIORITY.RPC],
+            Equals(before + 1))
+
+
+class TestDeferToDatabaseWithPriority(MAASServerTestCase):
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__defers_to_database_threadpool_with_priority(self):
+
+        @orm.transactional
+        def call_in_database_thread(a, b):
+            orm.validate_in_transaction(connection)
+            return sentinel.called, a, b
+
+        priority = random.choice([
+            threads.DATABASE_PRIORITY.INTERACTIVE,
+            threads.DATABASE_PRIORITY.RPC,
+            threads.DATABASE_PRIORITY.BACKGROUND,
+        ])
+        scheduler = reactor.schedulerForDatabase
+        before = scheduler.dispatched[priority]
+        result = yield threads.deferToDatabaseWithPriority(
+            priority, call_in_database_thread, sentinel.a, b=sentinel.b)
+        self.assertThat(result, Equals(
+            (sentinel.called, sentinel.a, sentinel.b)))
+        self.assertThat(scheduler.dispatched[priority], Equals(before + 1))
+
 
 class TestCallOutToDatabase(MAASServerTestCase):
 
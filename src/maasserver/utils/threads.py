@@ -11,11 +11,14 @@ pools to limit the number of connections each `regiond` process will consume.
 
 __all__ = [
     "callOutToDatabase",
+    "DATABASE_PRIORITY",
     "deferToDatabase",
+    "deferToDatabaseWithPriority",
     "install_database_pool",
     "install_database_unpool",
     "install_default_pool",
     "make_database_pool",
+    "make_database_scheduler",
     "make_default_pool",
 ]
 
@@ -24,9 +27,11 @@ from maasserver.utils.orm import (
     FullyConnected,
     TotallyDisconnected,
 )
+from provisioningserver.utils.debug import register_statistics
 from provisioningserver.utils.twisted import (
     asynchronous,
     FOREVER,
+    PrioritisedThreadPool,
     ThreadPool,
     ThreadUnpool,
 )
@@ -48,6 +53,33 @@ max_threads_for_default_pool = 50
 max_threads_for_database_pool = 9
 
 
+class DATABASE_PRIORITY:
+    """Classes of work sharing the database thread-pool."""
+    #: Requests from people waiting on the other end: the web UI, via the
+    #: WebSocket, and the HTTP API.
+    INTERACTIVE = "interactive"
+    #: RPC calls from rack controllers, and anything not otherwise marked.
+    RPC = "rpc"
+    #: Periodic and bulk work, like processing status messages from nodes.
+    BACKGROUND = "background"
+
+
+# Share of the database thread-pool given to each class of work when all of
+# them are busy. When some are idle, the others take up the slack.
+database_priority_weights = {
+    DATABASE_PRIORITY.INTERACTIVE: 6,
+    DATABASE_PRIORITY.RPC: 3,
+    DATABASE_PRIORITY.BACKGROUND: 1,
+}
+
+# Maximum number of threads in the database thread-pool that each class of
+# work can occupy at once. Background work can be slow, so it is not allowed
+# to fill the pool; there's always room for something more urgent.
+database_priority_limits = {
+    DATABASE_PRIORITY.BACKGROUND: 6,
+}
+
+
 def make_default_pool(maxthreads=max_threads_for_default_pool):
     """Create a general thread-pool for non-database activity.
 
@@ -81,6 +113,24 @@ def make_database_unpool(maxthreads=max_threads_for_database_pool):
     return ThreadUnpool(DeferredSemaphore(maxthreads), ExclusivelyConnected)
 
 
+def make_database_scheduler(
+        pool, maxthreads=max_threads_for_database_pool,
+        weights=None, limits=None):
+    """Create a scheduler for the database thread-pool.
+
+    Calls are queued by `DATABASE_PRIORITY` and handed to `pool` no more than
+    `maxthreads` at a time, sharing it according to `weights` and `limits`,
+    which default to `database_priority_weights` and
+    `database_priority_limits`.
+    """
+    if weights is None:
+        weights = database_priority_weights
+    if limits is None:
+        limits = database_priority_limits
+    return PrioritisedThreadPool(
+        pool, maxthreads, weights, limits, default=DATABASE_PRIORITY.RPC)
+
+
 @asynchronous(timeout=FOREVER)
 def install_default_pool(maxthreads=max_threads_for_default_pool):
     """Install a custom pool as Twisted's global/reactor thread-pool.
@@ -112,7 +162,11 @@ def install_database_pool(maxthreads=max_threads_for_database_pool):
         # Start with ZERO threads to avoid pulling in all of Django's
         # configuration straight away; it may not be ready yet.
         reactor.threadpoolForDatabase = make_database_pool(maxthreads)
-        reactor.callInDatabase = reactor.threadpoolForDatabase.callInThread
+        reactor.schedulerForDatabase = make_database_scheduler(
+            reactor.threadpoolForDatabase, maxthreads)
+        reactor.callInDatabase = reactor.schedulerForDatabase.callInThread
+        register_statistics(
+            "Database thread-pool", reactor.schedulerForDatabase.report)
         reactor.callWhenRunning(reactor.threadpoolForDatabase.start)
         reactor.addSystemEventTrigger(
             "during", "shutdown", reactor.threadpoolForDatabase.stop)
@@ -132,7 +186,9 @@ def install_database_unpool(maxthreads=max_threads_for_database_pool):
         reactor.threadpoolForDatabase
     except AttributeError:
         reactor.threadpoolForDatabase = make_database_unpool(maxthreads)
-        reactor.callInDatabase = reactor.threadpoolForDatabase.callInThread
+        reactor.schedulerForDatabase = make_database_scheduler(
+            reactor.threadpoolForDatabase, maxthreads)
+        reactor.callInDatabase = reactor.schedulerForDatabase.callInThread
         reactor.callWhenRunning(reactor.threadpoolForDatabase.start)
         reactor.addSystemEventTrigger(
             "during", "shutdown", reactor.threadpoolForDatabase.stop)
@@ -143,9 +199,22 @@ def install_database_unpool(maxthreads=max_threads_for_database_pool):
 
 
 def deferToDatabase(func, *args, **kwargs):
-    """Call `func` in a thread where database activity is permitted."""
+    """Call `func` in a thread where database activity is permitted.
+
+    The call is queued with `DATABASE_PRIORITY.RPC`.
+    """
+    return threads.deferToThreadPool(
+        reactor, reactor.schedulerForDatabase,
+        func, *args, **kwargs)
+
+
+def deferToDatabaseWithPriority(priority, func, *args, **kwargs):
+    """Call `func` in a thread where database activity is permitted.
+
+    The call is queued with the given `priority`, one of `DATABASE_PRIORITY`.
+    """
     return threads.deferToThreadPool(
-        reactor, reactor.threadpoolForDatabase,
+        reactor, reactor.schedulerForDatabase.withPriority(priority),
         func, *args, **kwargs)
 
 
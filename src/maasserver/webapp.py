@@ -15,6 +15,7 @@ import re
 from django.conf import settings
 from lxml import html
 from maasserver import concurrency
+from maasserver.utils.threads import DATABASE_PRIORITY
 from maasserver.utils.views import WebApplicationHandler
 from maasserver.websockets.protocol import WebSocketFactory
 from maasserver.websockets.websockets import (
@@ -191,7 +192,9 @@ class WebApplicationService(StreamServerEndpointService):
         super(WebApplicationService, self).__init__(endpoint, self.site)
         self.websocket = WebSocketFactory(listener)
         self.threadpool = ThreadPoolLimiter(
-            reactor.threadpoolForDatabase, concurrency.webapp)
+            reactor.schedulerForDatabase.withPriority(
+                DATABASE_PRIORITY.INTERACTIVE),
+            concurrency.webapp)
         self.status_worker = status_worker
 
     def prepareApplication(self):
@@ -10,21 +10,34 @@ __all__ = [
     "Handler",
     ]
 
+from collections import OrderedDict
+from datetime import datetime
 from operator import attrgetter
+import threading
 
 from django.contrib.postgres.fields import ArrayField
-from django.core.exceptions import ValidationError
+from django.core.exceptions import (
+    FieldDoesNotExist,
+    ValidationError,
+)
 from django.db.models import Model
 from django.http import HttpRequest
 from django.utils.encoding import is_protected_type
 from maasserver import concurrency
 from maasserver.utils.forms import get_QueryDict
 from maasserver.utils.orm import transactional
-from maasserver.utils.threads import deferToDatabase
+from maasserver.utils.threads import (
+    DATABASE_PRIORITY,
+    deferToDatabaseWithPriority,
+)
 from provisioningserver.utils.twisted import (
     asynchronous,
     IAsynchronous,
 )
+from twisted.internet.defer import (
+    inlineCallbacks,
+    returnValue,
+)
 
 
 DATETIME_FORMAT = "%a, %d %b. %Y %H:%M:%S"
@@ -62,6 +75,66 @@ class HandlerPermissionError(HandlerError):
     """Raised when permission is denied for the user of a given action."""
 
 
+class DehydrationCache:
+    """A process-wide, size-bounded cache of dehydrated objects.
+
+    Entries are keyed on `(handler_name, pk, for_list)` and hold the part
+    of a dehydrated object that is the same for every user. They are shared
+    by every websocket connection in the process, so a notification that is
+    pushed to many clients is only dehydrated once.
+
+    Entries are dropped when a notification for the object arrives. An
+    entry computed while an invalidation happened is not stored, since it
+    may already be out of date.
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self._entries = OrderedDict()
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached data for `key` or `None`."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def token(self):
+        """Return a token to pass to `put` for data about to be computed."""
+        with self._lock:
+            return self._invalidations
+
+    def put(self, key, data, token):
+        """Store `data` for `key` unless invalidated since `token`."""
+        with self._lock:
+            if token != self._invalidations:
+                return
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, handler_name, pk):
+        """Drop all entries for `pk` of `handler_name`."""
+        with self._lock:
+            self._invalidations += 1
+            for for_list in (True, False):
+                self._entries.pop((handler_name, pk, for_list), None)
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+
+
+# Shared by all handlers in this process.
+dehydration_cache = DehydrationCache()
+
+
 class HandlerOptions(object):
     """Configuraton class for `Handler`.
 
@@ -91,6 +164,8 @@ class HandlerOptions(object):
     form_requires_request = True
     listen_channels = []
     batch_key = 'id'
+    stream_batch_size = 50
+    cache_dehydrated = False
 
     def __new__(cls, meta=None):
         overrides = {}
@@ -167,6 +242,33 @@ class Handler(metaclass=HandlerMetaclass):
     def full_dehydrate(self, obj, for_list=False):
         """Convert the given object into a dictionary.
 
+        :param for_list: True when the object is being converted to belong
+            in a list.
+        """
+        data = self.full_dehydrate_shared(obj, for_list=for_list)
+        return self.dehydrate_for_user(obj, data, for_list=for_list)
+
+    def cached_full_dehydrate(self, obj, pk, for_list=False):
+        """Convert the given object into a dictionary, using the
+        `dehydration_cache` when `Meta.cache_dehydrated` is set.
+
+        Only the output of `full_dehydrate_shared` is cached;
+        `dehydrate_for_user` is always applied to a copy of it.
+        """
+        if not self._meta.cache_dehydrated:
+            return self.full_dehydrate(obj, for_list=for_list)
+        key = (self._meta.handler_name, pk, for_list)
+        data = dehydration_cache.get(key)
+        if data is None:
+            token = dehydration_cache.token()
+            data = self.full_dehydrate_shared(obj, for_list=for_list)
+            dehydration_cache.put(key, data, token)
+        return self.dehydrate_for_user(obj, dict(data), for_list=for_list)
+
+    def full_dehydrate_shared(self, obj, for_list=False):
+        """Convert the given object into a dictionary, leaving out anything
+        that depends on the user.
+
         :param for_list: True when the object is being converted to belong
             in a list.
         """
@@ -217,6 +319,20 @@ class Handler(metaclass=HandlerMetaclass):
         """
         return data
 
+    def dehydrate_for_user(self, obj, data, for_list=False):
+        """Add any info that depends on `self.user` to `data`.
+
+        Unlike `dehydrate`, this is never cached and is called for every
+        user, so override this rather than `dehydrate` for anything that
+        varies between users.
+
+        :param obj: object being dehydrated.
+        :param data: dictionary to place extra info.
+        :param for_list: True when the object is being converted to belong
+            in a list.
+        """
+        return data
+
     def _is_foreign_key_for(self, field_name, obj, value):
         """Given the specified field name for the specified object, returns
         True if the specified value is a foreign key; otherwise returns False.
@@ -331,7 +447,9 @@ class Handler(metaclass=HandlerMetaclass):
                     # This is going to block and hold a database connection so
                     # we limit its concurrency.
                     return concurrency.webapp.run(
-                        deferToDatabase, transactional(method), params)
+                        deferToDatabaseWithPriority,
+                        DATABASE_PRIORITY.INTERACTIVE,
+                        transactional(method), params)
         else:
             raise HandlerNoSuchMethodError(method_name)
 
@@ -343,6 +461,9 @@ class Handler(metaclass=HandlerMetaclass):
             also understands this distinction.
         :param offset: Offset into the queryset to return.
         :param limit: Maximum number of objects to return.
+        :param since: Only return objects updated after this time, given in
+            seconds since the epoch. Deleted objects are not reported, the
+            client still learns about those through notifications.
         """
         queryset = self.get_queryset()
         queryset = queryset.order_by(self._meta.batch_key)
@@ -350,6 +471,20 @@ class Handler(metaclass=HandlerMetaclass):
             queryset = queryset.filter(**{
                 "%s__gt" % self._meta.batch_key: params["start"]
                 })
+        if "since" in params:
+            try:
+                self._meta.object_class._meta.get_field("updated")
+            except FieldDoesNotExist:
+                raise HandlerValidationError({
+                    "since": ["Not supported by this handler."]
+                })
+            try:
+                since = datetime.fromtimestamp(float(params["since"]))
+            except (TypeError, ValueError, OverflowError, OSError):
+                raise HandlerValidationError({
+                    "since": ["Must be a number of seconds since the epoch."]
+                })
+            queryset = queryset.filter(updated__gt=since)
         if "limit" in params:
             queryset = queryset[:params["limit"]]
         objs = list(queryset)
@@ -361,6 +496,54 @@ class Handler(metaclass=HandlerMetaclass):
             for obj in objs
             ]
 
+    @asynchronous
+    @inlineCallbacks
+    def stream_list(self, params, send):
+        """List objects, sending them to the client in batches.
+
+        Each batch is fetched and dehydrated with `list` in its own
+        transaction, continuing from the `batch_key` of the last object in
+        the previous batch. Every batch but the last is passed to `send` as
+        soon as it is ready; the last batch is the result.
+
+        :param batch_size: Number of objects in each batch. Defaults to
+            `Meta.stream_batch_size`.
+        :param send: Callable that receives each intermediate batch.
+
+        All other parameters are the same as `list`.
+        """
+        if "list" not in self._meta.allowed_methods:
+            raise HandlerNoSuchMethodError("list")
+        params = dict(params)
+        params.pop("stream", None)
+        batch_size = params.pop("batch_size", self._meta.stream_batch_size)
+        try:
+            batch_size = int(batch_size)
+        except (TypeError, ValueError):
+            batch_size = 0
+        if batch_size <= 0:
+            raise HandlerValidationError({
+                "batch_size": ["Must be a positive integer."]
+            })
+        limit = params.pop("limit", None)
+        list_method = transactional(self.list)
+        while True:
+            size = batch_size if limit is None else min(batch_size, limit)
+            batch = yield concurrency.webapp.run(
+                deferToDatabaseWithPriority, DATABASE_PRIORITY.INTERACTIVE,
+                list_method, dict(params, limit=size))
+            if limit is not None:
+                limit -= len(batch)
+            if len(batch) != size or limit == 0:
+                # Also stop when `list` ignored the limit and returned more.
+                returnValue(batch)
+            if self._meta.batch_key not in batch[-1]:
+                raise HandlerError(
+                    "Unable to stream %s: '%s' is not a listed field." % (
+                        self._meta.handler_name, self._meta.batch_key))
+            send(batch)
+            params["start"] = batch[-1][self._meta.batch_key]
+
     def get(self, params):
         """Get object.
 
@@ -503,7 +686,7 @@ class Handler(metaclass=HandlerMetaclass):
             return (
                 self._meta.handler_name,
                 action,
-                self.full_dehydrate(obj, for_list=False),
+                self.cached_full_dehydrate(obj, pk, for_list=False),
                 )
         else:
             # Not active so only send the data like it was comming from
@@ -511,7 +694,7 @@ class Handler(metaclass=HandlerMetaclass):
             return (
                 self._meta.handler_name,
                 action,
-                self.full_dehydrate(obj, for_list=True),
+                self.cached_full_dehydrate(obj, pk, for_list=True),
                 )
 
     def listen(self, channel, action, pk):
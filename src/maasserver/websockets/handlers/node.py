@@ -69,6 +69,7 @@ class NodeHandler(TimestampedModelHandler):
         abstract = True
         pk = 'system_id'
         pk_type = str
+        cache_dehydrated = True
 
     def dehydrate_owner(self, user):
         """Return owners username."""
@@ -103,7 +104,6 @@ class NodeHandler(TimestampedModelHandler):
     def dehydrate(self, obj, data, for_list=False):
         """Add extra fields to `data`."""
         data["fqdn"] = obj.fqdn
-        data["actions"] = list(compile_node_actions(obj, self.user).keys())
         data["node_type_display"] = obj.get_node_type_display()
 
         data["extra_macs"] = [
@@ -219,6 +219,11 @@ class NodeHandler(TimestampedModelHandler):
 
         return data
 
+    def dehydrate_for_user(self, obj, data, for_list=False):
+        """Add the actions `self.user` can perform to `data`."""
+        data["actions"] = list(compile_node_actions(obj, self.user).keys())
+        return data
+
     def dehydrate_blockdevice(self, blockdevice, obj):
         """Return `BlockDevice` formatted for JSON encoding."""
         # model and serial are currently only avalible on physical block
@@ -27,8 +27,12 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from maasserver.eventloop import services
 from maasserver.utils.orm import transactional
-from maasserver.utils.threads import deferToDatabase
+from maasserver.utils.threads import (
+    DATABASE_PRIORITY,
+    deferToDatabaseWithPriority,
+)
 from maasserver.websockets import handlers
+from maasserver.websockets.base import dehydration_cache
 from maasserver.websockets.websockets import STATUSES
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils import typed
@@ -69,6 +73,9 @@ class RESPONSE_TYPE:
     #:
     ERROR = 1
 
+    #: Part of a streamed result, more will follow.
+    PARTIAL = 2
+
 
 @typed
 def get_cookie(cookies: Optional[str], cookie_name: str) -> Optional[str]:
@@ -210,7 +217,9 @@ class WebSocketProtocol(Protocol):
                 "Error authenticating user: %s" % failure.getErrorMessage())
             return None
 
-        d = deferToDatabase(self.getUserFromSessionId, session_id)
+        d = deferToDatabaseWithPriority(
+            DATABASE_PRIORITY.INTERACTIVE,
+            self.getUserFromSessionId, session_id)
         d.addCallbacks(got_user, got_user_error)
 
         return d
@@ -284,7 +293,14 @@ class WebSocketProtocol(Protocol):
             return None
 
         handler = self.buildHandler(handler_class)
-        d = handler.execute(method, message.get("params", {}))
+        params = message.get("params", {})
+        if method == "list" and params.get("stream"):
+            # Send the list in batches as they are dehydrated, with the
+            # final batch sent as the result.
+            d = handler.stream_list(
+                params, partial(self.sendPartialResult, request_id))
+        else:
+            d = handler.execute(method, params)
         d.addCallbacks(
             partial(self.sendResult, request_id),
             partial(self.sendError, request_id, handler, method))
@@ -311,6 +327,17 @@ class WebSocketProtocol(Protocol):
             result_msg, default=self._json_encode).encode("ascii"))
         return result
 
+    def sendPartialResult(self, request_id, result):
+        """Send part of a streamed result to client."""
+        result_msg = {
+            "type": MSG_TYPE.RESPONSE,
+            "request_id": request_id,
+            "rtype": RESPONSE_TYPE.PARTIAL,
+            "result": result,
+            }
+        self.transport.write(json.dumps(
+            result_msg, default=self._json_encode).encode("ascii"))
+
     def sendError(self, request_id, handler, method, failure):
         """Log and send error to client."""
         if isinstance(failure.value, ValidationError):
@@ -411,21 +438,34 @@ class WebSocketFactory(Factory):
         for handler in self.handlers.values():
             for channel in handler._meta.listen_channels:
                 self.listener.register(
-                    channel, partial(self.onNotify, handler, channel))
+                    channel, partial(self.onNotifies, handler, channel),
+                    batch=True)
 
     @inlineCallbacks
-    def onNotify(self, handler_class, channel, action, obj_id):
+    def onNotifies(self, handler_class, channel, notifies):
+        """Handle a batch of `(action, obj_id)` notifications for `channel`.
+
+        Each client gets a single trip to the database for the whole batch.
+        """
+        for _, obj_id in notifies:
+            dehydration_cache.invalidate(
+                handler_class._meta.handler_name,
+                handler_class._meta.pk_type(obj_id))
         for client in self.clients:
             handler = client.buildHandler(handler_class)
-            data = yield deferToDatabase(
-                self.processNotify, handler, channel, action, obj_id)
-            if data is not None:
-                (name, client_action, data) = data
+            messages = yield deferToDatabaseWithPriority(
+                DATABASE_PRIORITY.INTERACTIVE, self.processNotifies,
+                handler, channel, notifies)
+            for name, client_action, data in messages:
                 client.sendNotify(name, client_action, data)
 
     @transactional
-    def processNotify(self, handler, channel, action, obj_id):
-        return handler.on_listen(channel, action, obj_id)
+    def processNotifies(self, handler, channel, notifies):
+        messages = (
+            handler.on_listen(channel, action, obj_id)
+            for action, obj_id in notifies
+        )
+        return [message for message in messages if message is not None]
 
     def registerRPCEvents(self):
         """Register for connected and disconnected events from the RPC
@@ -460,10 +500,11 @@ class WebSocketFactory(Factory):
         return d
 
     def sendOnNotifyToController(self, system_id):
-        """Send onNotify to the `ControllerHandler` for `system_id`."""
+        """Send an update notification to the `ControllerHandler` for
+        `system_id`."""
         rack_handler = self.getHandler("controller")
         if rack_handler is None:
             return fail("Unable to get the 'controller' handler.")
         else:
-            return self.onNotify(
-                rack_handler, "controller", "update", system_id)
+            return self.onNotifies(
+                rack_handler, "controller", [("update", system_id)])
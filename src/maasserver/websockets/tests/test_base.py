@@ -5,13 +5,20 @@
 
 __all__ = []
 
+from datetime import (
+    datetime,
+    timedelta,
+)
 import random
+import time
 from unittest.mock import (
     ANY,
+    call,
     MagicMock,
     sentinel,
 )
 
+from django.contrib.auth.models import User
 from django.db.models.query import QuerySet
 from maasserver.forms import (
     AdminMachineForm,
@@ -24,8 +31,10 @@ from maasserver.testing.architecture import make_usable_architecture
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
 from maasserver.utils.orm import reload_object
+from maasserver.utils.threads import DATABASE_PRIORITY
 from maasserver.websockets import base
 from maasserver.websockets.base import (
+    DehydrationCache,
     Handler,
     HandlerDoesNotExistError,
     HandlerNoSuchMethodError,
@@ -33,6 +42,7 @@ from maasserver.websockets.base import (
 )
 from maastesting.matchers import (
     MockCalledOnceWith,
+    MockCallsMatch,
     MockNotCalled,
 )
 from maastesting.testcase import MAASTestCase
@@ -44,6 +54,7 @@ from testtools.matchers import (
     MatchesStructure,
 )
 from testtools.testcase import ExpectedException
+from twisted.internet.defer import succeed
 
 
 def make_handler(name, **kwargs):
@@ -117,6 +128,47 @@ class TestHandlerMeta(MAASTestCase):
         self.assertEqual(list_exclude, handler._meta.list_exclude)
 
 
+class TestDehydrationCache(MAASTestCase):
+
+    def test_get_returns_None_when_missing(self):
+        cache = DehydrationCache()
+        self.assertIsNone(cache.get(("machine", "abc", True)))
+
+    def test_put_then_get(self):
+        cache = DehydrationCache()
+        key = ("machine", "abc", True)
+        cache.put(key, sentinel.data, cache.token())
+        self.assertIs(sentinel.data, cache.get(key))
+
+    def test_put_ignored_after_invalidation(self):
+        cache = DehydrationCache()
+        key = ("machine", "abc", True)
+        token = cache.token()
+        cache.invalidate("machine", "other")
+        cache.put(key, sentinel.data, token)
+        self.assertIsNone(cache.get(key))
+
+    def test_invalidate_drops_list_and_detail_entries(self):
+        cache = DehydrationCache()
+        cache.put(("machine", "abc", True), sentinel.list, cache.token())
+        cache.put(("machine", "abc", False), sentinel.detail, cache.token())
+        cache.put(("device", "abc", True), sentinel.device, cache.token())
+        cache.invalidate("machine", "abc")
+        self.assertIsNone(cache.get(("machine", "abc", True)))
+        self.assertIsNone(cache.get(("machine", "abc", False)))
+        self.assertIs(sentinel.device, cache.get(("device", "abc", True)))
+
+    def test_evicts_least_recently_used(self):
+        cache = DehydrationCache(size=2)
+        cache.put(("machine", 1, True), sentinel.one, cache.token())
+        cache.put(("machine", 2, True), sentinel.two, cache.token())
+        cache.get(("machine", 1, True))
+        cache.put(("machine", 3, True), sentinel.three, cache.token())
+        self.assertIs(sentinel.one, cache.get(("machine", 1, True)))
+        self.assertIsNone(cache.get(("machine", 2, True)))
+        self.assertIs(sentinel.three, cache.get(("machine", 3, True)))
+
+
 class TestHandler(MAASServerTestCase):
 
     def make_nodes_handler(self, **kwargs):
@@ -166,6 +218,48 @@ class TestHandler(MAASServerTestCase):
             "power_state": node.power_state,
             }, handler.full_dehydrate(node, for_list=True))
 
+    def test_full_dehydrate_calls_dehydrate_for_user(self):
+        handler = self.make_nodes_handler(fields=["hostname"])
+        self.patch(handler, "dehydrate_for_user").side_effect = (
+            lambda obj, data, for_list: dict(data, user=handler.user.id))
+        node = factory.make_Node()
+        self.assertEqual({
+            "hostname": node.hostname,
+            "user": handler.user.id,
+            }, handler.full_dehydrate(node))
+
+    def test_cached_full_dehydrate_shares_between_handlers(self):
+        self.patch(base, "dehydration_cache", DehydrationCache())
+        node = factory.make_Node()
+        handlers = [
+            self.make_nodes_handler(
+                fields=["hostname"], cache_dehydrated=True)
+            for _ in range(2)
+        ]
+        shared = self.patch(handlers[1], "full_dehydrate_shared")
+        for handler in handlers:
+            self.patch(handler, "dehydrate_for_user").side_effect = (
+                lambda obj, data, for_list, user=handler.user: dict(
+                    data, user=user.id))
+        results = [
+            handler.cached_full_dehydrate(node, node.system_id)
+            for handler in handlers
+        ]
+        self.assertThat(shared, MockNotCalled())
+        self.assertEqual([
+            {"hostname": node.hostname, "user": handler.user.id}
+            for handler in handlers
+            ], results)
+
+    def test_cached_full_dehydrate_skips_cache_when_not_enabled(self):
+        self.patch(base, "dehydration_cache", DehydrationCache())
+        handler = self.make_nodes_handler(fields=["hostname"])
+        node = factory.make_Node()
+        handler.cached_full_dehydrate(node, node.system_id)
+        self.assertIsNone(
+            base.dehydration_cache.get(
+                (handler._meta.handler_name, node.system_id, False)))
+
     def test_full_dehydrate_calls_field_dehydrate_method_if_exists(self):
         handler = self.make_nodes_handler(fields=["hostname"])
         mock_dehydrate_hostname = self.patch(
@@ -336,11 +430,14 @@ class TestHandler(MAASServerTestCase):
         # thread that originates from a specific threadpool.
         handler = self.make_nodes_handler()
         params = {"system_id": factory.make_name("system_id")}
-        self.patch(base, "deferToDatabase").return_value = sentinel.thing
+        self.patch(base, "deferToDatabaseWithPriority").return_value = (
+            sentinel.thing)
         result = handler.execute("get", params).wait(30)
         self.assertThat(result, Is(sentinel.thing))
-        self.assertThat(base.deferToDatabase, MockCalledOnceWith(ANY, params))
-        [func, _] = base.deferToDatabase.call_args[0]
+        self.assertThat(
+            base.deferToDatabaseWithPriority, MockCalledOnceWith(
+                DATABASE_PRIORITY.INTERACTIVE, ANY, params))
+        [_, func, _] = base.deferToDatabaseWithPriority.call_args[0]
         self.assertThat(func.func, Equals(handler.get))
 
     def test_execute_calls_asynchronous_method_with_params(self):
@@ -409,6 +506,70 @@ class TestHandler(MAASServerTestCase):
         handler.list({"start": nodes[0].id})
         self.assertItemsEqual(pks, handler.cache['loaded_pks'])
 
+    def test_list_since(self):
+        nodes = [factory.make_Node() for _ in range(3)]
+        since = datetime.now() - timedelta(minutes=1)
+        for node in nodes[:2]:
+            Node.objects.filter(id=node.id).update(
+                updated=since - timedelta(minutes=1))
+        handler = self.make_nodes_handler(fields=['hostname'])
+        self.assertItemsEqual(
+            [{"hostname": nodes[2].hostname}],
+            handler.list({"since": time.mktime(since.timetuple())}))
+
+    def test_list_since_requires_updated_field(self):
+        handler = make_handler(
+            "TestUsersHandler", queryset=User.objects.all(),
+            object_class=User)
+        handler.__init__(factory.make_User(), {})
+        with ExpectedException(HandlerValidationError):
+            handler.list({"since": time.time()})
+
+    def test_list_since_must_be_a_timestamp(self):
+        handler = self.make_nodes_handler(fields=['hostname'])
+        for since in ["yesterday", None, "1e400", "nan"]:
+            with ExpectedException(HandlerValidationError):
+                handler.list({"since": since})
+
+    def make_sync_deferToDatabase(self):
+        self.patch(base, "deferToDatabaseWithPriority").side_effect = (
+            lambda priority, func, params: succeed(func(params)))
+
+    def test_stream_list_sends_batches_and_returns_last(self):
+        self.make_sync_deferToDatabase()
+        nodes = [factory.make_Node() for _ in range(5)]
+        handler = self.make_nodes_handler(fields=['id'])
+        send = MagicMock()
+        result = handler.stream_list(
+            {"stream": True, "batch_size": 2}, send).wait(30)
+        self.assertThat(send, MockCallsMatch(
+            call([{"id": nodes[0].id}, {"id": nodes[1].id}]),
+            call([{"id": nodes[2].id}, {"id": nodes[3].id}])))
+        self.assertEquals([{"id": nodes[4].id}], result)
+
+    def test_stream_list_honours_limit(self):
+        self.make_sync_deferToDatabase()
+        nodes = [factory.make_Node() for _ in range(5)]
+        handler = self.make_nodes_handler(fields=['id'])
+        send = MagicMock()
+        result = handler.stream_list(
+            {"batch_size": 2, "limit": 3}, send).wait(30)
+        self.assertThat(send, MockCalledOnceWith(
+            [{"id": nodes[0].id}, {"id": nodes[1].id}]))
+        self.assertEquals([{"id": nodes[2].id}], result)
+
+    def test_stream_list_rejects_batch_size_not_positive(self):
+        handler = self.make_nodes_handler(fields=['id'])
+        for batch_size in (0, -1, "ten", None):
+            with ExpectedException(HandlerValidationError):
+                handler.stream_list(
+                    {"batch_size": batch_size}, MagicMock()).wait(30)
+
+    def test_stream_list_only_allowed_with_list(self):
+        handler = self.make_nodes_handler(allowed_methods=['get'])
+        with ExpectedException(HandlerNoSuchMethodError):
+            handler.stream_list({}, MagicMock()).wait(30)
+
     def test_get(self):
         node = factory.make_Node()
         handler = self.make_nodes_handler(fields=['hostname'])
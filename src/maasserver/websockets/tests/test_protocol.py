@@ -8,6 +8,8 @@ from collections import deque
 import json
 import random
 from unittest.mock import (
+    ANY,
+    call,
     MagicMock,
     sentinel,
 )
@@ -38,6 +40,8 @@ from maastesting.matchers import (
     IsFiredDeferred,
     MockCalledOnceWith,
     MockCalledWith,
+    MockCallsMatch,
+    MockNotCalled,
 )
 from maastesting.testcase import MAASTestCase
 from maastesting.twisted import TwistedLoggerFixture
@@ -536,6 +540,43 @@ class TestWebSocketProtocol(MAASTransactionServerTestCase):
             protocol.cache[handler_name],
             handler_class.call_args[0][1])
 
+    def test_handleRequest_streams_list(self):
+        protocol, factory = self.make_protocol()
+        protocol.user = sentinel.user
+
+        handler_class = MagicMock()
+        handler_name = maas_factory.make_name("handler")
+        handler_class._meta.handler_name = handler_name
+        handler = handler_class.return_value
+        handler.stream_list.return_value = succeed(None)
+
+        # Inject mock handler into the factory.
+        factory.handlers[handler_name] = handler_class
+
+        params = {"stream": True}
+        protocol.handleRequest({
+            "type": MSG_TYPE.REQUEST,
+            "request_id": random.randint(1, 999999),
+            "method": "%s.list" % handler_name,
+            "params": params,
+        })
+
+        self.assertThat(handler.execute, MockNotCalled())
+        self.assertThat(
+            handler.stream_list, MockCalledOnceWith(params, ANY))
+
+    def test_sendPartialResult_sends_correct_json(self):
+        protocol, factory = self.make_protocol()
+        request_id = random.randint(1, 999999)
+        result = [maas_factory.make_name("data")]
+        protocol.sendPartialResult(request_id, result)
+        self.assertEquals({
+            "type": MSG_TYPE.RESPONSE,
+            "request_id": request_id,
+            "rtype": RESPONSE_TYPE.PARTIAL,
+            "result": result,
+            }, self.get_written_transport_message(protocol))
+
     @wait_for_reactor
     @inlineCallbacks
     def test_handleRequest_sends_response(self):
@@ -825,26 +866,27 @@ class TestWebSocketFactoryTransactional(
 
     @wait_for_reactor
     @inlineCallbacks
-    def test_onNotify_creates_handler_class_with_protocol_user(self):
+    def test_onNotifies_creates_handler_class_with_protocol_user(self):
         user = yield deferToDatabase(self.make_user)
         protocol, factory = self.make_protocol_with_factory(user=user)
         mock_class = MagicMock()
         mock_class.return_value.on_listen.return_value = None
-        yield factory.onNotify(
-            mock_class, sentinel.channel, sentinel.action, sentinel.obj_id)
+        yield factory.onNotifies(
+            mock_class, sentinel.channel, [(sentinel.action, sentinel.obj_id)])
         self.assertIs(
             protocol.user, mock_class.call_args[0][0])
 
     @wait_for_reactor
     @inlineCallbacks
-    def test_onNotify_creates_handler_class_with_protocol_cache(self):
+    def test_onNotifies_creates_handler_class_with_protocol_cache(self):
         user = yield deferToDatabase(self.make_user)
         protocol, factory = self.make_protocol_with_factory(user=user)
         handler_class = MagicMock()
         handler_class.return_value.on_listen.return_value = None
         handler_class._meta.handler_name = maas_factory.make_name("handler")
-        yield factory.onNotify(
-            handler_class, sentinel.channel, sentinel.action, sentinel.obj_id)
+        yield factory.onNotifies(
+            handler_class, sentinel.channel,
+            [(sentinel.action, sentinel.obj_id)])
         self.assertThat(
             handler_class, MockCalledOnceWith(
                 user, protocol.cache[handler_class._meta.handler_name]))
@@ -856,46 +898,56 @@ class TestWebSocketFactoryTransactional(
 
     @wait_for_reactor
     @inlineCallbacks
-    def test_onNotify_calls_handler_class_on_listen(self):
+    def test_onNotifies_calls_handler_class_on_listen(self):
         user = yield deferToDatabase(self.make_user)
         protocol, factory = self.make_protocol_with_factory(user=user)
         mock_class = MagicMock()
         mock_class.return_value.on_listen.return_value = None
-        yield factory.onNotify(
-            mock_class, sentinel.channel, sentinel.action, sentinel.obj_id)
+        yield factory.onNotifies(
+            mock_class, sentinel.channel, [(sentinel.action, sentinel.obj_id)])
         self.assertThat(
             mock_class.return_value.on_listen,
             MockCalledWith(sentinel.channel, sentinel.action, sentinel.obj_id))
 
     @wait_for_reactor
     @inlineCallbacks
-    def test_onNotify_calls_sendNotify_on_protocol(self):
+    def test_onNotifies_sends_notify_for_each_notification(self):
         user = yield deferToDatabase(self.make_user)
         protocol, factory = self.make_protocol_with_factory(user=user)
-        name = maas_factory.make_name("name")
-        action = maas_factory.make_name("action")
-        data = maas_factory.make_name("data")
         mock_class = MagicMock()
-        mock_class.return_value.on_listen.return_value = (name, action, data)
+        mock_class._meta.pk_type = str
+        mock_class.return_value.on_listen.side_effect = (
+            lambda channel, action, obj_id: (
+                None if obj_id == "2" else ("name", action, obj_id)))
         mock_sendNotify = self.patch(protocol, "sendNotify")
-        yield factory.onNotify(
-            mock_class, sentinel.channel, action, sentinel.obj_id)
+        invalidate = self.patch(
+            protocol_module.dehydration_cache, "invalidate")
+        yield factory.onNotifies(
+            mock_class, sentinel.channel,
+            [("create", "1"), ("update", "2"), ("delete", "3")])
+        self.assertThat(
+            mock_sendNotify, MockCallsMatch(
+                call("name", "create", "1"), call("name", "delete", "3")))
         self.assertThat(
-            mock_sendNotify, MockCalledWith(name, action, data))
+            invalidate, MockCallsMatch(
+                call(mock_class._meta.handler_name, "1"),
+                call(mock_class._meta.handler_name, "2"),
+                call(mock_class._meta.handler_name, "3")))
 
     @wait_for_reactor
     @inlineCallbacks
-    def test_updateRackController_calls_onNotify_for_controller_update(self):
+    def test_updateRackController_calls_onNotifies_for_controller_update(
+            self):
         user = yield deferToDatabase(transactional(maas_factory.make_User))
         controller = yield deferToDatabase(
             transactional(maas_factory.make_RackController))
         protocol, factory = self.make_protocol_with_factory(user=user)
-        mock_onNotify = self.patch(factory, "onNotify")
+        mock_onNotifies = self.patch(factory, "onNotifies")
         controller_handler = MagicMock()
         factory.handlers["controller"] = controller_handler
         yield factory.updateRackController(controller.system_id)
         self.assertThat(
-            mock_onNotify,
+            mock_onNotifies,
             MockCalledOnceWith(
                 controller_handler,
-                "controller", "update", controller.system_id))
+                "controller", [("update", controller.system_id)]))
@@ -12,11 +12,16 @@ HyBi-07 (http://tools.ietf.org/html/draft-ietf-hybi-thewebsocketprotocol-07),
 which are drafts of RFC 6455.
 """
 
+from itertools import cycle
+import os
+import zlib
+
 from maasserver.websockets.websockets import (
     _makeAccept,
     _makeFrame,
     _mask,
     _parseFrames,
+    _PerMessageDeflate,
     _WSException,
     CONTROLS,
     IWebSocketsFrameReceiver,
@@ -106,6 +111,18 @@ class TestFrameHelpers(MAASTestCase):
         key = b"\x37\xfa\x21\x3d"
         self.assertEqual(_mask(b"Hello", key), b"\x7f\x9f\x4d\x51\x58")
 
+    def test_maskMatchesBytewiseMask(self):
+        """
+        Masking a buffer of any length XORs each byte with the key byte at
+        the same position modulo four.
+        """
+        key = os.urandom(4)
+        for length in range(9):
+            buf = os.urandom(length)
+            self.assertEqual(
+                bytes(b ^ k for b, k in zip(buf, cycle(key))),
+                _mask(buf, key))
+
     def test_parseUnmaskedText(self):
         """
         A sample unmasked frame of "Hello" from HyBi-10, 4.7.
@@ -287,6 +304,18 @@ class TestFrameHelpers(MAASTestCase):
         error = self.assertRaises(_WSException, list, _parseFrames(frame))
         self.assertEqual("Reserved flag in frame (114)", str(error))
 
+    def test_parseRSV1(self):
+        """
+        L{_parseFrames} accepts the RSV1 flag when asked to, and yields it
+        with each frame.
+        """
+        frame = [b"\xc1\x05Hello\x81\x05Hello"]
+        frames = list(_parseFrames(frame, needMask=False, withRSV1=True))
+        self.assertEqual(
+            [(CONTROLS.TEXT, b"Hello", True, True),
+             (CONTROLS.TEXT, b"Hello", True, False)],
+            frames)
+
     def test_parseUnknownOpcode(self):
         """
         L{_parseFrames} raises a L{_WSException} error when the error uses an
@@ -330,6 +359,22 @@ class TestFrameHelpers(MAASTestCase):
         buf = _makeFrame(b"Hello", CONTROLS.TEXT, False)
         self.assertEqual(frame, buf)
 
+    def test_makeNonFinBinaryFrame(self):
+        """
+        L{_makeFrame} keeps the opcode of fragmented binary frames.
+        """
+        frame = b"\x02\x05Hello"
+        buf = _makeFrame(b"Hello", CONTROLS.BINARY, False)
+        self.assertEqual(frame, buf)
+
+    def test_makeRSV1Frame(self):
+        """
+        L{_makeFrame} can set the RSV1 flag for compressed messages.
+        """
+        frame = b"\xc1\x05Hello"
+        buf = _makeFrame(b"Hello", CONTROLS.TEXT, True, rsv1=True)
+        self.assertEqual(frame, buf)
+
     def test_makeMaskedFrame(self):
         """
         L{_makeFrame} can build masked frames.
@@ -339,6 +384,142 @@ class TestFrameHelpers(MAASTestCase):
         self.assertEqual(frame, buf)
 
 
+def deflate(data):
+    """Compress C{data} as a permessage-deflate client would."""
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = compressor.compress(data)
+    compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
+    return compressed[:-4]
+
+
+def inflate(data, decompressor=None):
+    """Decompress C{data} as a permessage-deflate client would."""
+    if decompressor is None:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    return decompressor.decompress(data + b"\x00\x00\xff\xff")
+
+
+class PerMessageDeflateTest(MAASTestCase):
+    """
+    Tests for L{_PerMessageDeflate}.
+    """
+
+    def test_negotiateNoOffer(self):
+        """
+        Nothing is negotiated if the client doesn't offer permessage-deflate.
+        """
+        self.assertIsNone(_PerMessageDeflate.negotiate(None))
+        self.assertIsNone(
+            _PerMessageDeflate.negotiate([b"x-webkit-deflate-frame"]))
+
+    def test_negotiateBrowserOffer(self):
+        """
+        The usual browser offer is accepted without parameters.
+        """
+        deflate, response = _PerMessageDeflate.negotiate(
+            [b"permessage-deflate; client_max_window_bits"], 100)
+        self.assertEqual(b"permessage-deflate", response)
+        self.assertEqual(100, deflate.threshold)
+        self.assertFalse(deflate.serverNoContextTakeover)
+        self.assertEqual(15, deflate.serverMaxWindowBits)
+
+    def test_negotiateParameters(self):
+        """
+        Context takeover and window size parameters are accepted and echoed
+        back.
+        """
+        deflate, response = _PerMessageDeflate.negotiate([
+            b"permessage-deflate; server_no_context_takeover; "
+            b"client_no_context_takeover; server_max_window_bits=10"])
+        self.assertEqual(
+            b"permessage-deflate; server_no_context_takeover; "
+            b"client_no_context_takeover; server_max_window_bits=10",
+            response)
+        self.assertTrue(deflate.serverNoContextTakeover)
+        self.assertTrue(deflate.clientNoContextTakeover)
+        self.assertEqual(10, deflate.serverMaxWindowBits)
+
+    def test_negotiateSkipsUnacceptableOffers(self):
+        """
+        Offers with unknown, duplicate, or unsupported parameters are skipped
+        in favour of later offers.
+        """
+        for offer in (b"permessage-deflate; foo",
+                      b"permessage-deflate; server_no_context_takeover; "
+                      b"server_no_context_takeover",
+                      b"permessage-deflate; server_max_window_bits=8",
+                      b"permessage-deflate; client_max_window_bits=16"):
+            deflate, response = _PerMessageDeflate.negotiate(
+                [offer + b", permessage-deflate"])
+            self.assertEqual(b"permessage-deflate", response)
+
+    def test_compressKeepsContext(self):
+        """
+        Compressed messages can be inflated by a client keeping one context,
+        and repeated messages compress better the second time.
+        """
+        deflate = _PerMessageDeflate()
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        message = os.urandom(100) * 4
+        first = deflate.compress(message)
+        second = deflate.compress(message)
+        self.assertLess(len(second), len(first))
+        self.assertEqual(message, inflate(first, decompressor))
+        self.assertEqual(message, inflate(second, decompressor))
+
+    def test_compressNoContextTakeover(self):
+        """
+        With I{server_no_context_takeover} each message is compressed
+        independently.
+        """
+        deflate = _PerMessageDeflate(serverNoContextTakeover=True)
+        message = os.urandom(100) * 4
+        self.assertEqual(deflate.compress(message), deflate.compress(message))
+        self.assertEqual(message, inflate(deflate.compress(message)))
+
+    def test_inflateFragmentedMessage(self):
+        """
+        A compressed message fragmented around a control frame is inflated.
+        """
+        message = b"Hello" * 100
+        compressed = deflate(message)
+        buffer = [b"".join((
+            _makeFrame(compressed[:10], CONTROLS.TEXT, False, mask=b"abcd",
+                       rsv1=True),
+            _makeFrame(b"ping", CONTROLS.PING, True, mask=b"abcd"),
+            _makeFrame(compressed[10:], CONTROLS.CONTINUE, True,
+                       mask=b"abcd"),
+            _makeFrame(b"Hello", CONTROLS.TEXT, True, mask=b"abcd"),
+        ))]
+        frames = list(_PerMessageDeflate().inflateFrames(
+            _parseFrames(buffer, withRSV1=True)))
+        self.assertEqual(
+            [CONTROLS.TEXT, CONTROLS.PING, CONTROLS.CONTINUE, CONTROLS.TEXT],
+            [opcode for opcode, _, _ in frames])
+        self.assertEqual(message, frames[0][1] + frames[2][1])
+        self.assertEqual(b"Hello", frames[3][1])
+
+    def test_inflateRejectsRSV1OnControlFrames(self):
+        """
+        RSV1 is only permitted on the first frame of a data message.
+        """
+        buffer = [_makeFrame(b"ping", CONTROLS.PING, True, rsv1=True)]
+        frames = _PerMessageDeflate().inflateFrames(
+            _parseFrames(buffer, needMask=False, withRSV1=True))
+        error = self.assertRaises(_WSException, list, frames)
+        self.assertEqual("RSV1 set on PING frame", str(error))
+
+    def test_inflateRejectsInvalidData(self):
+        """
+        Corrupt compressed data is rejected.
+        """
+        buffer = [_makeFrame(b"\xff" * 8, CONTROLS.TEXT, True, rsv1=True)]
+        frames = _PerMessageDeflate().inflateFrames(
+            _parseFrames(buffer, needMask=False, withRSV1=True))
+        self.assertRaises(_WSException, list, frames)
+
+
 @implementer(IWebSocketsFrameReceiver)
 class SavingEchoReceiver(object):
     """
@@ -412,6 +593,56 @@ class WebSocketsProtocolTest(MAASTestCase):
         self.protocol.dataReceived(b"\x72\x05")
         self.assertFalse(self.transport.connected)
 
+    def test_compressedFrameWithoutDeflate(self):
+        """
+        A compressed frame closes the connection if permessage-deflate has
+        not been negotiated.
+        """
+        self.protocol.dataReceived(_makeFrame(
+            deflate(b"Hello"), CONTROLS.TEXT, True, mask=b"abcd", rsv1=True))
+        self.assertFalse(self.transport.connected)
+
+
+class WebSocketsProtocolDeflateTest(MAASTestCase):
+    """
+    Tests for L{WebSocketsProtocol} with permessage-deflate negotiated.
+    """
+
+    def setUp(self):
+        super(WebSocketsProtocolDeflateTest, self).setUp()
+        self.receiver = SavingEchoReceiver()
+        self.protocol = WebSocketsProtocol(self.receiver)
+        self.protocol._deflate = _PerMessageDeflate(threshold=10)
+        self.transport = StringTransportWithDisconnection()
+        self.protocol.makeConnection(self.transport)
+        self.transport.protocol = self.protocol
+
+    def test_frameReceivedCompressed(self):
+        """
+        Compressed messages are inflated, and echoed messages at or above the
+        threshold are compressed.
+        """
+        message = b"Hello" * 10
+        self.protocol.dataReceived(_makeFrame(
+            deflate(message), CONTROLS.TEXT, True, mask=b"abcd", rsv1=True))
+        self.assertEqual(
+            [(CONTROLS.TEXT, message, True)], self.receiver.received)
+        [(opcode, data, fin, rsv1)] = _parseFrames(
+            [self.transport.value()], needMask=False, withRSV1=True)
+        self.assertTrue(rsv1)
+        self.assertEqual(message, inflate(data))
+
+    def test_frameReceivedUncompressed(self):
+        """
+        Uncompressed messages are still accepted, and short messages are
+        echoed without compression.
+        """
+        self.protocol.dataReceived(
+            _makeFrame(b"Hello", CONTROLS.TEXT, True, mask=b"abcd"))
+        self.assertEqual(
+            [(CONTROLS.TEXT, b"Hello", True)], self.receiver.received)
+        self.assertEqual(b"\x81\x05Hello", self.transport.value())
+
 
 class WebSocketsTransportTest(MAASTestCase):
     """
@@ -657,6 +888,49 @@ class WebSocketsResourceTest(MAASTestCase):
         self.assertEqual([b""], request.written)
         self.assertEqual(101, request.responseCode)
 
+    def renderWithExtensions(self, extensions):
+        request = DummyRequest(b"/")
+        request.requestHeaders = Headers()
+        transport = StringTransportWithDisconnection()
+        transport.protocol = Protocol()
+        request.transport = transport
+        self.update_headers(request, headers={
+            b"upgrade": b"Websocket",
+            b"connection": b"Upgrade",
+            b"sec-websocket-key": b"secure",
+            b"sec-websocket-version": b"13",
+            b"sec-websocket-extensions": extensions})
+        self.assertEqual(NOT_DONE_YET, self.resource.render(request))
+        return request
+
+    def test_renderDeflate(self):
+        """
+        If the client offers the permessage-deflate extension,
+        L{WebSocketsResource} accepts it and the protocol uses it.
+        """
+        request = self.renderWithExtensions(
+            b"permessage-deflate; client_max_window_bits")
+        self.assertEqual(
+            [b"permessage-deflate"], request.responseHeaders.getRawHeaders(
+                b"sec-websocket-extensions"))
+        self.assertIsInstance(self.echoProtocol._deflate, _PerMessageDeflate)
+        self.assertEqual(1024, self.echoProtocol._deflate.threshold)
+        self.assertIs(
+            self.echoProtocol._deflate,
+            self.echoProtocol._receiver.transport._deflate)
+
+    def test_renderDeflateDisabled(self):
+        """
+        If L{WebSocketsResource} has no deflate threshold, the
+        permessage-deflate extension is never accepted.
+        """
+        self.resource = WebSocketsResource(
+            self.resource._lookupProtocol, deflateThreshold=None)
+        request = self.renderWithExtensions(b"permessage-deflate")
+        self.assertIsNone(request.responseHeaders.getRawHeaders(
+            b"sec-websocket-extensions"))
+        self.assertIsNone(self.echoProtocol._deflate)
+
     def test_renderWrongUpgrade(self):
         """
         If the C{Upgrade} header contains an invalid value,
@@ -17,7 +17,6 @@ __all__ = ["WebSocketsResource", "IWebSocketsFrameReceiver",
 
 import base64
 from hashlib import sha1
-from itertools import cycle
 from struct import (
     pack,
     unpack,
@@ -26,6 +25,7 @@ from typing import (
     List,
     Sequence,
 )
+import zlib
 
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils import typed
@@ -93,6 +93,17 @@ class STATUSES(Values):
 # The GUID for WebSockets, from RFC 6455.
 _WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
 
+# Messages shorter than this are sent uncompressed even when the
+# permessage-deflate extension (RFC 7692) is in use.
+DEFLATE_THRESHOLD = 1024
+
+# Messages are compressed in the reactor thread, so favour speed over size.
+DEFLATE_LEVEL = 1
+
+# The trailer of a DEFLATE block flushed with Z_SYNC_FLUSH. RFC 7692 strips
+# it from the end of each compressed message.
+_DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
 
 @typed
 def _makeAccept(key: bytes) -> bytes:
@@ -123,11 +134,17 @@ def _mask(buf: bytes, key: bytes) -> bytes:
     @rtype: C{str}
     @return: A masked buffer of bytes.
     """
-    return bytes((b ^ k) for b, k in zip(buf, cycle(key)))
+    # XOR the whole buffer at once, as one (very) long integer.
+    length = len(buf)
+    keys = key * (length // 4 + 1)
+    masked = int.from_bytes(buf, "big") ^ int.from_bytes(keys[:length], "big")
+    return masked.to_bytes(length, "big")
 
 
 @typed
-def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
+def _makeFrame(
+        buf: bytes, opcode, fin: bool, mask: bytes=None,
+        rsv1: bool=False) -> bytes:
     """
     Make a frame.
 
@@ -146,6 +163,10 @@ def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
     @type mask: C{bytes} or C{NoneType}
     @param mask: If specified, the masking key to apply on the created frame.
 
+    @type rsv1: C{bool}
+    @param rsv1: Whether to set the RSV1 flag, which marks a compressed
+        message when the permessage-deflate extension is in use.
+
     @rtype: C{bytes}
     @return: A packed frame.
     """
@@ -155,29 +176,28 @@ def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
     else:
         lengthMask = 0
 
+    header = opcode.value
+    if fin:
+        header |= 0x80
+    if rsv1:
+        header |= 0x40
+
     if bufferLength > 0xffff:
-        length = b"%s%s" % (
-            bytes([lengthMask | 0x7f]), pack(">Q", bufferLength))
+        header = pack(">BBQ", header, lengthMask | 0x7f, bufferLength)
     elif bufferLength > 0x7d:
-        length = b"%s%s" % (
-            bytes([lengthMask | 0x7e]), pack(">H", bufferLength))
-    else:
-        length = bytes([lengthMask | bufferLength])
-
-    if fin:
-        header = 0x80
+        header = pack(">BBH", header, lengthMask | 0x7e, bufferLength)
     else:
-        header = 0x01
+        header = pack(">BB", header, lengthMask | bufferLength)
 
-    header = bytes([header | opcode.value])
     if mask is not None:
-        buf = b"%s%s" % (mask, _mask(buf, mask))
-    frame = b"%s%s%s" % (header, length, buf)
-    return frame
+        return b"".join((header, mask, _mask(buf, mask)))
+    else:
+        return header + buf
 
 
 @typed
-def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
+def _parseFrames(
+        frameBuffer: List[bytes], needMask: bool=True, withRSV1: bool=False):
     """
     Parse frames in a highly compliant manner. It modifies C{frameBuffer}
     removing the parsed content from it.
@@ -187,7 +207,13 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
 
     @param needMask: If C{True}, refuse any frame which is not masked.
     @type needMask: C{bool}
+
+    @param withRSV1: If C{True}, permit the RSV1 flag, as used by the
+        permessage-deflate extension, and yield whether it is set as a fourth
+        item for each frame.
+    @type withRSV1: C{bool}
     """
+    reserved = 0x30 if withRSV1 else 0x70
     start = 0
     payload = b"".join(frameBuffer)
 
@@ -198,7 +224,7 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
 
         # Grab the header. This single byte holds some flags and an opcode
         header = payload[start]
-        if header & 0x70:
+        if header & reserved:
             # At least one of the reserved flags is set. Pork chop sandwiches!
             raise _WSException("Reserved flag in frame (%d)" % (header,))
 
@@ -271,7 +297,10 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
                 # No reason given; use generic data.
                 data = STATUSES.NONE, b""
 
-        yield opcode, data, bool(fin)
+        if withRSV1:
+            yield opcode, data, bool(fin), bool(header & 0x40)
+        else:
+            yield opcode, data, bool(fin)
         start += offset + length
 
     if len(payload) > start:
@@ -280,6 +309,151 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
         frameBuffer[:] = []
 
 
+def _parseWindowBits(value: bytes, minimum: int) -> int:
+    """
+    Parse a I{max_window_bits} extension parameter value.
+
+    @raise ValueError: If C{value} is not a number from C{minimum} to 15.
+    """
+    if not value.isdigit() or not minimum <= int(value) <= zlib.MAX_WBITS:
+        raise ValueError("Unsupported window bits: %r" % (value,))
+    return int(value)
+
+
+class _PerMessageDeflate(object):
+    """
+    The permessage-deflate extension (RFC 7692) as negotiated for one
+    connection.
+
+    @ivar threshold: Messages shorter than this are sent uncompressed.
+    @type threshold: C{int}
+    """
+
+    _dataOpcodes = (CONTROLS.TEXT, CONTROLS.BINARY, CONTROLS.CONTINUE)
+
+    def __init__(
+            self, threshold=DEFLATE_THRESHOLD, serverNoContextTakeover=False,
+            clientNoContextTakeover=False, serverMaxWindowBits=zlib.MAX_WBITS):
+        self.threshold = threshold
+        self.serverNoContextTakeover = serverNoContextTakeover
+        self.clientNoContextTakeover = clientNoContextTakeover
+        self.serverMaxWindowBits = serverMaxWindowBits
+        self._compressor = self._makeCompressor()
+        self._decompressor = self._makeDecompressor()
+        self._inflating = False
+
+    @classmethod
+    def negotiate(cls, headers, threshold=DEFLATE_THRESHOLD):
+        """
+        Accept the first acceptable permessage-deflate offer from a client.
+
+        @param headers: The raw I{Sec-WebSocket-Extensions} request headers,
+            or C{None}.
+        @type headers: C{list} of C{bytes}
+
+        @return: A tuple of the L{_PerMessageDeflate} instance and the
+            I{Sec-WebSocket-Extensions} response header, or C{None} if no
+            acceptable offer was made.
+        """
+        for header in headers or ():
+            for offer in header.split(b","):
+                name, *params = offer.split(b";")
+                if name.strip().lower() != b"permessage-deflate":
+                    continue
+                try:
+                    options, response = cls._acceptParams(params)
+                except ValueError:
+                    continue
+                return cls(threshold, **options), b"; ".join(response)
+        return None
+
+    @staticmethod
+    def _acceptParams(params):
+        """
+        Return the options and response parameters for an offer.
+
+        @raise ValueError: If the offer's parameters are not acceptable.
+        """
+        offered = {}
+        for param in params:
+            key, sep, value = param.partition(b"=")
+            key = key.strip().lower()
+            if key in offered:
+                raise ValueError("Duplicate parameter: %r" % (key,))
+            offered[key] = value.strip().strip(b'"') if sep else None
+        options, response = {}, [b"permessage-deflate"]
+        for key, value in offered.items():
+            if key == b"server_no_context_takeover" and value is None:
+                options["serverNoContextTakeover"] = True
+                response.append(key)
+            elif key == b"client_no_context_takeover" and value is None:
+                options["clientNoContextTakeover"] = True
+                response.append(key)
+            elif key == b"server_max_window_bits" and value is not None:
+                # zlib does not support an 8-bit window for raw DEFLATE.
+                bits = _parseWindowBits(value, 9)
+                options["serverMaxWindowBits"] = bits
+                response.append(b"%s=%d" % (key, bits))
+            elif key == b"client_max_window_bits":
+                # Inflating with the largest window copes with whatever the
+                # client chooses, so there's no need to constrain it.
+                if value is not None:
+                    _parseWindowBits(value, 8)
+            else:
+                raise ValueError("Unsupported parameter: %r" % (key,))
+        return options, response
+
+    def _makeCompressor(self):
+        return zlib.compressobj(
+            DEFLATE_LEVEL, zlib.DEFLATED, -self.serverMaxWindowBits)
+
+    def _makeDecompressor(self):
+        return zlib.decompressobj(-zlib.MAX_WBITS)
+
+    @typed
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress the payload of a whole message.
+        """
+        compressed = b"".join((
+            self._compressor.compress(data),
+            self._compressor.flush(zlib.Z_SYNC_FLUSH),
+        ))
+        if self.serverNoContextTakeover:
+            self._compressor = self._makeCompressor()
+        if compressed.endswith(_DEFLATE_TAIL):
+            compressed = compressed[:-len(_DEFLATE_TAIL)]
+        return compressed
+
+    def inflateFrames(self, frames):
+        """
+        Inflate the payloads of compressed messages.
+
+        @param frames: Frames from L{_parseFrames}, called with C{withRSV1}.
+
+        @return: An iterator of C{(opcode, data, fin)} tuples, as yielded by
+            L{_parseFrames} when the extension is not in use.
+        """
+        for opcode, data, fin, rsv1 in frames:
+            if opcode in (CONTROLS.TEXT, CONTROLS.BINARY):
+                self._inflating = rsv1
+            elif rsv1:
+                # 6.1: Only the first frame of a message may set RSV1.
+                raise _WSException("RSV1 set on %s frame" % opcode.name)
+            if self._inflating and opcode in self._dataOpcodes:
+                try:
+                    data = self._decompressor.decompress(data)
+                    if fin:
+                        data += self._decompressor.decompress(_DEFLATE_TAIL)
+                except zlib.error as error:
+                    raise _WSException("Invalid compressed data (%s)" % error)
+                if fin:
+                    self._inflating = False
+                    if self.clientNoContextTakeover:
+                        self._decompressor = self._makeDecompressor()
+            yield opcode, data, fin
+
+
 class IWebSocketsFrameReceiver(Interface):
     """
     An interface for receiving WebSockets frames.
@@ -317,13 +491,17 @@ class WebSocketsTransport(object):
 
     @ivar _transport: A reference to the real transport.
 
+    @ivar _deflate: The negotiated permessage-deflate extension, or C{None}.
+    @type _deflate: L{_PerMessageDeflate}
+
     @since: 13.2
     """
 
     _disconnecting = False
 
-    def __init__(self, transport):
+    def __init__(self, transport, deflate=None):
         self._transport = transport
+        self._deflate = deflate
 
     @typed
     def sendFrame(self, opcode, data: bytes, fin: bool):
@@ -339,7 +517,14 @@ class WebSocketsTransport(object):
         @type fin: C{bool}
         @param fin: Whether or not we're sending a final frame.
         """
-        packet = _makeFrame(data, opcode, fin)
+        # Only unfragmented messages are compressed.
+        compress = (
+            self._deflate is not None and fin and
+            opcode in (CONTROLS.TEXT, CONTROLS.BINARY) and
+            len(data) >= self._deflate.threshold)
+        if compress:
+            data = self._deflate.compress(data)
+        packet = _makeFrame(data, opcode, fin, rsv1=compress)
         self._transport.write(packet)
 
     @typed
@@ -383,9 +568,14 @@ class WebSocketsProtocol(Protocol):
     @ivar _buffer: The pending list of frames not processed yet.
     @type _buffer: C{list}
 
+    @ivar _deflate: The negotiated permessage-deflate extension, or C{None}.
+        Must be set before the connection is made.
+    @type _deflate: L{_PerMessageDeflate}
+
     @since: 13.2
     """
     _buffer = None
+    _deflate = None
 
     def __init__(self, receiver):
         self._receiver = receiver
@@ -397,13 +587,19 @@ class WebSocketsProtocol(Protocol):
         peer = self.transport.getPeer()
         log.debug("Opening connection with {peer}", peer=peer)
         self._buffer = []
-        self._receiver.makeConnection(WebSocketsTransport(self.transport))
+        self._receiver.makeConnection(
+            WebSocketsTransport(self.transport, self._deflate))
 
     def _parseFrames(self):
         """
         Find frames in incoming data and pass them to the underlying protocol.
         """
-        for opcode, data, fin in _parseFrames(self._buffer):
+        if self._deflate is None:
+            frames = _parseFrames(self._buffer)
+        else:
+            frames = self._deflate.inflateFrames(
+                _parseFrames(self._buffer, withRSV1=True))
+        for opcode, data, fin in frames:
             self._receiver.frameReceived(opcode, data, fin)
             if opcode == CONTROLS.CLOSE:
                 # The other side wants us to close.
@@ -590,12 +786,18 @@ class WebSocketsResource(object):
         L{lookupProtocolForFactory}.
     @type lookupProtocol: C{callable}.
 
+    @param deflateThreshold: Messages shorter than this many bytes are sent
+        uncompressed when the client supports the permessage-deflate
+        extension. If C{None}, the extension is never negotiated.
+    @type deflateThreshold: C{int} or C{NoneType}
+
     @since: 13.2
     """
     isLeaf = True
 
-    def __init__(self, lookupProtocol):
+    def __init__(self, lookupProtocol, deflateThreshold=DEFLATE_THRESHOLD):
         self._lookupProtocol = lookupProtocol
+        self._deflateThreshold = deflateThreshold
 
     def getChildWithDefault(self, name, request):
         """
@@ -695,6 +897,15 @@ class WebSocketsResource(object):
         # 4.2.2.5.5 Optional codec declaration
         if protocolName:
             request.setHeader(b"Sec-WebSocket-Protocol", protocolName)
+        # RFC 7692 Compression extension, if the client offers it.
+        deflate = None
+        if self._deflateThreshold is not None:
+            negotiated = _PerMessageDeflate.negotiate(
+                request.requestHeaders.getRawHeaders(
+                    b"Sec-WebSocket-Extensions"), self._deflateThreshold)
+            if negotiated is not None:
+                deflate, extensions = negotiated
+                request.setHeader(b"Sec-WebSocket-Extensions", extensions)
 
         # Provoke request into flushing headers and finishing the handshake.
         request.write(b"")
@@ -713,6 +924,7 @@ class WebSocketsResource(object):
 
         if not isinstance(protocol, WebSocketsProtocol):
             protocol = WebSocketsProtocolWrapper(protocol)
+        protocol._deflate = deflate
 
         # Connect the transport to our factory, and make things go. We need to
         # do some stupid stuff here; see #3204, which could fix it.
@@ -15,18 +15,28 @@ from maasserver.enum import (
     NODE_STATUS,
     NODE_TYPE,
 )
+from maasserver.models import (
+    Event,
+    EventType,
+)
 from maasserver.models.timestampedmodel import now
 from maasserver.preseed import CURTIN_INSTALL_LOG
 from maasserver.utils.orm import (
     in_transaction,
+    is_retryable_failure,
     make_serialization_failure,
+    reload_object,
+    savepoint,
     transactional,
     TransactionManagementError,
 )
-from maasserver.utils.threads import deferToDatabase
+from maasserver.utils.threads import (
+    DATABASE_PRIORITY,
+    deferToDatabaseWithPriority,
+)
 from metadataserver import logger
 from metadataserver.api import (
-    add_event_to_node_event_log,
+    get_node_event_type_name,
     process_file,
 )
 from metadataserver.enum import SCRIPT_STATUS
@@ -34,6 +44,7 @@ from metadataserver.models import (
     NodeKey,
     ScriptSet,
 )
+from provisioningserver.events import EVENT_DETAILS
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils.twisted import deferred
 from twisted.application.internet import TimerService
@@ -196,7 +207,8 @@ class StatusWorkerService(TimerService, object):
     def _tryUpdateNodes(self):
         if len(self.queue) != 0:
             queue, self.queue = self.queue, defaultdict(list)
-            d = deferToDatabase(self._preProcessQueue, queue)
+            d = deferToDatabaseWithPriority(
+                DATABASE_PRIORITY.BACKGROUND, self._preProcessQueue, queue)
             d.addCallback(self._processMessagesLater)
             d.addErrback(log.err, "Failed to process node status messages.")
             return d
@@ -233,25 +245,77 @@ class StatusWorkerService(TimerService, object):
                 "outside of a transaction.")
         else:
             # Here we're in a database thread, with a database connection.
-            # We only save the last_ping off the last message in the
-            # list of messages. This removes the number of database saves
-            # required.
-            for idx, message in enumerate(messages):
-                try:
-                    self._processMessage(node, message)
-                except:
-                    log.err(
-                        None,
-                        "Failed to process message "
-                        "for node: %s" % node.hostname)
-                if idx == len(messages) - 1:
-                    try:
-                        self._updateLastPing(node, message)
-                    except:
-                        log.err(
-                            None,
-                            "Failed to update last ping "
-                            "for node: %s" % node.hostname)
+            # All the messages are processed in one transaction, and we only
+            # save the last_ping off the last message in the list of
+            # messages. This removes the number of database saves required.
+            if len(messages) == 0:
+                return
+            try:
+                self._processMessageBatch(node, messages)
+            except:
+                log.err(
+                    None,
+                    "Failed to process messages "
+                    "for node: %s" % node.hostname)
+            try:
+                self._updateLastPing(node, messages[-1])
+            except:
+                log.err(
+                    None,
+                    "Failed to update last ping "
+                    "for node: %s" % node.hostname)
+
+    @transactional
+    def _processMessageBatch(self, node, messages):
+        """Process `messages` for `node` in a single transaction.
+
+        Events are written together with `bulk_create`, files sent for the
+        same `ScriptResult` are merged and stored once, and the node is
+        saved once at the end, if at all. A message that cannot be processed
+        is logged and skipped without affecting the others.
+        """
+        # This may be retried, so start from a fresh copy of the node each
+        # time; changes made to it during a failed attempt must not linger.
+        node = reload_object(node)
+        if node is None:
+            return
+        event_types, events, results = {}, [], {}
+        save_node = False
+        for message in messages:
+            # The event depends on the node's status before the message.
+            event = self._makeEvent(node, message, event_types)
+            message_results = {}
+            try:
+                with savepoint():
+                    save_message = self._applyMessage(
+                        node, message, message_results)
+            except Exception as error:
+                if is_retryable_failure(error):
+                    raise
+                log.err(
+                    None,
+                    "Failed to process message "
+                    "for node: %s" % node.hostname)
+            else:
+                events.append(event)
+                for script_result, args in message_results.items():
+                    results.setdefault(script_result, {}).update(args)
+                save_node = save_node or save_message
+
+        Event.objects.bulk_create(events)
+        for script_result, args in results.items():
+            try:
+                with savepoint():
+                    script_result.store_result(**args)
+            except Exception as error:
+                if is_retryable_failure(error):
+                    raise
+                log.err(
+                    None,
+                    "Failed to store result %s "
+                    "for node: %s" % (script_result.name, node.hostname))
+        if save_node:
+            node.save()
 
     @transactional
     def _updateLastPing(self, node, message):
@@ -288,19 +352,55 @@ class StatusWorkerService(TimerService, object):
 
     @transactional
     def _processMessage(self, node, message):
+        # Add this event to the node event log.
+        self._makeEvent(node, message, {}).save()
+
+        # Commit results to the database.
+        results = {}
+        save_node = self._applyMessage(node, message, results)
+        for script_result, args in results.items():
+            script_result.store_result(**args)
+
+        if save_node:
+            node.save()
+
+    def _makeEvent(self, node, message, event_types):
+        """Return a new, unsaved, `Event` for `message` from `node`.
+
+        :param event_types: A dict of `EventType`s by name, used as a cache,
+            and updated with any event type found or registered here.
+        """
+        type_name = get_node_event_type_name(node, message.get('result'))
+        try:
+            event_type = event_types[type_name]
+        except KeyError:
+            event_details = EVENT_DETAILS[type_name]
+            event_type = event_types[type_name] = EventType.objects.register(
+                type_name, event_details.description, event_details.level)
+        created = message['timestamp']
+        if created is None:
+            created = now()
+        return Event(
+            node=node, type=event_type, level=event_type.level,
+            action=message['name'], description="'%s' %s" % (
+                message['origin'], message['description']),
+            created=created, updated=created)
+
+    def _applyMessage(self, node, message, results):
+        """Apply `message` to `node`, without saving the node.
+
+        Files sent in the message are added to `results`, grouped by the
+        `ScriptResult` to which they belong, ready for `store_result`.
+
+        :return: True if the node has been changed and needs saving.
+        """
         event_type = message['event_type']
         origin = message['origin']
         activity_name = message['name']
         description = message['description']
         result = message.get('result', None)
 
-        # Add this event to the node event log.
-        add_event_to_node_event_log(
-            node, origin, activity_name, description, result,
-            message['timestamp'])
-
         # Group files together with the ScriptResult they belong.
-        results = {}
         for sent_file in message.get('files', []):
             # Set the result type according to the node's status.
             if node.status in (
@@ -326,10 +426,6 @@ class StatusWorkerService(TimerService, object):
                 content=sent_file['content'])
             process_file(results, script_set, script_name, content, sent_file)
 
-        # Commit results to the database.
-        for script_result, args in results.items():
-            script_result.store_result(**args)
-
         # At the end of a top-level event, we change the node status.
         save_node = False
         if self._is_top_level(activity_name) and event_type == 'finish':
@@ -365,8 +461,7 @@ class StatusWorkerService(TimerService, object):
                 script_result.status = SCRIPT_STATUS.RUNNING
                 script_result.save(update_fields=['status'])
 
-        if save_node:
-            node.save()
+        return save_node
 
     def _retrieve_content(self, compression, encoding, content):
         """Extract the content of the sent file."""
@@ -433,8 +528,9 @@ class StatusWorkerService(TimerService, object):
             message['event_type'] == 'finish')
         has_files = len(message.get('files', [])) > 0
         if is_starting_event or is_final_event or has_files:
-            d = deferToDatabase(
-                self._processMessageNow, authorization, message)
+            d = deferToDatabaseWithPriority(
+                DATABASE_PRIORITY.BACKGROUND, self._processMessageNow,
+                authorization, message)
             d.addErrback(
                 log.err, "Failed to process status message instantly.")
             return d
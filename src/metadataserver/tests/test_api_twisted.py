@@ -11,7 +11,7 @@ from datetime import datetime
 from io import BytesIO
 import json
 from unittest.mock import (
-    call,
+    ANY,
     Mock,
     sentinel,
 )
@@ -36,11 +36,12 @@ from maasserver.utils.orm import (
 )
 from maasserver.utils.threads import deferToDatabase
 from maastesting.matchers import (
+    DocTestMatches,
     MockCalledOnceWith,
-    MockCallsMatch,
     MockNotCalled,
 )
 from maastesting.testcase import MAASTestCase
+from maastesting.twisted import TwistedLoggerFixture
 from metadataserver import api
 from metadataserver.api_twisted import (
     StatusHandlerResource,
@@ -241,22 +242,37 @@ class TestStatusWorkerServiceTransactional(MAASTransactionServerTestCase):
 
     @wait_for_reactor
     @inlineCallbacks
-    def test__processMessages_calls_processMessage_and_updateLastPing(self):
+    def test__processMessages_processes_batch_and_updates_last_ping(self):
         worker = StatusWorkerService(sentinel.dbtasks)
-        mock_processMessage = self.patch(worker, "_processMessage")
+        mock_processMessageBatch = self.patch(worker, "_processMessageBatch")
         mock_updateLastPing = self.patch(worker, "_updateLastPing")
         yield deferToDatabase(
             worker._processMessages, sentinel.node,
             [sentinel.message1, sentinel.message2])
         self.assertThat(
-            mock_processMessage,
-            MockCallsMatch(
-                call(sentinel.node, sentinel.message1),
-                call(sentinel.node, sentinel.message2)))
+            mock_processMessageBatch,
+            MockCalledOnceWith(
+                sentinel.node, [sentinel.message1, sentinel.message2]))
         self.assertThat(
             mock_updateLastPing,
             MockCalledOnceWith(sentinel.node, sentinel.message2))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__processMessages_updates_last_ping_when_batch_fails(self):
+        worker = StatusWorkerService(sentinel.dbtasks)
+        mock_processMessageBatch = self.patch(worker, "_processMessageBatch")
+        mock_processMessageBatch.side_effect = ZeroDivisionError()
+        mock_updateLastPing = self.patch(worker, "_updateLastPing")
+        node = Mock(hostname=factory.make_name("host"))
+        with TwistedLoggerFixture() as logger:
+            yield deferToDatabase(
+                worker._processMessages, node, [sentinel.message])
+        self.assertThat(
+            mock_updateLastPing, MockCalledOnceWith(node, sentinel.message))
+        self.assertThat(logger.output, DocTestMatches(
+            "Failed to process messages for node: %s..." % node.hostname))
+
     @wait_for_reactor
     @inlineCallbacks
     def test_queueMessages_processes_top_level_message_instantly(self):
@@ -336,6 +352,21 @@ class TestStatusWorkerService(MAASServerTestCase):
         worker = StatusWorkerService(sentinel.dbtasks)
         worker._processMessage(node, payload)
 
+    def processMessageBatch(self, node, payloads):
+        worker = StatusWorkerService(sentinel.dbtasks)
+        worker._processMessageBatch(node, payloads)
+
+    def make_payload(self, **kwargs):
+        payload = {
+            'event_type': 'progress',
+            'origin': 'cloud-init',
+            'name': factory.make_name('modules-config/config'),
+            'description': factory.make_name('description'),
+            'timestamp': datetime.utcnow(),
+        }
+        payload.update(kwargs)
+        return payload
+
     def updateLastPing(self, node, payload):
         worker = StatusWorkerService(sentinel.dbtasks)
         worker._updateLastPing(node, payload)
@@ -862,3 +893,80 @@ class TestStatusWorkerService(MAASServerTestCase):
         script_result = script_set.find_script_result(
             script_name=CURTIN_INSTALL_LOG)
         self.assertEqual(SCRIPT_STATUS.RUNNING, script_result.status)
+
+    def test_batch_writes_events_for_all_messages_at_once(self):
+        node = factory.make_Node(status=NODE_STATUS.COMMISSIONING)
+        payloads = [self.make_payload() for _ in range(3)]
+        bulk_create = self.patch(
+            Event.objects, "bulk_create",
+            Mock(wraps=Event.objects.bulk_create))
+        self.processMessageBatch(node, payloads)
+        self.assertThat(bulk_create, MockCalledOnceWith(ANY))
+        self.assertEqual(
+            [payload['name'] for payload in payloads],
+            list(Event.objects.filter(node=node).order_by(
+                'id').values_list('action', flat=True)))
+
+    def test_batch_skips_message_that_fails(self):
+        node = factory.make_Node(status=NODE_STATUS.COMMISSIONING)
+        bad_payload = self.make_payload(files=[{
+            "path": "sample.txt",
+            "encoding": "uuencode",
+            "compression": "bzip2",
+            "content": encode_as_base64(b"content"),
+        }])
+        payloads = [self.make_payload(), bad_payload, self.make_payload()]
+        with TwistedLoggerFixture() as logger:
+            self.processMessageBatch(node, payloads)
+        self.assertEqual(
+            [payloads[0]['name'], payloads[2]['name']],
+            list(Event.objects.filter(node=node).order_by(
+                'id').values_list('action', flat=True)))
+        self.assertThat(logger.output, DocTestMatches(
+            "Failed to process message for node: %s..." % node.hostname))
+
+    def test_batch_merges_files_for_the_same_script_result(self):
+        node = factory.make_Node(
+            interface=True, status=NODE_STATUS.COMMISSIONING,
+            with_empty_script_sets=True)
+        script_result = (
+            node.current_commissioning_script_set.scriptresult_set.first())
+        script_result.status = SCRIPT_STATUS.RUNNING
+        script_result.save()
+        stdout, stderr = b'standard output', b'standard error'
+        payloads = [
+            self.make_payload(files=[{
+                "path": script_result.name + ".out",
+                "encoding": "base64",
+                "content": encode_as_base64(stdout),
+            }]),
+            self.make_payload(files=[{
+                "path": script_result.name + ".err",
+                "encoding": "base64",
+                "content": encode_as_base64(stderr),
+            }]),
+        ]
+        self.processMessageBatch(node, payloads)
+        script_result = reload_object(script_result)
+        self.assertEqual(stdout, script_result.stdout)
+        self.assertEqual(stderr, script_result.stderr)
+        self.assertEqual(SCRIPT_STATUS.PASSED, script_result.status)
+
+    def test_batch_applies_node_status_changes(self):
+        node = factory.make_Node(
+            interface=True, status=NODE_STATUS.COMMISSIONING)
+        payloads = [
+            self.make_payload(),
+            self.make_payload(
+                event_type='finish', result='FAILURE', origin='curtin',
+                name='commissioning'),
+        ]
+        self.processMessageBatch(node, payloads)
+        self.assertEqual(
+            NODE_STATUS.FAILED_COMMISSIONING, reload_object(node).status)
+
+    def test_batch_ignores_deleted_node(self):
+        node = factory.make_Node(status=NODE_STATUS.COMMISSIONING)
+        node.delete()
+        self.processMessageBatch(node, [self.make_payload()])
+        self.assertEqual(0, Event.objects.filter(node_id=node.id).count())
@@ -0,0 +1,417 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Native client for the OMAPI protocol spoken by the ISC DHCP server.
+
+This amends host maps inside a running DHCP server over a single, persistent
+connection, instead of forking an `omshell` process for each change. See
+`provisioningserver.dhcp.omshell.Omshell` for the subprocess-based client.
+"""
+
+__all__ = [
+    "OmapiClient",
+    "OmapiConnectionError",
+    "OmapiError",
+    "OmapiHostError",
+    ]
+
+import base64
+import binascii
+import hmac
+from itertools import count
+import random
+import socket
+import struct
+import threading
+
+from netaddr import IPAddress
+from provisioningserver.logger import get_maas_logger
+
+
+maaslog = get_maas_logger("dhcp.omapi")
+
+
+OMAPI_PROTOCOL_VERSION = 100
+OMAPI_HEADER_SIZE = 24
+
+OMAPI_OP_OPEN = 1
+OMAPI_OP_UPDATE = 3
+OMAPI_OP_STATUS = 5
+OMAPI_OP_DELETE = 6
+
+# The name and algorithm of the key in the DHCP server's configuration.
+OMAPI_KEY_NAME = b"omapi_key"
+OMAPI_KEY_ALGORITHM = b"hmac-md5.SIG-ALG.REG.INT."
+OMAPI_SIGNATURE_SIZE = 16
+
+
+class OmapiError(Exception):
+    """An error talking to the DHCP server over OMAPI."""
+
+
+class OmapiConnectionError(OmapiError):
+    """The OMAPI connection could not be established, or it failed."""
+
+
+class OmapiHostError(OmapiError):
+    """The DHCP server refused a change to a host map.
+
+    :ivar operation: One of "remove", "create", or "modify".
+    :ivar mac_address: The MAC address of the host map.
+    :ivar ip_address: The IP address of the host map, or `None` for removals.
+    """
+
+    def __init__(self, operation, mac_address, ip_address, message):
+        super(OmapiHostError, self).__init__(message)
+        self.operation = operation
+        self.mac_address = mac_address
+        self.ip_address = ip_address
+
+
+def pack_values(values):
+    """Pack a sequence of ``(name, value)`` byte string pairs."""
+    packed = [
+        struct.pack("!H", len(name)) + name +
+        struct.pack("!I", len(value)) + value
+        for name, value in values
+    ]
+    packed.append(b"\0\0")
+    return b"".join(packed)
+
+
+def read_values(read):
+    """Read ``(name, value)`` pairs, as packed by `pack_values`."""
+    values = []
+    while True:
+        name_length, = struct.unpack("!H", read(2))
+        if name_length == 0:
+            return values
+        name = read(name_length)
+        value_length, = struct.unpack("!I", read(4))
+        values.append((name, read(value_length)))
+
+
+class OmapiMessage:
+    """A message in the OMAPI protocol.
+
+    :ivar message: The ``(name, value)`` pairs that describe the message.
+    :ivar obj: The ``(name, value)`` pairs of the object it refers to.
+    """
+
+    def __init__(
+            self, opcode, handle=0, tid=0, rid=0, message=(), obj=(),
+            authid=0, signature=b""):
+        super(OmapiMessage, self).__init__()
+        self.opcode = opcode
+        self.handle = handle
+        self.tid = tid
+        self.rid = rid
+        self.message = list(message)
+        self.obj = list(obj)
+        self.authid = authid
+        self.signature = signature
+
+    def get_message_value(self, name, default=None):
+        return dict(self.message).get(name, default)
+
+    def pack_for_signing(self, authlen):
+        """Pack everything except the authenticator and the signature."""
+        return b"".join((
+            struct.pack(
+                "!IIIII", authlen, self.opcode, self.handle,
+                self.tid, self.rid),
+            pack_values(self.message),
+            pack_values(self.obj),
+        ))
+
+    def pack(self, key=None):
+        """Pack this message, signing it with `key` if one is given."""
+        if key is None:
+            self.signature = b""
+            body = self.pack_for_signing(0)
+        else:
+            body = self.pack_for_signing(OMAPI_SIGNATURE_SIZE)
+            self.signature = hmac.new(key, body, "md5").digest()
+        return struct.pack("!I", self.authid) + body + self.signature
+
+    @classmethod
+    def read(cls, read):
+        """Read a message using `read`, which returns exactly N bytes."""
+        authid, authlen, opcode, handle, tid, rid = struct.unpack(
+            "!IIIIII", read(OMAPI_HEADER_SIZE))
+        message = read_values(read)
+        obj = read_values(read)
+        signature = read(authlen)
+        return cls(
+            opcode, handle=handle, tid=tid, rid=rid, message=message,
+            obj=obj, authid=authid, signature=signature)
+
+    def verify(self, key):
+        """Return whether this message is signed correctly by `key`."""
+        expected = hmac.new(
+            key, self.pack_for_signing(len(self.signature)), "md5").digest()
+        return hmac.compare_digest(expected, self.signature)
+
+    def get_error(self):
+        """Return the error reported by this response, or `None`."""
+        if self.opcode != OMAPI_OP_STATUS:
+            return None
+        result = self.get_message_value(b"result")
+        if result is None or struct.unpack("!I", result)[0] == 0:
+            return None
+        text = self.get_message_value(b"message")
+        if text is None:
+            return "error %d" % struct.unpack("!I", result)
+        else:
+            return text.decode("utf-8", "replace")
+
+
+def make_host_values(mac_address, ip_address):
+    return [
+        (b"ip-address", IPAddress(ip_address).packed),
+        (b"hardware-address", bytes.fromhex(mac_address.replace(":", ""))),
+        (b"hardware-type", struct.pack("!I", 1)),
+    ]
+
+
+def make_host_name(mac_address):
+    # The "name" is an identifier used within the DHCP server; MAAS uses
+    # the MAC address, as described in `Omshell.create`.
+    return mac_address.replace(":", "-").encode("ascii")
+
+
+def make_flag(name):
+    return name, struct.pack("!I", 1)
+
+
+class OmapiClient:
+    """Amend host maps in the DHCP server over a persistent OMAPI connection.
+
+    The connection is established on first use and kept open between calls.
+    All the changes passed to `update_hosts` are pipelined over it, so the
+    cost of a change is a few bytes on the wire rather than a process.
+
+    :param server_address: The address for the DHCP server (ip or hostname)
+    :param shared_key: The base64-encoded HMAC-MD5 key that is configured
+        as ``omapi_key`` in the DHCP server; see `Omshell`.
+    """
+
+    # Seconds to wait for the DHCP server before giving up.
+    timeout = 30
+
+    # The maximum number of messages to have outstanding at once.
+    pipeline_depth = 100
+
+    def __init__(self, server_address, shared_key, ipv6=False):
+        super(OmapiClient, self).__init__()
+        self.server_address = server_address
+        self.shared_key = shared_key
+        self.ipv6 = ipv6
+        if ipv6 is True:
+            self.server_port = 7912
+        else:
+            self.server_port = 7911
+        self._key = None
+        self._lock = threading.Lock()
+        self._sock = None
+        self._rfile = None
+        self._authid = 0
+        self._tids = None
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def connect(self):
+        """Connect and authenticate to the DHCP server."""
+        self.close()
+        try:
+            self._key = base64.b64decode(self.shared_key, validate=True)
+        except (binascii.Error, TypeError) as error:
+            raise OmapiConnectionError(
+                "Invalid OMAPI key: %s" % error) from error
+        try:
+            self._sock = socket.create_connection(
+                (self.server_address, self.server_port), self.timeout)
+            self._rfile = self._sock.makefile("rb")
+            self._tids = count(random.randrange(1, 2 ** 31))
+            self._sock.sendall(struct.pack(
+                "!II", OMAPI_PROTOCOL_VERSION, OMAPI_HEADER_SIZE))
+            version, header_size = struct.unpack("!II", self._read(8))
+            if (version, header_size) != (
+                    OMAPI_PROTOCOL_VERSION, OMAPI_HEADER_SIZE):
+                raise OmapiConnectionError(
+                    "Unsupported OMAPI protocol version %d (header size "
+                    "%d)." % (version, header_size))
+            # Open an authenticator; every message after this one is signed
+            # with the key, and refers to it by its handle.
+            response, = self._exchange([OmapiMessage(
+                OMAPI_OP_OPEN,
+                message=[(b"type", b"authenticator")],
+                obj=[
+                    (b"name", OMAPI_KEY_NAME),
+                    (b"algorithm", OMAPI_KEY_ALGORITHM),
+                ])])
+            if response.opcode != OMAPI_OP_UPDATE or response.handle == 0:
+                raise OmapiConnectionError(
+                    "Could not authenticate to the DHCP server: %s" % (
+                        response.get_error() or "no authenticator"))
+            self._authid = response.handle
+        except OSError as error:
+            self.close()
+            raise OmapiConnectionError(str(error)) from error
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        """Close the connection to the DHCP server, if it's open."""
+        if self._rfile is not None:
+            self._rfile.close()
+            self._rfile = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self._authid = 0
+
+    def _read(self, size):
+        data = self._rfile.read(size)
+        if len(data) != size:
+            raise OmapiConnectionError(
+                "Connection to the DHCP server was closed.")
+        return data
+
+    def _exchange(self, messages):
+        """Send `messages` and return their responses, in the same order.
+
+        Up to `pipeline_depth` messages are written before waiting for the
+        responses, which the server sends back in order.
+        """
+        key = self._key if self._authid else None
+        responses = []
+        for start in range(0, len(messages), self.pipeline_depth):
+            batch = messages[start:start + self.pipeline_depth]
+            for message in batch:
+                message.tid = next(self._tids)
+                message.authid = self._authid
+            try:
+                self._sock.sendall(
+                    b"".join(message.pack(key) for message in batch))
+                pending = {message.tid: None for message in batch}
+                waiting = len(pending)
+                while waiting > 0:
+                    response = OmapiMessage.read(self._read)
+                    if key is not None and not response.verify(key):
+                        raise OmapiConnectionError(
+                            "Response from the DHCP server has an invalid "
+                            "signature.")
+                    if pending.get(response.rid, False) is None:
+                        pending[response.rid] = response
+                        waiting -= 1
+            except (OSError, struct.error) as error:
+                raise OmapiConnectionError(str(error)) from error
+            responses.extend(pending[message.tid] for message in batch)
+        return responses
+
+    def update_hosts(self, remove=(), create=(), modify=()):
+        """Remove, create, and modify host maps, in that order.
+
+        :param remove: MAC addresses of host maps to remove.
+        :param create: ``(mac_address, ip_address)`` pairs to create.
+        :param modify: ``(mac_address, ip_address)`` pairs to modify.
+        :raise OmapiConnectionError: If the DHCP server could not be reached.
+            Every change may be safely retried, with this client or with
+            `Omshell`: removing a missing host, or creating an existing one,
+            is not an error.
+        :raise OmapiHostError: For the first change refused by the server.
+        """
+        with self._lock:
+            reconnected = not self.connected
+            if reconnected:
+                self.connect()
+            try:
+                self._update_hosts(remove, create, modify)
+            except OmapiConnectionError:
+                self.close()
+                if reconnected:
+                    raise
+            else:
+                return
+            # The connection may have been closed by the DHCP server since it
+            # was last used, when it was restarted for example. Try again.
+            maaslog.debug("Reconnecting to the DHCP server over OMAPI.")
+            self.connect()
+            try:
+                self._update_hosts(remove, create, modify)
+            except OmapiConnectionError:
+                self.close()
+                raise
+
+    def _update_hosts(self, remove, create, modify):
+        remove, create, modify = list(remove), list(create), list(modify)
+        # Find the handles of the hosts to remove or modify.
+        lookups = self._exchange([
+            OmapiMessage(
+                OMAPI_OP_OPEN, message=[(b"type", b"host")],
+                obj=[(b"name", make_host_name(mac_address))])
+            for mac_address in remove + [
+                mac_address for mac_address, _ in modify]
+        ])
+        remove_lookups = lookups[:len(remove)]
+        modify_lookups = lookups[len(remove):]
+
+        errors = []
+        changes = []
+        for mac_address, lookup in zip(remove, remove_lookups):
+            error = lookup.get_error()
+            if error is None:
+                changes.append((
+                    "remove", mac_address, None,
+                    OmapiMessage(OMAPI_OP_DELETE, handle=lookup.handle)))
+            elif "not found" not in error:
+                errors.append(OmapiHostError(
+                    "remove", mac_address, None, error))
+            else:
+                # It was already removed. Consider success.
+                pass
+        for mac_address, ip_address in create:
+            changes.append((
+                "create", mac_address, ip_address,
+                OmapiMessage(
+                    OMAPI_OP_OPEN,
+                    message=[
+                        (b"type", b"host"),
+                        make_flag(b"create"),
+                        make_flag(b"exclusive"),
+                    ],
+                    obj=[(b"name", make_host_name(mac_address))] +
+                    make_host_values(mac_address, ip_address))))
+        for (mac_address, ip_address), lookup in zip(modify, modify_lookups):
+            error = lookup.get_error()
+            if error is None:
+                changes.append((
+                    "modify", mac_address, ip_address,
+                    OmapiMessage(
+                        OMAPI_OP_UPDATE, handle=lookup.handle,
+                        obj=make_host_values(mac_address, ip_address))))
+            else:
+                errors.append(OmapiHostError(
+                    "modify", mac_address, ip_address, error))
+
+        responses = self._exchange([change[-1] for change in changes])
+        for (operation, mac_address, ip_address, _), response in zip(
+                changes, responses):
+            error = response.get_error()
+            if error is None:
+                pass
+            elif operation == "create" and (
+                    "already exists" in error or "I/O error" in error):
+                # Host map already existed. Treat as success.
+                pass
+            else:
+                errors.append(OmapiHostError(
+                    operation, mac_address, ip_address, error))
+
+        if len(errors) > 0:
+            order = ["remove", "create", "modify"]
+            raise min(errors, key=lambda error: order.index(error.operation))
@@ -49,9 +49,10 @@ class TestDHCPNotify(MAASTestCase):
             sentinel.service, reactor)
         dv = DeferredValue()
 
-        def mock_processNotification(*args, **kwargs):
+        def mock_processNotificationBatch(*args, **kwargs):
             dv.set(args)
-        self.patch(service, "processNotification", mock_processNotification)
+        self.patch(
+            service, "processNotificationBatch", mock_processNotificationBatch)
 
         return socket_path, service, dv
 
@@ -81,7 +82,8 @@ class TestDHCPNotify(MAASTestCase):
         ])
         yield done.get(timeout=10)
 
-        self.assertThat(done.value[0], MatchesDict({
+        [notification] = done.value[0]
+        self.assertThat(notification, MatchesDict({
             "action": Equals(action),
             "mac": Equals(mac),
             "ip_family": Equals(ip_family),
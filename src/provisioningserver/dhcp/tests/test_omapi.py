@@ -0,0 +1,262 @@
+# Copyright 2017 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the omapi.py file."""
+
+__all__ = []
+
+import base64
+from itertools import count
+import os
+import socket
+import struct
+import threading
+
+from maastesting.factory import factory
+from maastesting.testcase import MAASTestCase
+from netaddr import IPAddress
+from provisioningserver.dhcp.omapi import (
+    OMAPI_HEADER_SIZE,
+    OMAPI_OP_DELETE,
+    OMAPI_OP_OPEN,
+    OMAPI_OP_STATUS,
+    OMAPI_OP_UPDATE,
+    OMAPI_PROTOCOL_VERSION,
+    OmapiClient,
+    OmapiConnectionError,
+    OmapiHostError,
+    OmapiMessage,
+)
+
+
+def make_status(result, message):
+    return OmapiMessage(OMAPI_OP_STATUS, message=[
+        (b"result", struct.pack("!I", result)),
+        (b"message", message.encode("ascii")),
+    ])
+
+
+class FakeOmapiServer(threading.Thread):
+    """A DHCP server that understands just enough OMAPI to manage hosts."""
+
+    def __init__(self, shared_key):
+        super(FakeOmapiServer, self).__init__(daemon=True)
+        self.key = base64.b64decode(shared_key)
+        self.hosts = {}
+        self.connections = 0
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+        self.connection = None
+        self.handles = count(1)
+
+    def stop(self):
+        if self.is_alive():
+            # Shutting down the listener wakes the blocked accept().
+            self.listener.shutdown(socket.SHUT_RDWR)
+            self.drop_connection()
+            self.join()
+        self.listener.close()
+
+    def drop_connection(self):
+        connection = self.connection
+        if connection is not None:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def run(self):
+        while True:
+            try:
+                self.connection, _ = self.listener.accept()
+            except OSError:
+                break
+            self.connections += 1
+            try:
+                self.serve(self.connection)
+            except (EOFError, OSError):
+                pass
+            finally:
+                self.connection.close()
+                self.connection = None
+
+    def serve(self, connection):
+        rfile = connection.makefile("rb")
+
+        def read(size):
+            data = rfile.read(size)
+            if len(data) != size:
+                raise EOFError()
+            return data
+
+        connection.sendall(struct.pack(
+            "!II", OMAPI_PROTOCOL_VERSION, OMAPI_HEADER_SIZE))
+        read(8)
+        authid = 0
+        objects = {}
+        while True:
+            message = OmapiMessage.read(read)
+            if authid != 0 and not message.verify(self.key):
+                # The ISC DHCP server drops the connection.
+                return
+            if message.opcode == OMAPI_OP_OPEN:
+                response = self.open(message, objects)
+            elif message.opcode == OMAPI_OP_UPDATE:
+                self.hosts[objects[message.handle]].update(message.obj)
+                response = OmapiMessage(
+                    OMAPI_OP_UPDATE, handle=message.handle)
+            elif message.opcode == OMAPI_OP_DELETE:
+                del self.hosts[objects.pop(message.handle)]
+                response = make_status(0, "success")
+            response.rid = message.tid
+            response.authid = authid
+            connection.sendall(response.pack(
+                None if authid == 0 else self.key))
+            if message.get_message_value(b"type") == b"authenticator":
+                authid = response.handle
+
+    def open(self, message, objects):
+        obj = dict(message.obj)
+        if message.get_message_value(b"type") == b"authenticator":
+            return OmapiMessage(OMAPI_OP_UPDATE, handle=next(self.handles))
+        name = obj[b"name"]
+        if message.get_message_value(b"create") is not None:
+            if name in self.hosts:
+                return make_status(18, "already exists")
+            self.hosts[name] = obj
+        elif name not in self.hosts:
+            return make_status(23, "not found")
+        handle = next(self.handles)
+        objects[handle] = name
+        return OmapiMessage(
+            OMAPI_OP_UPDATE, handle=handle, obj=self.hosts[name].items())
+
+
+class TestOmapiClient(MAASTestCase):
+
+    def setUp(self):
+        super(TestOmapiClient, self).setUp()
+        self.shared_key = base64.b64encode(os.urandom(64)).decode("ascii")
+        self.server = FakeOmapiServer(self.shared_key)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def make_client(self, shared_key=None):
+        if shared_key is None:
+            shared_key = self.shared_key
+        client = OmapiClient("127.0.0.1", shared_key)
+        client.server_port = self.server.port
+        self.addCleanup(client.close)
+        return client
+
+    def add_host(self, mac, ip):
+        name = mac.replace(":", "-").encode("ascii")
+        self.server.hosts[name] = {
+            b"name": name,
+            b"ip-address": IPAddress(ip).packed,
+        }
+        return name
+
+    def test_initialisation(self):
+        client = OmapiClient("127.0.0.1", self.shared_key, ipv6=True)
+        self.assertEqual(7912, client.server_port)
+        self.assertFalse(client.connected)
+
+    def test_update_hosts_creates_host(self):
+        client = self.make_client()
+        mac = factory.make_mac_address()
+        ip = factory.make_ipv4_address()
+        client.update_hosts(create=[(mac, ip)])
+        name = mac.replace(":", "-").encode("ascii")
+        self.assertEqual({
+            b"name": name,
+            b"ip-address": IPAddress(ip).packed,
+            b"hardware-address": bytes.fromhex(mac.replace(":", "")),
+            b"hardware-type": struct.pack("!I", 1),
+        }, self.server.hosts[name])
+
+    def test_update_hosts_ignores_existing_host_on_create(self):
+        client = self.make_client()
+        mac = factory.make_mac_address()
+        self.add_host(mac, factory.make_ipv4_address())
+        client.update_hosts(create=[(mac, factory.make_ipv4_address())])
+
+    def test_update_hosts_removes_host(self):
+        client = self.make_client()
+        mac = factory.make_mac_address()
+        self.add_host(mac, factory.make_ipv4_address())
+        client.update_hosts(remove=[mac])
+        self.assertEqual({}, self.server.hosts)
+
+    def test_update_hosts_ignores_missing_host_on_remove(self):
+        client = self.make_client()
+        client.update_hosts(remove=[factory.make_mac_address()])
+
+    def test_update_hosts_modifies_host(self):
+        client = self.make_client()
+        mac = factory.make_mac_address()
+        ip = factory.make_ipv4_address()
+        name = self.add_host(mac, factory.make_ipv4_address())
+        client.update_hosts(modify=[(mac, ip)])
+        self.assertEqual(
+            IPAddress(ip).packed, self.server.hosts[name][b"ip-address"])
+
+    def test_update_hosts_raises_for_missing_host_on_modify(self):
+        client = self.make_client()
+        mac = factory.make_mac_address()
+        ip = factory.make_ipv4_address()
+        error = self.assertRaises(
+            OmapiHostError, client.update_hosts, modify=[(mac, ip)])
+        self.assertEqual(
+            ("modify", mac, ip, "not found"),
+            (error.operation, error.mac_address, error.ip_address,
+             str(error)))
+
+    def test_update_hosts_pipelines_over_one_connection(self):
+        client = self.make_client()
+        client.pipeline_depth = 7
+        hosts = [
+            (factory.make_mac_address(), factory.make_ipv4_address())
+            for _ in range(20)
+        ]
+        client.update_hosts(create=hosts)
+        client.update_hosts(remove=[mac for mac, _ in hosts[:10]])
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual(
+            {mac.replace(":", "-").encode("ascii") for mac, _ in hosts[10:]},
+            set(self.server.hosts))
+
+    def test_update_hosts_reconnects_when_connection_is_dropped(self):
+        client = self.make_client()
+        mac = factory.make_mac_address()
+        ip = factory.make_ipv4_address()
+        client.update_hosts(create=[(mac, ip)])
+        self.server.drop_connection()
+        client.update_hosts(remove=[mac])
+        self.assertEqual(2, self.server.connections)
+        self.assertEqual({}, self.server.hosts)
+
+    def test_update_hosts_raises_when_server_unreachable(self):
+        client = self.make_client()
+        self.server.stop()
+        self.assertRaises(
+            OmapiConnectionError, client.update_hosts,
+            create=[(factory.make_mac_address(), "10.0.0.1")])
+        self.assertFalse(client.connected)
+
+    def test_update_hosts_raises_when_key_is_wrong(self):
+        shared_key = base64.b64encode(os.urandom(64)).decode("ascii")
+        client = self.make_client(shared_key)
+        self.assertRaises(
+            OmapiConnectionError, client.update_hosts,
+            create=[(factory.make_mac_address(), "10.0.0.1")])
+        self.assertEqual({}, self.server.hosts)
+
+    def test_update_hosts_raises_when_key_is_invalid(self):
+        client = self.make_client("not base64!")
+        self.assertRaises(
+            OmapiConnectionError, client.update_hosts,
+            remove=[factory.make_mac_address()])
+        self.assertEqual(0, self.server.connections)
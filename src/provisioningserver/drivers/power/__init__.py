@@ -274,6 +274,10 @@ class PowerDriver(PowerDriverBase):
     wait_time = DEFAULT_WAITING_POLICY
     queryable = True
 
+    # Maximum number of nodes using this driver that the power monitor will
+    # query at the same time.
+    query_concurrency = 5
+
     def __init__(self, clock=reactor):
         self.clock = reactor
 
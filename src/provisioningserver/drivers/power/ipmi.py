@@ -177,6 +177,7 @@ class IPMIPowerDriver(PowerDriver):
     ]
     ip_extractor = make_ip_extractor('power_address')
     wait_time = (4, 8, 16, 32)
+    query_concurrency = 20
 
     def detect_missing_packages(self):
         if not shell.has_command_available('ipmipower'):
@@ -45,6 +45,8 @@ class VirshPowerDriver(PowerDriver):
     ]
     ip_extractor = make_ip_extractor(
         'power_address', IP_EXTRACTOR_PATTERNS.URL)
+    # Each query opens an SSH session to the hypervisor.
+    query_concurrency = 2
 
     def detect_missing_packages(self):
         missing_packages = set()
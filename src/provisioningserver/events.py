@@ -11,7 +11,10 @@ __all__ = [
     'send_rack_event',
     ]
 
-from collections import namedtuple
+from collections import (
+    deque,
+    namedtuple,
+)
 from logging import (
     DEBUG,
     ERROR,
@@ -25,6 +28,7 @@ from provisioningserver.logger import (
 )
 from provisioningserver.rpc import getRegionClient
 from provisioningserver.rpc.exceptions import (
+    NoConnectionsAvailable,
     NoSuchEventType,
     NoSuchNode,
 )
@@ -32,6 +36,7 @@ from provisioningserver.rpc.region import (
     RegisterEventType,
     SendEvent,
     SendEventMACAddress,
+    SendEvents,
 )
 from provisioningserver.utils.env import get_maas_id
 from provisioningserver.utils.twisted import (
@@ -41,15 +46,38 @@ from provisioningserver.utils.twisted import (
     FOREVER,
     suppress,
 )
+from twisted.internet import reactor
 from twisted.internet.defer import (
+    Deferred,
+    DeferredList,
+    inlineCallbacks,
     maybeDeferred,
+    returnValue,
     succeed,
 )
+from twisted.internet.error import ConnectionClosed
+from twisted.protocols.amp import UnhandledCommand
+from twisted.python.failure import Failure
 
 
 maaslog = get_maas_logger("events")
 log = LegacyLogger()
 
+# The most events sent to the region in one `SendEvents` call.
+EVENT_BATCH_SIZE = 100
+
+# AMP limits each value to 0xffff bytes, so keep the encoded `events` in
+# each `SendEvents` call comfortably below that.
+EVENT_BATCH_LIMIT = 60 * (2 ** 10)  # 60kiB
+
+# Seconds to wait before sending events again when the region did not
+# acknowledge them, e.g. because there was no connection to the region.
+EVENT_RETRY_DELAY = 5.0
+
+# The most events kept while the region cannot be reached. When there are
+# more, the oldest events are dropped.
+EVENT_BUFFER_SIZE = 10000
+
 
 class EVENT_TYPES:
     # Power-related events.
@@ -336,12 +364,25 @@ class NodeEventHub:
 
     This automatically ensures that the event type is registered before
     sending logs to the region.
+
+    Events are sent in batches with `SendEvents`. Only one batch is in
+    progress at a time; events logged meanwhile are queued, and sent
+    together once it completes. Events that the region does not
+    acknowledge are kept and sent again later, so they are not lost while
+    the rack is disconnected from the region.
     """
 
-    def __init__(self):
+    def __init__(self, clock=reactor):
         super(NodeEventHub, self).__init__()
         self._types_registering = dict()
         self._types_registered = set()
+        # Events waiting to be sent, as (event, waiter) pairs. The waiter is
+        # None once it has been told that sending the event failed.
+        self._events = deque()
+        self._events_dropped = 0
+        self._sending = False
+        self._retry = None
+        self.clock = clock
 
     @asynchronous
     def registerEventType(self, event_type):
@@ -427,13 +468,12 @@ class NodeEventHub:
         :param description: An optional description of the event.
         :type description: unicode
         """
-        def send(_):
-            client = getRegionClient()
-            return client(
-                SendEvent, system_id=system_id, type_name=event_type,
-                description=description)
-
-        d = self.ensureEventTypeRegistered(event_type).addCallback(send)
+        event = {
+            "system_id": system_id, "type_name": event_type,
+            "description": description,
+        }
+        d = self.ensureEventTypeRegistered(event_type)
+        d.addCallback(lambda _: self._queueEvent(event))
         d.addErrback(self._checkEventTypeRegistered, event_type)
         return d
 
@@ -450,13 +490,12 @@ class NodeEventHub:
         :param description: An optional description of the event.
         :type description: unicode
         """
-        def send(_):
-            client = getRegionClient()
-            return client(
-                SendEventMACAddress, mac_address=mac_address,
-                type_name=event_type, description=description)
-
-        d = self.ensureEventTypeRegistered(event_type).addCallback(send)
+        event = {
+            "mac_address": mac_address, "type_name": event_type,
+            "description": description,
+        }
+        d = self.ensureEventTypeRegistered(event_type)
+        d.addCallback(lambda _: self._queueEvent(event))
         d.addErrback(self._checkEventTypeRegistered, event_type)
 
         # Suppress NoSuchNode. This happens during enlistment because the
@@ -468,6 +507,154 @@ class NodeEventHub:
 
         return d
 
+    def _queueEvent(self, event):
+        """Queue `event` to be sent to the region.
+
+        The event is stamped with the time it was queued, so that it is
+        recorded with that time however long it waits to be sent.
+
+        :return: A `Deferred` that fires once the region has the event, or
+            fails if the first attempt to send it fails.
+        """
+        event["timestamp"] = self.clock.seconds()
+        d = Deferred()
+        self._events.append((event, d))
+        self._dropOldestEvents()
+        if not self._sending and self._retry is None:
+            self._sendEvents()
+        return d
+
+    def _dropOldestEvents(self):
+        """Drop the oldest events until there are `EVENT_BUFFER_SIZE`."""
+        while len(self._events) > EVENT_BUFFER_SIZE:
+            if self._events_dropped == 0:
+                maaslog.warning(
+                    "Too many events are waiting to be sent to the region; "
+                    "dropping the oldest.")
+            self._events_dropped += 1
+            _, waiter = self._events.popleft()
+            if waiter is not None:
+                waiter.cancel()
+
+    def _takeBatch(self, count):
+        """Take up to `count` events, within `EVENT_BATCH_LIMIT`, to send.
+
+        At least one event is taken, however large it is.
+        """
+        batch, size = [], 0
+        while len(self._events) > 0 and len(batch) < count:
+            length = get_encoded_size(self._events[0][0])
+            if len(batch) != 0 and size + length > EVENT_BATCH_LIMIT:
+                break
+            batch.append(self._events.popleft())
+            size += length
+        return batch
+
+    @inlineCallbacks
+    def _sendEvents(self):
+        """Send batches of events until none remain, or sending fails.
+
+        When the region cannot take a batch for a reason other than a lost
+        connection, its events are sent again in smaller batches; an event
+        that the region cannot take on its own is dropped.
+        """
+        self._sending = True
+        count = EVENT_BATCH_SIZE
+        try:
+            while len(self._events) > 0:
+                batch = self._takeBatch(count)
+                try:
+                    sent = yield self._sendBatch(batch)
+                except Exception:
+                    if len(batch) == 1:
+                        log.err(None, "Region could not take an event.")
+                        self._fire(Failure(), batch[0][1])
+                    else:
+                        self._events.extendleft(reversed(batch))
+                        count = len(batch) // 2
+                    continue
+                count = EVENT_BATCH_SIZE
+                if not sent:
+                    # Put the events back, in order, to send them again.
+                    self._events.extendleft(
+                        (event, None) for event, _ in reversed(batch))
+                    self._dropOldestEvents()
+                    self._retry = self.clock.callLater(
+                        EVENT_RETRY_DELAY, self._retryEvents)
+                    break
+        finally:
+            self._sending = False
+
+    def _retryEvents(self):
+        self._retry = None
+        if not self._sending:
+            self._sendEvents()
+
+    @inlineCallbacks
+    def _sendBatch(self, batch):
+        """Send `batch`, a list of (event, waiter) pairs, to the region.
+
+        :return: A `Deferred` that fires with `False` if there is no
+            connection to the region to take the events, else `True`. It
+            fails, without firing the waiters, if the region could not take
+            the events for some other reason.
+        """
+        try:
+            client = getRegionClient()
+            response = yield client(
+                SendEvents, events=[event for event, _ in batch])
+        except UnhandledCommand:
+            # The region is older than this rack and cannot take a batch of
+            # events; send each of them separately.
+            yield DeferredList([
+                self._sendEvent(client, event).addBoth(self._fire, waiter)
+                for event, waiter in batch
+            ])
+        except (NoConnectionsAvailable, ConnectionClosed):
+            failure = Failure()
+            for _, waiter in batch:
+                self._fire(failure, waiter)
+            returnValue(False)
+        else:
+            if self._events_dropped != 0:
+                maaslog.warning(
+                    "Dropped %d event(s) that could not be sent to the "
+                    "region.", self._events_dropped)
+                self._events_dropped = 0
+            for _, waiter in batch:
+                self._fire(response, waiter)
+        returnValue(True)
+
+    def _sendEvent(self, client, event):
+        # `SendEvent` and `SendEventMACAddress` do not take a timestamp.
+        event = {
+            key: value for key, value in event.items()
+            if key != "timestamp"
+        }
+        if "system_id" in event:
+            return client(SendEvent, **event)
+        else:
+            return client(SendEventMACAddress, **event)
+
+    def _fire(self, result, waiter):
+        if waiter is None:
+            pass  # Already told about a failure.
+        elif isinstance(result, Failure):
+            waiter.errback(result)
+        else:
+            waiter.callback(result)
+
+
+def get_encoded_size(event):
+    """Return the number of bytes `event` takes in the `SendEvents` call.
+
+    Each key and value is preceded by its 2-byte length, and the event ends
+    with a 2-byte terminator. The timestamp is sent as its `str`.
+    """
+    return 2 + sum(
+        4 + len(key.encode("utf-8")) + len(str(value).encode("utf-8"))
+        for key, value in event.items())
+
 
 # Singleton.
 nodeEventHub = NodeEventHub()
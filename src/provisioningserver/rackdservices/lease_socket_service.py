@@ -7,14 +7,23 @@ __all__ = [
     "LeaseSocketService",
     ]
 
-from collections import deque
+from collections import (
+    deque,
+    OrderedDict,
+)
 import json
 import os
 
-from provisioningserver.logger import get_maas_logger
+from provisioningserver.logger import (
+    get_maas_logger,
+    LegacyLogger,
+)
 from provisioningserver.path import get_data_path
 from provisioningserver.rpc.exceptions import NoConnectionsAvailable
-from provisioningserver.rpc.region import UpdateLease
+from provisioningserver.rpc.region import (
+    UpdateLease,
+    UpdateLeases,
+)
 from provisioningserver.utils.twisted import (
     pause,
     retries,
@@ -24,11 +33,21 @@ from twisted.internet import (
     reactor,
     task,
 )
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import (
+    inlineCallbacks,
+    maybeDeferred,
+    returnValue,
+)
 from twisted.internet.protocol import DatagramProtocol
+from twisted.protocols.amp import UnhandledCommand
 
 
 maaslog = get_maas_logger("lease_socket_service")
+log = LegacyLogger()
+
+# AMP limits each value to 0xffff bytes, so keep the encoded `updates` in
+# each `UpdateLeases` call comfortably below that.
+BATCH_LIMIT = 60 * (2 ** 10)  # 60kiB
 
 
 def get_socket_path():
@@ -36,6 +55,47 @@ def get_socket_path():
     return os.path.join(get_data_path("/var/lib/maas"), "dhcpd.sock")
 
 
+def coalesce_notifications(notifications):
+    """Return `notifications` keeping only the last one for each MAC/IP.
+
+    A burst of lease events for the same MAC/IP pair (commit, release,
+    commit again...) only needs its final state sent to the region. MAC
+    addresses are compared without regard to case, as the region does. The
+    result is ordered by the position of the last notification for each
+    pair.
+    """
+    coalesced = OrderedDict()
+    for notification in notifications:
+        mac = notification.get("mac")
+        if mac is not None:
+            mac = mac.lower()
+        key = (mac, notification.get("ip"))
+        coalesced.pop(key, None)
+        coalesced[key] = notification
+    return list(coalesced.values())
+
+
+def split_notifications(notifications, limit=BATCH_LIMIT):
+    """Yield lists of `notifications` whose JSON dump fits within `limit`.
+
+    The JSON dump of a notification is at least as long as its encoding in
+    an `AmpList`, so this is a conservative measure of each batch. Every
+    batch holds at least one notification, and the order is preserved.
+    """
+    batch, size = [], 2  # Brackets.
+    for notification in notifications:
+        # There is a delimiter between this and the preceding element;
+        # json.dumps(), by default, uses ", ", i.e. 2 characters.
+        length = len(json.dumps(notification)) + 2
+        if len(batch) != 0 and size + length > limit:
+            yield batch
+            batch, size = [], 2
+        batch.append(notification)
+        size += length
+    if len(batch) != 0:
+        yield batch
+
+
 class LeaseSocketService(Service, DatagramProtocol):
     """Service for recieving lease information over MAAS dhcpd.sock."""
 
@@ -91,33 +151,78 @@ class LeaseSocketService(Service, DatagramProtocol):
         # notifications will still be sent.
         self.notifications.append(notification)
 
+    @inlineCallbacks
     def processNotifications(self, clock=reactor):
-        """Process all notifications."""
-        def gen_notifications(notifications):
-            while len(notifications) != 0:
-                yield notifications.popleft()
-        return task.coiterate(
-            self.processNotification(notification, clock=clock)
-            for notification in gen_notifications(self.notifications))
+        """Process all notifications.
+
+        Every notification queued since the last run is coalesced and sent
+        to the region in batches that fit within an AMP value. When a batch
+        cannot be sent, it and every batch after it are put back at the
+        front of the queue to be sent on the next run; this never fails, so
+        the looping call keeps running.
+        """
+        notifications = []
+        while len(self.notifications) != 0:
+            notifications.append(self.notifications.popleft())
+        notifications = coalesce_notifications(notifications)
+        batches = list(split_notifications(notifications))
+        for index, batch in enumerate(batches):
+            try:
+                yield maybeDeferred(
+                    self.processNotificationBatch, batch, clock=clock)
+            except NoConnectionsAvailable:
+                pass  # Already logged by getClient.
+            except Exception:
+                log.err(None, "Failed to send DHCP lease information.")
+            else:
+                continue
+            self.notifications.extendleft(reversed([
+                notification for unsent in batches[index:]
+                for notification in unsent
+            ]))
+            break
 
     @inlineCallbacks
-    def processNotification(self, notification, clock=reactor):
-        """Send a notification to the region."""
-        client = None
+    def getClient(self, clock=reactor):
+        """Return a client to the region, or `None` if none is available."""
         for elapsed, remaining, wait in retries(30, 10, clock):
             try:
                 client = yield self.client_service.getClientNow()
-                break
             except NoConnectionsAvailable:
-                yield pause(wait, self.clock)
-        else:
-            maaslog.error(
-                "Can't send DHCP lease information, no RPC "
-                "connection to region.")
-            return
-
-        # Notification contains all the required data except for the cluster
-        # UUID. Add that into the notification and send the information to
-        # the region for processing.
-        notification["cluster_uuid"] = client.localIdent
-        yield client(UpdateLease, **notification)
+                yield pause(wait, clock)
+            else:
+                returnValue(client)
+        maaslog.error(
+            "Can't send DHCP lease information, no RPC "
+            "connection to region.")
+        returnValue(None)
+
+    @inlineCallbacks
+    def processNotificationBatch(self, notifications, clock=reactor):
+        """Send a batch of notifications to the region.
+
+        Falls back to sending each notification with `UpdateLease` when the
+        region does not support `UpdateLeases`.
+
+        :raise NoConnectionsAvailable: When there is no connection to the
+            region over which to send the batch.
+        """
+        client = yield self.getClient(clock)
+        if client is None:
+            raise NoConnectionsAvailable()
+
+        updates = [
+            {key: value for key, value in notification.items()
+             if value is not None}
+            for notification in notifications
+        ]
+        try:
+            yield client(
+                UpdateLeases, cluster_uuid=client.localIdent,
+                updates=updates)
+        except UnhandledCommand:
+            # Region has not been upgraded to support the batch call, send
+            # the notifications one at a time over the same connection.
+            for update in updates:
+                yield client(
+                    UpdateLease, cluster_uuid=client.localIdent, **update)
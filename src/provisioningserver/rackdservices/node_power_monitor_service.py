@@ -10,6 +10,7 @@ __all__ = [
 
 from datetime import timedelta
 
+from provisioningserver.drivers.power.registry import PowerDriverRegistry
 from provisioningserver.logger import (
     get_maas_logger,
     LegacyLogger,
@@ -19,10 +20,17 @@ from provisioningserver.rpc.exceptions import (
     NoConnectionsAvailable,
     NoSuchCluster,
 )
-from provisioningserver.rpc.power import query_all_nodes
+from provisioningserver.rpc.power import (
+    power_action_registry,
+    query_node,
+)
 from provisioningserver.rpc.region import ListNodePowerParameters
 from twisted.application.internet import TimerService
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet import reactor
+from twisted.internet.defer import (
+    DeferredSemaphore,
+    inlineCallbacks,
+)
 from twisted.internet.error import ConnectionDone
 
 
@@ -30,17 +38,71 @@ maaslog = get_maas_logger("power_monitor_service")
 log = LegacyLogger()
 
 
+class MonitoredNode:
+    """The cached power parameters and query schedule of a node.
+
+    :ivar node: The power parameters, as returned by the region.
+    :ivar refreshed: When the region last sent the power parameters.
+    :ivar next_query: When the power state should next be queried.
+    :ivar interval: Seconds between queries while the power state is stable.
+    :ivar query: The `Deferred` of the query in progress, if any.
+    """
+
+    def __init__(self, node, now, interval):
+        super(MonitoredNode, self).__init__()
+        self.node = node
+        self.refreshed = now
+        self.next_query = now
+        self.interval = interval
+        self.query = None
+
+    def refresh(self, node, now, interval):
+        """Update the power parameters with those from the region."""
+        self.refreshed = now
+        changed = (
+            node['power_type'] != self.node['power_type'] or
+            node['context'] != self.node['context'])
+        # Keep the most recently queried power state; the region may not
+        # have processed it yet.
+        node['power_state'] = self.node['power_state']
+        self.node = node
+        if changed:
+            # New power parameters; query with them as soon as possible.
+            self.next_query = now
+            self.interval = interval
+
+
 class NodePowerMonitorService(TimerService, object):
-    """Service to monitor the power status of all nodes in this cluster."""
+    """Service to monitor the power status of all nodes in this cluster.
+
+    The power parameters the region hands out are cached, and each node is
+    queried on its own schedule. A node whose power state is changing is
+    queried every `check_interval`; while its power state is stable the
+    interval doubles after each query, up to `max_query_interval`. The
+    number of queries in progress at once is limited per power driver by
+    its `query_concurrency`.
+    """
 
     check_interval = timedelta(seconds=15).total_seconds()
-    max_nodes_at_once = 5
+    max_query_interval = timedelta(minutes=5).total_seconds()
+
+    # Power parameters the region has not handed out again within this time
+    # are dropped, e.g. the node was deleted or is monitored by another rack.
+    cache_expiry = timedelta(minutes=15).total_seconds()
 
     def __init__(self, clock=None):
         # Call self.query_nodes() every self.check_interval.
         super(NodePowerMonitorService, self).__init__(
             self.check_interval, self.try_query_nodes)
         self.clock = clock
+        self.nodes = {}
+        self.semaphores = {}
+
+    def _getClock(self):
+        if self.clock is None:
+            return reactor
+        else:
+            return self.clock
 
     def try_query_nodes(self):
         """Attempt to query nodes' power states.
@@ -60,18 +122,91 @@ class NodePowerMonitorService(TimerService, object):
 
     @inlineCallbacks
     def query_nodes(self, client):
+        """Refresh the cached power parameters then query the nodes that are
+        due to be queried.
+
+        This does not wait for the queries to complete; a slow power driver
+        must not hold up the queries of other nodes.
+        """
         # Get the nodes' power parameters from the region. Keep getting more
         # power parameters until the region returns an empty list.
+        clock = self._getClock()
         while True:
             response = yield client(
                 ListNodePowerParameters, uuid=client.localIdent)
             power_parameters = response['nodes']
             if len(power_parameters) > 0:
-                yield query_all_nodes(
-                    power_parameters, max_concurrency=self.max_nodes_at_once,
-                    clock=self.clock)
+                self.update_nodes(power_parameters, clock.seconds())
             else:
                 break
+        self.query_due_nodes()
+
+    def update_nodes(self, power_parameters, now):
+        """Cache the `power_parameters` received from the region."""
+        for node in power_parameters:
+            monitored = self.nodes.get(node['system_id'])
+            if monitored is None:
+                self.nodes[node['system_id']] = MonitoredNode(
+                    node, now, self.check_interval)
+            else:
+                monitored.refresh(node, now, self.check_interval)
+
+    def query_due_nodes(self):
+        """Start querying the power state of nodes that are due."""
+        clock = self._getClock()
+        now = clock.seconds()
+        for system_id, monitored in list(self.nodes.items()):
+            if now - monitored.refreshed >= self.cache_expiry:
+                del self.nodes[system_id]
+            elif monitored.query is not None or monitored.next_query > now:
+                continue
+            elif system_id in power_action_registry:
+                # The power state is being changed; check back soon.
+                monitored.interval = self.check_interval
+                monitored.next_query = now + self.check_interval
+            else:
+                self.query_node(monitored, clock)
+
+    def getQuerySemaphore(self, power_type):
+        """Return the semaphore limiting queries for `power_type`."""
+        semaphore = self.semaphores.get(power_type)
+        if semaphore is None:
+            driver = PowerDriverRegistry.get_item(power_type)
+            semaphore = DeferredSemaphore(tokens=driver.query_concurrency)
+            self.semaphores[power_type] = semaphore
+        return semaphore
+
+    def query_node(self, monitored, clock):
+        """Query the power state of `monitored` and schedule the next query.
+
+        :type monitored: `MonitoredNode`
+        """
+        power_type = monitored.node['power_type']
+        if power_type not in PowerDriverRegistry:
+            # This rack cannot query the node; don't keep trying.
+            monitored.next_query = clock.seconds() + self.max_query_interval
+            return None
+
+        def schedule(power_state):
+            # `query_node` reports and consumes failures, returning None.
+            monitored.query = None
+            previous_state = monitored.node['power_state']
+            if power_state is not None and power_state != previous_state:
+                monitored.node['power_state'] = power_state
+                monitored.interval = self.check_interval
+            else:
+                monitored.interval = min(
+                    monitored.interval * 2, self.max_query_interval)
+            monitored.next_query = clock.seconds() + monitored.interval
+
+        semaphore = self.getQuerySemaphore(power_type)
+        d = monitored.query = semaphore.run(
+            query_node, monitored.node, clock)
+        d.addErrback(
+            log.err, "Failed to query power state of %s." % (
+                monitored.node['hostname']))
+        d.addCallback(schedule)
+        return d
 
     def query_nodes_failed(self, failure, localIdent):
         if failure.check(NoSuchCluster):
@@ -10,22 +10,33 @@ import os
 import socket
 import time
 from unittest.mock import (
+    call,
     MagicMock,
     sentinel,
 )
 
 from maastesting.factory import factory
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockCallsMatch,
+)
 from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
 )
+from maastesting.twisted import extract_result
 from provisioningserver.rackdservices import lease_socket_service
 from provisioningserver.rackdservices.lease_socket_service import (
+    coalesce_notifications,
     LeaseSocketService,
+    split_notifications,
 )
 from provisioningserver.rpc import getRegionClient
-from provisioningserver.rpc.region import UpdateLease
+from provisioningserver.rpc.exceptions import NoConnectionsAvailable
+from provisioningserver.rpc.region import (
+    UpdateLease,
+    UpdateLeases,
+)
 from provisioningserver.rpc.testing import MockLiveClusterToRegionRPCFixture
 from provisioningserver.utils.twisted import (
     DeferredValue,
@@ -43,6 +54,10 @@ from twisted.internet import (
 )
 from twisted.internet.protocol import DatagramProtocol
 from twisted.internet.threads import deferToThread
+from twisted.protocols.amp import (
+    TooLong,
+    UnhandledCommand,
+)
 
 
 class TestLeaseSocketService(MAASTestCase):
@@ -56,11 +71,6 @@ class TestLeaseSocketService(MAASTestCase):
             lease_socket_service, "get_socket_path").return_value = socket_path
         return socket_path
 
-    def patch_rpc_UpdateLease(self):
-        fixture = self.useFixture(MockLiveClusterToRegionRPCFixture())
-        protocol, connecting = fixture.makeEventLoop(UpdateLease)
-        return protocol, connecting
-
     def send_notification(self, socket_path, payload):
         conn = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
         conn.connect(socket_path)
@@ -128,16 +138,18 @@ class TestLeaseSocketService(MAASTestCase):
         self.assertEquals([packet], list(service.notifications))
 
     @defer.inlineCallbacks
-    def test_processNotification_gets_called_with_notification(self):
+    def test_processNotificationBatch_gets_called_with_notification(self):
         socket_path = self.patch_socket_path()
         service = LeaseSocketService(
             sentinel.service, reactor)
         dv = DeferredValue()
 
-        # Mock processNotifcation to catch the call.
-        def mock_processNotification(*args, **kwargs):
+        # Mock processNotificationBatch to catch the call.
+        def mock_processNotificationBatch(*args, **kwargs):
             dv.set(args)
-        self.patch(service, "processNotification", mock_processNotification)
+        self.patch(
+            service, "processNotificationBatch",
+            mock_processNotificationBatch)
 
         # Start the service and stop it at the end of the test.
         service.startService()
@@ -152,26 +164,25 @@ class TestLeaseSocketService(MAASTestCase):
         yield deferToThread(self.send_notification, socket_path, packet)
         yield dv.get(timeout=10)
 
-        # Packet should be the argument passed to processNotifcation
-        self.assertEquals((packet,), dv.value)
+        # Packet should be in the batch passed to processNotificationBatch.
+        self.assertEquals(([packet],), dv.value)
 
     @defer.inlineCallbacks
-    def test_processNotification_gets_called_multiple_times(self):
+    def test_processNotificationBatch_receives_notifications_in_order(self):
         socket_path = self.patch_socket_path()
         service = LeaseSocketService(
             sentinel.service, reactor)
-        dvs = [
-            DeferredValue(),
-            DeferredValue(),
-        ]
+        received = []
+        dv = DeferredValue()
 
-        # Mock processNotifcation to catch the call.
-        def mock_processNotification(*args, **kwargs):
-            for dv in dvs:
-                if not dv.isSet:
-                    dv.set(args)
-                    break
-        self.patch(service, "processNotification", mock_processNotification)
+        # Mock processNotificationBatch to catch the calls.
+        def mock_processNotificationBatch(notifications, **kwargs):
+            received.extend(notifications)
+            if len(received) == 2:
+                dv.set(None)
+        self.patch(
+            service, "processNotificationBatch",
+            mock_processNotificationBatch)
 
         # Start the service and stop it at the end of the test.
         service.startService()
@@ -179,26 +190,118 @@ class TestLeaseSocketService(MAASTestCase):
 
         # Create test payload to send.
         packet1 = {
-            "test1": factory.make_name("test1")
+            "mac": factory.make_mac_address(),
+            "ip": factory.make_ipv4_address(),
         }
         packet2 = {
-            "test2": factory.make_name("test2")
+            "mac": factory.make_mac_address(),
+            "ip": factory.make_ipv4_address(),
         }
 
         # Send notifications to the socket and wait for notifications.
         yield deferToThread(self.send_notification, socket_path, packet1)
         yield deferToThread(self.send_notification, socket_path, packet2)
-        yield dvs[0].get(timeout=10)
-        yield dvs[1].get(timeout=10)
+        yield dv.get(timeout=10)
 
-        # Packet should be the argument passed to processNotification in
-        # order.
-        self.assertEquals((packet1,), dvs[0].value)
-        self.assertEquals((packet2,), dvs[1].value)
+        # Packets should be passed to processNotificationBatch in order.
+        self.assertEquals([packet1, packet2], received)
+
+    def test_processNotifications_coalesces_by_mac_and_ip(self):
+        service = LeaseSocketService(
+            sentinel.service, reactor)
+        process = self.patch(service, "processNotificationBatch")
+        mac = factory.make_mac_address()
+        ip = factory.make_ipv4_address()
+        other = {"action": "commit", "mac": mac,
+                 "ip": factory.make_ipv4_address()}
+        service.notifications.extend([
+            {"action": "commit", "mac": mac, "ip": ip},
+            other,
+            {"action": "release", "mac": mac, "ip": ip},
+        ])
+        service.processNotifications(clock=reactor)
+        self.assertThat(
+            process, MockCalledOnceWith(
+                [other, {"action": "release", "mac": mac, "ip": ip}],
+                clock=reactor))
+        self.assertEquals(0, len(service.notifications))
+
+    def test_coalesce_notifications_ignores_case_of_mac(self):
+        mac = factory.make_mac_address()
+        ip = factory.make_ipv4_address()
+        release = {"action": "release", "mac": mac.upper(), "ip": ip}
+        self.assertEquals([release], coalesce_notifications([
+            {"action": "commit", "mac": mac.lower(), "ip": ip}, release]))
+
+    def test_processNotifications_sends_batches_within_limit(self):
+        service = LeaseSocketService(
+            sentinel.service, reactor)
+        process = self.patch(service, "processNotificationBatch")
+        notifications = [
+            {"action": "commit", "mac": factory.make_mac_address(),
+             "ip": "10.0.%d.%d" % divmod(index, 256)}
+            for index in range(2000)
+        ]
+        service.notifications.extend(notifications)
+        service.processNotifications(clock=reactor)
+        batches = [args[0] for args, _ in process.call_args_list]
+        self.assertGreater(len(batches), 1)
+        self.assertEquals(
+            notifications, [item for batch in batches for item in batch])
+        for batch in batches:
+            self.assertLessEqual(
+                len(json.dumps(batch)), lease_socket_service.BATCH_LIMIT)
+        self.assertEquals(0, len(service.notifications))
+
+    def test_processNotifications_requeues_unsent_notifications(self):
+        service = LeaseSocketService(
+            sentinel.service, reactor)
+        self.patch(lease_socket_service, "split_notifications").side_effect = (
+            lambda notifications: ([item] for item in notifications))
+        process = self.patch(service, "processNotificationBatch")
+        process.side_effect = [
+            None, defer.fail(TooLong(True, True, b"updates", b""))]
+        log_err = self.patch(lease_socket_service.log, "err")
+        notifications = [
+            {"action": "commit", "mac": factory.make_mac_address(),
+             "ip": factory.make_ipv4_address()}
+            for _ in range(3)
+        ]
+        service.notifications.extend(notifications)
+        later = {"action": "commit", "mac": factory.make_mac_address(),
+                 "ip": factory.make_ipv4_address()}
+        service.notifications.append(later)
+        d = service.processNotifications(clock=reactor)
+        # The looping call carries on; the unsent notifications are sent
+        # first on the next run.
+        self.assertIsNone(extract_result(d))
+        self.assertEquals(
+            notifications[1:] + [later], list(service.notifications))
+        self.assertThat(log_err, MockCalledOnceWith(
+            None, "Failed to send DHCP lease information."))
+
+    def test_processNotifications_requeues_without_connection(self):
+        service = LeaseSocketService(
+            sentinel.service, reactor)
+        process = self.patch(service, "processNotificationBatch")
+        process.side_effect = NoConnectionsAvailable()
+        notification = {"action": "commit", "mac": factory.make_mac_address(),
+                        "ip": factory.make_ipv4_address()}
+        service.notifications.append(notification)
+        d = service.processNotifications(clock=reactor)
+        self.assertIsNone(extract_result(d))
+        self.assertEquals([notification], list(service.notifications))
+
+    def test_split_notifications_keeps_oversized_notification(self):
+        notification = {"hostname": "x" * 100}
+        self.assertEquals(
+            [[notification]],
+            list(split_notifications([notification], limit=10)))
 
     @defer.inlineCallbacks
-    def test_processNotification_send_to_region(self):
-        protocol, connecting = self.patch_rpc_UpdateLease()
+    def test_processNotificationBatch_send_to_region(self):
+        fixture = self.useFixture(MockLiveClusterToRegionRPCFixture())
+        protocol, connecting = fixture.makeEventLoop(UpdateLeases)
         self.addCleanup((yield connecting))
 
         client = getRegionClient()
@@ -209,24 +312,52 @@ class TestLeaseSocketService(MAASTestCase):
 
         # Notification to region.
         packet = {
-            "action": "commit",
+            "action": "expiry",
             "mac": factory.make_mac_address(),
             "ip_family": "ipv4",
             "ip": factory.make_ipv4_address(),
             "timestamp": int(time.time()),
-            "lease_time": 30,
-            "hostname": factory.make_name("host"),
+            "lease_time": None,
+            "hostname": None,
         }
-        yield service.processNotification(packet, clock=reactor)
+        yield service.processNotificationBatch([packet], clock=reactor)
         self.assertThat(
-            protocol.UpdateLease,
+            protocol.UpdateLeases,
             MockCalledOnceWith(
                 protocol,
                 cluster_uuid=client.localIdent,
-                action=packet["action"],
-                mac=packet["mac"],
-                ip_family=packet["ip_family"],
-                ip=packet["ip"],
-                timestamp=packet["timestamp"],
-                lease_time=packet["lease_time"],
-                hostname=packet["hostname"]))
+                updates=[{
+                    "action": packet["action"],
+                    "mac": packet["mac"],
+                    "ip_family": packet["ip_family"],
+                    "ip": packet["ip"],
+                    "timestamp": packet["timestamp"],
+                    "lease_time": None,
+                    "hostname": None,
+                }]))
+
+    @defer.inlineCallbacks
+    def test_processNotificationBatch_falls_back_to_UpdateLease(self):
+        client = MagicMock()
+        client.side_effect = [
+            defer.fail(UnhandledCommand()), defer.succeed({})]
+        rpc_service = MagicMock()
+        rpc_service.getClientNow.return_value = defer.succeed(client)
+        service = LeaseSocketService(
+            rpc_service, reactor)
+
+        packet = {
+            "action": "release",
+            "mac": factory.make_mac_address(),
+            "ip_family": "ipv4",
+            "ip": factory.make_ipv4_address(),
+            "timestamp": int(time.time()),
+        }
+        expected = dict(packet)
+        yield service.processNotificationBatch([packet], clock=reactor)
+        self.assertThat(
+            client, MockCallsMatch(
+                call(
+                    UpdateLeases, cluster_uuid=client.localIdent,
+                    updates=[expected]),
+                call(UpdateLease, cluster_uuid=client.localIdent, **expected)))
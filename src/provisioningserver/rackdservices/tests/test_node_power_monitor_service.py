@@ -14,7 +14,10 @@ from unittest.mock import (
 
 from fixtures import FakeLogger
 from maastesting.factory import factory
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
@@ -23,6 +26,7 @@ from maastesting.twisted import (
     extract_result,
     TwistedLoggerFixture,
 )
+from provisioningserver.drivers.power.registry import PowerDriverRegistry
 from provisioningserver.rackdservices import (
     node_power_monitor_service as npms,
 )
@@ -32,8 +36,12 @@ from provisioningserver.rpc import (
     region,
 )
 from provisioningserver.rpc.testing import MockClusterToRegionRPCFixture
-from testtools.matchers import MatchesStructure
+from testtools.matchers import (
+    Is,
+    MatchesStructure,
+)
 from twisted.internet.defer import (
+    Deferred,
     fail,
     succeed,
 )
@@ -73,38 +81,141 @@ class TestNodePowerMonitorService(MAASTestCase):
             proto_region.ListNodePowerParameters,
             MockCalledOnceWith(ANY, uuid=client.localIdent))
 
-    def test_query_nodes_calls_query_all_nodes(self):
-        service = self.make_monitor_service()
-        service.max_nodes_at_once = sentinel.max_nodes_at_once
-
-        example_power_parameters = {
-            "system_id": factory.make_UUID(),
+    def make_power_parameters(self, power_type="ipmi"):
+        return {
+            "system_id": factory.make_name("system_id"),
             "hostname": factory.make_hostname(),
-            "power_state": factory.make_name("power_state"),
-            "power_type": factory.make_name("power_type"),
+            "power_state": "off",
+            "power_type": power_type,
             "context": {},
         }
 
+    def test_query_nodes_queries_nodes_from_region(self):
+        service = self.make_monitor_service()
+        power_parameters = self.make_power_parameters()
+
         rpc_fixture = self.useFixture(MockClusterToRegionRPCFixture())
         proto_region, io = rpc_fixture.makeEventLoop(
             region.ListNodePowerParameters)
         proto_region.ListNodePowerParameters.side_effect = [
-            succeed({"nodes": [example_power_parameters]}),
+            succeed({"nodes": [power_parameters]}),
             succeed({"nodes": []}),
         ]
 
-        query_all_nodes = self.patch(npms, "query_all_nodes")
+        query_node = self.patch(npms, "query_node")
+        query_node.return_value = succeed("off")
 
         d = service.query_nodes(getRegionClient())
         io.flush()
 
         self.assertEqual(None, extract_result(d))
         self.assertThat(
-            query_all_nodes,
-            MockCalledOnceWith(
-                [example_power_parameters],
-                max_concurrency=sentinel.max_nodes_at_once,
-                clock=service.clock))
+            query_node, MockCalledOnceWith(power_parameters, service.clock))
+        self.assertThat(
+            service.nodes[power_parameters["system_id"]],
+            MatchesStructure(query=Is(None)))
+
+    def test_query_due_nodes_queries_cached_nodes_when_due(self):
+        service = self.make_monitor_service()
+        power_parameters = self.make_power_parameters()
+        service.update_nodes([power_parameters], service.clock.seconds())
+        query_node = self.patch(npms, "query_node")
+        query_node.return_value = succeed("off")
+
+        service.query_due_nodes()
+        service.query_due_nodes()
+        self.assertEqual(1, query_node.call_count)
+        service.clock.advance(service.check_interval * 2)
+        service.query_due_nodes()
+        self.assertEqual(2, query_node.call_count)
+
+    def test_query_due_nodes_skips_node_being_queried(self):
+        service = self.make_monitor_service()
+        service.update_nodes(
+            [self.make_power_parameters()], service.clock.seconds())
+        query_node = self.patch(npms, "query_node")
+        query_node.return_value = Deferred()
+
+        service.query_due_nodes()
+        service.clock.advance(service.max_query_interval)
+        service.query_due_nodes()
+        self.assertEqual(1, query_node.call_count)
+
+    def test_query_due_nodes_skips_node_with_power_action(self):
+        service = self.make_monitor_service()
+        power_parameters = self.make_power_parameters()
+        service.update_nodes([power_parameters], service.clock.seconds())
+        self.patch(npms, "power_action_registry", {
+            power_parameters["system_id"]: sentinel.action})
+        query_node = self.patch(npms, "query_node")
+
+        service.query_due_nodes()
+        self.assertThat(query_node, MockNotCalled())
+        monitored = service.nodes[power_parameters["system_id"]]
+        self.assertEqual(service.check_interval, monitored.next_query)
+
+    def test_query_due_nodes_drops_expired_nodes(self):
+        service = self.make_monitor_service()
+        power_parameters = self.make_power_parameters()
+        service.update_nodes([power_parameters], service.clock.seconds())
+        self.patch(npms, "query_node").return_value = succeed("off")
+
+        service.clock.advance(service.cache_expiry)
+        service.query_due_nodes()
+        self.assertEqual({}, service.nodes)
+
+    def test_query_node_backs_off_while_power_state_is_stable(self):
+        service = self.make_monitor_service()
+        power_parameters = self.make_power_parameters()
+        service.update_nodes([power_parameters], service.clock.seconds())
+        monitored = service.nodes[power_parameters["system_id"]]
+        self.patch(npms, "query_node").return_value = succeed("off")
+
+        intervals = []
+        for _ in range(6):
+            service.query_node(monitored, service.clock)
+            intervals.append(monitored.interval)
+        self.assertEqual(
+            [30, 60, 120, 240, 300, 300], intervals)
+
+    def test_query_node_resets_interval_when_power_state_changes(self):
+        service = self.make_monitor_service()
+        power_parameters = self.make_power_parameters()
+        service.update_nodes([power_parameters], service.clock.seconds())
+        monitored = service.nodes[power_parameters["system_id"]]
+        monitored.interval = service.max_query_interval
+        self.patch(npms, "query_node").return_value = succeed("on")
+
+        service.query_node(monitored, service.clock)
+        self.assertEqual(service.check_interval, monitored.interval)
+        self.assertEqual(service.check_interval, monitored.next_query)
+        self.assertEqual("on", monitored.node["power_state"])
+
+    def test_update_nodes_queries_soon_with_new_power_parameters(self):
+        service = self.make_monitor_service()
+        power_parameters = self.make_power_parameters()
+        service.update_nodes([power_parameters], service.clock.seconds())
+        monitored = service.nodes[power_parameters["system_id"]]
+        monitored.interval = service.max_query_interval
+        monitored.next_query = service.max_query_interval
+
+        new_parameters = dict(
+            power_parameters, context={"power_address": "10.0.0.1"})
+        service.clock.advance(1)
+        service.update_nodes([new_parameters], service.clock.seconds())
+        self.assertThat(monitored, MatchesStructure.byEquality(
+            node=new_parameters, refreshed=1, next_query=1,
+            interval=service.check_interval))
+
+    def test_getQuerySemaphore_limits_per_power_driver(self):
+        service = self.make_monitor_service()
+        ipmi = service.getQuerySemaphore("ipmi")
+        virsh = service.getQuerySemaphore("virsh")
+        self.assertIs(ipmi, service.getQuerySemaphore("ipmi"))
+        self.assertEqual(
+            PowerDriverRegistry["ipmi"].query_concurrency, ipmi.limit)
+        self.assertEqual(
+            PowerDriverRegistry["virsh"].query_concurrency, virsh.limit)
 
     def test_query_nodes_copes_with_NoSuchCluster(self):
         service = self.make_monitor_service()
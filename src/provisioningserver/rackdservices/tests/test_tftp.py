@@ -29,7 +29,10 @@ from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
 )
-from maastesting.twisted import TwistedLoggerFixture
+from maastesting.twisted import (
+    extract_result,
+    TwistedLoggerFixture,
+)
 from netaddr import IPNetwork
 from netaddr.ip import (
     IPV4_LINK_LOCAL,
@@ -41,6 +44,8 @@ from provisioningserver.boot.tests.test_pxe import compose_config_path
 from provisioningserver.events import EVENT_TYPES
 from provisioningserver.rackdservices import tftp as tftp_module
 from provisioningserver.rackdservices.tftp import (
+    BOOT_CONFIG_TTL,
+    BootConfigCache,
     get_boot_image,
     log_request,
     Port,
@@ -80,6 +85,7 @@ from twisted.internet.address import (
     IPv6Address,
 )
 from twisted.internet.defer import (
+    Deferred,
     fail,
     inlineCallbacks,
     succeed,
@@ -217,6 +223,7 @@ class TestTFTPBackend(MAASTestCase):
         from provisioningserver import boot
         self.patch(boot, "find_mac_via_arp")
         self.patch(tftp_module, 'log_request')
+        self.patch(tftp_module, 'boot_config_cache', BootConfigCache())
 
     def test_init(self):
         temp_dir = self.make_dir()
@@ -639,6 +646,128 @@ class TestTFTPBackend(MAASTestCase):
             backend.fetcher, MockCalledOnceWith(
                 client, GetBootConfig, **params_okay))
 
+    @inlineCallbacks
+    def test_get_kernel_params_reuses_kernel_params(self):
+        fake_kernel_params = make_kernel_parameters(purpose="local")
+        fake_params = fake_kernel_params._asdict()
+        client = Mock()
+        client.localIdent = factory.make_name("system_id")
+        client.return_value = succeed(fake_params)
+        client_service = Mock()
+        client_service.getClientNow.return_value = succeed(client)
+        backend = TFTPBackend(self.make_dir(), client_service)
+        params = {
+            "mac": factory.make_mac_address("-"),
+            "arch": fake_params["arch"],
+            "local_ip": factory.make_ipv4_address(),
+            "remote_ip": factory.make_ipv4_address(),
+        }
+        first = yield backend.get_kernel_params(dict(params))
+        second = yield backend.get_kernel_params(dict(params))
+        self.assertEqual(fake_kernel_params._replace(label="local"), first)
+        self.assertIs(first, second)
+        self.assertThat(client, MockCalledOnceWith(
+            GetBootConfig, system_id=client.localIdent, **params))
+
+    @inlineCallbacks
+    def test_get_kernel_params_reuses_no_response(self):
+        client = Mock()
+        client.localIdent = factory.make_name("system_id")
+        client.return_value = fail(BootConfigNoResponse())
+        client_service = Mock()
+        client_service.getClientNow.return_value = succeed(client)
+        backend = TFTPBackend(self.make_dir(), client_service)
+        params = {
+            "mac": factory.make_mac_address("-"),
+            "local_ip": factory.make_ipv4_address(),
+            "remote_ip": factory.make_ipv4_address(),
+        }
+        with ExpectedException(BootConfigNoResponse):
+            yield backend.get_kernel_params(dict(params))
+        with ExpectedException(BootConfigNoResponse):
+            yield backend.get_kernel_params(dict(params))
+        self.assertThat(client, MockCalledOnceWith(
+            GetBootConfig, system_id=client.localIdent, **params))
+
+
+class TestBootConfigCache(MAASTestCase):
+    """Tests for `BootConfigCache`."""
+
+    def make_key(self, mac=None):
+        if mac is None:
+            mac = factory.make_mac_address()
+        return (
+            mac, factory.make_name("arch"), factory.make_name("subarch"),
+            factory.make_name("bios_boot_method"),
+            factory.make_ipv4_address())
+
+    def test_get_calls_fetch_once(self):
+        cache = BootConfigCache(clock=Clock())
+        key = self.make_key()
+        fetch = Mock(return_value=succeed(sentinel.kernel_params))
+        first = extract_result(cache.get(key, fetch))
+        second = extract_result(cache.get(key, fetch))
+        self.assertIs(sentinel.kernel_params, first)
+        self.assertIs(sentinel.kernel_params, second)
+        self.assertThat(fetch, MockCalledOnceWith())
+
+    def test_get_keeps_no_response(self):
+        cache = BootConfigCache(clock=Clock())
+        key = self.make_key()
+        fetch = Mock(side_effect=lambda: fail(BootConfigNoResponse()))
+        self.assertRaises(
+            BootConfigNoResponse, extract_result, cache.get(key, fetch))
+        self.assertRaises(
+            BootConfigNoResponse, extract_result, cache.get(key, fetch))
+        self.assertThat(fetch, MockCalledOnceWith())
+
+    def test_get_does_not_keep_other_failures(self):
+        cache = BootConfigCache(clock=Clock())
+        key = self.make_key()
+        fetch = Mock(side_effect=lambda: fail(ZeroDivisionError()))
+        self.assertRaises(
+            ZeroDivisionError, extract_result, cache.get(key, fetch))
+        self.assertRaises(
+            ZeroDivisionError, extract_result, cache.get(key, fetch))
+        self.assertEqual(2, fetch.call_count)
+
+    def test_get_fetches_again_once_expired(self):
+        clock = Clock()
+        cache = BootConfigCache(clock=clock)
+        key = self.make_key()
+        fetch = Mock(return_value=succeed(sentinel.kernel_params))
+        extract_result(cache.get(key, fetch))
+        clock.advance(BOOT_CONFIG_TTL)
+        extract_result(cache.get(key, fetch))
+        self.assertEqual(2, fetch.call_count)
+
+    def test_discard_forgets_configs_for_macs(self):
+        cache = BootConfigCache(clock=Clock())
+        mac = factory.make_mac_address()
+        key_discarded = self.make_key(mac)
+        key_kept = self.make_key()
+        fetch = Mock(return_value=succeed(sentinel.kernel_params))
+        extract_result(cache.get(key_discarded, fetch))
+        extract_result(cache.get(key_kept, fetch))
+        cache.discard([mac.upper().replace(":", "-")])
+        self.assertEqual([key_kept], list(cache.entries))
+
+    def test_discard_forgets_configs_being_fetched(self):
+        cache = BootConfigCache(clock=Clock())
+        key = self.make_key()
+        fetching = Deferred()
+        cache.get(key, lambda: fetching)
+        cache.discard([key[0]])
+        fetching.callback(sentinel.kernel_params)
+        self.assertEqual({}, cache.entries)
+
+    def test_clear_forgets_all_configs(self):
+        cache = BootConfigCache(clock=Clock())
+        fetch = Mock(return_value=succeed(sentinel.kernel_params))
+        extract_result(cache.get(self.make_key(), fetch))
+        cache.clear()
+        self.assertEqual({}, cache.entries)
+
 
 class TestTFTPService(MAASTestCase):
 
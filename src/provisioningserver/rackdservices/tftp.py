@@ -4,6 +4,8 @@
 """Twisted Application Plugin for the MAAS TFTP server."""
 
 __all__ = [
+    "boot_config_cache",
+    "BootConfigCache",
     "TFTPBackend",
     "TFTPService",
     ]
@@ -64,11 +66,14 @@ from twisted.internet.address import (
     IPv6Address,
 )
 from twisted.internet.defer import (
+    fail,
     inlineCallbacks,
     maybeDeferred,
     returnValue,
+    succeed,
 )
 from twisted.internet.task import deferLater
+from twisted.python.failure import Failure
 from twisted.python.filepath import FilePath
 
 
@@ -76,6 +81,17 @@ maaslog = get_maas_logger("tftp")
 log = LegacyLogger()
 
 
+# How long, in seconds, a boot configuration from the region is reused. The
+# region asks for the configurations of a node to be discarded when its
+# status or boot settings change, so this only bounds how long it takes for
+# other changes, to kernel options or global settings for example, to be
+# seen by booting machines.
+BOOT_CONFIG_TTL = 30
+
+# Expired boot configurations are pruned once this many are held.
+BOOT_CONFIG_CACHE_SIZE = 10000
+
+
 def get_boot_image(params):
     """Get the boot image for the params on this rack controller."""
     # Match on purpose; enlist uses the commissioning purpose.
@@ -134,6 +150,94 @@ def log_request(mac_address, file_name, clock=reactor):
     d.addErrback(log.err, "Logging TFTP request failed.")
 
 
+def normalise_mac(mac):
+    """Return `mac` in the form the region uses, or `None`."""
+    if mac is None:
+        return None
+    else:
+        return mac.lower().replace("-", ":")
+
+
+class BootConfigCache:
+    """Boot configurations recently obtained from the region.
+
+    Firmware asks for several configuration files for each boot, and
+    retries those it doesn't get quickly, so many machines powering on at
+    once would otherwise flood the region with `GetBootConfig` calls. Both
+    `KernelParameters` and `BootConfigNoResponse` answers are kept for
+    `ttl` seconds, keyed on the booting machine's MAC address,
+    architecture, subarchitecture, BIOS boot method, and the local IP
+    address it's booting through.
+    """
+
+    def __init__(self, ttl=BOOT_CONFIG_TTL, clock=reactor):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}
+        # Incremented whenever configurations are discarded, so that those
+        # being fetched at the time are not kept.
+        self.generation = 0
+
+    def get(self, key, fetch):
+        """Return the configuration for `key`, calling `fetch` if needed.
+
+        :param key: A ``(mac, arch, subarch, bios_boot_method, local_ip)``
+            tuple. The MAC address must be normalised.
+        :param fetch: A no-argument callable that obtains the configuration
+            from the region.
+        :return: A `Deferred` that fires with a `KernelParameters` or fails
+            with `BootConfigNoResponse`.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires, kernel_params = entry
+            if expires > self.clock.seconds():
+                if kernel_params is None:
+                    return fail(BootConfigNoResponse())
+                else:
+                    return succeed(kernel_params)
+            else:
+                del self.entries[key]
+        d = maybeDeferred(fetch)
+        d.addBoth(self._store, key, self.generation)
+        return d
+
+    def _store(self, result, key, generation):
+        # Don't keep what was fetched while configurations were discarded.
+        if generation == self.generation:
+            if not isinstance(result, Failure):
+                self._set(key, result)
+            elif result.check(BootConfigNoResponse):
+                self._set(key, None)
+        return result
+
+    def _set(self, key, kernel_params):
+        now = self.clock.seconds()
+        if len(self.entries) >= BOOT_CONFIG_CACHE_SIZE:
+            self.entries = {
+                key: entry for key, entry in self.entries.items()
+                if entry[0] > now
+            }
+        self.entries[key] = now + self.ttl, kernel_params
+
+    def discard(self, macs):
+        """Discard all configurations for the given MAC addresses."""
+        macs = {normalise_mac(mac) for mac in macs}
+        self.generation += 1
+        for key in list(self.entries):
+            if key[0] in macs:
+                del self.entries[key]
+
+    def clear(self):
+        """Discard all configurations."""
+        self.generation += 1
+        self.entries.clear()
+
+
+# The boot configurations used by this rack controller's TFTP backends.
+boot_config_cache = BootConfigCache()
+
+
 class TFTPBackend(FilesystemSynchronousBackend):
     """A partially dynamic read-only TFTP server.
 
@@ -236,6 +340,8 @@ class TFTPBackend(FilesystemSynchronousBackend):
     def get_kernel_params(self, params):
         """Return kernel parameters obtained from the API.
 
+        Parameters are reused from `boot_config_cache` when possible.
+
         :param params: Parameters so far obtained, typically from the file
             path requested.
         :return: A `KernelParameters` instance.
@@ -259,9 +365,16 @@ class TFTPBackend(FilesystemSynchronousBackend):
             d.addCallback(lambda data: KernelParameters(**data))
             return d
 
-        d = self.client_service.getClientNow()
-        d.addCallback(fetch, params)
-        return d
+        def get_client_and_fetch():
+            d = self.client_service.getClientNow()
+            d.addCallback(fetch, params)
+            return d
+
+        key = (
+            normalise_mac(params.get("mac")), params.get("arch"),
+            params.get("subarch"), params.get("bios_boot_method"),
+            params.get("local_ip"))
+        return boot_config_cache.get(key, get_client_and_fetch)
 
     @deferred
     def get_boot_method_reader(self, boot_method, params):
@@ -15,6 +15,7 @@ __all__ = [
     "ConfigureDHCPv6",
     "ConfigureDHCPv6_V2",
     "DescribePowerTypes",
+    "DiscardBootConfig",
     "GetPreseedData",
     "Identify",
     "ListBootImages",
@@ -549,9 +550,12 @@ class EvaluateTag(amp.Command):
         ])),
         # A 3-part credential string for the web API.
         (b"credentials", amp.Unicode()),
-        # List of nodes the rack controller should evaluate.
+        # List of nodes the rack controller should evaluate. The details
+        # key identifies the node's details, so the rack controller can
+        # cache them; it changes when the node is commissioned again.
         (b"nodes", AmpList([
             (b"system_id", amp.Unicode()),
+            (b"details_key", amp.Unicode(optional=True)),
         ])),
     ]
     response = []
@@ -749,3 +753,18 @@ class DisableAndShutoffRackd(amp.Command):
         exceptions.CannotDisableAndShutoffRackd: (
             b"CannotDisableAndShutoffRackd"),
     }
+
+
+class DiscardBootConfig(amp.Command):
+    """Discard the boot configurations cached for the given MAC addresses.
+
+    The region calls this when the status or boot settings of a node
+    change, so that its next boot configuration comes from the region.
+
+    :since: 2.3
+    """
+    arguments = [
+        (b"macs", amp.ListOf(amp.Unicode())),
+    ]
+    response = []
+    errors = []
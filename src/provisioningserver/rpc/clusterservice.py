@@ -12,7 +12,6 @@ import json
 from operator import itemgetter
 import os
 from os import urandom
-import random
 import re
 from socket import (
     AF_INET,
@@ -45,6 +44,7 @@ from provisioningserver.logger import (
     get_maas_logger,
     LegacyLogger,
 )
+from provisioningserver.rackdservices import tftp
 from provisioningserver.refresh import (
     get_sys_info,
     refresh,
@@ -669,6 +669,16 @@ class Cluster(RPCProtocol):
             d.addBoth(callOut, lock.release)
         return {}
 
+    @cluster.DiscardBootConfig.responder
+    def discard_boot_config(self, macs):
+        """DiscardBootConfig()
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.cluster.DiscardBootConfig`.
+        """
+        tftp.boot_config_cache.discard(macs)
+        return {}
+
     @cluster.DisableAndShutoffRackd.responder
     def disable_and_shutoff_rackd(self):
         """DisableAndShutoffRackd()
@@ -990,7 +1000,8 @@ class ClusterClientService(TimerService, object):
     def getClient(self):
         """Returns a :class:`common.Client` connected to a region.
 
-        The client is chosen at random.
+        The client is for the least loaded connection; see
+        :py:func:`~provisioningserver.rpc.common.select_least_loaded`.
 
         :raises: :py:class:`~.exceptions.NoConnectionsAvailable` when
             there are no open connections to a region controller.
@@ -999,7 +1010,7 @@ class ClusterClientService(TimerService, object):
         if len(conns) == 0:
             raise exceptions.NoConnectionsAvailable()
         else:
-            return common.Client(random.choice(conns))
+            return common.Client(common.select_least_loaded(conns))
 
     @deferred
     def getClientNow(self):
@@ -5,13 +5,25 @@
 
 __all__ = [
     "Authenticate",
+    "calls_handled",
+    "calls_made",
     "Client",
+    "CommandStatistics",
+    "ConnectionLoad",
+    "get_connection_load",
     "Identify",
     "RPCProtocol",
+    "select_least_loaded",
 ]
 
+from bisect import bisect_left
+from collections import Counter
+from math import inf
 from os import getpid
+import random
 from socket import gethostname
+from time import monotonic
+from weakref import WeakKeyDictionary
 
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.rpc.interfaces import (
@@ -27,6 +39,163 @@ from twisted.python.failure import Failure
 log = LegacyLogger()
 
 
+# How much each completed call moves a connection's average latency towards
+# the latency of that call.
+LATENCY_EWMA_WEIGHT = 0.2
+
+# Seconds over which a connection's average latency halves while no calls
+# complete on it, so that a connection made to look slow by a few slow calls
+# is chosen again before long, and its latency measured afresh.
+LATENCY_HALF_LIFE = 30.0
+
+# Upper bounds, in seconds, of the buckets in each latency histogram.
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, inf)
+
+
+class CommandStatistics:
+    """Counts and latency histograms of RPC commands.
+
+    :ivar calls: A `Counter` of calls, keyed by command name.
+    :ivar failures: A `Counter` of calls that failed, keyed by command name.
+    :ivar latencies: A dict mapping command names to lists of counts of
+        calls, one for each bucket in `LATENCY_BUCKETS`.
+    :ivar durations: A dict mapping command names to the total time, in
+        seconds, spent in those calls.
+    """
+
+    def __init__(self):
+        super(CommandStatistics, self).__init__()
+        self.calls = Counter()
+        self.failures = Counter()
+        self.latencies = {}
+        self.durations = Counter()
+
+    def record(self, command, elapsed, failed=False):
+        """Record a call to `command` that took `elapsed` seconds.
+
+        :param command: The command's name, as a byte string.
+        """
+        command = command.decode("ascii")
+        self.calls[command] += 1
+        if failed:
+            self.failures[command] += 1
+        if command not in self.latencies:
+            self.latencies[command] = [0] * len(LATENCY_BUCKETS)
+        self.latencies[command][bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        self.durations[command] += elapsed
+
+    def histogram(self, command):
+        """Return ``(upper-bound, count)`` tuples for `command`'s calls."""
+        counts = self.latencies.get(command, [0] * len(LATENCY_BUCKETS))
+        return list(zip(LATENCY_BUCKETS, counts))
+
+    def report(self):
+        """Return a line of text for each command, sorted by name.
+
+        Each line gives the number of calls and failures, the average time
+        taken, and the non-empty buckets of the command's histogram.
+        """
+        return [
+            "%s: %d call(s), %d failed, %.3fs average; %s" % (
+                command, self.calls[command], self.failures[command],
+                self.durations[command] / self.calls[command],
+                ", ".join(
+                    "<=%ss: %d" % (bound, count)
+                    for bound, count in self.histogram(command)
+                    if count != 0))
+            for command in sorted(self.calls)
+        ]
+
+
+# Calls made from this process to the remote side: from the region to rack
+# controllers, or from a rack controller to the region.
+calls_made = CommandStatistics()
+
+# Calls handled by this process for the remote side.
+calls_handled = CommandStatistics()
+
+
+class ConnectionLoad:
+    """The load on a single RPC connection.
+
+    :ivar outstanding: The number of calls in flight.
+    :ivar latency: A moving average of how long calls take to complete, in
+        seconds, or `None` if none has yet.
+    :ivar updated: The time, from `monotonic`, at which `latency` was last
+        updated, or `None` if it is not decaying.
+    """
+
+    def __init__(self):
+        super(ConnectionLoad, self).__init__()
+        self.outstanding = 0
+        self.latency = None
+        self.updated = None
+
+    def started(self):
+        """Record that a call has been made."""
+        self.outstanding += 1
+
+    def finished(self, elapsed, now=None):
+        """Record that a call completed after `elapsed` seconds.
+
+        :param now: The time, from `monotonic`, at which the call completed.
+        """
+        if now is None:
+            now = monotonic()
+        self.outstanding -= 1
+        latency = self.getLatency(now)
+        if latency is None:
+            self.latency = elapsed
+        else:
+            self.latency = latency + LATENCY_EWMA_WEIGHT * (elapsed - latency)
+        self.updated = now
+
+    def getLatency(self, now=None):
+        """Return `latency`, decayed by `LATENCY_HALF_LIFE` until `now`."""
+        if self.latency is None or self.updated is None:
+            return self.latency
+        if now is None:
+            now = monotonic()
+        idle = max(0.0, now - self.updated)
+        return self.latency * 0.5 ** (idle / LATENCY_HALF_LIFE)
+
+    @property
+    def cost(self):
+        """An estimate of how long a new call would take to complete.
+
+        This is a tuple so that, while no latencies are known, connections
+        with fewer calls in flight are still preferred.
+        """
+        latency = self.getLatency()
+        latency = 0.0 if latency is None else latency
+        return (self.outstanding + 1) * latency, self.outstanding
+
+
+_connection_loads = WeakKeyDictionary()
+
+
+def get_connection_load(conn):
+    """Return the `ConnectionLoad` for `conn`."""
+    try:
+        return _connection_loads[conn]
+    except KeyError:
+        load = _connection_loads[conn] = ConnectionLoad()
+        return load
+
+
+def select_least_loaded(conns):
+    """Return the connection from `conns` expected to answer soonest.
+
+    Ties are broken at random, so that work is still spread between
+    connections that are equally loaded.
+    """
+    costs = {conn: get_connection_load(conn).cost for conn in conns}
+    cheapest = min(costs.values())
+    return random.choice([
+        conn for conn, cost in costs.items() if cost == cheapest])
+
+
 class Identify(amp.Command):
     """Request the identity of the remote side, e.g. its UUID.
 
@@ -150,7 +319,25 @@ class Client:
                 "arguments are not supported. Usage: client(command, arg1="
                 "value1, ...)" % (receiver_name, len(args), args))
 
-        return self._conn.callRemote(cmd, **kwargs)
+        d = self._conn.callRemote(cmd, **kwargs)
+        load = get_connection_load(self._conn)
+        load.started()
+        started = monotonic()
+
+        def record(result):
+            finished = monotonic()
+            elapsed = finished - started
+            load.finished(elapsed, finished)
+            calls_made.record(
+                cmd.commandName, elapsed, isinstance(result, Failure))
+            return result
+
+        return d.addBoth(record)
+
+    @property
+    def load(self):
+        """The `ConnectionLoad` of the connection."""
+        return get_connection_load(self._conn)
 
     @asynchronous
     def getHostCertificate(self):
@@ -238,8 +425,17 @@ class RPCProtocol(amp.AMP, object):
         wrap them with :class:`amp.RemoteAmpError`. This prevents the
         disconnecting behaviour.
         """
+        started = monotonic()
         d = super(RPCProtocol, self).dispatchCommand(box)
 
+        def record(result):
+            calls_handled.record(
+                box[amp.COMMAND], monotonic() - started,
+                isinstance(result, Failure))
+            return result
+
+        d.addBoth(record)
+
         def coerce_error(failure):
             if failure.check(amp.RemoteAmpError):
                 return failure
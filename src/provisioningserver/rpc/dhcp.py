@@ -23,6 +23,11 @@ from provisioningserver.dhcp import (
     DHCPv6Server,
 )
 from provisioningserver.dhcp.config import get_config
+from provisioningserver.dhcp.omapi import (
+    OmapiClient,
+    OmapiConnectionError,
+    OmapiHostError,
+)
 from provisioningserver.dhcp.omshell import Omshell
 from provisioningserver.logger import get_maas_logger
 from provisioningserver.rpc.exceptions import (
@@ -225,9 +230,60 @@ def _modify_host_map(omshell, mac, ip_address):
         raise CannotModifyHostMap(err)
 
 
+# Persistent OMAPI connections to the DHCP servers, keyed by service name.
+_omapi_clients = {}
+
+
+def _get_omapi_client(server):
+    """Return the `OmapiClient` for `server`, creating it if needed."""
+    client = _omapi_clients.get(server.dhcp_service)
+    if client is None or client.shared_key != server.omapi_key:
+        if client is not None:
+            client.close()
+        client = _omapi_clients[server.dhcp_service] = OmapiClient(
+            server_address='127.0.0.1', shared_key=server.omapi_key,
+            ipv6=server.ipv6)
+    return client
+
+
 @synchronous
 def _update_hosts(server, remove, add, modify):
-    """Update the hosts using the OMAPI."""
+    """Update the hosts using the OMAPI.
+
+    The changes are pipelined over a persistent OMAPI connection to the DHCP
+    server. If that connection cannot be used, fall back to `omshell`.
+    """
+    client = _get_omapi_client(server)
+    try:
+        client.update_hosts(
+            [host["mac"] for host in remove],
+            [(host["mac"], host["ip"]) for host in add],
+            [(host["mac"], host["ip"]) for host in modify])
+    except OmapiConnectionError as e:
+        maaslog.warning(
+            "Could not update host maps over OMAPI connection to %s server "
+            "(%s); using omshell instead." % (server.descriptive_name, e))
+        _update_hosts_with_omshell(server, remove, add, modify)
+    except OmapiHostError as e:
+        if e.operation == "remove":
+            err = "Could not remove host map for %s: %s" % (
+                e.mac_address, e)
+            exception_type = CannotRemoveHostMap
+        elif e.operation == "create":
+            err = "Could not create host map for %s -> %s: %s" % (
+                e.mac_address, e.ip_address, e)
+            exception_type = CannotCreateHostMap
+        else:
+            err = "Could not modify host map for %s -> %s: %s" % (
+                e.mac_address, e.ip_address, e)
+            exception_type = CannotModifyHostMap
+        maaslog.error(err)
+        raise exception_type(err)
+
+
+@synchronous
+def _update_hosts_with_omshell(server, remove, add, modify):
+    """Update the hosts using the OMAPI, via `omshell`."""
     omshell = Omshell(
         server_address='127.0.0.1', shared_key=server.omapi_key,
         ipv6=server.ipv6)
@@ -35,6 +35,7 @@ from provisioningserver.rpc.exceptions import (
 from provisioningserver.rpc.region import (
     MarkNodeFailed,
     UpdateNodePowerState,
+    UpdateNodePowerStates,
 )
 from provisioningserver.utils.twisted import (
     asynchronous,
@@ -45,6 +46,7 @@ from provisioningserver.utils.twisted import (
 from twisted.internet import reactor
 from twisted.internet.defer import (
     CancelledError,
+    Deferred,
     DeferredList,
     DeferredSemaphore,
     inlineCallbacks,
@@ -52,6 +54,8 @@ from twisted.internet.defer import (
     succeed,
 )
 from twisted.internet.task import deferLater
+from twisted.protocols.amp import UnhandledCommand
+from twisted.python.failure import Failure
 
 
 maaslog = get_maas_logger("power")
@@ -66,18 +70,92 @@ CHANGE_POWER_STATE_TIMEOUT = timedelta(minutes=5).total_seconds()
 power_action_registry = {}
 
 
+class PowerStateUpdates:
+    """Report power states to the region in batches.
+
+    Only one `UpdateNodePowerStates` call is in progress at a time; states
+    reported meanwhile are queued, and sent together once it completes.
+    When a node's state is reported more than once before being sent, only
+    the latest state is sent.
+    """
+
+    def __init__(self):
+        super(PowerStateUpdates, self).__init__()
+        # Maps system IDs to (power state, [waiting Deferreds]).
+        self.pending = {}
+        self.sending = False
+
+    def update(self, system_id, state):
+        """Queue `state` to be reported for `system_id`.
+
+        :return: A `Deferred` that fires once the region has been updated.
+        """
+        d = Deferred()
+        _, waiters = self.pending.get(system_id, (None, []))
+        self.pending[system_id] = state, waiters + [d]
+        if not self.sending:
+            self.send()
+        return d
+
+    @inlineCallbacks
+    def send(self):
+        """Send batches of power states until none remain."""
+        self.sending = True
+        try:
+            while len(self.pending) > 0:
+                pending, self.pending = self.pending, {}
+                yield self.sendBatch(pending)
+        finally:
+            self.sending = False
+
+    @inlineCallbacks
+    def sendBatch(self, pending):
+        try:
+            client = getRegionClient()
+            response = yield client(UpdateNodePowerStates, states=[
+                {"system_id": system_id, "power_state": state}
+                for system_id, (state, _) in pending.items()
+            ])
+        except UnhandledCommand:
+            # The region is older than this rack and cannot take a batch of
+            # power states; report each of them separately.
+            yield DeferredList([
+                client(
+                    UpdateNodePowerState, system_id=system_id,
+                    power_state=state).addBoth(self.fire, waiters)
+                for system_id, (state, waiters) in pending.items()
+            ])
+        except:
+            failure = Failure()
+            for _, waiters in pending.values():
+                self.fire(failure, waiters)
+        else:
+            for _, waiters in pending.values():
+                self.fire(response, waiters)
+
+    def fire(self, result, waiters):
+        for waiter in waiters:
+            if isinstance(result, Failure):
+                waiter.errback(result)
+            else:
+                waiter.callback(result)
+
+
+# Batches the power states reported by `power_state_update`.
+power_state_updates = PowerStateUpdates()
+
+
 @asynchronous
 def power_state_update(system_id, state):
     """Report to the region about a node's power state.
 
+    Power states reported at around the same time are sent to the region
+    together; see `PowerStateUpdates`.
+
     :param system_id: The system ID for the node.
     :param state: Typically "on", "off", or "error".
     """
-    client = getRegionClient()
-    return client(
-        UpdateNodePowerState,
-        system_id=system_id,
-        power_state=state)
+    return power_state_updates.update(system_id, state)
 
 
 @asynchronous(timeout=15)
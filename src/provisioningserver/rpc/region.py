@@ -30,9 +30,12 @@ __all__ = [
     "RequestNodeInfoByMACAddress",
     "SendEvent",
     "SendEventMACAddress",
+    "SendEvents",
     "UpdateInterfaces",
     "UpdateLastImageSync",
+    "UpdateLeases",
     "UpdateNodePowerState",
+    "UpdateNodePowerStates",
 ]
 
 from provisioningserver.rpc.arguments import (
@@ -309,6 +312,24 @@ class UpdateNodePowerState(amp.Command):
     errors = {NoSuchNode: b"NoSuchNode"}
 
 
+class UpdateNodePowerStates(amp.Command):
+    """Update the power states of many nodes.
+
+    Each entry in `states` carries the same fields as `UpdateNodePowerState`.
+    Nodes that do not exist are ignored.
+
+    :since: 2.3
+    """
+
+    arguments = [
+        (b"states", AmpList(
+            [(b"system_id", amp.Unicode()),
+             (b"power_state", amp.Unicode())])),
+    ]
+    response = []
+    errors = {}
+
+
 class RegisterEventType(amp.Command):
     """Register an event type.
 
@@ -366,6 +387,31 @@ class SendEventMACAddress(amp.Command):
     }
 
 
+class SendEvents(amp.Command):
+    """Send many events.
+
+    Each entry in `events` carries the same fields as `SendEvent` or
+    `SendEventMACAddress`; exactly one of `system_id` or `mac_address` is
+    given. An entry may also carry the `timestamp`, in seconds since the
+    epoch, at which the event occurred; otherwise the time it is received
+    is used. Events for unknown nodes or event types are ignored. Unlike
+    `SendEvent`, the response is sent once the events have been recorded.
+
+    :since: 2.3
+    """
+
+    arguments = [
+        (b"events", AmpList(
+            [(b"system_id", amp.Unicode(optional=True)),
+             (b"mac_address", amp.Unicode(optional=True)),
+             (b"type_name", amp.Unicode()),
+             (b"description", amp.Unicode()),
+             (b"timestamp", amp.Float(optional=True))])),
+    ]
+    response = []
+    errors = {}
+
+
 class ReportForeignDHCPServer(amp.Command):
     """Report a foreign DHCP server on a rack controller's interface.
 
@@ -528,6 +574,33 @@ class UpdateLease(amp.Command):
     }
 
 
+class UpdateLeases(amp.Command):
+    """Report a batch of DHCP lease updates from a cluster controller.
+
+    Each entry in `updates` carries the same fields as `UpdateLease`. The
+    cluster coalesces the updates so that only the last action for each
+    MAC/IP pair is sent, and the region processes the whole batch in a
+    single transaction.
+
+    :since: 2.3
+    """
+    arguments = [
+        (b"cluster_uuid", amp.Unicode()),
+        (b"updates", AmpList(
+            [(b"action", amp.Unicode()),
+             (b"mac", amp.Unicode()),
+             (b"ip_family", amp.Unicode()),
+             (b"ip", amp.Unicode()),
+             (b"timestamp", amp.Integer()),
+             (b"lease_time", amp.Integer(optional=True)),
+             (b"hostname", amp.Unicode(optional=True))])),
+    ]
+    response = []
+    errors = {
+        NoSuchCluster: b"NoSuchCluster",
+    }
+
+
 class UpdateServices(amp.Command):
     """Report service statuses that are monitored on the rackd.
 
@@ -71,6 +71,7 @@ from provisioningserver.drivers.pod import (
 from provisioningserver.drivers.power import PowerError
 from provisioningserver.drivers.power.registry import PowerDriverRegistry
 from provisioningserver.path import get_data_path
+from provisioningserver.rackdservices import tftp
 from provisioningserver.rpc import (
     boot_images,
     cluster,
@@ -823,6 +824,16 @@ class TestClusterClientService(MAASTestCase):
                 for conn in service.connections.values()
             })
 
+    def test_getClient_returns_least_loaded_connection(self):
+        service = ClusterClientService(Clock())
+        busy, idle = DummyConnection(), DummyConnection()
+        common.get_connection_load(busy).started()
+        service.connections = {
+            sentinel.eventloop01: busy,
+            sentinel.eventloop02: idle,
+        }
+        self.assertEqual(common.Client(idle), service.getClient())
+
     def test_getClient_when_there_are_no_connections(self):
         service = ClusterClientService(Clock())
         service.connections = {}
@@ -3142,3 +3153,20 @@ class TestClusterProtocol_DisableAndShutoffRackd(MAASTestCase):
         with ExpectedException(exceptions.CannotDisableAndShutoffRackd):
             yield call_responder(
                 Cluster(), cluster.DisableAndShutoffRackd, {})
+
+
+class TestClusterProtocol_DiscardBootConfig(MAASTestCase):
+
+    def test__is_registered(self):
+        protocol = Cluster()
+        responder = protocol.locateResponder(
+            cluster.DiscardBootConfig.commandName)
+        self.assertIsNotNone(responder)
+
+    def test_discards_boot_configs(self):
+        discard = self.patch(tftp.boot_config_cache, "discard")
+        macs = [factory.make_mac_address() for _ in range(3)]
+        response = call_responder(
+            Cluster(), cluster.DiscardBootConfig, {"macs": macs})
+        self.assertEquals({}, response.result)
+        self.assertThat(discard, MockCalledOnceWith(macs))
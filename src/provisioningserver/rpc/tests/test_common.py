@@ -5,6 +5,7 @@
 
 __all__ = []
 
+from math import inf
 import random
 import re
 from unittest.mock import sentinel
@@ -32,9 +33,14 @@ from testtools.matchers import (
     Equals,
     Is,
     IsInstance,
+    MatchesStructure,
     Not,
 )
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import (
+    Deferred,
+    fail,
+    succeed,
+)
 from twisted.internet.protocol import connectionDone
 from twisted.protocols import amp
 from twisted.test.proto_helpers import StringTransport
@@ -84,11 +90,34 @@ class TestClient(MAASTestCase):
     def test_call(self):
         conn, client = self.make_connection_and_client()
         self.patch_autospec(conn, "callRemote")
-        conn.callRemote.return_value = sentinel.response
-        response = client(sentinel.command, foo=sentinel.foo, bar=sentinel.bar)
-        self.assertThat(response, Is(sentinel.response))
+        conn.callRemote.return_value = succeed(sentinel.response)
+        response = client(common.Identify, foo=sentinel.foo, bar=sentinel.bar)
+        self.assertThat(extract_result(response), Is(sentinel.response))
         self.assertThat(conn.callRemote, MockCalledOnceWith(
-            sentinel.command, foo=sentinel.foo, bar=sentinel.bar))
+            common.Identify, foo=sentinel.foo, bar=sentinel.bar))
+
+    def test_call_tracks_load_of_connection(self):
+        conn, client = self.make_connection_and_client()
+        self.patch(common, "monotonic").side_effect = [10.0, 12.5]
+        calling = Deferred()
+        self.patch_autospec(conn, "callRemote").return_value = calling
+        client(common.Identify)
+        self.assertThat(client.load, MatchesStructure.byEquality(
+            outstanding=1, latency=None))
+        calling.callback({})
+        self.assertThat(client.load, MatchesStructure.byEquality(
+            outstanding=0, latency=2.5))
+
+    def test_call_records_statistics(self):
+        conn, client = self.make_connection_and_client()
+        self.patch(common, "calls_made", common.CommandStatistics())
+        self.patch(common, "monotonic").side_effect = [10.0, 10.02]
+        self.patch_autospec(conn, "callRemote").return_value = (
+            fail(ZeroDivisionError()))
+        response = client(common.Identify)
+        self.assertRaises(ZeroDivisionError, extract_result, response)
+        self.assertEqual({"Identify": 1}, common.calls_made.calls)
+        self.assertEqual({"Identify": 1}, common.calls_made.failures)
 
     def test_call_with_keyword_arguments_raises_useful_error(self):
         conn = DummyConnection()
@@ -240,6 +269,139 @@ class TestRPCProtocol_UnhandledErrorsWhenHandlingCommands(MAASTestCase):
         self.assertThat(observed_boxes_sent, Equals(expected_boxes_sent))
 
 
+class TestRPCProtocol_RecordsCommandsHandled(MAASTestCase):
+
+    def test_records_statistics(self):
+        self.patch(common, "calls_handled", common.CommandStatistics())
+        protocol = common.RPCProtocol()
+        protocol.makeConnection(StringTransport())
+        dispatchCommand = self.patch(amp.AMP, "dispatchCommand")
+        dispatchCommand.return_value = succeed({})
+        box = amp.AmpBox(_ask=b"1", _command=b"Identify")
+        protocol.ampBoxReceived(box)
+        self.assertEqual({"Identify": 1}, common.calls_handled.calls)
+        self.assertEqual({}, common.calls_handled.failures)
+
+
+class TestCommandStatistics(MAASTestCase):
+    """Tests for `common.CommandStatistics`."""
+
+    def test_record_counts_calls_and_failures(self):
+        stats = common.CommandStatistics()
+        stats.record(b"Foo", 0.1)
+        stats.record(b"Foo", 0.1, failed=True)
+        stats.record(b"Bar", 0.1)
+        self.assertEqual({"Foo": 2, "Bar": 1}, stats.calls)
+        self.assertEqual({"Foo": 1}, stats.failures)
+
+    def test_record_adds_to_histogram(self):
+        stats = common.CommandStatistics()
+        stats.record(b"Foo", 0.001)
+        stats.record(b"Foo", 0.005)
+        stats.record(b"Foo", 0.3)
+        stats.record(b"Foo", 1000)
+        histogram = dict(stats.histogram("Foo"))
+        self.assertEqual(2, histogram[0.005])
+        self.assertEqual(1, histogram[0.5])
+        self.assertEqual(1, histogram[inf])
+        self.assertEqual(4, sum(histogram.values()))
+        self.assertAlmostEqual(1000.306, stats.durations["Foo"])
+
+    def test_report_describes_each_command(self):
+        stats = common.CommandStatistics()
+        stats.record(b"Foo", 0.001)
+        stats.record(b"Foo", 0.3, failed=True)
+        stats.record(b"Bar", 2)
+        self.assertEqual([
+            "Bar: 1 call(s), 0 failed, 2.000s average; <=2.5s: 1",
+            "Foo: 2 call(s), 1 failed, 0.150s average; "
+            "<=0.005s: 1, <=0.5s: 1",
+        ], stats.report())
+
+    def test_histogram_of_unknown_command_is_empty(self):
+        stats = common.CommandStatistics()
+        self.assertEqual(
+            [(bound, 0) for bound in common.LATENCY_BUCKETS],
+            stats.histogram("Foo"))
+
+
+class TestConnectionLoad(MAASTestCase):
+    """Tests for `common.ConnectionLoad`."""
+
+    def test_finished_starts_average_with_first_latency(self):
+        load = common.ConnectionLoad()
+        load.started()
+        load.finished(2.0)
+        self.assertEqual(0, load.outstanding)
+        self.assertEqual(2.0, load.latency)
+
+    def test_finished_moves_average_towards_latency(self):
+        load = common.ConnectionLoad()
+        load.latency = 1.0
+        load.started()
+        load.finished(2.0)
+        self.assertAlmostEqual(
+            1.0 + common.LATENCY_EWMA_WEIGHT, load.latency)
+
+    def test_finished_moves_decayed_average_towards_latency(self):
+        load = common.ConnectionLoad()
+        load.latency = 4.0
+        load.updated = 10.0
+        load.started()
+        load.finished(1.0, 10.0 + common.LATENCY_HALF_LIFE)
+        self.assertAlmostEqual(
+            2.0 - common.LATENCY_EWMA_WEIGHT, load.latency)
+        self.assertEqual(10.0 + common.LATENCY_HALF_LIFE, load.updated)
+
+    def test_latency_decays_while_idle(self):
+        load = common.ConnectionLoad()
+        load.started()
+        load.finished(8.0, 10.0)
+        self.assertEqual(8.0, load.getLatency(10.0))
+        self.assertAlmostEqual(
+            4.0, load.getLatency(10.0 + common.LATENCY_HALF_LIFE))
+        self.assertAlmostEqual(
+            1.0, load.getLatency(10.0 + 3 * common.LATENCY_HALF_LIFE))
+
+    def test_cost_accounts_for_outstanding_calls(self):
+        load = common.ConnectionLoad()
+        load.latency = 0.5
+        load.started()
+        load.started()
+        self.assertEqual((1.5, 2), load.cost)
+
+
+class TestSelectLeastLoaded(MAASTestCase):
+    """Tests for `common.select_least_loaded`."""
+
+    def test_selects_connection_with_fewest_outstanding_calls(self):
+        busy, idle = FakeConnection(), FakeConnection()
+        common.get_connection_load(busy).started()
+        self.assertIs(idle, common.select_least_loaded([busy, idle]))
+
+    def test_selects_connection_with_lowest_latency(self):
+        slow, fast = FakeConnection(), FakeConnection()
+        common.get_connection_load(slow).latency = 2.0
+        common.get_connection_load(fast).latency = 0.1
+        self.assertIs(fast, common.select_least_loaded([slow, fast]))
+
+    def test_selects_slow_connection_again_once_latency_decays(self):
+        slow, fast = FakeConnection(), FakeConnection()
+        now = 10 * common.LATENCY_HALF_LIFE
+        self.patch(common, "monotonic").return_value = now
+        common.get_connection_load(slow).started()
+        common.get_connection_load(slow).finished(10.0, 0.0)
+        common.get_connection_load(fast).started()
+        common.get_connection_load(fast).finished(0.1, now)
+        self.assertIs(slow, common.select_least_loaded([slow, fast]))
+
+    def test_selects_at_random_among_equally_loaded(self):
+        conns = [FakeConnection() for _ in range(3)]
+        choice = self.patch(common.random, "choice")
+        common.select_least_loaded(conns)
+        self.assertThat(choice, MockCalledOnceWith(conns))
+
+
 class TestMakeCommandRef(MAASTestCase):
     """Tests for `common.make_command_ref`."""
 
@@ -25,6 +25,10 @@ from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
 )
+from provisioningserver.dhcp.omapi import (
+    OmapiConnectionError,
+    OmapiHostError,
+)
 from provisioningserver.dhcp.testing.config import (
     DHCPConfigNameResolutionDisabled,
     fix_shared_networks_failover,
@@ -412,11 +416,111 @@ class TestCreateHostMap(MAASTestCase):
 
 class TestUpdateHost(MAASTestCase):
 
+    def setUp(self):
+        super(TestUpdateHost, self).setUp()
+        self.patch(dhcp, "_omapi_clients", {})
+
+    def make_server(self):
+        server = Mock()
+        server.dhcp_service = factory.make_name("dhcpd")
+        server.omapi_key = factory.make_name("key")
+        server.ipv6 = factory.pick_bool()
+        return server
+
+    def test__creates_omapi_client_with_correct_arguments(self):
+        client = self.patch(dhcp, "OmapiClient")
+        server = self.make_server()
+        dhcp._update_hosts(server, [], [], [])
+        self.assertThat(client, MockCallsMatch(
+            call(
+                ipv6=server.ipv6, server_address="127.0.0.1",
+                shared_key=server.omapi_key),
+        ))
+
+    def test__reuses_omapi_client(self):
+        client = self.patch(dhcp, "OmapiClient")
+        client.return_value.shared_key = sentinel.key
+        server = self.make_server()
+        server.omapi_key = sentinel.key
+        dhcp._update_hosts(server, [], [], [])
+        dhcp._update_hosts(server, [], [], [])
+        self.assertThat(client, MockCalledOnceWith(
+            ipv6=server.ipv6, server_address="127.0.0.1",
+            shared_key=sentinel.key))
+
+    def test__replaces_omapi_client_when_key_changes(self):
+        client = self.patch(dhcp, "OmapiClient")
+        client.return_value.shared_key = sentinel.key
+        server = self.make_server()
+        server.omapi_key = sentinel.key
+        dhcp._update_hosts(server, [], [], [])
+        server.omapi_key = sentinel.other_key
+        dhcp._update_hosts(server, [], [], [])
+        self.assertThat(client.return_value.close, MockCalledOnceWith())
+        self.assertEqual(2, client.call_count)
+
+    def test__performs_operations_over_omapi(self):
+        client = self.patch(dhcp, "OmapiClient").return_value
+        omshell = self.patch(dhcp, "Omshell")
+        remove_host = make_host()
+        add_host = make_host()
+        modify_host = make_host()
+        server = self.make_server()
+        dhcp._update_hosts(server, [remove_host], [add_host], [modify_host])
+        self.assertThat(client.update_hosts, MockCalledOnceWith(
+            [remove_host["mac"]],
+            [(add_host["mac"], add_host["ip"])],
+            [(modify_host["mac"], modify_host["ip"])]))
+        self.assertThat(omshell, MockNotCalled())
+
+    def test__falls_back_to_omshell_when_omapi_cannot_connect(self):
+        client = self.patch(dhcp, "OmapiClient").return_value
+        client.update_hosts.side_effect = OmapiConnectionError("refused")
+        update_hosts_with_omshell = self.patch(
+            dhcp, "_update_hosts_with_omshell")
+        remove_host = make_host()
+        add_host = make_host()
+        modify_host = make_host()
+        server = self.make_server()
+        with FakeLogger("maas.dhcp") as logger:
+            dhcp._update_hosts(
+                server, [remove_host], [add_host], [modify_host])
+        self.assertThat(update_hosts_with_omshell, MockCalledOnceWith(
+            server, [remove_host], [add_host], [modify_host]))
+        self.assertDocTestMatches(
+            "Could not update host maps over OMAPI connection to ... "
+            "(refused); using omshell instead.", logger.output)
+
+    def test__raises_error_when_omapi_refuses_change(self):
+        client = self.patch(dhcp, "OmapiClient").return_value
+        mac = factory.make_mac_address()
+        ip = factory.make_ip_address()
+        expectations = [
+            ("remove", None, exceptions.CannotRemoveHostMap,
+             "Could not remove host map for %s: bad" % mac),
+            ("create", ip, exceptions.CannotCreateHostMap,
+             "Could not create host map for %s -> %s: bad" % (mac, ip)),
+            ("modify", ip, exceptions.CannotModifyHostMap,
+             "Could not modify host map for %s -> %s: bad" % (mac, ip)),
+        ]
+        server = self.make_server()
+        for operation, ip_address, exception_type, message in expectations:
+            client.update_hosts.side_effect = OmapiHostError(
+                operation, mac, ip_address, "bad")
+            with FakeLogger("maas.dhcp") as logger:
+                error = self.assertRaises(
+                    exception_type, dhcp._update_hosts, server, [], [], [])
+            self.assertEqual(message, str(error))
+            self.assertDocTestMatches(message, logger.output)
+
+
+class TestUpdateHostWithOmshell(MAASTestCase):
+
     def test__creates_omshell_with_correct_arguments(self):
         omshell = self.patch(dhcp, "Omshell")
         server = Mock()
         server.ipv6 = factory.pick_bool()
-        dhcp._update_hosts(server, [], [], [])
+        dhcp._update_hosts_with_omshell(server, [], [], [])
         self.assertThat(omshell, MockCallsMatch(
             call(
                 ipv6=server.ipv6, server_address="127.0.0.1",
@@ -431,7 +535,8 @@ class TestUpdateHost(MAASTestCase):
         modify_host = make_host()
         server = Mock()
         server.ipv6 = factory.pick_bool()
-        dhcp._update_hosts(server, [remove_host], [add_host], [modify_host])
+        dhcp._update_hosts_with_omshell(
+            server, [remove_host], [add_host], [modify_host])
         self.assertThat(
             omshell.remove,
             MockCallsMatch(
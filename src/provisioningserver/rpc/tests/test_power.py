@@ -80,6 +80,7 @@ class TestPowerHelpers(MAASTestCase):
     def setUp(self):
         super(TestPowerHelpers, self).setUp()
         self.useFixture(EventTypesAllRegistered())
+        self.patch(power, "power_state_updates", power.PowerStateUpdates())
 
     def patch_rpc_methods(self):
         fixture = self.useFixture(MockClusterToRegionRPCFixture())
@@ -167,6 +168,68 @@ class TestPowerHelpers(MAASTestCase):
         self.assertIsNone(extract_result(d))
 
 
+class TestPowerStateUpdates(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def patch_rpc_methods(self):
+        fixture = self.useFixture(MockClusterToRegionRPCFixture())
+        protocol, io = fixture.makeEventLoop(
+            region.UpdateNodePowerState, region.UpdateNodePowerStates)
+        return protocol, io
+
+    def test_update_sends_UpdateNodePowerStates(self):
+        system_id = factory.make_name('system_id')
+        state = random.choice(['on', 'off'])
+        protocol, io = self.patch_rpc_methods()
+        d = power.PowerStateUpdates().update(system_id, state)
+        io.flush()
+        self.assertEqual({}, extract_result(d))
+        self.assertThat(
+            protocol.UpdateNodePowerStates,
+            MockCalledOnceWith(ANY, states=[
+                {"system_id": system_id, "power_state": state}]))
+
+    def test_update_batches_states_while_sending(self):
+        protocol, io = self.patch_rpc_methods()
+        updates = power.PowerStateUpdates()
+        system_ids = [factory.make_name('system_id') for _ in range(3)]
+        d1 = updates.update(system_ids[0], 'on')
+        d2 = updates.update(system_ids[1], 'on')
+        d3 = updates.update(system_ids[2], 'off')
+        d4 = updates.update(system_ids[1], 'off')
+        io.flush()
+        for d in (d1, d2, d3, d4):
+            self.assertEqual({}, extract_result(d))
+        self.assertThat(
+            protocol.UpdateNodePowerStates, MockCallsMatch(
+                call(ANY, states=[
+                    {"system_id": system_ids[0], "power_state": 'on'}]),
+                call(ANY, states=[
+                    {"system_id": system_ids[1], "power_state": 'off'},
+                    {"system_id": system_ids[2], "power_state": 'off'}])))
+
+    def test_update_falls_back_to_UpdateNodePowerState(self):
+        system_id = factory.make_name('system_id')
+        state = random.choice(['on', 'off'])
+        fixture = self.useFixture(MockClusterToRegionRPCFixture())
+        protocol, io = fixture.makeEventLoop(region.UpdateNodePowerState)
+        d = power.PowerStateUpdates().update(system_id, state)
+        io.flush()
+        self.assertEqual({}, extract_result(d))
+        self.assertThat(
+            protocol.UpdateNodePowerState,
+            MockCalledOnceWith(ANY, system_id=system_id, power_state=state))
+
+    def test_update_fails_when_region_not_available(self):
+        self.patch(power, "getRegionClient").side_effect = (
+            exceptions.NoConnectionsAvailable())
+        d = power.PowerStateUpdates().update(
+            factory.make_name('system_id'), 'on')
+        self.assertRaises(
+            exceptions.NoConnectionsAvailable, extract_result, d)
+
+
 class TestChangePowerState(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
@@ -174,6 +237,7 @@ class TestChangePowerState(MAASTestCase):
     def setUp(self):
         super(TestChangePowerState, self).setUp()
         self.useFixture(EventTypesAllRegistered())
+        self.patch(power, "power_state_updates", power.PowerStateUpdates())
 
     @inlineCallbacks
     def patch_rpc_methods(self, return_value={}, side_effect=None):
@@ -382,6 +446,7 @@ class TestMaybeChangePowerState(MAASTestCase):
     def setUp(self):
         super(TestMaybeChangePowerState, self).setUp()
         self.patch(power, 'power_action_registry', {})
+        self.patch(power, "power_state_updates", power.PowerStateUpdates())
         for _, power_driver in PowerDriverRegistry:
             self.patch(
                 power_driver, "detect_missing_packages").return_value = []
@@ -667,6 +732,7 @@ class TestPowerQuery(MAASTestCase):
     def setUp(self):
         super(TestPowerQuery, self).setUp()
         self.useFixture(EventTypesAllRegistered())
+        self.patch(power, "power_state_updates", power.PowerStateUpdates())
         self.patch(power, "deferToThread", maybeDeferred)
         for _, power_driver in PowerDriverRegistry:
             self.patch(
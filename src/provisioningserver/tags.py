@@ -4,6 +4,7 @@
 """Cluster-side evaluation of tags."""
 
 __all__ = [
+    'details_cache',
     'merge_details',
     'merge_details_cleanly',
     'process_node_tags',
@@ -13,6 +14,7 @@ from collections import OrderedDict
 from functools import partial
 import http.client
 import json
+import threading
 import urllib.error
 import urllib.parse
 import urllib.request
@@ -34,6 +36,90 @@ maaslog = get_maas_logger("tag_processing")
 # face of it, appears excessive.
 DEFAULT_BATCH_SIZE = 100
 
+# Minimum number of merged details documents to keep in `details_cache`. A
+# parsed lshw document takes a few hundred kB of memory.
+DETAILS_CACHE_SIZE = 1000
+
+# Maximum number of merged details documents to keep in `details_cache`, so
+# that it takes no more than several hundred MB however many nodes there are.
+DETAILS_CACHE_MAX_SIZE = 2000
+
+
+class DetailsCache:
+    """A least-recently-used cache of merged node details documents.
+
+    Documents are keyed by a token the region derives from the commissioning
+    results that the details came from. The token changes whenever a node is
+    commissioned again, so a cached document never needs invalidating; it
+    will fall out of the cache once it is no longer used.
+
+    Tags are evaluated by walking the same nodes in the same order, so a
+    plain LRU smaller than that walk would never be hit. The cache is
+    instead sized with `reserve` to hold every node of the current and the
+    previous evaluation pass, and never less than `size`. It never grows
+    beyond `max_size` though; beyond that, documents are parsed again.
+    """
+
+    def __init__(self, size=DETAILS_CACHE_SIZE, max_size=None):
+        super(DetailsCache, self).__init__()
+        if max_size is None:
+            max_size = max(size, DETAILS_CACHE_MAX_SIZE)
+        self.min_size = size
+        self.max_size = max_size
+        self.size = size
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pass = None
+        self._pass_nodes = set()
+        self._last_pass_nodes = set()
+
+    def reserve(self, pass_key, system_ids):
+        """Make room for the documents of `system_ids`.
+
+        :param pass_key: Identifies the evaluation pass, i.e. one evaluation
+            of a tag definition, that `system_ids` are part of. A pass may
+            be split across several calls.
+        """
+        with self._lock:
+            if pass_key != self._pass:
+                self._pass = pass_key
+                self._last_pass_nodes = self._pass_nodes
+                self._pass_nodes = set()
+            self._pass_nodes.update(system_ids)
+            self.size = min(self.max_size, max(self.min_size, len(
+                self._pass_nodes | self._last_pass_nodes)))
+            self._evict()
+
+    def get(self, key):
+        """Return the document cached for `key`, or `None`."""
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is not None:
+                self._docs.move_to_end(key)
+            return doc
+
+    def put(self, key, doc):
+        """Cache `doc` for `key`, evicting the least recently used."""
+        with self._lock:
+            self._docs[key] = doc
+            self._docs.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._docs) > self.size:
+            self._docs.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._pass = None
+            self._pass_nodes.clear()
+            self._last_pass_nodes.clear()
+            self.size = self.min_size
+
+
+details_cache = DetailsCache()
+
 
 def process_response(response):
     """All responses should be httplib.OK.
@@ -256,22 +342,41 @@ def gen_batches(things, batch_size):
     return (things[s] for s in slices)
 
 
-def gen_node_details(client, batches):
+def gen_node_details(client, batches, details_keys=None):
     """Fetch node details.
 
     This lazily fetches data in batches, but this detail is hidden
     from callers.
 
+    :param details_keys: An optional mapping of system IDs to the keys of
+        their details in `details_cache`. Cached documents are used rather
+        than being fetched again, and fetched documents are cached.
     :return: An iterator of ``(system-id, details-document)`` tuples.
     """
+    if details_keys is None:
+        details_keys = {}
     get_details = partial(get_details_for_nodes, client)
     for batch in batches:
-        for system_id, details in get_details(batch).items():
-            yield system_id, merge_details(details)
+        to_fetch = []
+        for system_id in batch:
+            key = details_keys.get(system_id)
+            doc = None if key is None else details_cache.get(key)
+            if doc is None:
+                to_fetch.append(system_id)
+            else:
+                yield system_id, doc
+        if len(to_fetch) == 0:
+            continue
+        for system_id, details in get_details(to_fetch).items():
+            doc = merge_details(details)
+            key = details_keys.get(system_id)
+            if key is not None:
+                details_cache.put(key, doc)
+            yield system_id, doc
 
 
 def process_all(client, rack_id, tag_name, tag_definition, system_ids,
-                xpath, batch_size=None):
+                xpath, batch_size=None, details_keys=None):
     maaslog.debug(
         "processing %d system_ids for tag %s.",
         len(system_ids), tag_name)
@@ -280,7 +385,7 @@ def process_all(client, rack_id, tag_name, tag_definition, system_ids,
         batch_size = DEFAULT_BATCH_SIZE
 
     batches = gen_batches(system_ids, batch_size)
-    node_details = gen_node_details(client, batches)
+    node_details = gen_node_details(client, batches, details_keys)
     nodes_matched, nodes_unmatched = classify(
         partial(try_match_xpath, xpath, logger=maaslog), node_details)
     post_updated_nodes(
@@ -294,7 +399,8 @@ def process_node_tags(
     """Update the nodes for a new/changed tag definition.
 
     :param rack_id: System ID for the rack controller.
-    :param nodes: List of nodes to process tags for.
+    :param nodes: List of nodes to process tags for. Each may have a
+        ``details_key``, under which its details are cached.
     :param client: A `MAASClient` used to fetch the node's details via
         calls to the web API.
     :param tag_name: Name of the tag to update nodes for
@@ -308,6 +414,12 @@ def process_node_tags(
         node["system_id"]
         for node in nodes
     ]
+    details_keys = {
+        node["system_id"]: node["details_key"]
+        for node in nodes
+        if node.get("details_key") is not None
+    }
+    details_cache.reserve((tag_name, tag_definition), system_ids)
     process_all(
         client, rack_id, tag_name, tag_definition, system_ids, xpath,
-        batch_size=batch_size)
+        batch_size=batch_size, details_keys=details_keys)
@@ -9,6 +9,8 @@ __all__ = [
 import random
 from unittest.mock import (
     ANY,
+    call,
+    Mock,
     sentinel,
 )
 
@@ -16,12 +18,16 @@ from maastesting.factory import factory
 from maastesting.matchers import (
     MockCalledOnce,
     MockCalledOnceWith,
+    MockCalledWith,
+    MockCallsMatch,
     MockNotCalled,
 )
 from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
 )
+from maastesting.twisted import extract_result
+from provisioningserver import events as events_module
 from provisioningserver.events import (
     EVENT_DETAILS,
     EVENT_TYPES,
@@ -34,6 +40,7 @@ from provisioningserver.events import (
 )
 from provisioningserver.rpc import region
 from provisioningserver.rpc.exceptions import (
+    NoConnectionsAvailable,
     NoSuchEventType,
     NoSuchNode,
 )
@@ -49,10 +56,13 @@ from testtools.matchers import (
     IsInstance,
 )
 from twisted.internet.defer import (
+    Deferred,
     fail,
     inlineCallbacks,
     succeed,
 )
+from twisted.internet.error import ConnectionLost
+from twisted.internet.task import Clock
 
 
 class TestEvents(MAASTestCase):
@@ -278,3 +288,191 @@ class TestSendEventMACAddress(MAASTestCase):
             yield event_hub.logByMAC(event_name, mac_address, description)
         # The event has been removed from the cache.
         self.assertThat(event_hub._types_registered, HasLength(0))
+
+
+class TestNodeEventHubSendEvents(MAASTestCase):
+    """Tests for batching events in `NodeEventHub`."""
+
+    def setUp(self):
+        super(TestNodeEventHubSendEvents, self).setUp()
+        self.client = Mock(side_effect=lambda *args, **kwargs: succeed({}))
+        self.patch(events_module, "getRegionClient").return_value = (
+            self.client)
+        self.clock = Clock()
+        self.event_hub = NodeEventHub(clock=self.clock)
+        # Don't contact the region to register event types.
+        self.event_hub._types_registered.update(map_enum(EVENT_TYPES).values())
+
+    def make_event(self):
+        return {
+            "system_id": factory.make_name("system_id"),
+            "type_name": random.choice(list(map_enum(EVENT_TYPES))),
+            "description": factory.make_name("description"),
+            "timestamp": self.clock.seconds(),
+        }
+
+    def log(self, event):
+        return self.event_hub.logByID(
+            event["type_name"], event["system_id"], event["description"])
+
+    def test__sends_event_with_SendEvents(self):
+        event = self.make_event()
+        d = self.log(event)
+        self.assertThat(extract_result(d), Equals({}))
+        self.assertThat(self.client, MockCalledOnceWith(
+            region.SendEvents, events=[event]))
+
+    def test__sends_event_by_mac_address_with_SendEvents(self):
+        mac_address = factory.make_mac_address()
+        event_type = random.choice(list(map_enum(EVENT_TYPES)))
+        d = self.event_hub.logByMAC(event_type, mac_address, "description")
+        self.assertThat(extract_result(d), Equals({}))
+        self.assertThat(self.client, MockCalledOnceWith(
+            region.SendEvents, events=[{
+                "mac_address": mac_address, "type_name": event_type,
+                "description": "description",
+                "timestamp": self.clock.seconds()}]))
+
+    def test__stamps_events_with_time_they_were_queued(self):
+        self.client.side_effect = [fail(ConnectionLost()), succeed({})]
+        self.clock.advance(1000.5)
+        event = self.make_event()
+        self.log(event).addErrback(lambda _: None)
+        self.clock.advance(events_module.EVENT_RETRY_DELAY)
+        self.assertThat(self.client, MockCallsMatch(
+            call(region.SendEvents, events=[event]),
+            call(region.SendEvents, events=[event])))
+        self.assertThat(event["timestamp"], Equals(1000.5))
+
+    def test__sends_events_logged_while_sending_together(self):
+        sending = Deferred()
+        self.client.side_effect = [sending, succeed({})]
+        events = [self.make_event() for _ in range(3)]
+        ds = [self.log(event) for event in events]
+        self.assertThat(self.client, MockCalledOnceWith(
+            region.SendEvents, events=events[:1]))
+        sending.callback({})
+        self.assertThat(self.client, MockCallsMatch(
+            call(region.SendEvents, events=events[:1]),
+            call(region.SendEvents, events=events[1:])))
+        self.assertThat([extract_result(d) for d in ds], AllMatch(Equals({})))
+
+    def test__limits_size_of_batches(self):
+        self.patch(events_module, "EVENT_BATCH_SIZE", 2)
+        sending = Deferred()
+        self.client.side_effect = [sending, succeed({}), succeed({})]
+        events = [self.make_event() for _ in range(5)]
+        for event in events:
+            self.log(event)
+        sending.callback({})
+        self.assertThat(self.client, MockCallsMatch(
+            call(region.SendEvents, events=events[:1]),
+            call(region.SendEvents, events=events[1:3]),
+            call(region.SendEvents, events=events[3:])))
+
+    def test__keeps_events_and_sends_them_again_after_failure(self):
+        self.client.side_effect = [fail(ConnectionLost()), succeed({})]
+        event = self.make_event()
+        d = self.log(event)
+        # The caller is told about the failure.
+        self.assertRaises(ConnectionLost, extract_result, d)
+        self.assertThat(self.client, MockCalledOnce())
+        # Events logged before the retry wait for it.
+        another_event = self.make_event()
+        another_d = self.log(another_event)
+        self.assertThat(self.client, MockCalledOnce())
+        self.clock.advance(events_module.EVENT_RETRY_DELAY)
+        self.assertThat(self.client, MockCallsMatch(
+            call(region.SendEvents, events=[event]),
+            call(region.SendEvents, events=[event, another_event])))
+        self.assertThat(extract_result(another_d), Equals({}))
+        self.assertThat(self.event_hub._events, HasLength(0))
+
+    def test__limits_encoded_size_of_batches(self):
+        sending = Deferred()
+        self.client.side_effect = [sending, succeed({}), succeed({})]
+        events = [self.make_event() for _ in range(5)]
+        for event in events:
+            event["description"] = "x" * 400
+        # Two events fit in a batch, but not three.
+        self.patch(events_module, "EVENT_BATCH_LIMIT", 2 * max(
+            events_module.get_encoded_size(event) for event in events))
+        for event in events:
+            self.log(event)
+        sending.callback({})
+        self.assertThat(self.client, MockCallsMatch(
+            call(region.SendEvents, events=events[:1]),
+            call(region.SendEvents, events=events[1:3]),
+            call(region.SendEvents, events=events[3:])))
+
+    def test__splits_batches_the_region_cannot_take(self):
+        sending = Deferred()
+        events = [self.make_event() for _ in range(4)]
+        bad_event = events[2]
+
+        def send(command, events):
+            if self.client.call_count == 1:
+                return sending
+            elif bad_event in events:
+                return fail(ZeroDivisionError())
+            else:
+                return succeed({})
+
+        self.client.side_effect = send
+        log = self.patch(events_module, "log")
+        ds = [self.log(event) for event in events]
+        sending.callback({})
+        self.assertThat(self.client, MockCallsMatch(
+            call(region.SendEvents, events=events[:1]),
+            call(region.SendEvents, events=events[1:]),
+            call(region.SendEvents, events=events[1:2]),
+            call(region.SendEvents, events=events[2:]),
+            call(region.SendEvents, events=events[2:3]),
+            call(region.SendEvents, events=events[3:])))
+        self.assertThat(log.err, MockCalledOnceWith(None, ANY))
+        self.assertRaises(ZeroDivisionError, extract_result, ds[2])
+        self.assertThat(
+            [extract_result(ds[index]) for index in (0, 1, 3)],
+            AllMatch(Equals({})))
+        self.assertThat(self.event_hub._events, HasLength(0))
+        self.assertThat(self.event_hub._retry, Is(None))
+
+    def test__keeps_events_when_there_is_no_connection(self):
+        self.patch(events_module, "getRegionClient").side_effect = (
+            NoConnectionsAvailable())
+        event = self.make_event()
+        d = self.log(event)
+        self.assertRaises(NoConnectionsAvailable, extract_result, d)
+        self.assertThat(
+            list(self.event_hub._events), Equals([(event, None)]))
+
+    def test__get_encoded_size_matches_SendEvents(self):
+        event = self.make_event()
+        event["description"] = "\u2603 snowman"
+        encoded = region.SendEvents.makeArguments(
+            {"events": [event]}, None)
+        self.assertThat(
+            events_module.get_encoded_size(event),
+            Equals(len(encoded[b"events"])))
+
+    def test__drops_oldest_events_when_buffer_is_full(self):
+        self.patch(events_module, "EVENT_BUFFER_SIZE", 2)
+        maaslog = self.patch(events_module, "maaslog")
+        self.client.side_effect = lambda *args, **kwargs: fail(
+            ConnectionLost())
+        events = [self.make_event() for _ in range(3)]
+        for event in events:
+            self.log(event).addErrback(lambda _: None)
+        self.assertThat(
+            [event for event, _ in self.event_hub._events],
+            Equals(events[1:]))
+        self.assertThat(maaslog.warning, MockCalledOnce())
+        # The number of events dropped is reported once the region can
+        # take events again.
+        self.client.side_effect = lambda *args, **kwargs: succeed({})
+        self.clock.advance(events_module.EVENT_RETRY_DELAY)
+        self.assertThat(self.client, MockCalledWith(
+            region.SendEvents, events=events[1:]))
+        self.assertThat(maaslog.warning, MockCallsMatch(
+            call(ANY),
+            call(ANY, 1)))
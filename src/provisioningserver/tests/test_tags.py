@@ -28,6 +28,7 @@ from maastesting.matchers import (
     IsCallable,
     MockCalledOnceWith,
     MockCallsMatch,
+    MockNotCalled,
 )
 from maastesting.testcase import MAASTestCase
 from provisioningserver import tags
@@ -472,6 +473,102 @@ class TestGenNodeDetails(MAASTestCase):
             get_details_for_nodes.mock_calls)
 
 
+    def test__uses_and_fills_details_cache(self):
+        self.patch(tags, "details_cache", tags.DetailsCache())
+        tags.details_cache.put("key1", "cached:s1")
+        get_details_for_nodes = self.patch(tags, "get_details_for_nodes")
+        get_details_for_nodes.return_value = {
+            "s2": {"bar": "<node>s2</node>"},
+            "s3": {"cob": "<node>s3</node>"},
+        }
+        self.fake_merge_details()
+        node_details = tags.gen_node_details(
+            sentinel.client, [["s1", "s2", "s3"]],
+            {"s1": "key1", "s2": "key2"})
+        self.assertItemsEqual(
+            [('s1', 'cached:s1'), ('s2', 'merged:bar'), ('s3', 'merged:cob')],
+            node_details)
+        self.assertThat(
+            get_details_for_nodes,
+            MockCalledOnceWith(sentinel.client, ["s2", "s3"]))
+        self.assertEqual("merged:bar", tags.details_cache.get("key2"))
+
+    def test__does_not_fetch_when_all_cached(self):
+        self.patch(tags, "details_cache", tags.DetailsCache())
+        tags.details_cache.put("key1", "cached:s1")
+        get_details_for_nodes = self.patch(tags, "get_details_for_nodes")
+        node_details = tags.gen_node_details(
+            sentinel.client, [["s1"]], {"s1": "key1"})
+        self.assertItemsEqual([('s1', 'cached:s1')], node_details)
+        self.assertThat(get_details_for_nodes, MockNotCalled())
+
+
+class TestDetailsCache(MAASTestCase):
+
+    def test_get_returns_None_when_not_cached(self):
+        cache = tags.DetailsCache()
+        self.assertIsNone(cache.get(factory.make_name("key")))
+
+    def test_put_evicts_least_recently_used(self):
+        cache = tags.DetailsCache(size=2)
+        cache.put("a", sentinel.a)
+        cache.put("b", sentinel.b)
+        self.assertIs(sentinel.a, cache.get("a"))
+        cache.put("c", sentinel.c)
+        self.assertIs(sentinel.a, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(sentinel.c, cache.get("c"))
+
+    def test_clear(self):
+        cache = tags.DetailsCache()
+        cache.put("a", sentinel.a)
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+
+    def test_reserve_grows_to_hold_a_whole_pass(self):
+        cache = tags.DetailsCache(size=2)
+        # One pass split across two calls.
+        cache.reserve("tag1", ["s1", "s2"])
+        cache.reserve("tag1", ["s3"])
+        self.assertEqual(3, cache.size)
+        for key in "abc":
+            cache.put(key, key)
+        # Walking the same nodes again in the same order hits every time.
+        self.assertEqual(["a", "b", "c"], [cache.get(key) for key in "abc"])
+
+    def test_reserve_grows_no_larger_than_max_size(self):
+        cache = tags.DetailsCache(size=1, max_size=2)
+        cache.reserve("tag1", ["s1", "s2", "s3"])
+        self.assertEqual(2, cache.size)
+        for key in "abc":
+            cache.put(key, key)
+        self.assertIsNone(cache.get("a"))
+
+    def test_max_size_defaults_to_at_least_size(self):
+        self.assertEqual(
+            tags.DETAILS_CACHE_MAX_SIZE, tags.DetailsCache(size=1).max_size)
+        size = tags.DETAILS_CACHE_MAX_SIZE + 1
+        self.assertEqual(size, tags.DetailsCache(size=size).max_size)
+
+    def test_reserve_keeps_room_for_the_previous_pass(self):
+        cache = tags.DetailsCache(size=1)
+        cache.reserve("tag1", ["s1", "s2", "s3"])
+        cache.reserve("tag2", ["s1"])
+        self.assertEqual(3, cache.size)
+        cache.reserve("tag3", ["s1"])
+        self.assertEqual(1, cache.size)
+
+    def test_reserve_evicts_down_to_size(self):
+        cache = tags.DetailsCache(size=1)
+        cache.reserve("tag1", ["s1", "s2"])
+        cache.put("a", sentinel.a)
+        cache.put("b", sentinel.b)
+        cache.reserve("tag2", ["s1"])
+        cache.reserve("tag3", ["s1"])
+        self.assertIsNone(cache.get("a"))
+        self.assertIs(sentinel.b, cache.get("b"))
+
+
 class TestTagUpdating(MAASTestCase):
 
     def setUp(self):
@@ -614,3 +711,16 @@ class TestTagUpdating(MAASTestCase):
                 tag_url, as_json=True, op='update_nodes',
                 rack_controller=rack_id, definition=tag_definition,
                 add=['system-id1'], remove=['system-id2']))
+
+    def test_process_node_tags_reserves_details_cache(self):
+        self.patch(tags, "details_cache", tags.DetailsCache())
+        reserve = self.patch(tags.details_cache, "reserve")
+        self.patch(tags, "process_all")
+        tag_name = factory.make_name('tag')
+        tag_definition = '//node'
+        tags.process_node_tags(
+            factory.make_name('rack'),
+            [{"system_id": "system-id1"}, {"system_id": "system-id2"}],
+            tag_name, tag_definition, {}, sentinel.client)
+        self.assertThat(reserve, MockCalledOnceWith(
+            (tag_name, tag_definition), ["system-id1", "system-id2"]))
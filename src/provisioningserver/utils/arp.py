@@ -314,8 +314,8 @@ def observe_arp_packets(
             # Not an Ethernet interface. Need to exit here, because our
             # assumptions about the link layer header won't be correct.
             return 4
-        for header, packet in pcap:
-            ethernet = Ethernet(packet, time=header.timestamp_seconds)
+        for header, packet in pcap.iter_bulk(ethertypes=[ETHERTYPE.ARP]):
+            ethernet = Ethernet(packet, time=header[0])
             if not ethernet.is_valid():
                 # Ignore packets with a truncated Ethernet header.
                 continue
@@ -38,10 +38,12 @@ from provisioningserver.security import (
     fernet_encrypt_psk,
 )
 from provisioningserver.utils import sudo
+from provisioningserver.utils.ethernet import ETHERTYPE
 from provisioningserver.utils.network import format_eui
 from provisioningserver.utils.pcap import (
     PCAP,
     PCAPError,
+    PCAPPacketHeader,
 )
 from provisioningserver.utils.script import ActionScriptError
 from provisioningserver.utils.tcpip import (
@@ -265,7 +267,9 @@ def observe_beaconing_packets(input=sys.stdin.buffer, out=sys.stdout):
             # Not an Ethernet interface. Need to exit here, because our
             # assumptions about the link layer header won't be correct.
             return 4
-        for pcap_header, packet_bytes in pcap:
+        ipv4_packets = pcap.iter_bulk(ethertypes=[ETHERTYPE.IPV4])
+        for pcap_header, packet_bytes in ipv4_packets:
+            pcap_header = PCAPPacketHeader._make(pcap_header)
             try:
                 packet = decode_ethernet_udp_packet(packet_bytes, pcap_header)
                 beacon = BeaconingPacket(packet.payload)
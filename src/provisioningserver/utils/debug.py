@@ -5,10 +5,16 @@
 
 __all__ = [
     'get_full_thread_dump',
+    'get_rpc_statistics_dump',
+    'get_statistics_dump',
     'print_full_thread_dump',
     'register_sigusr2_thread_dump_handler',
+    'register_statistics',
+    'report_counters',
+    'unregister_statistics',
     ]
 
+from collections import OrderedDict
 import io
 import signal
 from sys import _current_frames as current_frames
@@ -19,6 +25,10 @@ from time import (
 )
 import traceback
 
+# Reports printed by `get_statistics_dump`, keyed by title, in the order
+# they were registered.
+_statistics = OrderedDict()
+
 
 def get_full_thread_dump():
     """Returns a string containing a traceback for all threads"""
@@ -45,9 +55,67 @@ def get_full_thread_dump():
     return thread_dump
 
 
+def get_rpc_statistics_dump():
+    """Returns a string containing statistics for all RPC calls"""
+    from provisioningserver.rpc import common
+    output = io.StringIO()
+    time = strftime("%Y-%m-%d %H:%M:%S", gmtime())
+    output.write("\n>>>> Begin RPC statistics (%s) >>>>\n" % time)
+    for title, statistics in (
+            ("Calls made", common.calls_made),
+            ("Calls handled", common.calls_handled)):
+        output.write("\n# %s\n" % title)
+        for line in statistics.report():
+            output.write("%s\n" % line)
+    output.write("\n<<<< End RPC statistics <<<<\n\n")
+
+    statistics_dump = output.getvalue()
+    output.close()
+    return statistics_dump
+
+
+def register_statistics(title, report):
+    """Include `report` in the statistics printed upon SIGUSR2.
+
+    :param title: The heading printed before the report. A report already
+        registered with this title is replaced.
+    :param report: A callable that returns the report as a list of lines.
+    """
+    _statistics[title] = report
+
+
+def unregister_statistics(title):
+    """Stop printing the report registered with `title`, if any."""
+    _statistics.pop(title, None)
+
+
+def report_counters(counters):
+    """Return a line of text for each of `counters`, sorted by name."""
+    return ["%s: %d" % (name, counters[name]) for name in sorted(counters)]
+
+
+def get_statistics_dump():
+    """Returns a string containing every registered report of statistics"""
+    output = io.StringIO()
+    time = strftime("%Y-%m-%d %H:%M:%S", gmtime())
+    output.write("\n>>>> Begin statistics (%s) >>>>\n" % time)
+    for title, report in list(_statistics.items()):
+        output.write("\n# %s\n" % title)
+        for line in report():
+            output.write("%s\n" % line)
+    output.write("\n<<<< End statistics <<<<\n\n")
+
+    statistics_dump = output.getvalue()
+    output.close()
+    return statistics_dump
+
+
 def print_full_thread_dump(signum=None, stack=None):
-    """Creates a full thread dump, then prints it to stdout."""
+    """Creates a full thread dump, then prints it to stdout, followed by
+    statistics for all RPC calls and every registered report."""
     print(get_full_thread_dump())
+    print(get_rpc_statistics_dump())
+    print(get_statistics_dump())
 
 
 def register_sigusr2_thread_dump_handler():
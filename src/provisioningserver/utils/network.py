@@ -19,8 +19,11 @@ __all__ = [
     'ip_range_within_network',
 ]
 
+from array import array
+from bisect import bisect_left
 import codecs
 from collections import namedtuple
+from functools import lru_cache
 from operator import attrgetter
 import re
 import socket
@@ -46,11 +49,13 @@ from netaddr import (
     IPAddress,
     IPNetwork,
     IPRange,
+    OUI,
 )
 from netaddr.core import (
     AddrFormatError,
     NotRegisteredError,
 )
+from netaddr.eui import ieee
 import netifaces
 from provisioningserver.utils.dhclient import get_dhclient_info
 from provisioningserver.utils.ipaddr import get_ip_addr
@@ -86,6 +91,12 @@ ENI_PARSED_METHODS = [
 
 REVERSE_RESOLVE_RETRIES = (1, 2, 4, 8, 16)
 
+# Matches the first line of each record in the IEEE OUI registry, e.g.:
+#   00-00-00   (hex)		XEROX CORPORATION
+OUI_REGISTRY_RECORD = re.compile(
+    br'^[ \t]*([0-9A-Fa-f]{2})-([0-9A-Fa-f]{2})-([0-9A-Fa-f]{2})'
+    br'[ \t]+\(hex\)[ \t]+(.*?)\s*$', re.MULTILINE)
+
 
 # Type hints for `outer_range` parameter (get_unused_ranges()).
 OuterRange = TypeVar('OuterRange', IPRange, IPNetwork, bytes, str)
@@ -920,14 +931,78 @@ def format_eui(eui):
     return str(eui).replace('-', ':').lower()
 
 
-def get_eui_organization(eui):
-    """Returns the registered organization for the specified EUI, if it can be
-    determined. Otherwise, returns None.
+class OUIIndex:
+    """In-memory index of the organizations in the IEEE OUI registry.
 
-    :param eui:A `netaddr.EUI` object.
+    The 24-bit prefixes are held in a sorted array and found by bisection;
+    the organization for each prefix is at the same position in a list.
+    """
+
+    def __init__(self, records):
+        """
+        :param records: An iterable of `(oui, organization)` tuples, where
+            `oui` is an integer. If an OUI is repeated, the first wins.
+        """
+        organizations = {}
+        for oui, organization in records:
+            organizations.setdefault(oui, organization)
+        self.prefixes = array('I', sorted(organizations))
+        self.organizations = [
+            organizations[prefix] for prefix in self.prefixes]
+
+    @classmethod
+    def from_registry(cls, data: bytes):
+        """Create an index from the contents of an `oui.txt` file."""
+        names = {}
+
+        def records():
+            for match in OUI_REGISTRY_RECORD.finditer(data):
+                oui = int(b''.join(match.group(1, 2, 3)), 16)
+                # Share one string between an organization's prefixes.
+                name = match.group(4).decode('utf-8', 'replace')
+                yield oui, names.setdefault(name, name)
+
+        return cls(records())
+
+    def __len__(self):
+        return len(self.prefixes)
+
+    def get(self, oui: int):
+        """Returns the organization for `oui`, or None if not registered."""
+        index = bisect_left(self.prefixes, oui)
+        if index != len(self.prefixes) and self.prefixes[index] == oui:
+            return self.organizations[index]
+        else:
+            return None
+
+
+@lru_cache(maxsize=1)
+def get_oui_index():
+    """Returns an `OUIIndex` of netaddr's copy of the OUI registry.
+
+    The registry is read once, the first time this is called. Returns None
+    if the registry cannot be read.
     """
     try:
-        registration = eui.oui.registration()
+        with open(ieee.OUI_REGISTRY, 'rb') as fd:
+            data = fd.read()
+    except (AttributeError, OSError):
+        # Different versions of netaddr keep the registry elsewhere.
+        return None
+    else:
+        return OUIIndex.from_registry(data)
+
+
+@lru_cache(maxsize=1024)
+def get_oui_organization(oui: int):
+    """Returns the registered organization for the specified 24-bit OUI, if
+    it can be determined. Otherwise, returns None.
+    """
+    index = get_oui_index()
+    if index is not None:
+        return index.get(oui)
+    try:
+        registration = OUI(oui).registration()
         # Note that `registration` is not a dictionary, so we can't use .get().
         return registration['org']
     except UnicodeError:
@@ -940,6 +1015,16 @@ def get_eui_organization(eui):
         return None
 
 
+def get_eui_organization(eui):
+    """Returns the registered organization for the specified EUI, if it can be
+    determined. Otherwise, returns None.
+
+    :param eui:A `netaddr.EUI` object.
+    """
+    # The OUI is the most significant 24 bits of an EUI-48 or EUI-64.
+    return get_oui_organization(eui.value >> (eui.version - 24))
+
+
 def get_mac_organization(mac):
     """Returns the registered organization for the specified EUI, if it can be
     determined. Otherwise, returns None.
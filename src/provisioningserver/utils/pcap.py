@@ -20,6 +20,15 @@ import sys
 PCAP_NATIVE_BYTE_ORDER_MAGIC_NUMBER = 0xa1b2c3d4
 PCAP_HEADER_SIZE = 24
 PCAP_PACKET_HEADER_SIZE = 16
+PCAP_PACKET_HEADER = struct.Struct('IIII')
+
+# Number of bytes to ask for at once when reading packets in bulk.
+PCAP_BULK_READ_SIZE = 65536
+
+# Offsets of the Ethertype within an untagged and an 802.1q-tagged frame.
+ETHERTYPE_OFFSET = 12
+VLAN_ETHERTYPE_OFFSET = 16
+ETHERTYPE_VLAN = 0x8100
 
 PCAPHeader = namedtuple('PCAPHeader', (
     'magic_number',
@@ -64,6 +73,8 @@ class PCAP:
        """
         super().__init__()
         self.stream = stream
+        # Bytes read from the stream but not yet consumed; see `read_bulk`.
+        self.buffer = bytearray()
         global_header_bytes = stream.read(PCAP_HEADER_SIZE)
         if len(global_header_bytes) == 0:
             raise EOFError("No PCAP output found.")
@@ -94,7 +105,7 @@ class PCAP:
         :raise EOFError: If this is an attempt to read beyond the last packet.
         :raise PCAPError: If the PCAP stream was invalid.
         """
-        pcap_packet_header_bytes = self.stream.read(PCAP_PACKET_HEADER_SIZE)
+        pcap_packet_header_bytes = self._read(PCAP_PACKET_HEADER_SIZE)
         if len(pcap_packet_header_bytes) == 0:
             raise EOFError("End of PCAP stream.")
         if len(pcap_packet_header_bytes) != PCAP_PACKET_HEADER_SIZE:
@@ -108,11 +119,98 @@ class PCAP:
         # } pcaprec_hdr_t;
         pcap_packet_header = PCAPPacketHeader._make(
             struct.unpack('IIII', pcap_packet_header_bytes))
-        packet = self.stream.read(pcap_packet_header.bytes_captured)
+        packet = self._read(pcap_packet_header.bytes_captured)
         if len(packet) != pcap_packet_header.bytes_captured:
             raise PCAPError("Unexpected end of PCAP stream: invalid packet.")
         return pcap_packet_header, packet
 
+    def _read(self, size):
+        """Reads `size` bytes, consuming any buffered bytes first."""
+        if len(self.buffer) == 0:
+            return self.stream.read(size)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+    def read_bulk(self, ethertypes=None, size=PCAP_BULK_READ_SIZE):
+        """Reads all the complete packets available from the PCAP stream.
+
+        Up to `size` bytes are read at once; when the stream supports
+        `read1()`, as pipes from tcpdump do, this does not block once some
+        data is available. Any trailing partial packet is kept for the next
+        call.
+
+        :param ethertypes: If specified, a collection of Ethertypes (as
+            `bytes`, e.g. `ETHERTYPE.ARP`). Packets of other types are
+            skipped before being copied out of the read buffer. The Ethertype
+            of an 802.1q-tagged frame is that of its encapsulated payload.
+        :returns: a list of (pcap_packet_header, packet) tuples, as returned
+            by `read()`, except that each pcap_packet_header is a plain
+            tuple. The list may be empty if no complete packet matched.
+        :raise EOFError: If this is an attempt to read beyond the last packet.
+        :raise PCAPError: If the PCAP stream was invalid.
+        """
+        read = getattr(self.stream, "read1", self.stream.read)
+        data = read(size)
+        if len(data) == 0:
+            if len(self.buffer) == 0:
+                raise EOFError("End of PCAP stream.")
+            elif len(self.buffer) < PCAP_PACKET_HEADER_SIZE:
+                raise PCAPError(
+                    "Unexpected end of PCAP stream: invalid packet header.")
+            else:
+                raise PCAPError(
+                    "Unexpected end of PCAP stream: invalid packet.")
+        buffer = self.buffer
+        buffer += data
+        if ethertypes is not None:
+            ethertypes = frozenset(
+                int.from_bytes(ethertype, "big") for ethertype in ethertypes)
+        view = memoryview(buffer)
+        unpack_header = PCAP_PACKET_HEADER.unpack_from
+        packets = []
+        offset = 0
+        end = len(buffer)
+        try:
+            while end - offset >= PCAP_PACKET_HEADER_SIZE:
+                header = unpack_header(buffer, offset)
+                start = offset + PCAP_PACKET_HEADER_SIZE
+                stop = start + header[2]
+                if stop > end:
+                    break
+                offset = stop
+                if ethertypes is not None:
+                    index = start + ETHERTYPE_OFFSET
+                    if stop - index < 2:
+                        continue
+                    ethertype = buffer[index] << 8 | buffer[index + 1]
+                    if ethertype == ETHERTYPE_VLAN:
+                        index = start + VLAN_ETHERTYPE_OFFSET
+                        if stop - index < 2:
+                            continue
+                        ethertype = buffer[index] << 8 | buffer[index + 1]
+                    if ethertype not in ethertypes:
+                        continue
+                packets.append((header, bytes(view[start:stop])))
+        finally:
+            view.release()
+        del buffer[:offset]
+        return packets
+
+    def iter_bulk(self, ethertypes=None):
+        """Iterate this PCAP stream, reading packets in bulk.
+
+        See `read_bulk` for the meaning of `ethertypes`. Stops when EOF is
+        encountered."""
+        while True:
+            try:
+                packets = self.read_bulk(ethertypes)
+            except EOFError:
+                break
+            yield from packets
+
     def __iter__(self):
         """Iterate this PCAP stream.
 
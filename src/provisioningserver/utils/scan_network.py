@@ -8,21 +8,36 @@ __all__ = [
     "run"
 ]
 
-from collections import namedtuple
+from collections import (
+    namedtuple,
+    OrderedDict,
+)
 import json
 from multiprocessing import cpu_count
 from multiprocessing.pool import ThreadPool
 import os
+import select
+import socket
+import struct
 import subprocess
 import sys
 from textwrap import dedent
 import time
 
 from netaddr import (
+    IPAddress,
     IPNetwork,
     IPSet,
 )
 from netaddr.core import AddrFormatError
+from provisioningserver.utils.arp import (
+    ARP_PACKET,
+    SIZEOF_ARP_PACKET,
+)
+from provisioningserver.utils.ethernet import (
+    Ethernet,
+    ETHERTYPE,
+)
 from provisioningserver.utils.network import get_all_interfaces_definition
 from provisioningserver.utils.script import ActionScriptError
 from provisioningserver.utils.shell import (
@@ -37,6 +52,18 @@ PingParameters = namedtuple('PingParameters', ('interface', 'ip'))
 NmapParameters = namedtuple('NmapParameters', ('interface', 'cidr', 'slow'))
 
 
+# The Linux protocol number for ARP frames on an AF_PACKET socket.
+ETH_P_ARP = 0x0806
+
+# Packets per second to send during an ARP scan, unless otherwise specified.
+# A /16 takes a little over a minute to sweep at this rate.
+ARP_SCAN_RATE = 1000
+
+# Packets per second to send during a slow ARP scan; this matches the rate
+# used for slow nmap scans.
+ARP_SCAN_SLOW_RATE = 9
+
+
 def add_arguments(parser):
     """Add this command's options to the `ArgumentParser`.
 
@@ -61,7 +88,13 @@ def add_arguments(parser):
         """)
     parser.add_argument(
         '-s', '--slow', action='store_true', required=False,
-        help='Scan slower. Only applies to nmap scans; ping is slow already.')
+        help='Scan slower. Applies to ARP and nmap scans; ping is slow '
+             'already.')
+    parser.add_argument(
+        '-r', '--rate', required=False, type=int,
+        help='Number of ARP requests to send per second during an ARP scan. '
+             'Default is %d, or %d if --slow is specified.' % (
+                 ARP_SCAN_RATE, ARP_SCAN_SLOW_RATE))
     parser.add_argument(
         '-t', '--threads', required=False, type=int,
         help='Number of concurrent threads to spawn during a scan. '
@@ -69,7 +102,8 @@ def add_arguments(parser):
              'ping, or one times the number of CPUs when using nmap.')
     parser.add_argument(
         '-p', '--ping', action='store_true', required=False,
-        help='Scan using ping. (Default is to scan with nmap, if installed.)')
+        help='Scan using ping. (Default is to scan with ARP, if raw sockets '
+             'can be used, otherwise with nmap, if installed.)')
     parser.add_argument(
         'interface', type=str, nargs='?',
         help="Ethernet interface to ping from. Optional if all interfaces are "
@@ -331,6 +365,204 @@ def ping_scan(to_scan: dict, threads=None, threads_per_cpu=4):
             yield from pool.imap(run_ping, jobs)
 
 
+def open_arp_socket(ifname: str):
+    """Open a raw socket to send and receive ARP frames on `ifname`.
+
+    :return: A tuple of the socket and the interface's MAC address (`bytes`).
+    """
+    sock = socket.socket(
+        socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+    try:
+        sock.bind((ifname, ETH_P_ARP))
+        sock.setblocking(False)
+        return sock, sock.getsockname()[4]
+    except:
+        sock.close()
+        raise
+
+
+def arp_scan_available():
+    """Return True if raw sockets can be opened to perform an ARP scan."""
+    if not hasattr(socket, 'AF_PACKET'):
+        return False
+    try:
+        socket.socket(
+            socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP)).close()
+    except OSError:
+        return False
+    else:
+        return True
+
+
+def make_arp_request(src_mac: bytes, src_ip: int, target_ip: int) -> bytes:
+    """Return a broadcast Ethernet frame asking who has `target_ip`.
+
+    :param src_ip: The IPv4 address to send from, as an integer. If zero, the
+        request is sent as an ARP probe (see RFC 5227).
+    """
+    return b''.join((
+        b'\xff' * 6, src_mac, ETHERTYPE.ARP,
+        struct.pack(
+            ARP_PACKET, 1, 0x800, 6, 4, 1, src_mac, src_ip,
+            b'\x00' * 6, target_ip),
+    ))
+
+
+def get_arp_sender_ip(frame: bytes):
+    """Return the sender IPv4 address (an integer) of the ARP `frame`.
+
+    Returns None if `frame` is not an Ethernet ARP packet with a sender.
+    """
+    ethernet = Ethernet(frame)
+    if not ethernet.is_valid() or ethernet.ethertype != ETHERTYPE.ARP:
+        return None
+    if len(ethernet.payload) < SIZEOF_ARP_PACKET:
+        return None
+    (hardware_type, protocol, hardware_length, protocol_length, _,
+     sender_mac, sender_ip, _, _) = struct.unpack(
+        ARP_PACKET, ethernet.payload[:SIZEOF_ARP_PACKET])
+    if (hardware_type, protocol, hardware_length, protocol_length) != (
+            1, 0x800, 6, 4):
+        return None
+    if sender_ip == 0 or sender_mac == b'\x00' * 6:
+        return None
+    return sender_ip
+
+
+def yield_arp_targets(to_scan: dict, interfaces: dict=None):
+    """Yields each (interface, source-ip, target-ip) triple to scan.
+
+    The IP addresses are integers. The source IP is the address configured
+    on the interface for the network being scanned, or zero if there isn't
+    one.
+
+    :param to_scan: dict of {<interface-name>: <iterable-of-cidr-strings>}.
+    :param interfaces: the output of `get_all_interfaces_definition()`.
+    """
+    for interface in to_scan:
+        if interfaces is not None and interface in interfaces:
+            links = [
+                IPNetwork(link)
+                for link in yield_ipv4_networks_on_link(interface, interfaces)
+            ]
+        else:
+            links = []
+        for cidr in to_scan[interface]:
+            ipnetwork = IPNetwork(cidr)
+            if ipnetwork.version != 4:
+                continue
+            src_ip = 0
+            for link in links:
+                if IPAddress(ipnetwork.first) in link.cidr:
+                    src_ip = int(link.ip)
+                    break
+            for ip in ipnetwork.iter_hosts():
+                yield interface, src_ip, int(ip)
+
+
+def arp_scan(
+        to_scan: dict, interfaces: dict=None, slow=False, rate=None,
+        tries=2, timeout=1.0, open_socket=open_arp_socket, unscanned=None):
+    """Scans the specified networks by sending ARP requests.
+
+    The `to_scan` dictionary must be in the format:
+
+        {<interface_name>: <iterable-of-cidr-strings>, ...}
+
+    One raw socket is opened per interface. Requests are sent at `rate`
+    packets per second across all interfaces, while replies are collected
+    from every socket as they arrive. Addresses that have not replied are
+    asked again, up to `tries` times, then replies are awaited for a further
+    `timeout` seconds. Finally, an event is yielded for each address, in the
+    order they were scanned.
+
+    :param unscanned: If given, a dict to which the networks of interfaces
+        whose socket cannot be opened are added, in the same format as
+        `to_scan`, so that they can be scanned some other way. Those
+        interfaces are skipped. Otherwise the `OSError` is raised.
+    """
+    if rate is None:
+        rate = ARP_SCAN_SLOW_RATE if slow else ARP_SCAN_RATE
+    interval = 1.0 / rate
+    # The CIDRs may be given as iterators, which can only be used once.
+    to_scan = {
+        interface: list(cidrs)
+        for interface, cidrs in to_scan.items()
+    }
+    targets = list(yield_arp_targets(to_scan, interfaces))
+    sockets = {}
+    try:
+        for interface in OrderedDict.fromkeys(
+                interface for interface, _, _ in targets):
+            try:
+                sockets[interface] = open_socket(interface)
+            except OSError:
+                if unscanned is None:
+                    raise
+                unscanned[interface] = to_scan[interface]
+        targets = [target for target in targets if target[0] in sockets]
+        # Results for each (interface, ip) pair; an interface's own address
+        # is always up, as pinging it would be.
+        results = OrderedDict(
+            ((interface, ip), ip == src_ip)
+            for interface, src_ip, ip in targets)
+        waiting = sum(1 for result in results.values() if not result)
+        interfaces_by_fd = {
+            sock.fileno(): interface
+            for interface, (sock, _) in sockets.items()
+        }
+
+        def receive(until):
+            # Collect replies until the monotonic clock reaches `until`.
+            nonlocal waiting
+            while waiting > 0:
+                remaining = until - time.monotonic()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select.select(
+                    list(interfaces_by_fd), [], [], remaining)
+                for fd in readable:
+                    interface = interfaces_by_fd[fd]
+                    sock, _ = sockets[interface]
+                    while True:
+                        try:
+                            frame = sock.recv(65535)
+                        except (BlockingIOError, InterruptedError):
+                            break
+                        key = interface, get_arp_sender_ip(frame)
+                        if results.get(key) is False:
+                            results[key] = True
+                            waiting -= 1
+
+        for _ in range(tries):
+            if waiting == 0:
+                break
+            next_send = time.monotonic()
+            for interface, src_ip, ip in targets:
+                if results[interface, ip]:
+                    continue
+                receive(next_send)
+                sock, src_mac = sockets[interface]
+                try:
+                    sock.send(make_arp_request(src_mac, src_ip, ip))
+                except (BlockingIOError, InterruptedError):
+                    # The send buffer is full; this will be retried.
+                    pass
+                next_send = max(next_send + interval, time.monotonic())
+            receive(time.monotonic() + timeout)
+    finally:
+        for sock, _ in sockets.values():
+            sock.close()
+
+    for (interface, ip), result in results.items():
+        yield {
+            "scan_type": "arp",
+            "interface": interface,
+            "ip": str(IPAddress(ip)),
+            "result": result,
+        }
+
+
 def write_event(event, output=sys.stdout):
     """Writes an event dictionary to the specified stream in JSON format.
 
@@ -389,37 +621,32 @@ def adjust_scanning_parameters(
     return ifname_to_scan
 
 
-def scan_networks(args, to_scan, stderr, stdout):
+def scan_networks(args, to_scan, stderr, stdout, interfaces=None):
     """Interprets the specified `args` and `to_scan` dict to perform the scan.
 
     Uses the specified `stdout` and `stderr` for output.
+
+    :param interfaces: the output of `get_all_interfaces_definition()`, used
+        to choose source addresses for an ARP scan.
     """
     # Start the clock. (We want to measure how long the scan takes.)
     clock = time.monotonic()
-    # The user must explicitly opt out of using `nmap` by selecting --ping,
-    # unless `nmap` is not installed.
-    use_nmap = has_command_available('nmap')
+    # The user must explicitly opt out of scanning with ARP or `nmap` by
+    # selecting --ping. Without raw sockets, `nmap` is used if it's installed
+    # and `ping` otherwise. Interfaces on which a raw socket can't be opened
+    # are scanned the same way.
     use_ping = args.ping
-    if use_nmap and not use_ping:
-        tool = 'nmap'
-        scanner = nmap_scan(to_scan, slow=args.slow, threads=args.threads)
-        count = 0
-        for count, event in enumerate(scanner, 1):
-            write_event(event, stdout)
-        clock_diff = time.monotonic() - clock
-        if count > 0:
-            stderr.write(
-                "%d nmap scan(s) completed in %d second(s).\n" % (
-                    count, clock_diff))
-            stderr.flush()
-    else:
-        tool = 'ping'
-        # For a ping scan, we can easily get a count of the number of hosts,
-        # and whether or not the ping was successful. It will be printed to
-        # stderr for informational purposes.
-        count = 0
+    use_arp = not use_ping and arp_scan_available()
+    tool = None
+    count = 0
+    if use_arp:
+        tool = 'arp'
         hosts = 0
-        for event in ping_scan(to_scan, threads=args.threads):
+        unscanned = OrderedDict()
+        scanner = arp_scan(
+            to_scan, interfaces, slow=args.slow, rate=args.rate,
+            unscanned=unscanned)
+        for event in scanner:
             count += 1
             if event['result'] is True:
                 hosts += 1
@@ -427,9 +654,51 @@ def scan_networks(args, to_scan, stderr, stdout):
         clock_diff = time.monotonic() - clock
         if count > 0:
             stderr.write(
-                "Pinged %d hosts (%d up) in %d second(s).\n" % (
+                "ARP scanned %d hosts (%d up) in %d second(s).\n" % (
                     count, hosts, clock_diff))
             stderr.flush()
+        to_scan = unscanned
+    if not use_arp or len(to_scan) > 0:
+        use_nmap = not use_ping and has_command_available('nmap')
+        fallback = 'nmap' if use_nmap else 'ping'
+        if tool is None:
+            tool = fallback
+        else:
+            stderr.write(
+                "Warning: cannot ARP scan on %s; using %s instead.\n" % (
+                    ", ".join(to_scan), fallback))
+            stderr.flush()
+        if use_nmap:
+            scans = 0
+            for event in nmap_scan(
+                    to_scan, slow=args.slow, threads=args.threads):
+                scans += 1
+                write_event(event, stdout)
+            clock_diff = time.monotonic() - clock
+            if scans > 0:
+                stderr.write(
+                    "%d nmap scan(s) completed in %d second(s).\n" % (
+                        scans, clock_diff))
+                stderr.flush()
+            count += scans
+        else:
+            # For a ping scan, we can easily get a count of the number of
+            # hosts, and whether or not the ping was successful. It will be
+            # printed to stderr for informational purposes.
+            pinged = 0
+            hosts = 0
+            for event in ping_scan(to_scan, threads=args.threads):
+                pinged += 1
+                if event['result'] is True:
+                    hosts += 1
+                write_event(event, stdout)
+            clock_diff = time.monotonic() - clock
+            if pinged > 0:
+                stderr.write(
+                    "Pinged %d hosts (%d up) in %d second(s).\n" % (
+                        pinged, hosts, clock_diff))
+                stderr.flush()
+            count += pinged
     return {"count": count, "tool": tool, "seconds": clock_diff}
 
 
@@ -466,7 +735,8 @@ def run(args, stdout=sys.stdout, stderr=sys.stderr):
         # user if they requested to scan a CIDR that doesn't exist.
         warn_about_missing_cidrs(ifname_to_scan, cidrs, interfaces, stderr)
 
-    result = scan_networks(args, to_scan, stderr, stdout)
+    result = scan_networks(
+        args, to_scan, stderr, stdout, interfaces=interfaces)
     if result['count'] == 0:
         stderr.write("Requested network(s) not available to scan: %s\n" % (
             ", ".join(cidrs) if len(cidrs) > 0 else ifname_to_scan))
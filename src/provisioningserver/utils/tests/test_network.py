@@ -14,6 +14,7 @@ from socket import (
     gaierror,
     IPPROTO_TCP,
 )
+from textwrap import dedent
 from typing import List
 from unittest import mock
 from unittest.mock import Mock
@@ -59,6 +60,8 @@ from provisioningserver.utils.network import (
     get_eui_organization,
     get_interface_children,
     get_mac_organization,
+    get_oui_index,
+    get_oui_organization,
     has_ipv4_address,
     hex_str_to_bytes,
     inet_ntop,
@@ -71,6 +74,7 @@ from provisioningserver.utils.network import (
     MAASIPSet,
     make_iprange,
     make_network,
+    OUIIndex,
     parse_integer,
     preferred_hostnames_sort_key,
     resolve_host_to_addrinfo,
@@ -223,6 +227,11 @@ class TestFindIPViaARP(MAASTestCase):
 class TestGetMACOrganization(MAASTestCase):
     """Tests for `get_mac_organization()` and `get_eui_organization()`."""
 
+    def setUp(self):
+        super(TestGetMACOrganization, self).setUp()
+        get_oui_organization.cache_clear()
+        self.addCleanup(get_oui_organization.cache_clear)
+
     def test_get_mac_organization(self):
         mac_address = "48:51:b7:00:00:00"
         self.assertThat(
@@ -234,17 +243,75 @@ class TestGetMACOrganization(MAASTestCase):
             get_eui_organization(EUI(mac_address)), IsNonEmptyString)
 
     def test_get_eui_organization_returns_None_for_UnicodeError(self):
-        mock_eui = Mock()
-        mock_eui.oui = Mock()
-        mock_eui.oui.registration = Mock()
-        mock_eui.oui.registration.side_effect = UnicodeError
-        organization = get_eui_organization(mock_eui)
+        self.patch(network_module, "get_oui_index").return_value = None
+        OUI = self.patch(network_module, "OUI")
+        OUI.return_value.registration.side_effect = UnicodeError
+        organization = get_eui_organization(EUI("48:51:b7:00:00:00"))
         self.assertThat(organization, Is(None))
 
     def test_get_eui_organization_returns_none_for_invalid_mac(self):
         organization = get_eui_organization(EUI("FF:FF:b7:00:00:00"))
         self.assertThat(organization, Is(None))
 
+    def test_get_eui_organization_uses_oui_of_eui64(self):
+        self.assertThat(
+            get_eui_organization(EUI("48:51:b7:ff:fe:00:00:00")),
+            Equals(get_mac_organization("48:51:b7:00:00:00")))
+
+    def test_get_eui_organization_falls_back_to_netaddr(self):
+        self.patch(network_module, "get_oui_index").return_value = None
+        self.assertThat(
+            get_eui_organization(EUI("48:51:b7:00:00:00")), IsNonEmptyString)
+
+    def test_get_oui_organization_caches_results(self):
+        get_oui_index = self.patch(network_module, "get_oui_index")
+        get_oui_index.return_value = OUIIndex([(0x4851b7, "Intel")])
+        for _ in range(3):
+            self.assertThat(get_oui_organization(0x4851b7), Equals("Intel"))
+        self.assertThat(get_oui_index, MockCalledOnce())
+
+
+class TestOUIIndex(MAASTestCase):
+    """Tests for `OUIIndex` and `get_oui_index()`."""
+
+    def test_get_finds_organization(self):
+        index = OUIIndex([(3, "three"), (1, "one"), (2, "two")])
+        self.assertThat(
+            [index.get(oui) for oui in range(5)],
+            Equals([None, "one", "two", "three", None]))
+
+    def test_first_registration_wins(self):
+        index = OUIIndex([(1, "first"), (1, "second")])
+        self.assertThat(len(index), Equals(1))
+        self.assertThat(index.get(1), Equals("first"))
+
+    def test_from_registry_parses_hex_lines(self):
+        index = OUIIndex.from_registry(dedent("""\
+          OUI/MA-L\t\t\tOrganization
+          company_id\t\t\tOrganization
+          \t\t\t\tAddress
+
+          00-00-00   (hex)\t\tXEROX CORPORATION
+          000000     (base 16)\t\tXEROX CORPORATION
+          \t\t\t\tM/S 105-50C
+          \t\t\t\tWEBSTER  NY  14580
+          \t\t\t\tUS
+
+          60-89-B7   (hex)\t\tKAEL MÜHENDİSLİK
+          6089B7     (base 16)\t\tKAEL MÜHENDİSLİK
+          """).encode("utf-8"))
+        self.assertThat(len(index), Equals(2))
+        self.assertThat(index.get(0), Equals("XEROX CORPORATION"))
+        self.assertThat(index.get(0x6089b7), Equals("KAEL MÜHENDİSLİK"))
+
+    def test_get_oui_index_loads_registry_once(self):
+        get_oui_index.cache_clear()
+        self.addCleanup(get_oui_index.cache_clear)
+        index = get_oui_index()
+        self.assertThat(index, Not(Is(None)))
+        self.assertThat(get_oui_index(), Is(index))
+        self.assertThat(index.get(0x4851b7), IsNonEmptyString)
+
 
 class TestFindMACViaARP(MAASTestCase):
 
@@ -6,10 +6,14 @@
 __all__ = []
 
 import io
+import struct
 
 from maastesting.testcase import MAASTestCase
+from provisioningserver.utils.ethernet import ETHERTYPE
 from provisioningserver.utils.pcap import (
     PCAP,
+    PCAP_HEADER_SIZE,
+    PCAP_PACKET_HEADER_SIZE,
     PCAPError,
 )
 from testtools import ExpectedException
@@ -121,3 +125,64 @@ class TestPCAP(MAASTestCase):
                 PCAPError,
                 "Unexpected end of PCAP stream: invalid packet."):
             pcap.read()
+
+
+class TestPCAPReadBulk(MAASTestCase):
+
+    def test__reads_all_available_packets(self):
+        pcap = PCAP(io.BytesIO(TESTDATA))
+        packets = pcap.read_bulk()
+        self.assertThat(packets, Equals(list(PCAP(io.BytesIO(TESTDATA)))))
+        with ExpectedException(EOFError, "End of PCAP stream."):
+            pcap.read_bulk()
+
+    def test__keeps_partial_packets_for_next_read(self):
+        pcap = PCAP(io.BytesIO(TESTDATA))
+        packets = []
+        while True:
+            try:
+                packets.extend(pcap.read_bulk(size=7))
+            except EOFError:
+                break
+        self.assertThat(packets, Equals(list(PCAP(io.BytesIO(TESTDATA)))))
+
+    def test__read_consumes_buffered_bytes(self):
+        pcap = PCAP(io.BytesIO(TESTDATA))
+        self.assertThat(pcap.read_bulk(size=50), Equals([]))
+        self.assertThat(pcap.read()[0], Equals((1467058714, 931534, 60, 60)))
+        self.assertThat(pcap.read()[0], Equals((1467058715, 380619, 60, 60)))
+
+    def test__filters_by_ethertype(self):
+        arp = list(PCAP(io.BytesIO(TESTDATA)).iter_bulk(
+            ethertypes=[ETHERTYPE.ARP]))
+        ipv4 = list(PCAP(io.BytesIO(TESTDATA)).iter_bulk(
+            ethertypes=[ETHERTYPE.IPV4]))
+        self.assertThat(len(arp), Equals(2))
+        self.assertThat(ipv4, Equals([]))
+
+    def test__filters_by_encapsulated_ethertype_for_vlans(self):
+        header = TESTDATA[:PCAP_HEADER_SIZE]
+        packet = TESTDATA[
+            PCAP_HEADER_SIZE + PCAP_PACKET_HEADER_SIZE:
+            PCAP_HEADER_SIZE + PCAP_PACKET_HEADER_SIZE + 60]
+        # Insert an 802.1q tag (VID 42) before the ARP Ethertype.
+        packet = packet[:12] + b'\x81\x00\x00\x2a' + packet[12:]
+        data = header + struct.pack(
+            'IIII', 1, 0, len(packet), len(packet)) + packet
+        arp = list(PCAP(io.BytesIO(data)).iter_bulk(
+            ethertypes=[ETHERTYPE.ARP]))
+        self.assertThat(arp, Equals([((1, 0, 64, 64), packet)]))
+
+    def test__raises_PCAPError_for_invalid_packet_header(self):
+        pcap = PCAP(io.BytesIO(TESTDATA_INVALID_PACKET_HEADER))
+        with ExpectedException(
+                PCAPError,
+                "Unexpected end of PCAP stream: invalid packet header."):
+            list(pcap.iter_bulk())
+
+    def test__raises_PCAPError_for_invalid_packet(self):
+        pcap = PCAP(io.BytesIO(TESTDATA_INVALID_PACKET))
+        with ExpectedException(
+                PCAPError,
+                "Unexpected end of PCAP stream: invalid packet."):
+            list(pcap.iter_bulk())
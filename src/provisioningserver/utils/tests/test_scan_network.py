@@ -9,6 +9,8 @@ from argparse import ArgumentParser
 import io
 import os
 import random
+import socket
+import struct
 import subprocess
 from unittest.mock import (
     ANY,
@@ -22,12 +24,27 @@ from maastesting.matchers import (
     MockCalledOnceWith,
 )
 from maastesting.testcase import MAASTestCase
-from netaddr import IPNetwork
+from netaddr import (
+    IPAddress,
+    IPNetwork,
+)
 from provisioningserver.utils import scan_network as scan_network_module
+from provisioningserver.utils.arp import (
+    ARP,
+    ARP_OPERATION,
+    ARP_PACKET,
+)
+from provisioningserver.utils.ethernet import (
+    Ethernet,
+    ETHERTYPE,
+)
 from provisioningserver.utils.scan_network import (
     add_arguments,
+    arp_scan,
+    get_arp_sender_ip,
     get_nmap_arguments,
     get_ping_arguments,
+    make_arp_request,
     NmapParameters,
     PingParameters,
     run,
@@ -93,13 +110,14 @@ class TestScanNetworkCommand(MAASTestCase):
         self.run_command('--ping', '--threads', '37', '--slow')
         self.assertThat(self.scan_networks_mock, MockCalledOnceWith(
             ArgumentsMatching(threads=37, slow=True, ping=True),
-            ANY, ANY, ANY))
+            ANY, ANY, ANY, interfaces=TEST_INTERFACES))
 
     def test__default_arguments(self):
         self.run_command()
         self.assertThat(self.scan_networks_mock, MockCalledOnceWith(
-            ArgumentsMatching(threads=None, slow=False, ping=False),
-            ANY, ANY, ANY))
+            ArgumentsMatching(
+                threads=None, slow=False, ping=False, rate=None),
+            ANY, ANY, ANY, interfaces=TEST_INTERFACES))
 
     def test__scans_all_interface_cidrs_when_zero_parameters_passed(self):
         self.run_command()
@@ -108,14 +126,14 @@ class TestScanNetworkCommand(MAASTestCase):
                 'eth0': MatchesCIDRs(),
                 'eth1': MatchesCIDRs('192.168.0.0/24'),
                 'eth2': MatchesCIDRs('192.168.2.0/24', '192.168.3.0/24')
-            }, ANY, ANY))
+            }, ANY, ANY, interfaces=TEST_INTERFACES))
 
     def test__scans_all_cidrs_on_single_interface_when_ifname_passed(self):
         self.run_command('eth2')
         self.assertThat(self.scan_networks_mock, MockCalledOnceWith(
             ANY, {
                 'eth2': MatchesCIDRs('192.168.2.0/24', '192.168.3.0/24')
-            }, ANY, ANY))
+            }, ANY, ANY, interfaces=TEST_INTERFACES))
 
     def test__finds_correct_interface_if_passed_in_cidr_matches(self):
         self.run_command('192.168.2.0/24')
@@ -124,14 +142,14 @@ class TestScanNetworkCommand(MAASTestCase):
                 'eth0': MatchesCIDRs(),
                 'eth1': MatchesCIDRs(),
                 'eth2': MatchesCIDRs('192.168.2.0/24')
-            }, ANY, ANY))
+            }, ANY, ANY, interfaces=TEST_INTERFACES))
 
     def test__scans_specific_interface_cidr(self):
         self.run_command('eth2', '192.168.3.0/24')
         self.assertThat(self.scan_networks_mock, MockCalledOnceWith(
             ANY, {
                 'eth2': MatchesCIDRs('192.168.3.0/24')
-            }, ANY, ANY))
+            }, ANY, ANY, interfaces=TEST_INTERFACES))
 
     def test__scans_cidr_subset(self):
         self.run_command('192.168.3.0/28')
@@ -140,7 +158,7 @@ class TestScanNetworkCommand(MAASTestCase):
                 'eth0': MatchesCIDRs(),
                 'eth1': MatchesCIDRs(),
                 'eth2': MatchesCIDRs('192.168.3.0/28')
-            }, ANY, ANY))
+            }, ANY, ANY, interfaces=TEST_INTERFACES))
 
     def test__rejects_ipv6_cidr(self):
         expected_error = ".*Not a valid IPv4 CIDR:.*"
@@ -163,6 +181,9 @@ class TestScanNetworkCommandEndToEnd(MAASTestCase):
             scan_network_module, 'get_all_interfaces_definition')
         self.has_command_available_mock = self.patch(
             scan_network_module, 'has_command_available')
+        self.arp_scan_available_mock = self.patch(
+            scan_network_module, 'arp_scan_available')
+        self.arp_scan_available_mock.return_value = False
         self.all_interfaces_mock.return_value = TEST_INTERFACES
         self.popen = self.patch(scan_network_module.subprocess, 'Popen')
         self.popen.return_value.poll = Mock()
@@ -209,6 +230,51 @@ class TestScanNetworkCommandEndToEnd(MAASTestCase):
         self.assertThat(self.error_output.getvalue(), DocTestMatches(
             "Warning: 172.16.0.0/24 is not present on eth1..."))
 
+    def test__runs_arp_scan_when_raw_sockets_available(self):
+        self.arp_scan_available_mock.return_value = True
+        self.has_command_available_mock.return_value = True
+        arp_scan = self.patch(scan_network_module, 'arp_scan')
+        arp_scan.return_value = iter([
+            {"scan_type": "arp", "interface": "eth1",
+             "ip": "192.168.0.2", "result": True},
+            {"scan_type": "arp", "interface": "eth1",
+             "ip": "192.168.0.3", "result": False},
+        ])
+        self.run_command('--rate', '50', 'eth1', '192.168.0.0/24')
+        self.assertThat(arp_scan, MockCalledOnceWith(
+            {'eth1': MatchesCIDRs('192.168.0.0/24')}, TEST_INTERFACES,
+            slow=False, rate=50, unscanned={}))
+        self.assertThat(self.popen.call_count, Equals(0))
+        self.assertThat(self.output.getvalue(), Contains('"192.168.0.3"'))
+        self.assertThat(self.error_output.getvalue(), DocTestMatches(
+            "ARP scanned 2 hosts (1 up) in ... second(s)."))
+
+    def test__falls_back_for_interfaces_arp_scan_cannot_use(self):
+        self.arp_scan_available_mock.return_value = True
+        self.has_command_available_mock.return_value = False
+
+        def arp_scan(to_scan, interfaces, unscanned, **kwargs):
+            unscanned.update(to_scan)
+            return iter([])
+
+        self.patch(scan_network_module, 'arp_scan', arp_scan)
+        self.run_command('eth1', '192.168.0.1/32')
+        self.assertThat(self.popen, MockCalledOnceWith(
+            get_ping_arguments(
+                PingParameters(interface='eth1', ip='192.168.0.1')),
+            stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, env=select_c_utf8_locale()))
+        self.assertThat(self.error_output.getvalue(), DocTestMatches(
+            "...Warning: cannot ARP scan on eth1; using ping instead.\n"
+            "Pinged 1 hosts (1 up) in ... second(s)."))
+
+    def test__ping_overrides_arp_scan(self):
+        self.arp_scan_available_mock.return_value = True
+        arp_scan = self.patch(scan_network_module, 'arp_scan')
+        self.run_command('--ping', 'eth1', '192.168.0.1/32')
+        self.assertThat(arp_scan.call_count, Equals(0))
+        self.assertThat(self.popen.call_count, Equals(1))
+
     def test__runs_nmap_single_threaded(self):
         ip = factory.make_ip_address(ipv6=False)
         # Force the use of `nmap` by ensuring it is reported as available.
@@ -335,3 +401,194 @@ class TestYieldPingParameters(MAASTestCase):
             PingParameters(interface='eth0', ip='192.168.0.1'),
             PingParameters(interface='eth0', ip='192.168.0.2'),
         }))
+
+
+def make_arp_reply(mac, ip, target_mac, target_ip):
+    return b''.join((
+        target_mac, mac, ETHERTYPE.ARP,
+        struct.pack(
+            ARP_PACKET, 1, 0x800, 6, 4, 2, mac, int(IPAddress(ip)),
+            target_mac, int(IPAddress(target_ip))),
+    ))
+
+
+class FakeARPSocket:
+    """A socket on a network where only the `alive` addresses reply."""
+
+    def __init__(self, alive=()):
+        self.sock, self.peer = socket.socketpair(
+            socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.alive = {ip: factory.make_bytes(6) for ip in alive}
+        self.requests = []
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def recv(self, bufsize):
+        return self.sock.recv(bufsize)
+
+    def send(self, frame):
+        arp = ARP(Ethernet(frame).payload)
+        self.requests.append(arp)
+        target_ip = str(arp.target_ip)
+        if target_ip in self.alive:
+            self.peer.send(make_arp_reply(
+                self.alive[target_ip], target_ip,
+                arp.sender_hardware_bytes, arp.source_ip))
+        return len(frame)
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+        self.peer.close()
+
+
+class TestMakeARPRequest(MAASTestCase):
+
+    def test__makes_broadcast_request(self):
+        src_mac = factory.make_bytes(6)
+        frame = make_arp_request(
+            src_mac, int(IPAddress('192.168.0.1')),
+            int(IPAddress('192.168.0.2')))
+        ethernet = Ethernet(frame)
+        self.assertTrue(ethernet.is_valid())
+        self.assertThat(ethernet.dst_mac, Equals(b'\xff' * 6))
+        self.assertThat(ethernet.src_mac, Equals(src_mac))
+        arp = ARP(ethernet.payload)
+        self.assertThat(arp, MatchesStructure.byEquality(
+            operation=ARP_OPERATION.REQUEST,
+            source_ip=IPAddress('192.168.0.1'),
+            target_ip=IPAddress('192.168.0.2'),
+        ))
+
+
+class TestGetARPSenderIP(MAASTestCase):
+
+    def test__returns_sender_of_reply(self):
+        frame = make_arp_reply(
+            factory.make_bytes(6), '192.168.0.2',
+            factory.make_bytes(6), '192.168.0.1')
+        self.assertThat(
+            get_arp_sender_ip(frame), Equals(int(IPAddress('192.168.0.2'))))
+
+    def test__returns_none_for_probe(self):
+        frame = make_arp_request(
+            factory.make_bytes(6), 0, int(IPAddress('192.168.0.2')))
+        self.assertIsNone(get_arp_sender_ip(frame))
+
+    def test__returns_none_for_truncated_frame(self):
+        frame = make_arp_reply(
+            factory.make_bytes(6), '192.168.0.2',
+            factory.make_bytes(6), '192.168.0.1')
+        self.assertIsNone(get_arp_sender_ip(frame[:30]))
+
+
+class TestARPScan(MAASTestCase):
+
+    def scan(self, to_scan, sockets, **kwargs):
+        mac = factory.make_bytes(6)
+        kwargs.setdefault('rate', 100000)
+        kwargs.setdefault('timeout', 0.1)
+        return list(arp_scan(
+            to_scan, TEST_INTERFACES,
+            open_socket=lambda ifname: (sockets[ifname], mac), **kwargs))
+
+    def test__reports_replying_addresses_up(self):
+        sock = FakeARPSocket(alive={'192.168.0.5', '192.168.0.9'})
+        events = self.scan({'eth1': ['192.168.0.4/30']}, {'eth1': sock})
+        self.assertThat(events, Equals([
+            {"scan_type": "arp", "interface": "eth1",
+             "ip": "192.168.0.5", "result": True},
+            {"scan_type": "arp", "interface": "eth1",
+             "ip": "192.168.0.6", "result": False},
+        ]))
+        self.assertTrue(sock.closed)
+
+    def test__sends_from_address_on_link(self):
+        sock = FakeARPSocket()
+        self.scan({'eth2': ['192.168.3.8/31']}, {'eth2': sock}, tries=1)
+        self.assertThat(
+            {str(arp.source_ip) for arp in sock.requests},
+            Equals({'192.168.3.1'}))
+
+    def test__sends_probes_when_no_address_on_link(self):
+        sock = FakeARPSocket()
+        self.scan({'eth0': ['10.0.0.8/31']}, {'eth0': sock}, tries=1)
+        self.assertThat(
+            {str(arp.source_ip) for arp in sock.requests},
+            Equals({'0.0.0.0'}))
+
+    def test__reports_own_address_up_without_asking(self):
+        sock = FakeARPSocket()
+        events = self.scan({'eth1': ['192.168.0.1/32']}, {'eth1': sock})
+        self.assertThat(events, Equals([
+            {"scan_type": "arp", "interface": "eth1",
+             "ip": "192.168.0.1", "result": True},
+        ]))
+        self.assertThat(sock.requests, Equals([]))
+
+    def test__retries_only_silent_addresses(self):
+        sock = FakeARPSocket(alive={'192.168.0.2'})
+        self.scan({'eth1': ['192.168.0.2/31']}, {'eth1': sock}, tries=3)
+        self.assertThat(
+            [str(arp.target_ip) for arp in sock.requests],
+            Equals(['192.168.0.2', '192.168.0.3', '192.168.0.3',
+                    '192.168.0.3']))
+
+    def test__scans_each_interface_on_its_own_socket(self):
+        sockets = {
+            'eth1': FakeARPSocket(alive={'192.168.0.2'}),
+            'eth2': FakeARPSocket(alive={'192.168.2.2'}),
+        }
+        events = self.scan({
+            'eth1': ['192.168.0.2/32'],
+            'eth2': ['192.168.2.2/32'],
+        }, sockets)
+        self.assertThat(
+            sorted((event['interface'], event['result']) for event in events),
+            Equals([('eth1', True), ('eth2', True)]))
+        self.assertThat(len(sockets['eth1'].requests), Equals(1))
+        self.assertThat(len(sockets['eth2'].requests), Equals(1))
+
+    def test__skips_interfaces_whose_socket_cannot_be_opened(self):
+        sock = FakeARPSocket(alive={'192.168.0.2'})
+        mac = factory.make_bytes(6)
+
+        def open_socket(ifname):
+            if ifname == 'eth2':
+                raise PermissionError()
+            return sock, mac
+
+        unscanned = {}
+        events = list(arp_scan(
+            {'eth1': ['192.168.0.2/32'], 'eth2': ['192.168.2.2/32']},
+            TEST_INTERFACES, rate=100000, timeout=0.1,
+            open_socket=open_socket, unscanned=unscanned))
+        self.assertThat(events, Equals([
+            {"scan_type": "arp", "interface": "eth1",
+             "ip": "192.168.0.2", "result": True},
+        ]))
+        self.assertThat(unscanned, Equals({'eth2': ['192.168.2.2/32']}))
+        self.assertTrue(sock.closed)
+
+    def test__records_cidrs_given_as_iterators_when_skipping(self):
+        def open_socket(ifname):
+            raise PermissionError()
+
+        unscanned = {}
+        events = list(arp_scan(
+            {'eth1': (cidr for cidr in ['192.168.0.2/31'])}, TEST_INTERFACES,
+            open_socket=open_socket, unscanned=unscanned))
+        self.assertThat(events, Equals([]))
+        self.assertThat(unscanned, Equals({'eth1': ['192.168.0.2/31']}))
+
+    def test__raises_when_socket_cannot_be_opened(self):
+        def open_socket(ifname):
+            raise PermissionError()
+
+        scanner = arp_scan(
+            {'eth1': ['192.168.0.2/32']}, TEST_INTERFACES,
+            open_socket=open_socket)
+        self.assertRaises(PermissionError, list, scanner)
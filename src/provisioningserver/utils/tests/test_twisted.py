@@ -63,6 +63,7 @@ from provisioningserver.utils.twisted import (
     LONGTIME,
     makeDeferredWithProcessProtocol,
     pause,
+    PrioritisedThreadPool,
     reducedWebLogFormatter,
     retries,
     RPCFetcher,
@@ -1720,6 +1721,195 @@ class TestThreadPoolLimiter(MAASTestCase):
         self.assertThat(pool.lock.tokens, Equals(1))
 
 
+
+class RecordingThreadPool(DummyThreadPool):
+    """A thread-pool that records calls instead of making them."""
+
+    def __init__(self):
+        super(RecordingThreadPool, self).__init__()
+        self.calls = []
+
+    def callInThreadWithCallback(self, onResult, func, *args, **kwargs):
+        self.calls.append((onResult, func, args, kwargs))
+
+    def finish(self, index=0, result=None):
+        """Finish the call at `index` successfully with `result`."""
+        onResult, func, args, kwargs = self.calls.pop(index)
+        onResult(True, result)
+
+
+class TestPrioritisedThreadPool(MAASTestCase):
+    """Tests for `PrioritisedThreadPool`."""
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def make_pool(self, size=1, weights=None, limits=None):
+        if weights is None:
+            weights = {"high": 3, "low": 1}
+        pool_beneath = RecordingThreadPool()
+        pool = PrioritisedThreadPool(
+            pool_beneath, size, weights, limits, default="low",
+            clock=Clock())
+        return pool
+
+    def test__init(self):
+        pool_beneath = DummyThreadPool()
+        pool = PrioritisedThreadPool(
+            pool_beneath, 5, {"a": 1}, default="a", clock=sentinel.clock)
+        self.assertThat(pool, MatchesStructure(
+            pool=Is(pool_beneath), size=Equals(5), weights=Equals({"a": 1}),
+            limits=Equals({}), default=Equals("a"), clock=Is(sentinel.clock),
+            start=Equals(pool.pool.start), started=Equals(pool.pool.started),
+            stop=Equals(pool.pool.stop)))
+
+    def test__init_rejects_weights_that_are_not_positive(self):
+        self.assertRaises(
+            ValueError, PrioritisedThreadPool,
+            DummyThreadPool(), 1, {"a": 1, "b": 0}, default="a")
+
+    def test__init_rejects_unknown_default(self):
+        self.assertRaises(
+            ValueError, PrioritisedThreadPool,
+            DummyThreadPool(), 1, {"a": 1}, default="b")
+
+    def test__callInThread_uses_default_priority(self):
+        pool = self.make_pool()
+        pool.callInThread(sentinel.func, sentinel.arg, kwarg=sentinel.kwarg)
+        self.assertThat(pool.dispatched, Equals({"low": 1}))
+        [(_, func, args, kwargs)] = pool.pool.calls
+        self.assertThat(func, Is(sentinel.func))
+        self.assertThat(args, Equals((sentinel.arg,)))
+        self.assertThat(kwargs, Equals({"kwarg": sentinel.kwarg}))
+
+    def test__withPriority_calls_at_priority(self):
+        pool = self.make_pool()
+        pool.withPriority("high").callInThread(sentinel.func)
+        self.assertThat(pool.dispatched, Equals({"high": 1}))
+
+    def test__withPriority_rejects_unknown_priority(self):
+        pool = self.make_pool()
+        self.assertRaises(ValueError, pool.withPriority, "other")
+
+    def test__passes_no_more_than_size_calls_to_pool(self):
+        pool = self.make_pool(size=2)
+        for _ in range(5):
+            pool.callInThread(noop)
+        self.assertThat(pool.pool.calls, HasLength(2))
+        self.assertThat(pool.depth("low"), Equals(3))
+        pool.pool.finish()
+        self.assertThat(pool.pool.calls, HasLength(2))
+        self.assertThat(pool.depth("low"), Equals(2))
+
+    def test__calls_onResult_then_dispatches_next(self):
+        pool = self.make_pool()
+        onResult = Mock()
+        pool.callInThreadWithCallback(onResult, noop)
+        pool.callInThread(noop)
+        pool.pool.finish(result=sentinel.result)
+        self.assertThat(onResult, MockCalledOnceWith(True, sentinel.result))
+        self.assertThat(pool.running, Equals({"low": 1}))
+        self.assertThat(pool.dispatched, Equals({"low": 2}))
+
+    def test__shares_pool_according_to_weights(self):
+        pool = self.make_pool()
+        order = []
+        for _ in range(8):
+            pool.callInThreadWithPriority(
+                "low", None, order.append, "low")
+            pool.callInThreadWithPriority(
+                "high", None, order.append, "high")
+        while len(pool.pool.calls) > 0:
+            _, func, args, _ = pool.pool.calls[0]
+            func(*args)
+            pool.pool.finish()
+        # Three "high" calls for every "low" call.
+        self.assertThat(order[:8].count("high"), Equals(6))
+        self.assertThat(order[:8].count("low"), Equals(2))
+        self.assertThat(order[8:].count("high"), Equals(2))
+
+    def test__idle_priority_does_not_save_up_its_share(self):
+        pool = self.make_pool()
+        for _ in range(10):
+            pool.callInThreadWithPriority("low", None, noop)
+            pool.pool.finish()
+        # "high" has been idle; it now gets its share but no more.
+        for _ in range(8):
+            pool.callInThreadWithPriority("high", None, noop)
+            pool.callInThreadWithPriority("low", None, noop)
+        pool.dispatched.clear()
+        for _ in range(8):
+            pool.pool.finish()
+        self.assertThat(pool.dispatched, Equals({"high": 6, "low": 2}))
+
+    def test__limits_concurrent_calls_at_priority(self):
+        pool = self.make_pool(size=3, limits={"low": 1})
+        for _ in range(3):
+            pool.callInThreadWithPriority("low", None, noop)
+        self.assertThat(pool.running, Equals({"low": 1}))
+        self.assertThat(pool.depth("low"), Equals(2))
+        pool.callInThreadWithPriority("high", None, noop)
+        self.assertThat(pool.running, Equals({"low": 1, "high": 1}))
+
+    def test__records_time_spent_queued(self):
+        pool = self.make_pool()
+        pool.callInThread(noop)
+        pool.callInThread(noop)
+        pool.clock.advance(2)
+        pool.callInThread(noop)
+        pool.pool.finish()
+        pool.clock.advance(3)
+        pool.pool.finish()
+        self.assertThat(pool.queued, Equals({"low": 3}))
+        self.assertThat(pool.dispatched, Equals({"low": 3}))
+        self.assertThat(pool.waited, Equals({"low": 2 + 3}))
+        self.assertThat(pool.longest, Equals({"low": 3}))
+
+    def test__report_gives_a_line_for_each_priority(self):
+        pool = self.make_pool()
+        for _ in range(3):
+            pool.callInThread(noop)
+        pool.clock.advance(2)
+        pool.pool.finish()
+        self.assertThat(pool.report(), Equals([
+            "high: 0 waiting, 0 running, 0 queued, 0 dispatched; "
+            "0.000s average wait, 0.000s longest",
+            "low: 1 waiting, 1 running, 3 queued, 2 dispatched; "
+            "1.000s average wait, 2.000s longest",
+        ]))
+
+    def test__calls_onResult_when_pool_breaks(self):
+        pool = self.make_pool()
+        exception_type = factory.make_exception_type()
+        citwc = self.patch_autospec(pool.pool, "callInThreadWithCallback")
+        citwc.side_effect = exception_type
+        onResult = Mock()
+        pool.callInThreadWithCallback(onResult, noop)
+        self.assertThat(onResult, MockCalledOnceWith(False, ANY))
+        [_, failure], _ = onResult.call_args
+        self.assertThat(failure.type, Is(exception_type))
+        self.assertThat(pool.running, Equals({"low": 0}))
+
+    def test__logs_when_pool_breaks_without_callback(self):
+        pool = self.make_pool()
+        exception_type = factory.make_exception_type()
+        citwc = self.patch_autospec(pool.pool, "callInThreadWithCallback")
+        citwc.side_effect = exception_type
+        with TwistedLoggerFixture() as logger:
+            pool.callInThread(noop)
+        self.assertDocTestMatches(
+            "Critical failure arranging call in thread\n...",
+            logger.output)
+        self.assertThat(pool.running, Equals({"low": 0}))
+
+    @inlineCallbacks
+    def test__works_with_deferToThreadPool(self):
+        pool = PrioritisedThreadPool(
+            ThreadUnpool(DeferredSemaphore(2)), 2, {"a": 1}, default="a")
+        result = yield deferToThreadPool(
+            reactor, pool.withPriority("a"), lambda: sentinel.result)
+        self.assertThat(result, Is(sentinel.result))
+        self.assertThat(pool.running, Equals({"a": 0}))
+
 class TestMakeDeferredWithProcessProtocol(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
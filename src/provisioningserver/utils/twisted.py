@@ -20,6 +20,7 @@ __all__ = [
     'LONGTIME',
     'makeDeferredWithProcessProtocol',
     'pause',
+    'PrioritisedThreadPool',
     'reducedWebLogFormatter',
     'retries',
     'suppress',
@@ -30,7 +31,9 @@ __all__ = [
     ]
 
 from collections import (
+    Counter,
     defaultdict,
+    deque,
     Iterable,
 )
 from functools import (
@@ -990,6 +993,207 @@ class ThreadPoolLimiter:
             log.err, "Critical failure arranging call in thread")
 
 
+class PrioritisedThreadPool:
+    """Share a thread-pool between classes of work, according to weights.
+
+    This wraps another thread-pool. Calls are queued by priority, and no more
+    than `size` of them are passed to the underlying pool at once, so that
+    it never builds up a first-come-first-served queue of its own. When a
+    thread becomes free, the next call is taken from the non-empty queue
+    that has so far received the smallest share of the pool relative to its
+    weight. A busy class of work cannot starve another: with weights of 6
+    and 1, the lesser class still gets one in every seven threads when both
+    are busy, and all of them when the other is idle.
+
+    A class can also be limited to a number of concurrent calls, to keep
+    threads free for the others when its calls are long-running.
+
+    Like `ThreadPoolLimiter` this must only be used from the reactor thread.
+
+    :ivar queued: A `Counter` of calls queued, by priority.
+    :ivar dispatched: A `Counter` of calls passed to the pool, by priority.
+    :ivar waited: A `Counter` of seconds that dispatched calls spent queued,
+        by priority.
+    :ivar longest: A `Counter` of the longest time, in seconds, that a call
+        spent queued, by priority.
+    :ivar running: A `Counter` of calls in the pool, by priority.
+    """
+
+    def __init__(
+            self, pool, size, weights, limits=None, default=None,
+            clock=reactor):
+        """Initialise a new `PrioritisedThreadPool`.
+
+        :param pool: The thread-pool to call into.
+        :param size: The maximum number of concurrent calls into `pool`.
+        :param weights: A mapping of priority to a positive weight.
+        :param limits: An optional mapping of priority to the maximum number
+            of concurrent calls at that priority.
+        :param default: The priority used by `callInThread` and
+            `callInThreadWithCallback`.
+        """
+        super(PrioritisedThreadPool, self).__init__()
+        if any(weight <= 0 for weight in weights.values()):
+            raise ValueError("Weights must be positive: %r" % (weights,))
+        if default not in weights:
+            raise ValueError("Unknown default priority: %r" % (default,))
+        self.pool = pool
+        self.size = size
+        self.weights = dict(weights)
+        self.limits = {} if limits is None else dict(limits)
+        self.default = default
+        self.clock = clock
+        self.queues = {priority: deque() for priority in self.weights}
+        # Stride scheduling: each priority advances its pass by the inverse
+        # of its weight every time a call is dispatched, and the priority
+        # with the lowest pass goes next. A priority that was idle resumes
+        # from the pass of the most recent dispatch, so it cannot save up.
+        self.passes = dict.fromkeys(self.weights, 0.0)
+        self.current = 0.0
+        self.queued = Counter()
+        self.dispatched = Counter()
+        self.waited = Counter()
+        self.longest = Counter()
+        self.running = Counter()
+
+    start = property(attrgetter("pool.start"))
+    started = property(attrgetter("pool.started"))
+    stop = property(attrgetter("pool.stop"))
+
+    def depth(self, priority):
+        """Return the number of calls queued at `priority`."""
+        return len(self.queues[priority])
+
+    def report(self):
+        """Return a line of text for each priority, sorted by name.
+
+        Each line gives the number of calls queued now, running now, ever
+        queued, and ever dispatched, then the average and longest time that
+        dispatched calls spent queued.
+        """
+        return [
+            "%s: %d waiting, %d running, %d queued, %d dispatched; "
+            "%.3fs average wait, %.3fs longest" % (
+                priority, self.depth(priority), self.running[priority],
+                self.queued[priority], self.dispatched[priority],
+                self.waited[priority] / max(1, self.dispatched[priority]),
+                self.longest[priority])
+            for priority in sorted(self.weights, key=str)
+        ]
+
+    def withPriority(self, priority):
+        """Return a thread-pool that queues all calls at `priority`.
+
+        This can be passed to `deferToThreadPool`, `ThreadPoolLimiter`, and
+        the like.
+        """
+        if priority in self.queues:
+            return _ThreadPoolAtPriority(self, priority)
+        else:
+            raise ValueError("Unknown priority: %r" % (priority,))
+
+    def callInThread(self, func, *args, **kwargs):
+        """Queue a call at the default priority."""
+        self.callInThreadWithCallback(None, func, *args, **kwargs)
+
+    def callInThreadWithCallback(self, onResult, func, *args, **kwargs):
+        """Queue a call at the default priority."""
+        self.callInThreadWithPriority(
+            self.default, onResult, func, *args, **kwargs)
+
+    def callInThreadWithPriority(
+            self, priority, onResult, func, *args, **kwargs):
+        """Queue a call at `priority` then dispatch what can be dispatched.
+
+        See :class:`twisted.python.threadpool.ThreadPool` for the meaning of
+        `onResult`.
+        """
+        queue = self.queues[priority]
+        if len(queue) == 0:
+            self.passes[priority] = max(self.passes[priority], self.current)
+        queue.append((self.clock.seconds(), onResult, func, args, kwargs))
+        self.queued[priority] += 1
+        self._dispatch()
+
+    def _next(self):
+        """Return the priority of the next call to dispatch, or `None`."""
+        eligible = [
+            priority for priority, queue in self.queues.items()
+            if len(queue) > 0 and self.running[priority] < self.limits.get(
+                priority, self.size)
+        ]
+        if len(eligible) == 0:
+            return None
+        else:
+            return min(eligible, key=lambda priority: (
+                self.passes[priority], -self.weights[priority]))
+
+    def _dispatch(self):
+        while sum(self.running.values()) < self.size:
+            priority = self._next()
+            if priority is None:
+                break
+            self.current = self.passes[priority]
+            self.passes[priority] += 1.0 / self.weights[priority]
+            queued_at, onResult, func, args, kwargs = (
+                self.queues[priority].popleft())
+            waited = self.clock.seconds() - queued_at
+            self.dispatched[priority] += 1
+            self.waited[priority] += waited
+            self.longest[priority] = max(self.longest[priority], waited)
+            self.running[priority] += 1
+            self._call(priority, onResult, func, args, kwargs)
+
+    def _call(self, priority, onResult, func, args, kwargs):
+
+        def finished():
+            self.running[priority] -= 1
+            self._dispatch()
+
+        def callback(success, result):
+            try:
+                if onResult is not None:
+                    onResult(success, result)
+            finally:
+                if isInIOThread():
+                    finished()
+                else:
+                    reactor.callFromThread(finished)
+
+        try:
+            # If this fails we have serious problems. On the other hand, if
+            # this succeeds we have handed off all responsibility.
+            self.pool.callInThreadWithCallback(callback, func, *args, **kwargs)
+        except:
+            self.running[priority] -= 1
+            if onResult is None:
+                log.err(None, "Critical failure arranging call in thread")
+            else:
+                onResult(False, Failure())
+
+
+class _ThreadPoolAtPriority:
+    """A view of a `PrioritisedThreadPool` that calls at one priority."""
+
+    def __init__(self, pool, priority):
+        super(_ThreadPoolAtPriority, self).__init__()
+        self.pool = pool
+        self.priority = priority
+
+    start = property(attrgetter("pool.start"))
+    started = property(attrgetter("pool.started"))
+    stop = property(attrgetter("pool.stop"))
+
+    def callInThread(self, func, *args, **kwargs):
+        """Queue a call at this priority."""
+        self.callInThreadWithCallback(None, func, *args, **kwargs)
+
+    def callInThreadWithCallback(self, onResult, func, *args, **kwargs):
+        """Queue a call at this priority."""
+        self.pool.callInThreadWithPriority(
+            self.priority, onResult, func, *args, **kwargs)
+
+
 def makeDeferredWithProcessProtocol():
     """Returns a (`Deferred`, `ProcessProtocol`) tuple.
 